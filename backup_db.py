@@ -1,25 +1,221 @@
-import shutil
+import argparse
+import gzip
+import hashlib
+import json
 import os
-from datetime import datetime, timedelta
+import shutil
+import sqlite3
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
 DB_PATH = "bath_bot.db"  # путь к вашей базе
 BACKUP_DIR = "backups"
 BACKUP_DAYS = 7
+MANIFEST_SUFFIX = ".manifest.json"
+SQLITE_PREFIX = "bath_bot_backup_"
+MYSQL_PREFIX = "bath_bot_mysql_backup_"
+# Формат дампа MySQL: 2 — каждая инструкция SQL на отдельной строке
+MYSQL_DUMP_FORMAT = 2
+
+
+def file_sha256(path):
+    """Считает SHA-256 файла, читая его блоками"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(backup_path, backend, tables, dump_format=None):
+    """Сохраняет рядом с бэкапом манифест с размером, контрольной суммой и числом строк"""
+    manifest = {
+        'file': os.path.basename(backup_path),
+        'backend': backend,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'size': os.path.getsize(backup_path),
+        'sha256': file_sha256(backup_path),
+        'compression': 'gzip',
+        'tables': tables,
+    }
+    if dump_format is not None:
+        manifest['format'] = dump_format
+    with open(backup_path + MANIFEST_SUFFIX, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def _sqlite_table_counts(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    tables = [row[0] for row in cursor.fetchall()]
+    return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+def backup_sqlite(db_path, backup_dir, pages=256):
+    """Делает согласованную копию SQLite через online backup API и сжимает её.
+
+    Копирование идет шагами по pages страниц, поэтому бот может продолжать
+    писать в базу: SQLite сам перезапускает копирование измененных страниц.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_path = os.path.join(backup_dir, f"{SQLITE_PREFIX}{timestamp}.db.gz")
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=backup_dir)
+    os.close(fd)
+    try:
+        source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target, pages=pages, sleep=0.01)
+            integrity = target.execute('PRAGMA integrity_check').fetchone()[0]
+            if integrity != 'ok':
+                raise RuntimeError(f"Проверка целостности копии не пройдена: {integrity}")
+            tables = _sqlite_table_counts(target)
+        finally:
+            target.close()
+            source.close()
+
+        with open(tmp_path, 'rb') as raw, gzip.open(backup_path, 'wb', compresslevel=6) as compressed:
+            shutil.copyfileobj(raw, compressed, 1024 * 1024)
+    finally:
+        os.remove(tmp_path)
+
+    write_manifest(backup_path, 'sqlite', tables)
+    return backup_path
+
+
+def _sql_literal(value):
+    """Преобразует значение из MySQL в SQL-литерал для логического дампа"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return f"X'{bytes(value).hex()}'" if value else "''"
+    if isinstance(value, (datetime, date, timedelta)):
+        return f"'{value}'"
+    text = str(value)
+    for char, escaped in (('\\', '\\\\'), ("'", "\\'"), ('\0', '\\0'), ('\n', '\\n'), ('\r', '\\r'), ('\x1a', '\\Z')):
+        text = text.replace(char, escaped)
+    return f"'{text}'"
+
+
+def backup_mysql(backup_dir, chunk_size=1000):
+    """Делает логический дамп MySQL в рамках одного согласованного снимка.
+
+    Все таблицы читаются внутри транзакции START TRANSACTION WITH CONSISTENT
+    SNAPSHOT, строки выбираются порциями и записываются многострочными
+    INSERT прямо в gzip-файл, не накапливаясь в памяти. Каждая инструкция
+    занимает ровно одну строку (переводы строк в значениях экранируются
+    _sql_literal), поэтому восстановление не разбирает SQL.
+    """
+    import mysql.connector
+    from config import RDS_CONFIG
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_path = os.path.join(backup_dir, f"{MYSQL_PREFIX}{timestamp}.sql.gz")
+    tmp_path = backup_path + '.part'
+
+    conn = mysql.connector.connect(**RDS_CONFIG, ssl_verify_cert=True)
+    tables = {}
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+        table_names = [row[0] for row in cursor.fetchall()]
+
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as dump:
+            dump.write(f"-- bath_bot MySQL dump {timestamp}\n")
+            dump.write("SET FOREIGN_KEY_CHECKS=0;\n")
+            for table in table_names:
+                cursor.execute(f"SHOW CREATE TABLE `{table}`")
+                create_sql = ' '.join(cursor.fetchone()[1].splitlines())
+                dump.write(f"DROP TABLE IF EXISTS `{table}`;\n{create_sql};\n")
+
+                cursor.execute(f"SELECT * FROM `{table}`")
+                columns = ", ".join(f"`{column[0]}`" for column in cursor.description)
+                count = 0
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    values = ",".join(
+                        "(" + ",".join(_sql_literal(value) for value in row) + ")" for row in rows
+                    )
+                    dump.write(f"INSERT INTO `{table}` ({columns}) VALUES {values};\n")
+                    count += len(rows)
+                tables[table] = count
+            dump.write("SET FOREIGN_KEY_CHECKS=1;\n")
+        conn.commit()
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, backup_path)
+    write_manifest(backup_path, 'mysql', tables, dump_format=MYSQL_DUMP_FORMAT)
+    return backup_path
+
+
+def list_backups(backup_dir, backend):
+    """Возвращает бэкапы указанного типа, от новых к старым"""
+    prefix, suffix = (SQLITE_PREFIX, '.db.gz') if backend == 'sqlite' else (MYSQL_PREFIX, '.sql.gz')
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = [
+        os.path.join(backup_dir, fname) for fname in os.listdir(backup_dir)
+        if fname.startswith(prefix) and fname.endswith(suffix)
+    ]
+    return sorted(backups, reverse=True)
+
+
+def apply_retention(backup_dir, backend, keep_days=BACKUP_DAYS, keep_count=None):
+    """Удаляет бэкапы старше keep_days дней и сверх keep_count последних"""
+    now = datetime.now()
+    removed = []
+    for index, path in enumerate(list_backups(backup_dir, backend)):
+        age = now - datetime.fromtimestamp(os.path.getmtime(path))
+        if age.days > keep_days or (keep_count is not None and index >= keep_count):
+            os.remove(path)
+            if os.path.exists(path + MANIFEST_SUFFIX):
+                os.remove(path + MANIFEST_SUFFIX)
+            removed.append(path)
+    return removed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Резервное копирование базы данных бота")
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite', help="какую базу копировать")
+    parser.add_argument('--db-path', default=DB_PATH, help="путь к SQLite базе")
+    parser.add_argument('--backup-dir', default=BACKUP_DIR, help="каталог для бэкапов")
+    parser.add_argument('--keep-days', type=int, default=BACKUP_DAYS, help="сколько дней хранить бэкапы")
+    parser.add_argument('--keep-count', type=int, default=None, help="сколько последних бэкапов хранить")
+    parser.add_argument('--pages', type=int, default=256, help="страниц SQLite за один шаг копирования")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="строк MySQL в одном INSERT")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.backup_dir, exist_ok=True)
+
+    if args.backend == 'sqlite':
+        backup_path = backup_sqlite(args.db_path, args.backup_dir, args.pages)
+    else:
+        backup_path = backup_mysql(args.backup_dir, args.chunk_size)
+    print(f"Бэкап базы сохранён: {backup_path}")
+
+    # Удаляем старые бэкапы
+    for path in apply_retention(args.backup_dir, args.backend, args.keep_days, args.keep_count):
+        print(f"Удалён старый бэкап: {path}")
+
 
-os.makedirs(BACKUP_DIR, exist_ok=True)
-backup_name = f"bath_bot_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-backup_path = os.path.join(BACKUP_DIR, backup_name)
-
-# Копируем базу
-shutil.copy2(DB_PATH, backup_path)
-print(f"Бэкап базы сохранён: {backup_path}")
-
-# Удаляем старые бэкапы
-now = datetime.now()
-for fname in os.listdir(BACKUP_DIR):
-    if fname.startswith("bath_bot_backup_") and fname.endswith(".db"):
-        fpath = os.path.join(BACKUP_DIR, fname)
-        ftime = datetime.fromtimestamp(os.path.getmtime(fpath))
-        if (now - ftime).days > BACKUP_DAYS:
-            os.remove(fpath)
-            print(f"Удалён старый бэкап: {fpath}") 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
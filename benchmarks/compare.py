@@ -0,0 +1,40 @@
+"""Сравнение двух JSON-отчетов бенчмарков (например, до и после коммита).
+
+    python -m benchmarks.compare base.json new.json
+"""
+import argparse
+import json
+
+
+def compare(base, new, metric='median_ms'):
+    """Возвращает строки (имя, было, стало, изменение в %) для общих бенчмарков"""
+    rows = []
+    for name, stats in new['results'].items():
+        if name not in base['results']:
+            continue
+        before = base['results'][name][metric]
+        after = stats[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        rows.append((name, before, after, change))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарков")
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--metric', default='median_ms', choices=['min_ms', 'median_ms', 'mean_ms', 'p95_ms'])
+    args = parser.parse_args()
+
+    with open(args.base, encoding='utf-8') as file:
+        base = json.load(file)
+    with open(args.new, encoding='utf-8') as file:
+        new = json.load(file)
+
+    print(f"{base.get('commit')} -> {new.get('commit')} ({args.metric})")
+    for name, before, after, change in compare(base, new, args.metric):
+        print(f"{name:<36} {before:>9.3f} -> {after:>9.3f} ms  {change:+7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
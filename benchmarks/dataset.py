@@ -0,0 +1,103 @@
+import random
+from datetime import datetime, timedelta
+
+# Таблицы, которые заполняет генератор (и очищает перед загрузкой)
+TABLES = ['user_profiles', 'active_users', 'bath_history', 'bath_participants', 'pending_payments']
+
+FIRST_NAMES = ['Алексей', 'Мария', 'Иван', 'Ольга', 'Дмитрий', 'Анна', 'Сергей', 'Екатерина', 'Павел', 'Наталья']
+LAST_NAMES = ['Иванов', 'Петрова', 'Сидоров', 'Кузнецова', 'Смирнов', 'Попова', 'Волков', 'Соколова']
+OCCUPATIONS = ['Разработчик', 'Дизайнер', 'Маркетолог', 'Врач', 'Юрист', 'Предприниматель', 'Фотограф']
+
+
+def generate_dataset(seed=42, users=3000, weeks=156, participants=15, pending=500,
+                     max_participants=20, anchor_date="05.01.2025"):
+    """Генерирует воспроизводимый набор данных, похожий на боевой.
+
+    users — число профилей, weeks — сколько прошедших воскресений в
+    bath_history, participants — участников текущего события, pending —
+    ожидающих подтверждения оплат. anchor_date — дата текущего события.
+    Возвращает словарь {таблица: (колонки, строки)} и метаданные в ключе 'meta'.
+    """
+    rng = random.Random(seed)
+    anchor = datetime.strptime(anchor_date, "%d.%m.%Y")
+    past_dates = [(anchor - timedelta(weeks=week)).strftime("%d.%m.%Y") for week in range(1, weeks + 1)]
+    user_ids = [100000000 + index for index in range(users)]
+    usernames = {user_id: f"user{user_id}" for user_id in user_ids}
+
+    # Постоянные посетители ходят чаще: вес пользователя задает вероятность попасть в событие
+    weights = [rng.paretovariate(1.5) for _ in user_ids]
+    history = []
+    visits = {user_id: [] for user_id in user_ids}
+    for date_str in past_dates:
+        attendees = set(rng.choices(user_ids, weights=weights, k=max_participants))
+        for user_id in attendees:
+            paid = rng.random() < 0.9
+            visited = paid and rng.random() < 0.95
+            history.append((user_id, usernames[user_id], date_str, paid, visited))
+            if visited:
+                visits[user_id].append(datetime.strptime(date_str, "%d.%m.%Y").date())
+
+    profiles = []
+    for user_id in user_ids:
+        dates = visits[user_id]
+        profiles.append((
+            user_id,
+            usernames[user_id],
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}",
+            rng.choice(OCCUPATIONS),
+            f"insta_{user_id}",
+            "Навыки и увлечения " * rng.randint(1, 5),
+            len(dates),
+            min(dates) if dates else None,
+            max(dates) if dates else None,
+        ))
+
+    current = rng.sample(user_ids, min(participants, max_participants, users))
+    participants_rows = [
+        (user_id, usernames[user_id], anchor_date, rng.random() < 0.7, rng.random() < 0.2)
+        for user_id in current
+    ]
+
+    pending_users = rng.sample(user_ids, min(pending, users))
+    pending_rows = [
+        (user_id, usernames[user_id], anchor_date, rng.choice(['online', 'cash']), 150,
+         anchor - timedelta(minutes=rng.randint(0, 24 * 60)))
+        for user_id in pending_users
+    ]
+
+    active_rows = [(user_id, usernames[user_id]) for user_id in user_ids]
+
+    return {
+        'meta': {
+            'seed': seed, 'users': users, 'weeks': weeks, 'participants': len(participants_rows),
+            'pending': len(pending_rows), 'history_rows': len(history), 'anchor_date': anchor_date,
+            'user_ids': user_ids,
+        },
+        'user_profiles': (
+            ['user_id', 'username', 'full_name', 'birth_date', 'occupation', 'instagram', 'skills',
+             'total_visits', 'first_visit_date', 'last_visit_date'],
+            profiles
+        ),
+        'active_users': (['user_id', 'username'], active_rows),
+        'bath_history': (['user_id', 'username', 'date_str', 'paid', 'visited'], history),
+        'bath_participants': (['user_id', 'username', 'date_str', 'paid', 'cash'], participants_rows),
+        'pending_payments': (
+            ['user_id', 'username', 'date_str', 'payment_type', 'amount', 'last_notified'],
+            pending_rows
+        ),
+    }
+
+
+def load_dataset(conn, dataset, chunk_size=1000):
+    """Очищает таблицы и загружает в них набор данных пакетными вставками"""
+    cursor = conn.cursor()
+    for table in TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+    for table in TABLES:
+        columns, rows = dataset[table]
+        placeholders = ", ".join(["%s"] * len(columns))
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        for start in range(0, len(rows), chunk_size):
+            cursor.executemany(query, rows[start:start + chunk_size])
+    conn.commit()
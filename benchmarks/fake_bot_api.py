@@ -0,0 +1,104 @@
+"""Локальная заглушка Bot API для нагрузочных прогонов.
+
+FakeBotApi подставляется в Application через ApplicationBuilder().request(...):
+запросы бота не уходят в Telegram, а записываются, отвечают с заданной
+задержкой и с заданной долей получают 429 RetryAfter, как при флуд-контроле.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from telegram.request import BaseRequest
+
+FAKE_BOT_ID = 100000001
+FAKE_BOT_USERNAME = 'bath_load_bot'
+
+# Методы, ответ на которые — объект Message
+MESSAGE_METHODS = frozenset({
+    'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'sendDocument', 'sendPhoto',
+})
+# Методы, на которые распространяется флуд-контроль Telegram
+THROTTLED_METHODS = MESSAGE_METHODS | {'answerCallbackQuery', 'pinChatMessage'}
+
+
+class FakeBotApi(BaseRequest):
+    """BaseRequest, который отвечает на запросы бота локально.
+
+    latency и jitter — задержка ответа в секундах (jitter добавляется
+    случайно), retry_after_rate — доля запросов THROTTLED_METHODS, получающих
+    429 с retry_after секунд ожидания.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, retry_after_rate=0.0, retry_after=1, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.retry_afters = Counter()
+        self.requests = []   # (метод, параметры, ответ) успешных запросов в порядке поступления
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def bot_user(self):
+        return {
+            'id': FAKE_BOT_ID, 'is_bot': True, 'first_name': 'Bath Bot', 'username': FAKE_BOT_USERNAME,
+            'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False,
+        }
+
+    def sent_to(self, chat_id):
+        """Отправленные и отредактированные сообщения (словари Message) в чате chat_id, по порядку"""
+        return [
+            result for method, _, result in self.requests
+            if method in MESSAGE_METHODS and result['chat']['id'] == int(chat_id)
+        ]
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[api_method] += 1
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if api_method in THROTTLED_METHODS and self.retry_after_rate and self.rng.random() < self.retry_after_rate:
+            self.retry_afters[api_method] += 1
+            return 429, json.dumps({
+                'ok': False, 'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after},
+            }).encode('utf-8')
+        result = self._result(api_method, params)
+        self.requests.append((api_method, params, result))
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+    def _result(self, api_method, params):
+        if api_method == 'getMe':
+            return self.bot_user()
+        if api_method in MESSAGE_METHODS:
+            return self._message(params)
+        return True
+
+    def _message(self, params):
+        chat_id = int(params.get('chat_id', 0))
+        message = {
+            'message_id': params.get('message_id') or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+            'from': self.bot_user(),
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'caption' in params:
+            message['caption'] = params['caption']
+        if params.get('reply_markup'):
+            message['reply_markup'] = params['reply_markup']
+        return message
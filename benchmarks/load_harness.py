@@ -0,0 +1,381 @@
+"""Сквозной нагрузочный прогон бота на локальной MySQL и заглушке Bot API.
+
+Собирает настоящий Application через bot.build_application, подставляет
+FakeBotApi вместо Telegram и проигрывает для N одновременных пользователей
+путь «Записаться → Подтвердить запись → Я оплатил(а) онлайн / Наличными»,
+затем подтверждения оплат администратором. Нажатия берутся из кнопок,
+которые бот действительно отправил. В конце печатаются пропускная способность,
+перцентили задержек по шагам, число вызовов Database и проверки инвариантов:
+участников не больше MAX_BATH_PARTICIPANTS, ни одного повтора.
+
+    python -m benchmarks.load_harness --database bath_bot_bench --users 200 --latency-ms 30 --retry-after-rate 0.02
+
+Прогон удаляет данные синтетических пользователей и события --date, поэтому
+запуск против боевой RDS запрещен.
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+
+import config
+from config import MYSQL_CONFIG, MAX_BATH_PARTICIPANTS
+from database import Database
+from benchmarks.fake_bot_api import FakeBotApi, FAKE_BOT_ID
+from utils.callback_data import VERSION, CONFIRM_BATH, CLAIM_PAYMENT, ADMIN_CONFIRM, decode_callback
+from utils.formatting import create_bath_keyboard
+from utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+FIRST_USER_ID = 900000000
+FAKE_ADMIN_ID = 899999999
+GROUP_CHAT_ID = -1001000000001
+EVENT_MESSAGE_ID = 1000000
+DEFAULT_DATE = "07.01.2035"
+
+STEPS = ('join', 'confirm', 'claim', 'admin_confirm')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота с заглушкой Bot API")
+    parser.add_argument('--host', default=MYSQL_CONFIG['host'])
+    parser.add_argument('--port', type=int, default=MYSQL_CONFIG['port'])
+    parser.add_argument('--user', default=MYSQL_CONFIG['user'])
+    parser.add_argument('--password', default=MYSQL_CONFIG['password'])
+    parser.add_argument('--database', default=MYSQL_CONFIG['database'])
+    parser.add_argument('--users', type=int, default=100, help="число синтетических пользователей")
+    parser.add_argument('--concurrency', type=int, default=50, help="сколько пользователей проходят путь одновременно")
+    parser.add_argument('--concurrent-updates', type=int, default=config.CONCURRENT_UPDATES,
+                        help="параллельность обработки обновлений (как CONCURRENT_UPDATES)")
+    parser.add_argument('--date', default=DEFAULT_DATE, help="дата события, ДД.ММ.ГГГГ")
+    parser.add_argument('--cash-share', type=float, default=0.3, help="доля пользователей, выбирающих наличные")
+    parser.add_argument('--latency-ms', type=float, default=30.0, help="задержка ответа Bot API")
+    parser.add_argument('--jitter-ms', type=float, default=20.0, help="случайная добавка к задержке")
+    parser.add_argument('--retry-after-rate', type=float, default=0.0, help="доля запросов, получающих 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответе 429, секунды")
+    parser.add_argument('--skip-admin', action='store_true', help="не подтверждать оплаты администратором")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    return parser.parse_args()
+
+
+class DatabaseCallCounter:
+    """Считает вызовы публичных методов Database и открытые соединения во всех потоках"""
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._originals = {}
+
+    def install(self):
+        for name, attr in list(vars(Database).items()):
+            if inspect.isfunction(attr) and not name.startswith('_') and name != 'unit_of_work':
+                self._originals[name] = attr
+                setattr(Database, name, self._counted(name, attr))
+
+    def uninstall(self):
+        for name, attr in self._originals.items():
+            setattr(Database, name, attr)
+        self._originals.clear()
+
+    def _counted(self, name, func):
+        @functools.wraps(func)
+        def counted(*args, **kwargs):
+            with self._lock:
+                self.counts[name] += 1
+            return func(*args, **kwargs)
+        return counted
+
+
+def _execute(db, query, params=()):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall() if cursor.with_rows else None
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def cleanup(db, date_str, user_ids):
+    """Удаляет следы прогона: событие date_str и данные синтетических пользователей"""
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    for table in ('bath_participants', 'pending_payments', 'bath_invites'):
+        _execute(db, f'DELETE FROM {table} WHERE date_str = %s', (date_str,))
+    for table, column in (('user_profiles', 'user_id'), ('active_users', 'user_id'), ('bot_user_data', 'user_id')):
+        _execute(db, f'DELETE FROM {table} WHERE {column} IN ({placeholders})', tuple(user_ids))
+
+
+def seed_profiles(db, user_ids):
+    """Профили нужны, чтобы администратор мог подтвердить оплату (иначе PROFILE_MISSING)"""
+    for user_id in user_ids:
+        db.save_user_profile(user_id, f"load{user_id}", f"Load User {user_id}", "01.01.1990", "test", "", "")
+
+
+def check_invariants(db, fake, date_str, user_ids, admin_id):
+    """Возвращает список нарушений: переполнение события и повторы записей и сообщений"""
+    violations = []
+    rows = _execute(db, '''
+        SELECT user_id, COUNT(*) FROM bath_participants WHERE date_str = %s AND user_id <> 0 GROUP BY user_id
+    ''', (date_str,))
+    participants = len(rows)
+    if participants > MAX_BATH_PARTICIPANTS:
+        violations.append(f"переполнение: {participants} участников при лимите {MAX_BATH_PARTICIPANTS}")
+    duplicates = [user_id for user_id, count in rows if count > 1]
+    if duplicates:
+        violations.append(f"повторные записи в bath_participants: {duplicates[:10]}")
+    pending = _execute(db, '''
+        SELECT user_id FROM pending_payments WHERE date_str = %s GROUP BY user_id HAVING COUNT(*) > 1
+    ''', (date_str,))
+    if pending:
+        violations.append(f"повторные заявки на оплату: {[row[0] for row in pending][:10]}")
+    invites = [user_id for user_id in user_ids if len(_buttons(fake.sent_to(user_id), CONFIRM_BATH)) > 1]
+    if invites:
+        violations.append(f"повторные приглашения в личку: {invites[:10]}")
+    claims = Counter(
+        decode_callback(data)[1]['user_id'] for _, data in _buttons(fake.sent_to(admin_id), ADMIN_CONFIRM)
+    )
+    repeated = [user_id for user_id, count in claims.items() if count > 1]
+    if repeated:
+        violations.append(f"повторные уведомления администратору: {repeated[:10]}")
+    return participants, violations
+
+
+def _buttons(messages, action):
+    """(сообщение, callback_data) кнопок действия action в отправленных сообщениях, по порядку"""
+    result = []
+    for message in messages:
+        markup = message.get('reply_markup') or {}
+        for row in markup.get('inline_keyboard', []):
+            for button in row:
+                data = button.get('callback_data') or ''
+                if data[:2] == VERSION + action:
+                    result.append((message, data))
+    return result
+
+
+class LoadRun:
+    """Один прогон: подает обновления в Application и замеряет каждый шаг"""
+    def __init__(self, application, fake, args, admin_id):
+        self.application = application
+        self.fake = fake
+        self.args = args
+        self.admin_id = admin_id
+        self.rng = random.Random(args.seed)
+        self.histograms = {step: LatencyHistogram() for step in STEPS + ('flow',)}
+        self.outcomes = Counter()
+        self.errors = Counter()
+        self.updates = 0
+        self._update_ids = iter(range(1, 10 ** 9))
+
+    def _callback_update(self, user, chat, message_id, data):
+        update_id = next(self._update_ids)
+        return Update.de_json({
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': user,
+                'chat_instance': str(chat['id']),
+                'data': data,
+                'message': {
+                    'message_id': message_id, 'date': int(time.time()), 'chat': chat,
+                    'from': self.fake.bot_user(), 'text': '',
+                },
+            },
+        }, self.application.bot)
+
+    async def feed(self, step, update):
+        """Обрабатывает обновление так же, как после получения из update_queue"""
+        started = time.perf_counter()
+        try:
+            await self.application.update_processor.process_update(
+                update, self.application.process_update(update)
+            )
+        except Exception as e:
+            self.errors[f"{step}: {type(e).__name__}"] += 1
+        self.histograms[step].record(time.perf_counter() - started)
+        self.updates += 1
+
+    async def user_flow(self, user_id, join_data):
+        started = time.perf_counter()
+        user = {'id': user_id, 'is_bot': False, 'first_name': 'Load', 'last_name': str(user_id), 'username': f"load{user_id}"}
+        private = {'id': user_id, 'type': 'private'}
+        group = {'id': GROUP_CHAT_ID, 'type': 'supergroup'}
+
+        await self.feed('join', self._callback_update(user, group, EVENT_MESSAGE_ID, join_data))
+        invites = _buttons(self.fake.sent_to(user_id), CONFIRM_BATH)
+        if not invites:
+            self.outcomes['отказ при записи'] += 1
+            return
+        message, data = invites[-1]
+        message_id = message['message_id']
+
+        await self.feed('confirm', self._callback_update(user, private, message_id, data))
+        payment_type = 'cash' if self.rng.random() < self.args.cash_share else 'online'
+        claims = [
+            data for _, data in _buttons(self.fake.sent_to(user_id), CLAIM_PAYMENT)
+            if decode_callback(data)[1]['payment_type'] == payment_type
+        ]
+        if not claims:
+            self.outcomes['отказ при подтверждении'] += 1
+            return
+
+        await self.feed('claim', self._callback_update(user, private, message_id, claims[-1]))
+        self.outcomes[f"заявка ({payment_type})"] += 1
+        self.histograms['flow'].record(time.perf_counter() - started)
+
+    async def admin_flow(self):
+        admin = {'id': self.admin_id, 'is_bot': False, 'first_name': 'Admin', 'username': 'load_admin'}
+        private = {'id': self.admin_id, 'type': 'private'}
+        for message, data in _buttons(self.fake.sent_to(self.admin_id), ADMIN_CONFIRM):
+            await self.feed('admin_confirm', self._callback_update(admin, private, message['message_id'], data))
+
+
+async def run(args, db, admin_id, user_ids):
+    from bot import build_application
+    from services.tasks import background_tasks
+
+    fake = FakeBotApi(
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+        retry_after_rate=args.retry_after_rate, retry_after=args.retry_after, seed=args.seed,
+    )
+    application = build_application(
+        token=f"{FAKE_BOT_ID}:LOAD", request=fake, concurrent_updates=args.concurrent_updates
+    )
+    join_data = create_bath_keyboard(args.date).inline_keyboard[0][0].callback_data
+    load = LoadRun(application, fake, args, admin_id)
+
+    # Периодические задачи (напоминания, cash_list) не относятся к замеру
+    application.bot_data['scheduler'].jobs.clear()
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    try:
+        started = time.perf_counter()
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def limited(user_id):
+            async with limit:
+                await load.user_flow(user_id, join_data)
+        await asyncio.gather(*(limited(user_id) for user_id in user_ids))
+        users_elapsed = time.perf_counter() - started
+        # Кнопки администратора рассылаются фоновыми задачами после ответа пользователю
+        await background_tasks.join()
+        if not args.skip_admin:
+            await load.admin_flow()
+        elapsed = time.perf_counter() - started
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+    return load, fake, users_elapsed, elapsed
+
+
+def _percentiles(histogram):
+    return {
+        'count': histogram.count,
+        'p50_ms': round(histogram.percentile(0.5) * 1000, 1),
+        'p95_ms': round(histogram.percentile(0.95) * 1000, 1),
+        'p99_ms': round(histogram.percentile(0.99) * 1000, 1),
+        'max_ms': round(histogram.max * 1000, 1),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+
+    local_config = {
+        'host': args.host, 'port': args.port, 'user': args.user,
+        'password': args.password, 'database': args.database,
+    }
+    if args.host == config.RDS_CONFIG.get('host'):
+        print("Нагрузочный прогон изменяет данные: запуск против боевой RDS запрещен.")
+        raise SystemExit(2)
+    # Общий экземпляр get_database() берет конфиг по умолчанию при импорте обработчиков,
+    # поэтому подменяем его до импорта bot
+    config.RDS_CONFIG.clear()
+    config.RDS_CONFIG.update(local_config)
+    config.HEALTH_PORT = 0
+    if not config.ADMIN_IDS:
+        config.ADMIN_IDS.append(FAKE_ADMIN_ID)
+    admin_id = config.ADMIN_IDS[0]
+
+    counter = DatabaseCallCounter()
+    db = Database(file_path=os.devnull, config=local_config)
+    user_ids = [FIRST_USER_ID + index for index in range(args.users)]
+    cleanup(db, args.date, user_ids)
+    seed_profiles(db, user_ids)
+
+    counter.install()
+    try:
+        load, fake, users_elapsed, elapsed = asyncio.run(run(args, db, admin_id, user_ids))
+    finally:
+        counter.uninstall()
+    participants, violations = check_invariants(db, fake, args.date, user_ids, admin_id)
+    cleanup(db, args.date, user_ids)
+
+    print(f"Пользователей: {args.users}, одновременно: {args.concurrency}, "
+          f"параллельность обработки: {args.concurrent_updates}")
+    print(f"Обновлений: {load.updates} за {elapsed:.2f} с — {load.updates / elapsed:.1f} обновл./с; "
+          f"путь пользователей {args.users / users_elapsed:.1f} польз./с")
+    for step, histogram in load.histograms.items():
+        if histogram.count:
+            stats = _percentiles(histogram)
+            print(f"  {step:<14} {stats['count']:>6}  p50 {stats['p50_ms']:>8.1f}  p95 {stats['p95_ms']:>8.1f}  "
+                  f"p99 {stats['p99_ms']:>8.1f}  max {stats['max_ms']:>8.1f} мс")
+    print("Исходы: " + ", ".join(f"{name}: {count}" for name, count in sorted(load.outcomes.items())))
+    if load.errors:
+        print("Исключения: " + ", ".join(f"{name}: {count}" for name, count in sorted(load.errors.items())))
+    print(f"Вызовов Bot API: {sum(fake.calls.values())}, из них 429: {sum(fake.retry_afters.values())}")
+    db_calls = sum(counter.counts.values()) - counter.counts['get_connection']
+    print(f"Вызовов Database: {db_calls}, соединений: {counter.counts['get_connection']}, "
+          f"на обновление: {counter.counts['get_connection'] / max(load.updates, 1):.2f}")
+    for name, count in counter.counts.most_common(12):
+        print(f"  {name:<36} {count:>7}")
+    print(f"Участников: {participants} (лимит {MAX_BATH_PARTICIPANTS})")
+    for violation in violations:
+        print(f"НАРУШЕНИЕ: {violation}")
+
+    if args.output:
+        report = {
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'concurrent_updates': args.concurrent_updates,
+            'bot_api': {'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+                        'retry_after_rate': args.retry_after_rate},
+            'updates': load.updates,
+            'elapsed_s': round(elapsed, 3),
+            'updates_per_sec': round(load.updates / elapsed, 1),
+            'steps': {step: _percentiles(histogram) for step, histogram in load.histograms.items()},
+            'outcomes': dict(load.outcomes),
+            'errors': dict(load.errors),
+            'bot_api_calls': dict(fake.calls),
+            'bot_api_retry_after': dict(fake.retry_afters),
+            'db_calls': dict(counter.counts),
+            'participants': participants,
+            'violations': violations,
+        }
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    if violations:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
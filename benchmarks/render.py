@@ -0,0 +1,89 @@
+"""Микробенчмарк рендера сообщения о бане: прежняя сборка строк, новая сборка и кеш.
+
+База не нужна — участники берутся из памяти:
+
+    python -m benchmarks.render --participants 20 --iterations 20000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import BATH_TIME, BATH_COST, MAX_BATH_PARTICIPANTS, CARD_PAYMENT_LINK, REVOLUT_PAYMENT_LINK, BATH_LOCATION
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from utils.formatting import RenderCache, build_bath_message
+
+DATE_STR = "05.01.2025"
+
+
+class MemoryDatabase:
+    def __init__(self, participants):
+        self.participants = participants
+
+    def get_bath_participants(self, date_str):
+        return list(self.participants)
+
+
+def legacy_render(date_str, db):
+    """Рендер в том виде, в котором он был до кеша: запрос, конкатенация и новая клавиатура"""
+    participants = db.get_bath_participants(date_str)
+    message = f"НОВАЯ ЗАПИСЬ В БАНЮ👇\n\n"
+    message += f"Время: {BATH_TIME} ‼️\n\n"
+    message += f"Дата: ВОСКРЕСЕНЬЕ {date_str}\n\n"
+    message += f"Cтоимость: {BATH_COST} карта либо наличка при входе📍\n\n"
+    message += f"Список участников (максимум {MAX_BATH_PARTICIPANTS} человек):\n"
+    for i, participant in enumerate(participants, 1):
+        paid_status = "✅" if participant["paid"] else "❌"
+        message += f"{i}. {participant['username']} {paid_status}\n"
+    if len(participants) == 0:
+        message += "Пока никто не записался\n"
+    message += f"\nОплата:\n"
+    message += f"КАРТА\n{CARD_PAYMENT_LINK}\n"
+    message += f"Revolut\n{REVOLUT_PAYMENT_LINK}\n\n"
+    message += f"Локация: {BATH_LOCATION}\n\n"
+    if len(participants) < MAX_BATH_PARTICIPANTS:
+        message += f"Для записи:\n"
+        message += f"1. Нажмите кнопку 'Записаться' ниже\n"
+        message += f"2. Следуйте инструкциям бота в личном чате\n"
+        message += f"3. Оплатите участие и подтвердите оплату через бота\n"
+        message += f"4. Ожидайте подтверждения от администратора"
+    else:
+        message += f"\n❗️Лимит участников достигнут. Запись закрыта.\n"
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Записаться", callback_data=f"join_bath_{date_str}")]])
+    return message, keyboard
+
+
+def measure(name, func, iterations):
+    seconds = min(timeit.repeat(func, number=iterations, repeat=5))
+    per_call_us = seconds / iterations * 1_000_000
+    print(f"{name:<28} {per_call_us:8.2f} мкс/вызов")
+    return per_call_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение стоимости рендера сообщения о бане")
+    parser.add_argument('--participants', type=int, default=MAX_BATH_PARTICIPANTS)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    participants = [{'username': f"user{i}", 'paid': i % 2 == 0} for i in range(args.participants)]
+    db = MemoryDatabase(participants)
+    cache = RenderCache()
+    assert legacy_render(DATE_STR, db)[0] == build_bath_message(DATE_STR, participants)
+
+    def changed_render():
+        # Каждый вызов после изменения участников: кеш промахивается
+        cache.invalidate(DATE_STR)
+        return cache.render(DATE_STR, db)
+
+    print(f"Участников: {args.participants}, итераций: {args.iterations}")
+    before = measure("до (конкатенация)", lambda: legacy_render(DATE_STR, db), args.iterations)
+    measure("после, промах кеша", changed_render, args.iterations)
+    after = measure("после, попадание в кеш", lambda: cache.render(DATE_STR, db), args.iterations)
+    print(f"Ускорение при попадании: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
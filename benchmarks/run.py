@@ -0,0 +1,257 @@
+"""Бенчмарки слоя данных (методов Database) на синтетическом наборе данных.
+
+Запуск против локальной MySQL (параметры по умолчанию берутся из MYSQL_CONFIG):
+
+    python -m benchmarks.run --database bath_bot_bench --output bench.json
+
+Бенчмарки очищают и перезаписывают таблицы целевой базы, поэтому запуск
+против боевой RDS запрещен.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MYSQL_CONFIG, RDS_CONFIG, MAX_BATH_PARTICIPANTS
+from database import Database
+from benchmarks.dataset import generate_dataset, load_dataset
+
+logger = logging.getLogger(__name__)
+
+ROLLOVER_DATE = "01.01.2000"
+
+
+class BenchContext:
+    """Общие данные бенчмарков: база, метаданные набора и генератор случайных чисел"""
+    def __init__(self, db, meta, seed):
+        self.db = db
+        self.meta = meta
+        self.rng = random.Random(seed)
+        self.date_str = meta['anchor_date']
+        self.user_ids = meta['user_ids']
+
+    def random_user(self):
+        return self.rng.choice(self.user_ids)
+
+    def outsider(self):
+        """Пользователь, гарантированно не записанный на текущее событие"""
+        return 900000000 + self.rng.randint(0, 10_000_000)
+
+
+def _execute(db, query, params=()):
+    conn = db.get_connection()
+    try:
+        conn.cursor().execute(query, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Каждый бенчмарк: (setup, измеряемый вызов, teardown). setup возвращает аргумент для вызова.
+def _bench_participants(ctx):
+    return None, lambda _: ctx.db.get_bath_participants(ctx.date_str), None
+
+
+def _bench_participants_profiles(ctx):
+    return None, lambda _: ctx.db.get_bath_participants_profiles(ctx.date_str), None
+
+
+def _bench_user_profile(ctx):
+    return ctx.random_user, lambda user_id: ctx.db.get_user_profile(user_id), None
+
+
+def _bench_user_history(ctx):
+    return ctx.random_user, lambda user_id: ctx.db.get_user_bath_history(user_id), None
+
+
+def _bench_statistics(ctx):
+    return None, lambda _: ctx.db.get_bath_statistics(), None
+
+
+def _bench_export(ctx):
+    return None, lambda _: ctx.db.get_all_user_profiles(), None
+
+
+def _bench_active_users(ctx):
+    return None, lambda _: ctx.db.get_all_active_users(), None
+
+
+def _bench_reminders(ctx):
+    return None, lambda _: ctx.db.get_pending_payments_for_reminder(hours=4, limit=100), None
+
+
+def _bench_format_message(ctx):
+    from utils.formatting import format_bath_message
+    return None, lambda _: format_bath_message(ctx.date_str, ctx.db), None
+
+
+def _bench_register(ctx):
+    def call(user_id):
+        ctx.db.register_participant(ctx.date_str, user_id, f"bench{user_id}", MAX_BATH_PARTICIPANTS)
+        return user_id
+    return ctx.outsider, call, lambda user_id: ctx.db.remove_bath_participant(ctx.date_str, user_id)
+
+
+def _bench_claim_payment(ctx):
+    return (
+        ctx.outsider,
+        lambda user_id: ctx.db.claim_payment(user_id, f"bench{user_id}", ctx.date_str, 'online'),
+        lambda user_id: ctx.db.delete_pending_payment(user_id, ctx.date_str),
+    )
+
+
+def _bench_confirm_payment(ctx):
+    def setup():
+        user_id = ctx.random_user()
+        ctx.db.remove_bath_participant(ctx.date_str, user_id)
+        ctx.db.claim_payment(user_id, f"user{user_id}", ctx.date_str, 'cash')
+        return user_id
+    return (
+        setup,
+        lambda user_id: ctx.db.confirm_payment(user_id, ctx.date_str, 'cash'),
+        lambda user_id: ctx.db.remove_bath_participant(ctx.date_str, user_id),
+    )
+
+
+def _bench_rollover(ctx):
+    def setup():
+        for user_id in ctx.rng.sample(ctx.user_ids, MAX_BATH_PARTICIPANTS):
+            ctx.db.add_bath_participant(ROLLOVER_DATE, user_id, f"user{user_id}")
+    return (
+        setup,
+        lambda _: ctx.db.clear_previous_bath_events(except_date_str=ctx.date_str),
+        lambda _: _execute(ctx.db, "DELETE FROM bath_history WHERE date_str = %s", (ROLLOVER_DATE,)),
+    )
+
+
+BENCHMARKS = {
+    'get_bath_participants': _bench_participants,
+    'get_bath_participants_profiles': _bench_participants_profiles,
+    'get_user_profile': _bench_user_profile,
+    'get_user_bath_history': _bench_user_history,
+    'get_bath_statistics': _bench_statistics,
+    'get_all_user_profiles': _bench_export,
+    'get_all_active_users': _bench_active_users,
+    'get_pending_payments_for_reminder': _bench_reminders,
+    'format_bath_message': _bench_format_message,
+    'register_participant': _bench_register,
+    'claim_payment': _bench_claim_payment,
+    'confirm_payment': _bench_confirm_payment,
+    'clear_previous_bath_events': _bench_rollover,
+}
+
+
+def run_benchmark(ctx, factory, iterations, warmup):
+    """Выполняет бенчмарк и возвращает статистику времени одного вызова в миллисекундах"""
+    setup, call, teardown = factory(ctx)
+    timings = []
+    for index in range(warmup + iterations):
+        arg = setup() if setup else None
+        started = time.perf_counter()
+        call(arg)
+        elapsed = time.perf_counter() - started
+        if teardown:
+            teardown(arg)
+        if index >= warmup:
+            timings.append(elapsed * 1000)
+    timings.sort()
+    p95_index = min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))
+    return {
+        'iterations': iterations,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p95_ms': round(timings[p95_index], 3),
+        'max_ms': round(timings[-1], 3),
+        'ops_per_sec': round(1000 / statistics.fmean(timings), 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарки слоя данных бота")
+    parser.add_argument('--host', default=MYSQL_CONFIG['host'])
+    parser.add_argument('--port', type=int, default=MYSQL_CONFIG['port'])
+    parser.add_argument('--user', default=MYSQL_CONFIG['user'])
+    parser.add_argument('--password', default=MYSQL_CONFIG['password'])
+    parser.add_argument('--database', default=MYSQL_CONFIG['database'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--weeks', type=int, default=156)
+    parser.add_argument('--participants', type=int, default=15)
+    parser.add_argument('--pending', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="запустить только указанные бенчмарки")
+    parser.add_argument('--skip-load', action='store_true', help="не перезагружать набор данных")
+    parser.add_argument('--output', default=None, help="JSON-файл с результатами")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+
+    config = {
+        'host': args.host, 'port': args.port, 'user': args.user,
+        'password': args.password, 'database': args.database,
+    }
+    if args.host == RDS_CONFIG.get('host'):
+        print("Бенчмарки перезаписывают данные: запуск против боевой RDS запрещен.")
+        raise SystemExit(2)
+
+    state_file = os.path.join(tempfile.gettempdir(), 'bath_bot_bench_data.json')
+    db = Database(file_path=state_file, config=config)
+
+    dataset = generate_dataset(
+        seed=args.seed, users=args.users, weeks=args.weeks, participants=args.participants,
+        pending=args.pending, max_participants=MAX_BATH_PARTICIPANTS
+    )
+    if not args.skip_load:
+        started = time.perf_counter()
+        conn = db.get_connection()
+        try:
+            load_dataset(conn, dataset)
+        finally:
+            conn.close()
+        print(f"Набор данных загружен за {time.perf_counter() - started:.2f} с")
+
+    meta = dataset['meta']
+    ctx = BenchContext(db, meta, args.seed)
+    results = {}
+    for name in args.only or BENCHMARKS:
+        results[name] = run_benchmark(ctx, BENCHMARKS[name], args.iterations, args.warmup)
+        stats = results[name]
+        print(f"{name:<36} median {stats['median_ms']:>9.3f} ms  p95 {stats['p95_ms']:>9.3f} ms  {stats['ops_per_sec']:>8.1f} ops/s")
+
+    report = {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'backend': 'mysql',
+        'dataset': {key: value for key, value in meta.items() if key != 'user_ids'},
+        'iterations': args.iterations,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
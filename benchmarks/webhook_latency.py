@@ -0,0 +1,97 @@
+"""Нагрузочная проверка webhook: отправляет синтетические обновления и измеряет задержку ответа.
+
+Бот запускается локально в режиме webhook (WEBHOOK_URL задан), затем:
+
+    python -m benchmarks.webhook_latency --url http://127.0.0.1:8443/telegram --requests 1000 --concurrency 20
+
+Обновления — текстовые сообщения в личном чате, которые не совпадают ни с одним
+обработчиком, поэтому измеряется прием обновления, а не работа хендлеров.
+Перед замером проверяется, что запрос с неверным секретом отклоняется.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def make_update(update_id, user_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': 'Bench'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': f"benchmark {update_id}",
+        },
+    }
+
+
+def percentile(values, fraction):
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+async def run(url, secret, requests, concurrency, first_update_id, user_id):
+    semaphore = asyncio.Semaphore(concurrency)
+    timings, errors = [], []
+
+    async with httpx.AsyncClient(timeout=10) as client:
+        response = await client.post(url, json=make_update(first_update_id - 1, user_id),
+                                     headers={SECRET_HEADER: 'wrong-secret'})
+        if response.status_code != 403:
+            print(f"Внимание: запрос с неверным секретом вернул {response.status_code}, ожидался 403")
+
+        async def send(update_id):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=make_update(update_id, user_id),
+                                                 headers={SECRET_HEADER: secret})
+                except httpx.HTTPError as e:
+                    errors.append(str(e))
+                    return
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors.append(f"HTTP {response.status_code}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(first_update_id + index) for index in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    timings.sort()
+    if not timings:
+        print(f"Ни один запрос не выполнен: {errors[:5]}")
+        return
+    print(f"Запросов: {requests}, параллельно: {concurrency}, ошибок: {len(errors)}")
+    print(f"Пропускная способность: {len(timings) / elapsed:.1f} запросов/с")
+    print(
+        f"Задержка, мс: min {timings[0]:.2f}  p50 {statistics.median(timings):.2f}  "
+        f"p95 {percentile(timings, 0.95):.2f}  p99 {percentile(timings, 0.99):.2f}  max {timings[-1]:.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер задержки приема обновлений через webhook")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+    parser.add_argument('--secret', default=WEBHOOK_SECRET)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--first-update-id', type=int, default=10_000_000)
+    parser.add_argument('--user-id', type=int, default=999_000_001)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.secret, args.requests, args.concurrency, args.first_update_id, args.user_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,222 @@
+# Первым: отсчет фаз запуска начинается до импорта остальных модулей
+from services.startup import startup, READY_GROUP, FIRST_UPDATE_GROUP
+import argparse
 import logging
+from time import monotonic
 from logger import get_logger
-from config import BOT_TOKEN
-from database import Database
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
-from datetime import datetime, time
-import pytz
+from config import (
+    BOT_TOKEN, PAYMENT_REMINDER_INTERVAL_MINUTES, SEAT_HOLD_CHECK_MINUTES, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT,
+    WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS, HEALTH_PORT, CONCURRENT_UPDATES,
+    JOB_RUNS_RETENTION_DAYS, ROLLOVER_WEEKDAY, ROLLOVER_TIME
+)
+from database import get_database, on_participants_changed
+from telegram import Update
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler, TypeHandler
+import asyncio
+from datetime import datetime, time, timedelta
 
 # Импорт обработчиков
-from handlers.bath import start, register_bath, create_bath_event, button_callback, confirm_bath_registration, handle_payment_confirmation, admin_confirm_payment, admin_decline_payment, handle_deep_link
+from handlers.bath import start, register_bath, create_bath_event, button_callback, handle_deep_link, CALLBACK_HANDLERS, get_next_sunday
 from handlers.profile import profile, handle_profile_update, handle_full_name, handle_birth_date, handle_occupation, handle_instagram, handle_skills, start_profile_callback, export_profiles, cancel, history, handle_profile_update_text, PROFILE, FULL_NAME, BIRTH_DATE, OCCUPATION, INSTAGRAM, SKILLS
-from handlers.admin import mark_paid, add_subscriber, remove_subscriber, update_commands, mention_all, mark_visit, clear_db, remove_registration, cash_list
+from handlers.admin import mark_paid, add_subscriber, remove_subscriber, update_commands, mention_all, mark_visit, clear_db, remove_registration, cash_list, broadcast, broadcast_cancel, perf, cpu_profile, jobs, rollover_reset
+from services.notification import send_payment_reminders, notify_admins, MessageDispatcher
+from services.broadcast import resume_broadcasts, stop_broadcasts
+from services.pinned_message import PinnedMessageUpdater
+from services.persistence import DatabasePersistence
+from services.profiler import cpu_profiler
+from services.scheduler import JobScheduler, ScheduledJob, Daily, Every, CATCH_UP_LATEST
+from services.rollover import WeeklyRollover, format_report
+from services.admission import admission
+from services.waitlist import Waitlist
+from services.tasks import background_tasks
+from utils.http import HttpServer
+from utils.idempotency import callback_dedup
+from utils.locks import PerUserUpdateProcessor
+from utils.metrics import handler_metrics
 
 logger = get_logger(__name__)
-db = Database()
+db = get_database()
+startup.mark('imports')
+
+
+def webhook_enabled():
+    """Webhook используется, если задан WEBHOOK_URL и установлен веб-сервер PTB (tornado)"""
+    if not WEBHOOK_URL:
+        return False
+    try:
+        import tornado  # noqa: F401
+    except ImportError:
+        logger.warning("WEBHOOK_URL задан, но python-telegram-bot[webhooks] не установлен — используется polling")
+        return False
+    return True
+
+
+def health_handler(application):
+    started = monotonic()
+
+    async def health():
+        dispatcher = application.bot_data.get('dispatcher')
+        return 200, 'application/json', {
+            'status': 'ok' if application.running else 'starting',
+            'mode': application.bot_data.get('run_mode'),
+            'uptime_s': round(monotonic() - started),
+            'db_ready': db.schema_ready,
+            'update_queue': application.update_queue.qsize(),
+            'outbound_queue': dispatcher.queue_size() if dispatcher else 0,
+            'admission_queue': admission.queue_size(),
+            'duplicate_callbacks': callback_dedup.stats['duplicates'],
+            'background_tasks': len(background_tasks),
+        }
+    return health
+
+
+async def metrics_handler():
+    return 200, 'text/plain; version=0.0.4', handler_metrics.render_prometheus()
+
+
+async def post_init(application: Application):
+    """Запускает фоновые службы: диспетчер сообщений, обновление закрепа, продолжение рассылок"""
+    startup.mark('initialize')
+    # Схема базы проверяется в фоне, одновременно с первым getUpdates
+    startup.begin_schema_check(db)
+    dispatcher = MessageDispatcher(application.bot)
+    dispatcher.start()
+    application.bot_data['dispatcher'] = dispatcher
+    # Закрепленное сообщение события обновляется при каждом изменении списка участников
+    updater = PinnedMessageUpdater(application, db)
+    updater.start()
+    on_participants_changed(updater.mark_dirty)
+    application.bot_data['pinned_updater'] = updater
+    # Освободившиеся места предлагаются листу ожидания по событию изменения участников
+    waitlist = Waitlist(application, db)
+    waitlist.start()
+    application.bot_data['waitlist'] = waitlist
+    application.bot_data['scheduler'].start(application)
+    # Рассылки, прерванные перезапуском, продолжаются, когда бот уже принимает обновления
+    application.job_queue.run_once(resume_broadcasts, when=5, name="broadcast_resume")
+    if isinstance(application.persistence, DatabasePersistence):
+        application.job_queue.run_repeating(
+            application.persistence.evict_idle, interval=15 * 60, first=15 * 60, name="persistence_evict"
+        )
+    if HEALTH_PORT:
+        http_server = HttpServer(WEBHOOK_LISTEN, HEALTH_PORT, {
+            '/health': health_handler(application),
+            '/metrics': metrics_handler,
+        })
+        await http_server.start()
+        application.bot_data['http_server'] = http_server
+    startup.mark('post_init')
+
+
+async def post_shutdown(application: Application):
+    http_server = application.bot_data.pop('http_server', None)
+    if http_server:
+        await http_server.stop()
+    await stop_broadcasts(application)
+    await cpu_profiler.stop()
+    scheduler = application.bot_data.get('scheduler')
+    if scheduler:
+        await scheduler.stop()
+        logger.info("Планировщик остановлен: %s", scheduler.stats)
+    await startup.stop()
+    updater = application.bot_data.pop('pinned_updater', None)
+    if updater:
+        await updater.stop()
+        logger.info("Обновление закрепленного сообщения: %s", updater.stats)
+    # Личные сообщения очереди допуска, листа ожидания и фоновых задач идут через диспетчер, поэтому они останавливаются раньше
+    await admission.stop()
+    await background_tasks.stop()
+    logger.info("Фоновые задачи: %s", background_tasks.stats)
+    waitlist = application.bot_data.pop('waitlist', None)
+    if waitlist:
+        await waitlist.stop()
+        logger.info("Лист ожидания: %s", waitlist.stats)
+    dispatcher = application.bot_data.pop('dispatcher', None)
+    if dispatcher:
+        await dispatcher.stop()
+        logger.info("Диспетчер сообщений остановлен: %s", dispatcher.stats)
+
+
+async def cash_list_job(context):
+    await cash_list(None, context, silent=True)
+
+
+async def seat_holds_job(context):
+    """Снимает истекшие приглашения и неоплаченные места листа ожидания; освободившиеся места уходят листу ожидания"""
+    dates = await asyncio.to_thread(db.expire_seat_holds)
+    if dates:
+        logger.info("Сняты истекшие удержания мест: %s", ", ".join(dates))
 
-if __name__ == "__main__":
-    application = Application.builder().token(BOT_TOKEN).build()
+
+async def maintenance_job(context):
+    """Удаляет старые записи журнала запусков"""
+    pruned = await asyncio.to_thread(db.prune_job_runs, JOB_RUNS_RETENTION_DAYS)
+    logger.info("Обслуживание: удалено записей о запусках задач: %s", pruned)
+
+
+async def rollover_job(context):
+    """Автоматическая смена недели: событие на следующее воскресенье"""
+    date_str = get_next_sunday()
+    try:
+        report = await context.bot_data['rollover'].run(context, date_str)
+    except Exception as e:
+        await notify_admins(context, f"Автоматическая смена недели на {date_str} не удалась: {e}\n"
+                                     f"Команда /create_bath продолжит с прерванного этапа.")
+        raise
+    logger.info(format_report(date_str, report))
+
+
+def create_scheduler():
+    """Периодические задачи; каждый запуск записывается в job_runs"""
+    scheduler = JobScheduler(db)
+    # Список наличных администраторам в 10:00; после перезапуска догоняется в течение 3 часов
+    scheduler.add(ScheduledJob(
+        'cash_list_auto', cash_list_job, Daily(time(hour=10, minute=0)),
+        catch_up=CATCH_UP_LATEST, grace=timedelta(hours=3)
+    ))
+    # Напоминания об ожидающих подтверждения оплатах; пропущенный запуск не нужен — следующий скоро
+    scheduler.add(ScheduledJob(
+        'payment_reminders', send_payment_reminders, Every(PAYMENT_REMINDER_INTERVAL_MINUTES * 60)
+    ))
+    # Истекшие удержания мест; пропущенный запуск не нужен — следующий скоро
+    scheduler.add(ScheduledJob(
+        'seat_holds', seat_holds_job, Every(SEAT_HOLD_CHECK_MINUTES * 60)
+    ))
+    # Смена недели после бани; пропущенную догоняем в течение двух дней — дата та же
+    hour, minute = map(int, ROLLOVER_TIME.split(':'))
+    scheduler.add(ScheduledJob(
+        'weekly_rollover', rollover_job, Daily(time(hour=hour, minute=minute), days=[ROLLOVER_WEEKDAY]),
+        catch_up=CATCH_UP_LATEST, grace=timedelta(days=2)
+    ))
+    scheduler.add(ScheduledJob(
+        'maintenance', maintenance_job, Daily(time(hour=4, minute=0)),
+        catch_up=CATCH_UP_LATEST, grace=timedelta(hours=20)
+    ))
+    return scheduler
+
+
+def unknown_command(update, context):
+    logger.warning("Неизвестная команда: %s", update.message.text)
+    return update.message.reply_text("Неизвестная команда. Пожалуйста, используйте меню.")
+
+
+def build_application(token=BOT_TOKEN, request=None, persistence=None, concurrent_updates=CONCURRENT_UPDATES):
+    """Собирает Application со всеми обработчиками и планировщиком задач, не запуская его.
+
+    request — свой BaseRequest для обращений к Bot API (нагрузочный стенд
+    подставляет заглушку), persistence — хранилище состояния вместо
+    DatabasePersistence.
+    """
+    builder = (
+        Application.builder().token(token)
+        .persistence(DatabasePersistence(db) if persistence is None else persistence)
+        .post_init(post_init).post_shutdown(post_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    if concurrent_updates > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(concurrent_updates))
+    application = builder.build()
 
     # Регистрация команд
     application.add_handler(CommandHandler("start", start))
@@ -31,6 +232,12 @@ if __name__ == "__main__":
     application.add_handler(CommandHandler("mark_visit", mark_visit))
     application.add_handler(CommandHandler("remove_registration", remove_registration))
     application.add_handler(CommandHandler("history", history))
+    application.add_handler(CommandHandler("broadcast", broadcast))
+    application.add_handler(CommandHandler("broadcast_cancel", broadcast_cancel))
+    application.add_handler(CommandHandler("perf", perf))
+    application.add_handler(CommandHandler("cpu_profile", cpu_profile))
+    application.add_handler(CommandHandler("jobs", jobs))
+    application.add_handler(CommandHandler("rollover_reset", rollover_reset))
 
     # ConversationHandler для профиля
     profile_conv_handler = ConversationHandler(
@@ -69,30 +276,54 @@ if __name__ == "__main__":
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="profile",
+        persistent=True,
     )
     application.add_handler(profile_conv_handler)
 
     # Callback-и
-    application.add_handler(CallbackQueryHandler(confirm_bath_registration, pattern="^confirm_bath_"))
-    application.add_handler(CallbackQueryHandler(handle_payment_confirmation, pattern="^paid_bath_"))
-    application.add_handler(CallbackQueryHandler(handle_payment_confirmation, pattern="^cash_bath_"))
-    application.add_handler(CallbackQueryHandler(admin_confirm_payment, pattern="^admin_confirm_"))
-    application.add_handler(CallbackQueryHandler(admin_decline_payment, pattern="^admin_decline_"))
+    # Все inline-кнопки разбирает button_callback (см. handlers.bath.CALLBACK_HANDLERS)
     application.add_handler(CallbackQueryHandler(button_callback))
 
     # Неизвестная команда
-    def unknown_command(update, context):
-        logger.warning(f"Неизвестная команда: {update.message.text}")
-        return update.message.reply_text("Неизвестная команда. Пожалуйста, используйте меню.")
     application.add_handler(MessageHandler(filters.COMMAND, unknown_command))
 
-    # Автоматическая отправка cash_list по воскресеньям в 10:00
-    warsaw_tz = pytz.timezone('Europe/Warsaw')
-    application.job_queue.run_daily(
-        lambda context: cash_list(None, context, silent=True),
-        time=time(hour=10, minute=0, tzinfo=warsaw_tz),
-        name="cash_list_auto"
+    # Замер времени всех обработчиков (/perf, /metrics); после регистрации обработчиков
+    handler_metrics.install(application, tables=(CALLBACK_HANDLERS,))
+    # Ожидание проверки схемы и отметка первого обновления; не оборачиваются метриками
+    application.add_handler(TypeHandler(Update, startup.wait_ready), group=READY_GROUP)
+    application.add_handler(TypeHandler(Update, startup.update_handled), group=FIRST_UPDATE_GROUP)
+
+    # Периодические задачи запускаются в post_init
+    application.bot_data['scheduler'] = create_scheduler()
+    application.bot_data['rollover'] = WeeklyRollover(db)
+    startup.mark('build')
+    return application
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Telegram-бот записи в баню")
+    parser.add_argument(
+        '--measure-startup', action='store_true',
+        help="вывести длительность фаз запуска и время до первого обработанного обновления, затем остановиться"
     )
+    args = parser.parse_args()
+    startup.stop_after_first_update = args.measure_startup
+
+    application = build_application()
 
-    logger.info("Запуск бота")
-    application.run_polling()
+    if webhook_enabled():
+        application.bot_data['run_mode'] = 'webhook'
+        logger.info("Запуск бота в режиме webhook на %s:%s/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        application.bot_data['run_mode'] = 'polling'
+        logger.info("Запуск бота в режиме polling")
+        application.run_polling()
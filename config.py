@@ -1,3 +1,4 @@
+import hashlib
 import os
 from dotenv import load_dotenv
 
@@ -12,6 +13,89 @@ MAX_BATH_PARTICIPANTS = int(os.getenv('MAX_BATH_PARTICIPANTS', '20'))
 BATH_COST = int(os.getenv('BATH_COST', '1000'))
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
 
+# Сколько обновлений обрабатывается одновременно (обновления одного пользователя — всегда по очереди); 1 — последовательно
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '16'))
+
+# Хранение user_data и состояний диалогов в базе: интервал записи и время до выгрузки неактивных, секунды
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', '10'))
+PERSISTENCE_IDLE_TTL = int(os.getenv('PERSISTENCE_IDLE_TTL', str(6 * 3600)))
+
+# Логирование: каталог файлов, общий уровень и уровень вывода в консоль
+LOG_DIR = os.getenv('LOG_DIR', 'logs')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+LOG_CONSOLE_LEVEL = os.getenv('LOG_CONSOLE_LEVEL', 'INFO').upper()
+
+# Режим webhook (включается, если задан WEBHOOK_URL — публичный адрес без пути)
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token; по умолчанию выводится из токена бота
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or (
+    hashlib.sha256(BOT_TOKEN.encode('utf-8')).hexdigest()[:32] if BOT_TOKEN else None
+)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# Порт служебного HTTP-сервера (/health); 0 — не запускать
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '8080'))
+
+# Ключ подписи callback_data inline-кнопок (по умолчанию выводится из токена бота)
+CALLBACK_SECRET = os.getenv('CALLBACK_SECRET') or (
+    hashlib.sha256(f"callback:{BOT_TOKEN}".encode('utf-8')).hexdigest() if BOT_TOKEN else ''
+)
+# Принимать ли callback_data старого текстового формата (кнопки, отправленные до перехода на кодек).
+# Такие кнопки не подписаны, поэтому по умолчанию отклоняются; на время перехода их можно
+# включить, ограничив последним днем приема CALLBACK_LEGACY_UNTIL (ДД.ММ.ГГГГ)
+CALLBACK_ACCEPT_LEGACY = os.getenv('CALLBACK_ACCEPT_LEGACY', '0') == '1'
+CALLBACK_LEGACY_UNTIL = os.getenv('CALLBACK_LEGACY_UNTIL', '')
+# Сколько секунд повторное нажатие той же кнопки получает ответ первого без повторной обработки
+CALLBACK_DEDUP_SECONDS = float(os.getenv('CALLBACK_DEDUP_SECONDS', '10'))
+
+# Напоминания об ожидающих оплатах
+PAYMENT_REMINDER_HOURS = int(os.getenv('PAYMENT_REMINDER_HOURS', '4'))
+PAYMENT_REMINDER_INTERVAL_MINUTES = int(os.getenv('PAYMENT_REMINDER_INTERVAL_MINUTES', '30'))
+PAYMENT_REMINDER_BATCH_SIZE = int(os.getenv('PAYMENT_REMINDER_BATCH_SIZE', '100'))
+PAYMENT_REMINDER_ESCALATE_AFTER = int(os.getenv('PAYMENT_REMINDER_ESCALATE_AFTER', '3'))
+
+# Ограничение скорости исходящих сообщений (лимиты Telegram Bot API)
+NOTIFICATION_RATE = float(os.getenv('NOTIFICATION_RATE', '30'))
+NOTIFICATION_CONCURRENCY = int(os.getenv('NOTIFICATION_CONCURRENCY', '8'))
+NOTIFICATION_PRIVATE_INTERVAL = float(os.getenv('NOTIFICATION_PRIVATE_INTERVAL', '1'))
+NOTIFICATION_GROUP_PER_MINUTE = int(os.getenv('NOTIFICATION_GROUP_PER_MINUTE', '20'))
+NOTIFICATION_MAX_RETRIES = int(os.getenv('NOTIFICATION_MAX_RETRIES', '3'))
+# Фоновые задачи после ответа на нажатие (services.tasks): число попыток и начальная задержка повтора, секунды
+BACKGROUND_TASK_RETRIES = int(os.getenv('BACKGROUND_TASK_RETRIES', '4'))
+BACKGROUND_TASK_BACKOFF = float(os.getenv('BACKGROUND_TASK_BACKOFF', '5'))
+
+# Минимальный интервал между редактированиями закрепленного сообщения события, секунды
+PINNED_UPDATE_INTERVAL = float(os.getenv('PINNED_UPDATE_INTERVAL', '5'))
+
+# Время жизни кеша списков упоминаний /mention_all, секунды
+MENTION_CACHE_TTL = int(os.getenv('MENTION_CACHE_TTL', '600'))
+
+# Массовые рассылки
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '50'))
+BROADCAST_PROGRESS_INTERVAL = int(os.getenv('BROADCAST_PROGRESS_INTERVAL', '15'))
+BROADCAST_MAX_FAILURES = int(os.getenv('BROADCAST_MAX_FAILURES', '3'))
+
+# Профилирование CPU командой /cpu_profile: длительность по умолчанию и предел, секунды; строк в отчете
+CPU_PROFILE_DEFAULT_SECONDS = int(os.getenv('CPU_PROFILE_DEFAULT_SECONDS', '30'))
+CPU_PROFILE_MAX_SECONDS = int(os.getenv('CPU_PROFILE_MAX_SECONDS', '300'))
+CPU_PROFILE_TOP = int(os.getenv('CPU_PROFILE_TOP', '30'))
+
+# Планировщик задач: часовой пояс расписаний и срок хранения журнала запусков (job_runs), дни
+SCHEDULER_TIMEZONE = os.getenv('SCHEDULER_TIMEZONE', 'Europe/Warsaw')
+JOB_RUNS_RETENTION_DAYS = int(os.getenv('JOB_RUNS_RETENTION_DAYS', '90'))
+# Автоматическая смена недели: день недели (0 — понедельник) и время по SCHEDULER_TIMEZONE
+ROLLOVER_WEEKDAY = int(os.getenv('ROLLOVER_WEEKDAY', '6'))
+ROLLOVER_TIME = os.getenv('ROLLOVER_TIME', '14:00')
+# Окно наплыва после публикации события, секунды: записи идут через очередь допуска (services.admission)
+ADMISSION_SURGE_SECONDS = int(os.getenv('ADMISSION_SURGE_SECONDS', '1800'))
+# Сколько минут действует предложение освободившегося места из листа ожидания
+WAITLIST_OFFER_MINUTES = int(os.getenv('WAITLIST_OFFER_MINUTES', '30'))
+# Сколько минут подтвержденное место из листа ожидания ждет заявки на оплату
+WAITLIST_PAYMENT_MINUTES = int(os.getenv('WAITLIST_PAYMENT_MINUTES', '120'))
+# Как часто снимаются истекшие удержания мест (приглашения, неоплаченные места листа ожидания), минуты
+SEAT_HOLD_CHECK_MINUTES = int(os.getenv('SEAT_HOLD_CHECK_MINUTES', '5'))
+
 # AWS RDS Configuration
 RDS_CONFIG = {
     'host': os.getenv('RDS_HOST'),
@@ -1,14 +1,267 @@
 import json
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta, time
-import sqlite3
 import logging
 import mysql.connector
-from config import RDS_CONFIG
+from mysql.connector import errorcode
+from config import RDS_CONFIG, MAX_BATH_PARTICIPANTS
 from typing import List, Dict
 
 logger = logging.getLogger(__name__)
 
+# Результаты многошаговых операций с оплатой и записью
+PAYMENT_CONFIRMED = 'confirmed'
+PAYMENT_NOT_FOUND = 'not_found'
+PROFILE_MISSING = 'no_profile'
+REGISTERED = 'registered'
+ALREADY_REGISTERED = 'already_registered'
+EVENT_FULL = 'full'
+NO_SEATS = 'no_seats'
+INVITED = 'invited'
+ALREADY_INVITED = 'already_invited'
+
+# user_id строки-заглушки события в bath_participants (см. Database.create_bath_event)
+EVENT_PLACEHOLDER_USER_ID = 0
+
+# Сколько часов приглашение на запись (bath_invites) удерживает место
+INVITE_HOLD_HOURS = 2
+
+# Статусы массовых рассылок и их получателей
+BROADCAST_RUNNING = 'running'
+BROADCAST_DONE = 'done'
+BROADCAST_CANCELLED = 'cancelled'
+RECIPIENT_PENDING = 'pending'
+RECIPIENT_SENT = 'sent'
+RECIPIENT_FAILED = 'failed'
+RECIPIENT_BLOCKED = 'blocked'
+
+# Статусы запусков задач планировщика (таблица job_runs)
+JOB_RUNNING = 'running'
+JOB_OK = 'ok'
+JOB_FAILED = 'failed'
+
+# Статусы записи в листе ожидания (таблица waitlist)
+WAITLIST_WAITING = 'waiting'
+WAITLIST_OFFERED = 'offered'    # предложено место, ждем подтверждения до offer_expires_at
+WAITLIST_ACCEPTED = 'accepted'  # место подтверждено, ждем заявки на оплату до offer_expires_at
+WAITLIST_SEATED = 'seated'      # оплата подтверждена, пользователь в списке участников
+WAITLIST_EXPIRED = 'expired'
+WAITLIST_LEFT = 'left'
+
+# Подписчики на изменение списка участников; вызываются с date_str после фиксации изменений
+_participants_listeners = []
+
+
+def on_participants_changed(callback):
+    """Регистрирует callback(date_str), вызываемый при изменении участников события"""
+    _participants_listeners.append(callback)
+
+
+def _notify_participants_changed(date_str):
+    for callback in list(_participants_listeners):
+        try:
+            callback(date_str)
+        except Exception as e:
+            logger.error("Ошибка в обработчике изменения участников: %s", e, exc_info=True)
+
+
+_shared_database = None
+_shared_lock = threading.Lock()
+
+
+def get_database():
+    """Общий экземпляр Database для модулей бота.
+
+    Создается при первом вызове без обращения к базе: схему проверяет
+    запуск бота в фоне (см. services.startup), одновременно с первым getUpdates.
+    """
+    global _shared_database
+    with _shared_lock:
+        if _shared_database is None:
+            _shared_database = Database(init_schema=False)
+        return _shared_database
+
+
+class UnitOfWork:
+    """Шаги многошаговой операции, выполняемые на одном соединении.
+
+    Экземпляр создается только через Database.unit_of_work(): все методы
+    используют общий курсор, а фиксация (или откат) происходит один раз
+    при выходе из контекста.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()
+
+    def get_pending_payment(self, user_id, date_str, payment_type=None, for_update=False):
+        """Получает заявку на оплату, при for_update блокирует строку до конца транзакции"""
+        query = '''
+            SELECT user_id, username, date_str, payment_type
+            FROM pending_payments
+            WHERE user_id = %s AND date_str = %s
+        '''
+        params = [user_id, date_str]
+        if payment_type:
+            query += ' AND payment_type = %s'
+            params.append(payment_type)
+        if for_update:
+            query += ' FOR UPDATE'
+        self.cursor.execute(query, params)
+        row = self.cursor.fetchone()
+        if row:
+            return {'user_id': row[0], 'username': row[1], 'date_str': row[2], 'payment_type': row[3]}
+        return None
+
+    def get_user_profile(self, user_id):
+        """Получает краткий профиль пользователя (имя для списка участников)"""
+        self.cursor.execute('''
+            SELECT user_id, username, full_name
+            FROM user_profiles
+            WHERE user_id = %s
+        ''', (user_id,))
+        row = self.cursor.fetchone()
+        if row:
+            return {'user_id': row[0], 'username': row[1], 'full_name': row[2]}
+        return None
+
+    def lock_bath_participants(self, date_str):
+        """Блокирует список участников на дату и возвращает их user_id.
+
+        Строка-заглушка события (user_id 0, см. create_bath_event) тоже
+        блокируется — на ней ждут параллельные записи на пустое событие, —
+        но в список не входит и места не занимает.
+        """
+        self.cursor.execute('''
+            SELECT user_id FROM bath_participants
+            WHERE date_str = %s
+            FOR UPDATE
+        ''', (date_str,))
+        return [row[0] for row in self.cursor.fetchall() if row[0] != EVENT_PLACEHOLDER_USER_ID]
+
+    def upsert_bath_participant(self, date_str, user_id, username, paid=False, cash=False):
+        """Добавляет участника или обновляет статус оплаты существующего"""
+        self.cursor.execute('''
+            INSERT INTO bath_participants (date_str, user_id, username, paid, cash)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                username=VALUES(username),
+                paid=VALUES(paid),
+                cash=VALUES(cash)
+        ''', (date_str, user_id, username, paid, cash))
+
+    def add_pending_payment(self, user_id, username, date_str, payment_type, amount):
+        self.cursor.execute('''
+            INSERT INTO pending_payments
+            (user_id, username, date_str, payment_type, amount, created_at, last_notified)
+            VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ON DUPLICATE KEY UPDATE
+                username=VALUES(username),
+                payment_type=VALUES(payment_type),
+                amount=VALUES(amount),
+                created_at=CURRENT_TIMESTAMP,
+                last_notified=CURRENT_TIMESTAMP,
+                reminder_count=0
+        ''', (user_id, username, date_str, payment_type, amount))
+
+    def delete_pending_payment(self, user_id, date_str):
+        self.cursor.execute(
+            'DELETE FROM pending_payments WHERE user_id = %s AND date_str = %s',
+            (user_id, date_str)
+        )
+        return self.cursor.rowcount > 0
+
+    def add_active_user(self, user_id, username):
+        self.cursor.execute('''
+            INSERT INTO active_users (user_id, username, last_active)
+            VALUES (%s, %s, CURRENT_TIMESTAMP)
+            ON DUPLICATE KEY UPDATE
+                username=VALUES(username),
+                last_active=CURRENT_TIMESTAMP
+        ''', (user_id, username))
+
+    def count_seat_holders(self, date_str, exclude_user_id=None, hours=INVITE_HOLD_HOURS):
+        """Сколько пользователей занимают или удерживают место на дату.
+
+        Место держат участники, предложения и неистекшие подтверждения листа
+        ожидания, заявки на оплату и действующие приглашения на запись; каждый
+        пользователь считается один раз. exclude_user_id не учитывается:
+        собственное удержание не мешает пользователю занять место.
+        """
+        self.cursor.execute('''
+            SELECT COUNT(*) FROM (
+                SELECT user_id FROM bath_participants WHERE date_str = %s AND user_id <> 0
+                UNION
+                SELECT user_id FROM waitlist
+                WHERE date_str = %s AND (status = %s OR (status = %s AND offer_expires_at > NOW()))
+                UNION
+                SELECT user_id FROM pending_payments WHERE date_str = %s
+                UNION
+                SELECT invitee_id FROM bath_invites
+                WHERE date_str = %s AND created_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+            ) holders
+            WHERE user_id <> %s
+        ''', (date_str, date_str, WAITLIST_OFFERED, WAITLIST_ACCEPTED, date_str, date_str, hours,
+              exclude_user_id or 0))
+        return self.cursor.fetchone()[0]
+
+    def delete_invite(self, user_id, date_str):
+        self.cursor.execute(
+            'DELETE FROM bath_invites WHERE invitee_id = %s AND date_str = %s',
+            (user_id, date_str)
+        )
+
+    def delete_expired_invite(self, user_id, date_str, hours=INVITE_HOLD_HOURS):
+        self.cursor.execute('''
+            DELETE FROM bath_invites
+            WHERE invitee_id = %s AND date_str = %s
+            AND created_at < DATE_SUB(NOW(), INTERVAL %s HOUR)
+        ''', (user_id, date_str, hours))
+
+    def has_invite(self, user_id, date_str):
+        self.cursor.execute(
+            'SELECT 1 FROM bath_invites WHERE invitee_id = %s AND date_str = %s LIMIT 1',
+            (user_id, date_str)
+        )
+        return self.cursor.fetchone() is not None
+
+    def add_invite(self, user_id, username, date_str):
+        self.cursor.execute('''
+            INSERT IGNORE INTO bath_invites
+            (inviter_id, invitee_id, inviter_username, invitee_username, date_str, created_at)
+            VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ''', (user_id, user_id, username, username, date_str))
+
+    def next_waiting(self, date_str):
+        """Первый ожидающий по порядку (строка блокируется до конца транзакции)"""
+        self.cursor.execute('''
+            SELECT id, user_id, username FROM waitlist
+            WHERE date_str = %s AND status = %s
+            ORDER BY position, id
+            LIMIT 1
+            FOR UPDATE
+        ''', (date_str, WAITLIST_WAITING))
+        row = self.cursor.fetchone()
+        if row:
+            return {'id': row[0], 'user_id': row[1], 'username': row[2]}
+        return None
+
+    def mark_offered(self, waitlist_id, ttl_seconds):
+        self.cursor.execute('''
+            UPDATE waitlist
+            SET status = %s, offer_expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+            WHERE id = %s
+        ''', (WAITLIST_OFFERED, ttl_seconds, waitlist_id))
+
+    def seat_waitlisted(self, date_str, user_id):
+        """Пользователь из листа ожидания стал участником: место больше не удерживается отдельно"""
+        self.cursor.execute('''
+            UPDATE waitlist SET status = %s
+            WHERE date_str = %s AND user_id = %s AND status IN (%s, %s)
+        ''', (WAITLIST_SEATED, date_str, user_id, WAITLIST_OFFERED, WAITLIST_ACCEPTED))
+
+
 class Database:
     """Класс для работы с базой данных.
     
@@ -17,12 +270,27 @@ class Database:
     - Логи ротируются каждые 6 месяцев
     - Подписки хранятся до истечения срока
     """
-    def __init__(self, file_path="data.json", db_file="bath_history.db"):
+    def __init__(self, file_path="data.json", db_file="bath_history.db", config=None, init_schema=True):
         self.file_path = file_path
         self.data = self._load_data()
         self.db_file = db_file
-        self.config = RDS_CONFIG
-        self.init_db()
+        # По умолчанию используется RDS; другой конфиг нужен для локальной MySQL (бенчмарки, тесты)
+        self.config = config or RDS_CONFIG
+        self._schema_lock = threading.Lock()
+        self.schema_ready = False
+        if init_schema:
+            self.ensure_schema()
+
+    def ensure_schema(self):
+        """Создает недостающие таблицы один раз на экземпляр.
+
+        Потокобезопасно: параллельные вызовы ждут первую проверку. При ошибке
+        следующий вызов повторяет проверку.
+        """
+        with self._schema_lock:
+            if not self.schema_ready:
+                self.init_db()
+                self.schema_ready = True
 
     def _load_data(self):
         """Загрузка данных из файла"""
@@ -82,7 +350,12 @@ class Database:
 
     # Методы для бани
     def create_bath_event(self, date_str):
-        """Создает новое событие бани"""
+        """Создает новое событие бани.
+
+        Событие — строка-заглушка с user_id = EVENT_PLACEHOLDER_USER_ID (столбец
+        NOT NULL): она дает блокировку списку участников, пока записей нет.
+        Все выборки и подсчеты участников ее исключают (user_id <> 0).
+        """
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
@@ -90,13 +363,16 @@ class Database:
             cursor.execute('SELECT COUNT(*) FROM bath_participants WHERE date_str = %s', (date_str,))
             if cursor.fetchone()[0] == 0:
                 # Создаем новую запись
-                cursor.execute('INSERT INTO bath_participants (date_str) VALUES (%s)', (date_str,))
+                cursor.execute(
+                    'INSERT INTO bath_participants (date_str, user_id) VALUES (%s, %s)',
+                    (date_str, EVENT_PLACEHOLDER_USER_ID)
+                )
                 conn.commit()
-                logger.info(f"Created new bath event for {date_str}")
+                logger.info("Created new bath event for %s", date_str)
             else:
-                logger.info(f"Bath event for {date_str} already exists")
+                logger.info("Bath event for %s already exists", date_str)
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при создании события бани: {e}")
+            logger.error("Ошибка при создании события бани: %s", e)
             conn.rollback()
             raise
         finally:
@@ -112,10 +388,10 @@ class Database:
                 cursor.execute('''
                     SELECT date_str, user_id, username, paid 
                     FROM bath_participants 
-                    WHERE date_str != %s
+                    WHERE date_str != %s AND user_id <> 0
                 ''', (except_date_str,))
             else:
-                cursor.execute('SELECT date_str, user_id, username, paid FROM bath_participants')
+                cursor.execute('SELECT date_str, user_id, username, paid FROM bath_participants WHERE user_id <> 0')
             records = cursor.fetchall()
             # Переносим записи в историю
             for record in records:
@@ -125,6 +401,9 @@ class Database:
                 ''', record)
             # Очищаем таблицу участников
             if except_date_str:
+                cursor.execute('DELETE FROM waitlist WHERE date_str != %s', (except_date_str,))
+                # Неподтвержденные заявки прошедших бань больше не нужны: иначе напоминания шли бы бесконечно
+                cursor.execute('DELETE FROM pending_payments WHERE date_str != %s', (except_date_str,))
                 cursor.execute('DELETE FROM bath_participants WHERE date_str != %s', (except_date_str,))
                 # Удаляем все cash=1 для всех дат, кроме новой
                 cursor.execute('DELETE FROM bath_participants WHERE date_str != %s AND cash = 1', (except_date_str,))
@@ -133,7 +412,7 @@ class Database:
             conn.commit()
             return len(records)
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при очистке предыдущих событий: {e}")
+            logger.error("Ошибка при очистке предыдущих событий: %s", e)
             raise
         finally:
             conn.close()
@@ -148,27 +427,28 @@ class Database:
                 VALUES (%s, %s, %s, %s, %s)
             ''', (date_str, user_id, username, paid, cash))
             conn.commit()
+            _notify_participants_changed(date_str)
             return True
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при добавлении участника: {e}")
+            logger.error("Ошибка при добавлении участника: %s", e)
             return False
         finally:
             conn.close()
 
     def get_bath_participants(self, date_str):
-        """Получает список участников на определенную дату"""
+        """Получает список участников на определенную дату (без строки-заглушки события)"""
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT user_id, username, paid, cash 
                 FROM bath_participants 
-                WHERE date_str = %s
+                WHERE date_str = %s AND user_id <> 0
             ''', (date_str,))
             return [{"user_id": row[0], "username": row[1], "paid": bool(row[2]), "cash": bool(row[3])} 
                    for row in cursor.fetchall()]
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при получении списка участников: {e}")
+            logger.error("Ошибка при получении списка участников: %s", e)
             return []
         finally:
             conn.close()
@@ -184,9 +464,11 @@ class Database:
                 WHERE date_str = %s AND user_id = %s
             ''', (date_str, user_id))
             conn.commit()
+            if cursor.rowcount > 0:
+                _notify_participants_changed(date_str)
             return cursor.rowcount > 0
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при отметке оплаты: {e}")
+            logger.error("Ошибка при отметке оплаты: %s", e)
             return False
         finally:
             conn.close()
@@ -205,7 +487,7 @@ class Database:
             return [{"date": row[0], "paid": bool(row[1]), "visited": bool(row[2])} 
                    for row in cursor.fetchall()]
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при получении истории пользователя: {e}")
+            logger.error("Ошибка при получении истории пользователя: %s", e)
             return []
         finally:
             conn.close()
@@ -244,7 +526,7 @@ class Database:
                 "visited": row[3]
             } for row in cursor.fetchall()]
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при получении статистики: {e}")
+            logger.error("Ошибка при получении статистики: %s", e)
             return []
         finally:
             conn.close()
@@ -262,7 +544,7 @@ class Database:
             conn.commit()
             return cursor.rowcount > 0
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при отметке посещения: {e}")
+            logger.error("Ошибка при отметке посещения: %s", e)
             return False
         finally:
             conn.close()
@@ -272,13 +554,31 @@ class Database:
         try:
             connection = mysql.connector.connect(
                 **self.config,
-                ssl_verify_cert=True
+                ssl_verify_cert=bool(self.config.get('ssl_ca'))
             )
             return connection
         except mysql.connector.Error as err:
-            logger.error(f"Ошибка подключения к MySQL: {err}")
+            logger.error("Ошибка подключения к MySQL: %s", err)
             raise
 
+    @contextmanager
+    def unit_of_work(self):
+        """Открывает одно соединение и одну транзакцию для многошаговой операции.
+
+        При нормальном выходе из блока изменения фиксируются одним commit,
+        при любом исключении откатываются целиком.
+        """
+        conn = self.get_connection()
+        try:
+            conn.start_transaction()
+            yield UnitOfWork(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
     def init_db(self):
         """Инициализирует базу данных, создает необходимые таблицы"""
         try:
@@ -424,6 +724,7 @@ class Database:
                         amount DECIMAL(10,2) NOT NULL,
                         status VARCHAR(20) DEFAULT 'pending',
                         last_notified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        reminder_count INT DEFAULT 0,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                         UNIQUE KEY unique_pending_payment (user_id, date_str),
@@ -433,13 +734,129 @@ class Database:
                         INDEX idx_last_notified (last_notified)
                     )
                 """)
-                
+                self._ensure_column(cursor, 'pending_payments', 'reminder_count', 'INT DEFAULT 0')
+
+                # Создаем таблицы состояния бота (user_data и состояния диалогов)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_user_data (
+                        user_id BIGINT PRIMARY KEY,
+                        data MEDIUMTEXT NOT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_conversations (
+                        name VARCHAR(64) NOT NULL,
+                        conversation_key VARCHAR(64) NOT NULL,
+                        state VARCHAR(255) NOT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (name, conversation_key)
+                    )
+                """)
+
+                # Создаем таблицы массовых рассылок
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS broadcasts (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        created_by BIGINT NOT NULL,
+                        text TEXT NOT NULL,
+                        target VARCHAR(50) NOT NULL,
+                        status VARCHAR(20) DEFAULT 'running',
+                        total INT DEFAULT 0,
+                        sent INT DEFAULT 0,
+                        failed INT DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP NULL,
+                        INDEX idx_status (status)
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                        broadcast_id BIGINT NOT NULL,
+                        user_id BIGINT NOT NULL,
+                        status VARCHAR(20) DEFAULT 'pending',
+                        error VARCHAR(255),
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (broadcast_id, user_id),
+                        INDEX idx_broadcast_status (broadcast_id, status)
+                    )
+                """)
+                # Пользователи, которым не удается доставить сообщения (заблокировали бота и т.п.)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS undeliverable_users (
+                        user_id BIGINT PRIMARY KEY,
+                        reason VARCHAR(20) NOT NULL,
+                        failures INT DEFAULT 1,
+                        error VARCHAR(255),
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    )
+                """)
+                # Запуски задач планировщика: одна строка на задачу и плановое время (UTC),
+                # уникальный ключ не дает двум экземплярам бота выполнить один запуск
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS job_runs (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        job_name VARCHAR(64) NOT NULL,
+                        scheduled_for DATETIME NOT NULL,
+                        status VARCHAR(16) NOT NULL,
+                        worker VARCHAR(128),
+                        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP NULL,
+                        duration_ms INT,
+                        error VARCHAR(255),
+                        UNIQUE KEY unique_job_slot (job_name, scheduled_for),
+                        INDEX idx_started_at (started_at)
+                    )
+                """)
+                # Смена недели (services.rollover): последний завершенный этап по дате события;
+                # in_progress отмечает начатую отправку, чтобы повтор не отправил сообщение дважды
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS rollovers (
+                        date_str VARCHAR(10) PRIMARY KEY,
+                        stage VARCHAR(16),
+                        in_progress VARCHAR(16),
+                        cleared_events INT,
+                        message_id BIGINT,
+                        stage_ms TEXT,
+                        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP NULL
+                    )
+                """)
+                # Лист ожидания: порядок задает position (время нажатия, мкс), следующий
+                # ожидающий выбирается по индексу idx_waitlist_next одной строкой
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS waitlist (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        date_str VARCHAR(10) NOT NULL,
+                        user_id BIGINT NOT NULL,
+                        username VARCHAR(255),
+                        position BIGINT NOT NULL,
+                        status VARCHAR(16) NOT NULL DEFAULT 'waiting',
+                        offer_expires_at TIMESTAMP NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        UNIQUE KEY unique_waitlist_user (date_str, user_id),
+                        INDEX idx_waitlist_next (date_str, status, position)
+                    )
+                """)
+
                 conn.commit()
                 logging.info("Database initialized successfully")
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при инициализации базы данных: {e}")
+            logger.error("Ошибка при инициализации базы данных: %s", e)
             raise
 
+    def _ensure_column(self, cursor, table, column, definition):
+        """Добавляет колонку в уже существующую таблицу, если её ещё нет"""
+        cursor.execute('''
+            SELECT COUNT(*) FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        ''', (table, column))
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            logger.info("Added column %s.%s", table, column)
+
     def get_user_visits_count(self, user_id: int) -> int:
         """Получает общее количество посещений бани пользователем"""
         conn = self.get_connection()
@@ -481,6 +898,22 @@ class Database:
         finally:
             conn.close()
 
+    def get_pinned_message_id(self, chat_id, date_str):
+        """Возвращает id закрепленного сообщения события на дату date_str"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT message_id
+                FROM pinned_messages
+                WHERE chat_id = %s AND date_str = %s
+                ORDER BY id DESC LIMIT 1
+            ''', (chat_id, date_str))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
     def get_last_pinned_message_id(self, chat_id):
         conn = self.get_connection()
         try:
@@ -496,6 +929,18 @@ class Database:
         finally:
             conn.close()
 
+    def get_pinned_messages(self, chat_id):
+        """Все сохраненные закрепленные сообщения чата: [(date_str, message_id)]"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT date_str, message_id FROM pinned_messages WHERE chat_id = %s ORDER BY id', (chat_id,)
+            )
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
     def delete_pinned_message_id(self, message_id, chat_id):
         conn = self.get_connection()
         try:
@@ -559,18 +1004,39 @@ class Database:
         finally:
             conn.close()
 
-    def cleanup_old_bath_invites(self, hours=2):
-        """Удаляет устаревшие приглашения (старше N часов)"""
+    def expire_seat_holds(self, hours=INVITE_HOLD_HOURS):
+        """Снимает истекшие удержания мест и оповещает об освободившихся местах.
+
+        Удаляются приглашения старше hours часов, а подтвержденные места листа
+        ожидания без заявки на оплату в срок (offer_expires_at) истекают.
+        Для каждой затронутой даты вызываются подписчики изменения участников,
+        чтобы лист ожидания предложил места. Возвращает список дат.
+        """
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
             cursor.execute('''
-                DELETE FROM bath_invites 
+                SELECT date_str FROM bath_invites WHERE created_at < DATE_SUB(NOW(), INTERVAL %s HOUR)
+                UNION
+                SELECT date_str FROM waitlist WHERE status = %s AND offer_expires_at <= NOW()
+            ''', (hours, WAITLIST_ACCEPTED))
+            dates = [row[0] for row in cursor.fetchall()]
+            if not dates:
+                return []
+            cursor.execute('''
+                DELETE FROM bath_invites
                 WHERE created_at < DATE_SUB(NOW(), INTERVAL %s HOUR)
             ''', (hours,))
+            cursor.execute('''
+                UPDATE waitlist SET status = %s
+                WHERE status = %s AND offer_expires_at <= NOW()
+            ''', (WAITLIST_EXPIRED, WAITLIST_ACCEPTED))
             conn.commit()
         finally:
             conn.close()
+        for date_str in dates:
+            _notify_participants_changed(date_str)
+        return dates
 
     def try_add_bath_invite(self, user_id, username, date_str, hours=2):
         """Пытается добавить приглашение. Возвращает True, если приглашение новое, иначе False."""
@@ -616,7 +1082,7 @@ class Database:
             conn.commit()
             return True
         except mysql.connector.Error as e:
-            logger.error(f"Ошибка при сохранении профиля пользователя: {e}")
+            logger.error("Ошибка при сохранении профиля пользователя: %s", e)
             return False
         finally:
             conn.close()
@@ -681,7 +1147,7 @@ class Database:
                     up.skills
                 FROM bath_participants p
                 LEFT JOIN user_profiles up ON p.user_id = up.user_id
-                WHERE p.date_str = %s
+                WHERE p.date_str = %s AND p.user_id <> 0
             ''', (date_str,))
             rows = cursor.fetchall()
             return [{
@@ -753,7 +1219,8 @@ class Database:
                     payment_type=VALUES(payment_type),
                     amount=VALUES(amount),
                     created_at=CURRENT_TIMESTAMP,
-                    last_notified=CURRENT_TIMESTAMP
+                    last_notified=CURRENT_TIMESTAMP,
+                    reminder_count=0
             ''', (user_id, username, date_str, payment_type, BATH_COST))
             conn.commit()
         finally:
@@ -782,16 +1249,59 @@ class Database:
         finally:
             conn.close()
 
-    def get_pending_payments_for_reminder(self, hours=4):
+    def get_pending_payments_for_reminder(self, hours=4, limit=None, after_id=0, max_reminders=None):
+        """Возвращает заявки, по которым не было напоминаний дольше hours часов.
+
+        Выборка идёт по возрастанию id начиная после after_id, поэтому большие
+        списки можно читать страницами по limit записей. При max_reminders
+        заявки, получившие столько напоминаний, больше не выбираются.
+        """
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT user_id, username, date_str, payment_type 
+            query = '''
+                SELECT id, user_id, username, date_str, payment_type, reminder_count
                 FROM pending_payments
-                WHERE TIMESTAMPDIFF(HOUR, last_notified, NOW()) >= %s
-            ''', (hours,))
-            return cursor.fetchall()
+                WHERE last_notified <= NOW() - INTERVAL %s HOUR
+                  AND status = 'pending'
+                  AND id > %s
+            '''
+            params = [hours, after_id]
+            if max_reminders is not None:
+                query += ' AND COALESCE(reminder_count, 0) < %s'
+                params.append(max_reminders)
+            query += ' ORDER BY id'
+            if limit:
+                query += ' LIMIT %s'
+                params.append(limit)
+            cursor.execute(query, params)
+            return [{
+                'id': row[0],
+                'user_id': row[1],
+                'username': row[2],
+                'date_str': row[3],
+                'payment_type': row[4],
+                'reminder_count': row[5] or 0
+            } for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def mark_payments_notified(self, payment_ids):
+        """Отмечает отправку напоминания сразу для всей пачки заявок одним запросом"""
+        if not payment_ids:
+            return 0
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            placeholders = ', '.join(['%s'] * len(payment_ids))
+            cursor.execute(f'''
+                UPDATE pending_payments
+                SET last_notified = CURRENT_TIMESTAMP,
+                    reminder_count = reminder_count + 1
+                WHERE id IN ({placeholders})
+            ''', tuple(payment_ids))
+            conn.commit()
+            return cursor.rowcount
         finally:
             conn.close()
 
@@ -820,7 +1330,7 @@ class Database:
             payments = cursor.fetchall()
             return [{'date_str': p[0], 'payment_type': p[1]} for p in payments]
         except Exception as e:
-            logger.error(f"Ошибка при получении ожидающих оплат: {e}")
+            logger.error("Ошибка при получении ожидающих оплат: %s", e)
             return []
         finally:
             conn.close()
@@ -834,13 +1344,97 @@ class Database:
                 DELETE FROM bath_participants WHERE date_str = %s AND user_id = %s
             ''', (date_str, user_id))
             conn.commit()
+            if cursor.rowcount > 0:
+                _notify_participants_changed(date_str)
             return cursor.rowcount > 0
         except Exception as e:
-            logger.error(f"Ошибка при удалении участника: {e}")
+            logger.error("Ошибка при удалении участника: %s", e)
             return False
         finally:
             conn.close()
 
+    def register_participant(self, date_str, user_id, username, max_participants):
+        """Записывает пользователя на баню, если есть свободные места.
+
+        Проверка мест и вставка выполняются в одной транзакции с блокировкой
+        списка участников, поэтому параллельные записи не превышают лимит.
+        Возвращает REGISTERED, ALREADY_REGISTERED или EVENT_FULL.
+        """
+        with self.unit_of_work() as uow:
+            participant_ids = uow.lock_bath_participants(date_str)
+            if user_id in participant_ids:
+                return ALREADY_REGISTERED
+            if uow.count_seat_holders(date_str, exclude_user_id=user_id) >= max_participants:
+                return EVENT_FULL
+            uow.upsert_bath_participant(date_str, user_id, username)
+        _notify_participants_changed(date_str)
+        return REGISTERED
+
+    def reserve_seat(self, date_str, user_id, username, max_participants, hours=INVITE_HOLD_HOURS):
+        """Выдает приглашение на запись, которое hours часов удерживает место.
+
+        Проверка мест (см. UnitOfWork.count_seat_holders) и вставка
+        выполняются под блокировкой участников, как в register_participant,
+        поэтому при заполненном событии приглашение не создается.
+        Возвращает INVITED, ALREADY_INVITED или EVENT_FULL.
+        """
+        with self.unit_of_work() as uow:
+            uow.lock_bath_participants(date_str)
+            uow.delete_expired_invite(user_id, date_str, hours)
+            if uow.has_invite(user_id, date_str):
+                return ALREADY_INVITED
+            if uow.count_seat_holders(date_str, exclude_user_id=user_id, hours=hours) >= max_participants:
+                return EVENT_FULL
+            uow.add_invite(user_id, username, date_str)
+        return INVITED
+
+    def claim_payment(self, user_id, username, date_str, payment_type='online'):
+        """Регистрирует заявку пользователя на оплату и его активность одной транзакцией."""
+        from config import BATH_COST
+        with self.unit_of_work() as uow:
+            uow.add_active_user(user_id, username)
+            uow.add_pending_payment(user_id, username, date_str, payment_type, BATH_COST)
+
+    def confirm_payment(self, user_id, date_str, payment_type=None, max_participants=MAX_BATH_PARTICIPANTS):
+        """Подтверждает заявку на оплату и добавляет пользователя в список участников.
+
+        Список участников блокируется, как при записи, и пользователь не
+        добавляется сверх лимита. Возвращает кортеж (статус, заявка), где
+        статус — PAYMENT_CONFIRMED, PAYMENT_NOT_FOUND, PROFILE_MISSING или
+        NO_SEATS. В трех последних случаях база данных не изменяется.
+        """
+        with self.unit_of_work() as uow:
+            payment = uow.get_pending_payment(user_id, date_str, payment_type, for_update=True)
+            if not payment:
+                return PAYMENT_NOT_FOUND, None
+            profile = uow.get_user_profile(user_id)
+            if not profile:
+                return PROFILE_MISSING, payment
+            participant_ids = uow.lock_bath_participants(date_str)
+            if user_id not in participant_ids and len(participant_ids) >= max_participants:
+                return NO_SEATS, payment
+            username = profile['username'] or profile['full_name'] or payment['username']
+            is_cash = payment['payment_type'] == 'cash'
+            uow.upsert_bath_participant(date_str, user_id, username, paid=not is_cash, cash=is_cash)
+            uow.delete_pending_payment(user_id, date_str)
+            uow.seat_waitlisted(date_str, user_id)
+        _notify_participants_changed(date_str)
+        return PAYMENT_CONFIRMED, payment
+
+    def decline_payment(self, user_id, date_str):
+        """Отклоняет заявку на оплату. Возвращает True, если заявка существовала.
+
+        Вместе с заявкой удаляется приглашение пользователя: место больше не
+        удерживается, и подписчики изменения участников узнают, что оно свободно.
+        """
+        with self.unit_of_work() as uow:
+            declined = uow.delete_pending_payment(user_id, date_str)
+            if declined:
+                uow.delete_invite(user_id, date_str)
+        if declined:
+            _notify_participants_changed(date_str)
+        return declined
+
     def get_all_active_users(self):
         """Возвращает всех пользователей, у которых есть профиль."""
         conn = self.get_connection()
@@ -849,7 +1443,567 @@ class Database:
             cursor.execute('SELECT user_id, username FROM user_profiles')
             return [{'user_id': row[0], 'username': row[1]} for row in cursor.fetchall()]
         except Exception as e:
-            logger.error(f"Ошибка при получении всех пользователей с профилем: {e}")
+            logger.error("Ошибка при получении всех пользователей с профилем: %s", e)
             return []
         finally:
-            conn.close()
\ No newline at end of file
+            conn.close()
+    # Методы для массовых рассылок
+    def get_broadcast_audience(self, target, date_str=None, last_events=None):
+        """Возвращает user_id получателей рассылки.
+
+        target: 'all' — все пользователи с профилем, 'participants' — участники
+        события date_str, 'history' — записывавшиеся на last_events последних бань.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if target == 'all':
+                cursor.execute('SELECT user_id FROM user_profiles')
+            elif target == 'participants':
+                cursor.execute('''
+                    SELECT DISTINCT user_id FROM bath_participants
+                    WHERE date_str = %s AND user_id <> 0
+                ''', (date_str,))
+            elif target == 'history':
+                # date_str хранится как ДД.ММ.ГГГГ, поэтому сортируем по разобранной дате
+                cursor.execute('''
+                    SELECT DISTINCT h.user_id
+                    FROM bath_history h
+                    JOIN (
+                        SELECT date_str FROM bath_history
+                        GROUP BY date_str
+                        ORDER BY STR_TO_DATE(date_str, '%%d.%%m.%%Y') DESC
+                        LIMIT %s
+                    ) recent ON recent.date_str = h.date_str
+                ''', (last_events,))
+            else:
+                raise ValueError(f"Unknown broadcast target: {target}")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def create_broadcast(self, created_by, text, target, user_ids, max_failures=3, chunk_size=1000):
+        """Создает рассылку и список её получателей одной транзакцией.
+
+        Пользователи, заблокировавшие бота или с max_failures неудачными
+        доставками подряд, в рассылку не попадают.
+        Возвращает кортеж (id рассылки, число получателей).
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id FROM undeliverable_users
+                WHERE reason = %s OR failures >= %s
+            ''', (RECIPIENT_BLOCKED, max_failures))
+            skipped = {row[0] for row in cursor.fetchall()}
+            recipients = sorted(set(user_ids) - skipped)
+
+            cursor.execute('''
+                INSERT INTO broadcasts (created_by, text, target, status, total)
+                VALUES (%s, %s, %s, %s, %s)
+            ''', (created_by, text, target, BROADCAST_RUNNING, len(recipients)))
+            broadcast_id = cursor.lastrowid
+            for start in range(0, len(recipients), chunk_size):
+                cursor.executemany(
+                    'INSERT IGNORE INTO broadcast_recipients (broadcast_id, user_id) VALUES (%s, %s)',
+                    [(broadcast_id, user_id) for user_id in recipients[start:start + chunk_size]]
+                )
+            conn.commit()
+            return broadcast_id, len(recipients)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_broadcast(self, broadcast_id):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, created_by, text, target, status, total, sent, failed
+                FROM broadcasts WHERE id = %s
+            ''', (broadcast_id,))
+            row = cursor.fetchone()
+            if row:
+                return {
+                    'id': row[0], 'created_by': row[1], 'text': row[2], 'target': row[3],
+                    'status': row[4], 'total': row[5], 'sent': row[6], 'failed': row[7]
+                }
+            return None
+        finally:
+            conn.close()
+
+    def get_running_broadcasts(self):
+        """Возвращает id незавершенных рассылок (для продолжения после перезапуска)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM broadcasts WHERE status = %s ORDER BY id', (BROADCAST_RUNNING,))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def get_broadcast_batch(self, broadcast_id, limit):
+        """Возвращает следующую пачку получателей, которым сообщение ещё не отправлялось"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id FROM broadcast_recipients
+                WHERE broadcast_id = %s AND status = %s
+                ORDER BY user_id
+                LIMIT %s
+            ''', (broadcast_id, RECIPIENT_PENDING, limit))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def record_broadcast_results(self, broadcast_id, sent_ids, failures):
+        """Сохраняет итоги отправки пачки одной транзакцией.
+
+        failures — список (user_id, статус, текст ошибки), где статус
+        RECIPIENT_BLOCKED или RECIPIENT_FAILED. Недоставленные попадают в
+        undeliverable_users, успешная доставка снимает пользователя оттуда.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if sent_ids:
+                placeholders = ', '.join(['%s'] * len(sent_ids))
+                cursor.execute(f'''
+                    UPDATE broadcast_recipients SET status = %s, error = NULL
+                    WHERE broadcast_id = %s AND user_id IN ({placeholders})
+                ''', (RECIPIENT_SENT, broadcast_id, *sent_ids))
+                cursor.execute(
+                    f'DELETE FROM undeliverable_users WHERE user_id IN ({placeholders})',
+                    tuple(sent_ids)
+                )
+            if failures:
+                cursor.executemany('''
+                    UPDATE broadcast_recipients SET status = %s, error = %s
+                    WHERE broadcast_id = %s AND user_id = %s
+                ''', [(status, error[:255], broadcast_id, user_id) for user_id, status, error in failures])
+                cursor.executemany('''
+                    INSERT INTO undeliverable_users (user_id, reason, failures, error)
+                    VALUES (%s, %s, 1, %s)
+                    ON DUPLICATE KEY UPDATE
+                        reason=VALUES(reason),
+                        failures=failures + 1,
+                        error=VALUES(error)
+                ''', [(user_id, status, error[:255]) for user_id, status, error in failures])
+            cursor.execute('''
+                UPDATE broadcasts SET sent = sent + %s, failed = failed + %s
+                WHERE id = %s
+            ''', (len(sent_ids), len(failures), broadcast_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def finish_broadcast(self, broadcast_id, status=BROADCAST_DONE):
+        """Завершает (или отменяет) рассылку. Возвращает True, если она ещё выполнялась."""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE broadcasts SET status = %s, finished_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND status = %s
+            ''', (status, broadcast_id, BROADCAST_RUNNING))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    # Методы планировщика задач (services.scheduler)
+    def claim_job_run(self, job_name, scheduled_for, worker):
+        """Занимает запуск задачи на плановое время scheduled_for (UTC).
+
+        Возвращает id запуска или None, если этот запуск уже занят
+        (выполнен здесь раньше или другим экземпляром бота).
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT IGNORE INTO job_runs (job_name, scheduled_for, status, worker)
+                VALUES (%s, %s, %s, %s)
+            ''', (job_name, scheduled_for, JOB_RUNNING, worker))
+            conn.commit()
+            return cursor.lastrowid if cursor.rowcount > 0 else None
+        finally:
+            conn.close()
+
+    def finish_job_run(self, run_id, status, duration_ms, error=None):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE job_runs SET status = %s, duration_ms = %s, error = %s, finished_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (status, duration_ms, error[:255] if error else None, run_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_last_job_runs(self):
+        """Последний запуск каждой задачи: {имя: {scheduled_for, status, worker, duration_ms, error}}"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT r.job_name, r.scheduled_for, r.status, r.worker, r.duration_ms, r.error
+                FROM job_runs r
+                JOIN (
+                    SELECT job_name, MAX(scheduled_for) AS scheduled_for FROM job_runs GROUP BY job_name
+                ) last ON last.job_name = r.job_name AND last.scheduled_for = r.scheduled_for
+            ''')
+            return {
+                row[0]: {'scheduled_for': row[1], 'status': row[2], 'worker': row[3],
+                         'duration_ms': row[4], 'error': row[5]}
+                for row in cursor.fetchall()
+            }
+        finally:
+            conn.close()
+
+    def prune_job_runs(self, days=90):
+        """Удаляет записи о запусках старше days дней. Возвращает число удаленных."""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'DELETE FROM job_runs WHERE started_at < DATE_SUB(NOW(), INTERVAL %s DAY)', (days,)
+            )
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    # Методы смены недели (services.rollover)
+    def get_rollover(self, date_str):
+        """Состояние смены недели на дату события; создает запись при первом обращении"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute('INSERT IGNORE INTO rollovers (date_str) VALUES (%s)', (date_str,))
+            conn.commit()
+            cursor.execute('''
+                SELECT date_str, stage, in_progress, cleared_events, message_id, finished_at
+                FROM rollovers WHERE date_str = %s
+            ''', (date_str,))
+            return cursor.fetchone()
+        finally:
+            conn.close()
+
+    def begin_rollover_stage(self, date_str, stage):
+        """Отмечает начало этапа с внешним эффектом (отправка сообщения).
+
+        Возвращает False, если такой этап уже идет или был прерван:
+        повторять его нельзя, сообщение могло уйти.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE rollovers SET in_progress = %s
+                WHERE date_str = %s AND in_progress IS NULL
+            ''', (stage, date_str))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def reset_rollover_stage(self, date_str):
+        """Снимает отметку начатого этапа, чтобы отправку можно было повторить.
+
+        Вызывается, когда сообщение точно не ушло, или администратором
+        (/rollover_reset) после проверки чата. Возвращает False, если
+        отметки не было.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE rollovers SET in_progress = NULL
+                WHERE date_str = %s AND in_progress IS NOT NULL
+            ''', (date_str,))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete_rollover_stage(self, date_str, stage, cleared_events=None, message_id=None):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE rollovers
+                SET stage = %s, in_progress = NULL,
+                    cleared_events = COALESCE(%s, cleared_events), message_id = COALESCE(%s, message_id)
+                WHERE date_str = %s
+            ''', (stage, cleared_events, message_id, date_str))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def finish_rollover(self, date_str, stage_ms):
+        """Отмечает смену недели завершенной; stage_ms — длительности этапов последнего запуска"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE rollovers SET stage_ms = %s, finished_at = COALESCE(finished_at, CURRENT_TIMESTAMP)
+                WHERE date_str = %s
+            ''', (json.dumps(stage_ms), date_str))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # Методы листа ожидания (services.waitlist)
+    def add_to_waitlist(self, date_str, user_id, username, position):
+        """Ставит пользователя в лист ожидания (повторно — только после истекшего или отмененного предложения).
+
+        position — ключ порядка (время нажатия в мкс). Возвращает
+        (статус, место среди ожидающих); место None, если статус не waiting.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            # position обновляется раньше status, пока IF видит прежний статус
+            cursor.execute('''
+                INSERT INTO waitlist (date_str, user_id, username, position, status)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    position = IF(status IN (%s, %s), VALUES(position), position),
+                    status = IF(status IN (%s, %s), VALUES(status), status)
+            ''', (date_str, user_id, username, position, WAITLIST_WAITING,
+                  WAITLIST_EXPIRED, WAITLIST_LEFT, WAITLIST_EXPIRED, WAITLIST_LEFT))
+            conn.commit()
+            cursor.execute('''
+                SELECT w.status, (
+                    SELECT COUNT(*) FROM waitlist ahead
+                    WHERE ahead.date_str = w.date_str AND ahead.status = %s AND ahead.position <= w.position
+                )
+                FROM waitlist w WHERE w.date_str = %s AND w.user_id = %s
+            ''', (WAITLIST_WAITING, date_str, user_id))
+            status, place = cursor.fetchone()
+            return status, place if status == WAITLIST_WAITING else None
+        finally:
+            conn.close()
+
+    def count_seat_holders(self, date_str):
+        """Сколько мест на дату занято или удерживается (см. UnitOfWork.count_seat_holders)"""
+        with self.unit_of_work() as uow:
+            return uow.count_seat_holders(date_str)
+
+    def get_free_seats(self, date_str, max_participants, user_id=None):
+        """Свободные места: лимит минус занятые и удерживаемые (см. UnitOfWork.count_seat_holders).
+
+        Место, удерживаемое самим user_id, считается свободным для него.
+        """
+        with self.unit_of_work() as uow:
+            return max_participants - uow.count_seat_holders(date_str, exclude_user_id=user_id)
+
+    def offer_next_waitlist_seat(self, date_str, max_participants, ttl_seconds):
+        """Предлагает свободное место первому ожидающему.
+
+        Участники блокируются, как при записи, поэтому место не уйдет
+        одновременно и в лист ожидания, и обычной записи; заявки на оплату
+        и действующие приглашения тоже считаются занятыми местами.
+        Возвращает {user_id, username} или None, если мест или ожидающих нет.
+        """
+        with self.unit_of_work() as uow:
+            uow.lock_bath_participants(date_str)
+            if uow.count_seat_holders(date_str) >= max_participants:
+                return None
+            entry = uow.next_waiting(date_str)
+            if entry is None:
+                return None
+            uow.mark_offered(entry['id'], ttl_seconds)
+        return {'user_id': entry['user_id'], 'username': entry['username']}
+
+    def accept_waitlist_offer(self, date_str, user_id, ttl_seconds):
+        """Подтверждает предложенное место, если предложение еще действует.
+
+        Подтвержденное место держится ttl_seconds: без заявки на оплату к этому
+        сроку его снимает expire_seat_holds.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE waitlist SET status = %s, offer_expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                WHERE date_str = %s AND user_id = %s AND status = %s AND offer_expires_at > NOW()
+            ''', (WAITLIST_ACCEPTED, ttl_seconds, date_str, user_id, WAITLIST_OFFERED))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def expire_waitlist_offer(self, date_str, user_id):
+        """Снимает истекшее предложение. Возвращает True, если место освободилось."""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE waitlist SET status = %s
+                WHERE date_str = %s AND user_id = %s AND status = %s AND offer_expires_at <= NOW()
+            ''', (WAITLIST_EXPIRED, date_str, user_id, WAITLIST_OFFERED))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def leave_waitlist(self, date_str, user_id):
+        """Убирает пользователя из листа ожидания (отказ от места, отклоненная оплата)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE waitlist SET status = %s
+                WHERE date_str = %s AND user_id = %s AND status IN (%s, %s, %s)
+            ''', (WAITLIST_LEFT, date_str, user_id, WAITLIST_WAITING, WAITLIST_OFFERED, WAITLIST_ACCEPTED))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def get_open_waitlist_offers(self):
+        """Действующие предложения для восстановления таймеров: [(date_str, user_id, секунд до истечения)]"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT date_str, user_id, TIMESTAMPDIFF(SECOND, NOW(), offer_expires_at)
+                FROM waitlist WHERE status = %s
+            ''', (WAITLIST_OFFERED,))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_waitlist_dates(self):
+        """Даты, на которые есть ожидающие"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT DISTINCT date_str FROM waitlist WHERE status = %s', (WAITLIST_WAITING,))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    # Методы для хранения состояния бота (используются DatabasePersistence)
+    def get_bot_user_data(self, user_id):
+        """Возвращает сериализованные user_data пользователя или None"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT data FROM bot_user_data WHERE user_id = %s', (user_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def get_bot_conversations(self, name):
+        """Возвращает список (ключ, состояние) незавершенных диалогов обработчика name"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT conversation_key, state FROM bot_conversations WHERE name = %s',
+                (name,)
+            )
+            return cursor.fetchall()
+        except mysql.connector.ProgrammingError as e:
+            # Диалоги загружаются при запуске, пока схема проверяется в фоне;
+            # в новой базе таблицы еще нет — создаем схему и повторяем
+            if e.errno != errorcode.ER_NO_SUCH_TABLE or self.schema_ready:
+                raise
+        finally:
+            conn.close()
+        self.ensure_schema()
+        return self.get_bot_conversations(name)
+
+    def save_bot_state(self, user_rows=(), user_deletes=(), conversation_rows=(), conversation_deletes=()):
+        """Записывает накопленные изменения состояния бота одной транзакцией.
+
+        user_rows — (user_id, data), conversation_rows — (name, ключ, состояние),
+        user_deletes — user_id, conversation_deletes — (name, ключ).
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if user_rows:
+                cursor.executemany('''
+                    INSERT INTO bot_user_data (user_id, data) VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE data=VALUES(data)
+                ''', list(user_rows))
+            if user_deletes:
+                cursor.executemany('DELETE FROM bot_user_data WHERE user_id = %s', [(user_id,) for user_id in user_deletes])
+            if conversation_rows:
+                cursor.executemany('''
+                    INSERT INTO bot_conversations (name, conversation_key, state) VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE state=VALUES(state)
+                ''', list(conversation_rows))
+            if conversation_deletes:
+                cursor.executemany(
+                    'DELETE FROM bot_conversations WHERE name = %s AND conversation_key = %s',
+                    list(conversation_deletes)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_mention_users(self, target='all', date_str=None, dates=None):
+        """Возвращает пользователей для упоминания: user_id, username, full_name.
+
+        target: 'all' — все с профилем, 'participants' — записанные на date_str,
+        'unregistered' — с профилем, но не записанные на date_str,
+        'history' — записывавшиеся на любую из дат dates.
+        Все варианты фильтруют по индексированным колонкам date_str и user_id.
+        username берется только из профиля: в записях участников вместо него
+        может быть сохранено имя.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if target == 'all':
+                cursor.execute('SELECT user_id, username, full_name FROM user_profiles ORDER BY id')
+            elif target == 'participants':
+                cursor.execute('''
+                    SELECT bp.user_id, up.username, COALESCE(up.full_name, bp.username)
+                    FROM bath_participants bp
+                    LEFT JOIN user_profiles up ON up.user_id = bp.user_id
+                    WHERE bp.date_str = %s AND bp.user_id <> 0
+                    ORDER BY bp.id
+                ''', (date_str,))
+            elif target == 'unregistered':
+                cursor.execute('''
+                    SELECT up.user_id, up.username, up.full_name
+                    FROM user_profiles up
+                    LEFT JOIN bath_participants bp ON bp.user_id = up.user_id AND bp.date_str = %s
+                    WHERE bp.id IS NULL
+                    ORDER BY up.id
+                ''', (date_str,))
+            elif target == 'history':
+                if not dates:
+                    return []
+                placeholders = ', '.join(['%s'] * len(dates))
+                cursor.execute(f'''
+                    SELECT h.user_id, MAX(up.username), MAX(COALESCE(up.full_name, h.username))
+                    FROM bath_history h
+                    LEFT JOIN user_profiles up ON up.user_id = h.user_id
+                    WHERE h.date_str IN ({placeholders})
+                    GROUP BY h.user_id
+                    ORDER BY h.user_id
+                ''', tuple(dates))
+            else:
+                raise ValueError(f"Unknown mention target: {target}")
+            return [{'user_id': row[0], 'username': row[1], 'full_name': row[2]} for row in cursor.fetchall()]
+        finally:
+            conn.close()
@@ -1,12 +1,20 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from telegram import Update, BotCommand
 from telegram.ext import ContextTypes
-from config import ADMIN_IDS, BATH_CHAT_ID
-from database import Database
+from config import ADMIN_IDS, BATH_CHAT_ID, BROADCAST_MAX_FAILURES, CPU_PROFILE_DEFAULT_SECONDS
+from database import get_database, PAYMENT_CONFIRMED, PROFILE_MISSING, NO_SEATS, BROADCAST_CANCELLED
+from services.notification import get_dispatcher
+from services.broadcast import parse_target, start_broadcast
+from utils.locks import run_for_event
+from services.mentions import parse_mention_filter, get_mention_chunks
+from utils.callback_data import decode_callback, ADMIN_CONFIRM
+from utils.metrics import handler_metrics
+from services.profiler import cpu_profiler, ProfilerBusy
 from telegram.ext import ConversationHandler
 
-db = Database()
+db = get_database()
 logger = logging.getLogger(__name__)
 
 async def add_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -23,7 +31,7 @@ async def add_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("У вас нет прав для выполнения этой команды.")
-            logger.warning(f"[add_subscriber] Non-admin user {admin_id} attempted to add subscriber")
+            logger.warning("[add_subscriber] Non-admin user %s attempted to add subscriber", admin_id)
             return
             
         if len(context.args) != 2:
@@ -40,7 +48,7 @@ async def add_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
             target_id = int(target)
             user = await context.bot.get_chat(target_id)
             username = user.username or f"{user.first_name} {user.last_name or ''}"
-            logger.info(f"[add_subscriber] Adding subscription for user {username} (ID: {target_id}) for {days} days")
+            logger.info("[add_subscriber] Adding subscription for user %s (ID: %s) for %s days", username, target_id, days)
         except ValueError:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
@@ -48,7 +56,7 @@ async def add_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.warning("[add_subscriber] Invalid user_id format")
             return
         except Exception as e:
-            logger.error(f"[add_subscriber] Error getting user info: {e}", exc_info=True)
+            logger.error("[add_subscriber] Error getting user info: %s", e, exc_info=True)
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Не удалось получить информацию о пользователе.")
@@ -57,7 +65,7 @@ async def add_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
         paid_until = (datetime.now() + timedelta(days=days)).timestamp()
         try:
             db.add_subscriber(target_id, username, paid_until)
-            logger.info(f"[add_subscriber] Successfully added subscription for {username} (ID: {target_id})")
+            logger.info("[add_subscriber] Successfully added subscription for %s (ID: %s)", username, target_id)
             
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
@@ -69,24 +77,24 @@ async def add_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     chat_id=target_id,
                     text=f"Вам добавлена подписка на {days} дней. Спасибо за поддержку!"
                 )
-                logger.info(f"[add_subscriber] Sent notification to user {target_id}")
+                logger.info("[add_subscriber] Sent notification to user %s", target_id)
             except Exception as e:
-                logger.error(f"[add_subscriber] Error sending notification to user: {e}", exc_info=True)
+                logger.error("[add_subscriber] Error sending notification to user: %s", e, exc_info=True)
                 
         except Exception as e:
-            logger.error(f"[add_subscriber] Error adding subscription: {e}", exc_info=True)
+            logger.error("[add_subscriber] Error adding subscription: %s", e, exc_info=True)
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла ошибка при добавлении подписки.")
                 
     except Exception as e:
-        logger.error(f"[add_subscriber] Unexpected error: {e}", exc_info=True)
+        logger.error("[add_subscriber] Unexpected error: %s", e, exc_info=True)
         try:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла непредвиденная ошибка при добавлении подписки.")
         except Exception as inner_e:
-            logger.error(f"[add_subscriber] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[add_subscriber] Error sending error message: %s", inner_e, exc_info=True)
 
 async def remove_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -101,7 +109,7 @@ async def remove_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         try:
             target_id = int(context.args[0])
-            logger.info(f"[remove_subscriber] Attempting to remove subscriber {target_id}")
+            logger.info("[remove_subscriber] Attempting to remove subscriber %s", target_id)
             
             result = db.remove_subscriber(target_id)
             message = update.message or (update.callback_query and update.callback_query.message)
@@ -109,26 +117,26 @@ async def remove_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if result:
                 if message:
                     await message.reply_text(f"Подписка для пользователя с ID {target_id} удалена.")
-                logger.info(f"[remove_subscriber] Successfully removed subscriber {target_id}")
+                logger.info("[remove_subscriber] Successfully removed subscriber %s", target_id)
             else:
                 if message:
                     await message.reply_text(f"Пользователь с ID {target_id} не найден в базе подписчиков.")
-                logger.warning(f"[remove_subscriber] User {target_id} not found in subscribers")
+                logger.warning("[remove_subscriber] User %s not found in subscribers", target_id)
                 
         except ValueError:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Пожалуйста, укажите корректный user_id.")
-            logger.warning(f"[remove_subscriber] Invalid user_id provided: {context.args[0]}")
+            logger.warning("[remove_subscriber] Invalid user_id provided: %s", context.args[0])
             
     except Exception as e:
-        logger.error(f"[remove_subscriber] Unexpected error: {e}", exc_info=True)
+        logger.error("[remove_subscriber] Unexpected error: %s", e, exc_info=True)
         try:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла непредвиденная ошибка при удалении подписчика.")
         except Exception as inner_e:
-            logger.error(f"[remove_subscriber] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[remove_subscriber] Error sending error message: %s", inner_e, exc_info=True)
 
 async def check_subscriptions(context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -139,47 +147,33 @@ async def check_subscriptions(context: ContextTypes.DEFAULT_TYPE):
             logger.info("[check_subscriptions] No expired subscriptions found")
             return
             
-        logger.info(f"[check_subscriptions] Found {len(expired_subscribers)} expired subscriptions")
+        logger.info("[check_subscriptions] Found %s expired subscriptions", len(expired_subscribers))
         
+        # Уведомления пользователям и администраторам уходят одной массовой рассылкой через диспетчер
+        messages = []
         for subscriber in expired_subscribers:
-            try:
-                user_id = subscriber['user_id']
-                username = subscriber['username']
-                
-                # Уведомляем пользователя
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text="Ваша подписка истекла. Пожалуйста, продлите подписку для продолжения использования бота."
-                    )
-                    logger.info(f"[check_subscriptions] Sent expiration notification to user {user_id}")
-                except Exception as e:
-                    logger.error(f"[check_subscriptions] Error sending notification to user {user_id}: {e}", exc_info=True)
-                    
-                # Уведомляем администраторов
-                for admin_id in ADMIN_IDS:
-                    try:
-                        await context.bot.send_message(
-                            chat_id=admin_id,
-                            text=f"Подписка пользователя {username} (ID: {user_id}) истекла."
-                        )
-                        logger.info(f"[check_subscriptions] Sent admin notification about user {user_id}")
-                    except Exception as e:
-                        logger.error(f"[check_subscriptions] Error sending admin notification: {e}", exc_info=True)
-                        
-            except Exception as e:
-                logger.error(f"[check_subscriptions] Error processing subscriber {subscriber}: {e}", exc_info=True)
-                continue
+            user_id = subscriber['user_id']
+            username = subscriber['username']
+            messages.append({
+                'chat_id': user_id,
+                'text': "Ваша подписка истекла. Пожалуйста, продлите подписку для продолжения использования бота."
+            })
+            messages.extend(
+                {'chat_id': admin_id, 'text': f"Подписка пользователя {username} (ID: {user_id}) истекла."}
+                for admin_id in ADMIN_IDS
+            )
+        sent, failed = await get_dispatcher(context).send_many(messages, bulk=True)
+        logger.info("[check_subscriptions] Sent %s notifications, failed %s", len(sent), len(failed))
                 
         # Удаляем истекшие подписки
         try:
             db.remove_expired_subscribers()
             logger.info("[check_subscriptions] Removed expired subscriptions")
         except Exception as e:
-            logger.error(f"[check_subscriptions] Error removing expired subscriptions: {e}", exc_info=True)
+            logger.error("[check_subscriptions] Error removing expired subscriptions: %s", e, exc_info=True)
             
     except Exception as e:
-        logger.error(f"[check_subscriptions] Unexpected error: {e}", exc_info=True)
+        logger.error("[check_subscriptions] Unexpected error: %s", e, exc_info=True)
 
 async def handle_message_to_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -194,7 +188,7 @@ async def handle_message_to_user(update: Update, context: ContextTypes.DEFAULT_T
             query = None
             
         admin_id = update.effective_user.id
-        logger.info(f"[handle_message_to_user] Admin {admin_id} attempting to send message")
+        logger.info("[handle_message_to_user] Admin %s attempting to send message", admin_id)
         
         if context.user_data.get('messaging_user_id'):
             pass
@@ -208,7 +202,7 @@ async def handle_message_to_user(update: Update, context: ContextTypes.DEFAULT_T
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("У вас нет прав для выполнения этой операции.")
-            logger.warning(f"[handle_message_to_user] Non-admin user {admin_id} attempted to send message")
+            logger.warning("[handle_message_to_user] Non-admin user %s attempted to send message", admin_id)
             return ConversationHandler.END
             
         if query:
@@ -218,13 +212,13 @@ async def handle_message_to_user(update: Update, context: ContextTypes.DEFAULT_T
         # ... (оставить обработку отправки сообщения пользователю) ...
         
     except Exception as e:
-        logger.error(f"[handle_message_to_user] Unexpected error: {e}", exc_info=True)
+        logger.error("[handle_message_to_user] Unexpected error: %s", e, exc_info=True)
         try:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла непредвиденная ошибка при отправке сообщения.")
         except Exception as inner_e:
-            logger.error(f"[handle_message_to_user] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[handle_message_to_user] Error sending error message: %s", inner_e, exc_info=True)
         return ConversationHandler.END
 
 async def mark_paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -241,7 +235,7 @@ async def mark_paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("У вас нет прав для выполнения этой команды.")
-            logger.warning(f"[mark_paid] Non-admin user {admin_id} attempted to mark payment")
+            logger.warning("[mark_paid] Non-admin user %s attempted to mark payment", admin_id)
             return
 
         if len(context.args) != 2:
@@ -260,11 +254,11 @@ async def mark_paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text(f"Пользователь @{username} не найден.")
-            logger.warning(f"[mark_paid] User @{username} not found")
+            logger.warning("[mark_paid] User @%s not found", username)
             return
 
         # Отметить оплату в базе
-        result = db.mark_participant_paid(date_str, user_id)
+        result = await run_for_event(date_str, db.mark_participant_paid, date_str, user_id)
         message = update.message or (update.callback_query and update.callback_query.message)
         if result:
             if message:
@@ -275,20 +269,20 @@ async def mark_paid(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text=f"Ваша оплата за баню {date_str} подтверждена администратором!"
                 )
             except Exception as e:
-                logger.error(f"[mark_paid] Error sending notification to user: {e}", exc_info=True)
-            logger.info(f"[mark_paid] Payment marked as paid for @{username} ({user_id}) on {date_str}")
+                logger.error("[mark_paid] Error sending notification to user: %s", e, exc_info=True)
+            logger.info("[mark_paid] Payment marked as paid for @%s (%s) on %s", username, user_id, date_str)
         else:
             if message:
                 await message.reply_text(f"Не удалось отметить оплату пользователя @{username} за {date_str}. Проверьте данные.")
-            logger.warning(f"[mark_paid] Failed to mark payment for @{username} on {date_str}")
+            logger.warning("[mark_paid] Failed to mark payment for @%s on %s", username, date_str)
     except Exception as e:
-        logger.error(f"[mark_paid] Unexpected error: {e}", exc_info=True)
+        logger.error("[mark_paid] Unexpected error: %s", e, exc_info=True)
         try:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла непредвиденная ошибка при подтверждении оплаты.")
         except Exception as inner_e:
-            logger.error(f"[mark_paid] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[mark_paid] Error sending error message: %s", inner_e, exc_info=True)
 
 async def update_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
     admin_id = update.effective_user.id
@@ -307,43 +301,209 @@ async def update_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
         BotCommand("remove_subscriber", "Удалить подписчика (/remove_subscriber user_id)"),
         BotCommand("update_commands", "Обновить меню команд (только для админа)"),
         BotCommand("export_profiles", "Экспорт всех профилей пользователей"),
-        BotCommand("mention_all", "Упомянуть всех активных пользователей"),
+        BotCommand("mention_all", "Упомянуть пользователей (/mention_all all|participants|unregistered|lastN)"),
         BotCommand("mark_visit", "Отметить посещение бани"),
         BotCommand("clear_db", "Полная очистка базы данных (только для админа)"),
-        BotCommand("remove_registration", "Удалить регистрацию пользователя на баню (/remove_registration username DD.MM.YYYY")
+        BotCommand("remove_registration", "Удалить регистрацию пользователя на баню (/remove_registration username DD.MM.YYYY"),
+        BotCommand("broadcast", "Рассылка в личные сообщения (/broadcast all|participants|lastN текст)"),
+        BotCommand("broadcast_cancel", "Остановить рассылку (/broadcast_cancel id)"),
+        BotCommand("perf", "Время обработки по обработчикам (/perf [reset])"),
+        BotCommand("cpu_profile", "Профилирование CPU (/cpu_profile секунд)"),
+        BotCommand("jobs", "Периодические задачи и их последние запуски"),
+        BotCommand("rollover_reset", "Разрешить повторную отправку при смене недели (/rollover_reset DD.MM.YYYY)")
     ]
     await context.bot.set_my_commands(commands)
     await update.message.reply_text("Меню команд обновлено.")
 
 async def mention_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Упоминает пользователей: /mention_all [all|participants|unregistered|lastN]"""
     try:
         admin_id = update.effective_user.id
         if admin_id not in ADMIN_IDS:
             await update.message.reply_text("У вас нет прав для выполнения этой команды.")
             return
 
-        # Получаем всех активных пользователей
-        users = db.get_all_active_users()
-        if not users:
-            await update.message.reply_text("Нет активных пользователей для упоминания.")
+        mention_filter = parse_mention_filter(context.args[0]) if context.args else ('all', None)
+        if not mention_filter:
+            await update.message.reply_text(
+                "Использование: /mention_all [фильтр]\n"
+                "all — все с профилем, participants — участники ближайшей бани, "
+                "unregistered — ещё не записавшиеся, lastN — посещавшие за N последних недель (например, last4)."
+            )
             return
+        target, weeks = mention_filter
 
-        mentions = []
-        for user in users:
-            username = user.get('username')
-            if username:
-                mentions.append(f"@{username}")
-            else:
-                mentions.append(user.get('full_name', ''))
-        text = " ".join(mentions)
-        if not text.strip():
+        from handlers.bath import get_next_sunday
+        chunks = await asyncio.to_thread(get_mention_chunks, db, target, get_next_sunday(), weeks)
+        if not chunks:
             await update.message.reply_text("Нет пользователей для упоминания.")
             return
-        await update.message.reply_text(text)
+        # Части отправляются по очереди, чтобы сохранить порядок в чате
+        dispatcher = get_dispatcher(context)
+        for chunk in chunks:
+            await dispatcher.send_message(update.effective_chat.id, chunk, parse_mode='HTML')
+        logger.info("[mention_all] Sent %s messages (%s, weeks=%s)", len(chunks), target, weeks)
     except Exception as e:
-        logger.error(f"[mention_all] Unexpected error: {e}", exc_info=True)
+        logger.error("[mention_all] Unexpected error: %s", e, exc_info=True)
         await update.message.reply_text("Произошла ошибка при упоминании пользователей.")
 
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Массовая рассылка в личные сообщения: /broadcast all|participants|lastN текст"""
+    try:
+        admin_id = update.effective_user.id
+        if admin_id not in ADMIN_IDS:
+            await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+            return
+
+        parts = update.message.text.split(maxsplit=2)
+        target = parse_target(parts[1]) if len(parts) == 3 else None
+        if not target:
+            await update.message.reply_text(
+                "Использование: /broadcast <аудитория> <текст>\n"
+                "Аудитория: all — все с профилем, participants — участники ближайшей бани, "
+                "lastN — записывавшиеся на N последних бань (например, last4)."
+            )
+            return
+        target_name, last_events = target
+        text = parts[2]
+
+        from handlers.bath import get_next_sunday
+        user_ids = await asyncio.to_thread(
+            db.get_broadcast_audience, target_name, date_str=get_next_sunday(), last_events=last_events
+        )
+        broadcast_id, total = await asyncio.to_thread(
+            db.create_broadcast, admin_id, text, parts[1].lower(), user_ids, max_failures=BROADCAST_MAX_FAILURES
+        )
+        if not total:
+            await asyncio.to_thread(db.finish_broadcast, broadcast_id)
+            await update.message.reply_text("Нет получателей для рассылки.")
+            return
+        await update.message.reply_text(
+            f"Рассылка #{broadcast_id} запущена: {total} получателей "
+            f"(пропущено недоставляемых: {len(set(user_ids)) - total}).\n"
+            f"Остановить: /broadcast_cancel {broadcast_id}"
+        )
+        logger.info("[broadcast] Admin %s started broadcast #%s to %s users (%s)", admin_id, broadcast_id, total, parts[1])
+        start_broadcast(context.application, broadcast_id)
+    except Exception as e:
+        logger.error("[broadcast] Unexpected error: %s", e, exc_info=True)
+        await update.message.reply_text("Произошла ошибка при запуске рассылки.")
+
+async def broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        admin_id = update.effective_user.id
+        if admin_id not in ADMIN_IDS:
+            await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+            return
+        if len(context.args) != 1 or not context.args[0].isdigit():
+            await update.message.reply_text("Использование: /broadcast_cancel <id рассылки>")
+            return
+        broadcast_id = int(context.args[0])
+        if await asyncio.to_thread(db.finish_broadcast, broadcast_id, BROADCAST_CANCELLED):
+            await update.message.reply_text(f"Рассылка #{broadcast_id} будет остановлена после текущей пачки.")
+        else:
+            await update.message.reply_text(f"Рассылка #{broadcast_id} не найдена или уже завершена.")
+    except Exception as e:
+        logger.error("[broadcast_cancel] Unexpected error: %s", e, exc_info=True)
+        await update.message.reply_text("Произошла ошибка при остановке рассылки.")
+
+async def perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Время обработки обновлений по обработчикам: /perf или /perf reset"""
+    try:
+        admin_id = update.effective_user.id
+        if admin_id not in ADMIN_IDS:
+            await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+            return
+        if context.args and context.args[0] == 'reset':
+            handler_metrics.reset()
+            await update.message.reply_text("Статистика сброшена.")
+            return
+        text = handler_metrics.render_text()
+        dispatcher = context.bot_data.get('dispatcher')
+        if dispatcher:
+            text += f"\nИсходящая очередь: {dispatcher.queue_size()}"
+        await update.message.reply_text(text)
+    except Exception as e:
+        logger.error("[perf] Unexpected error: %s", e, exc_info=True)
+        await update.message.reply_text("Произошла ошибка при получении статистики.")
+
+async def jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Расписание и последние запуски задач планировщика"""
+    try:
+        admin_id = update.effective_user.id
+        if admin_id not in ADMIN_IDS:
+            await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+            return
+        scheduler = context.bot_data.get('scheduler')
+        if scheduler is None:
+            await update.message.reply_text("Планировщик не запущен.")
+            return
+        await update.message.reply_text(await scheduler.status_text())
+    except Exception as e:
+        logger.error("[jobs] Unexpected error: %s", e, exc_info=True)
+        await update.message.reply_text("Произошла ошибка при получении списка задач.")
+
+async def rollover_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Снимает отметку прерванной отправки смены недели: /rollover_reset DD.MM.YYYY"""
+    try:
+        admin_id = update.effective_user.id
+        if admin_id not in ADMIN_IDS:
+            await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+            return
+        if len(context.args) != 1:
+            await update.message.reply_text("Использование: /rollover_reset <DD.MM.YYYY>")
+            return
+        date_str = context.args[0]
+        try:
+            datetime.strptime(date_str, "%d.%m.%Y")
+        except ValueError:
+            await update.message.reply_text("Дата должна быть в формате DD.MM.YYYY.")
+            return
+        if await asyncio.to_thread(db.reset_rollover_stage, date_str):
+            logger.warning("[rollover_reset] Admin %s reset interrupted rollover stage for %s", admin_id, date_str)
+            await update.message.reply_text(
+                f"Отметка прерванной отправки за {date_str} снята. Повторите /create_bath, чтобы продолжить смену недели."
+            )
+        else:
+            await update.message.reply_text(f"Для {date_str} нет прерванной отправки.")
+    except Exception as e:
+        logger.error("[rollover_reset] Unexpected error: %s", e, exc_info=True)
+        await update.message.reply_text("Произошла ошибка при сбросе этапа смены недели.")
+
+async def cpu_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Профилирование CPU процесса: /cpu_profile [секунд]; отчет и .pstats приходят в этот чат"""
+    try:
+        admin_id = update.effective_user.id
+        if admin_id not in ADMIN_IDS:
+            await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+            return
+        if context.args and not context.args[0].isdigit():
+            await update.message.reply_text("Использование: /cpu_profile [секунд]")
+            return
+        seconds = int(context.args[0]) if context.args else CPU_PROFILE_DEFAULT_SECONDS
+        chat_id = update.effective_chat.id
+        dispatcher = get_dispatcher(context)
+
+        async def send_report(report, path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            await dispatcher.send_message(chat_id, report)
+            await dispatcher.call(
+                'send_document', chat_id,
+                document=data, filename=f"cpu_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pstats"
+            )
+
+        try:
+            cpu_profiler.start(seconds, send_report)
+        except (ProfilerBusy, ValueError) as e:
+            await update.message.reply_text(f"Профилирование не запущено: {e}")
+            return
+        logger.info("[cpu_profile] Admin %s started profiling for %s s", admin_id, seconds)
+        await update.message.reply_text(f"Профилирование запущено на {seconds} с. Отчет придет в этот чат.")
+    except Exception as e:
+        logger.error("[cpu_profile] Unexpected error: %s", e, exc_info=True)
+        await update.message.reply_text("Произошла ошибка при запуске профилирования.")
+
 async def mark_visit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if update.effective_chat.type != "private":
@@ -358,7 +518,7 @@ async def mark_visit(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("У вас нет прав для выполнения этой команды.")
-            logger.warning(f"[mark_visit] Non-admin user {admin_id} attempted to mark visit")
+            logger.warning("[mark_visit] Non-admin user %s attempted to mark visit", admin_id)
             return
 
         if len(context.args) != 2:
@@ -377,7 +537,7 @@ async def mark_visit(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text(f"Пользователь @{username} не найден.")
-            logger.warning(f"[mark_visit] User @{username} not found")
+            logger.warning("[mark_visit] User @%s not found", username)
             return
 
         # Отметить посещение в базе
@@ -392,20 +552,20 @@ async def mark_visit(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text=f"Ваше посещение бани {date_str} отмечено администратором!"
                 )
             except Exception as e:
-                logger.error(f"[mark_visit] Error sending notification to user: {e}", exc_info=True)
-            logger.info(f"[mark_visit] Visit marked for @{username} ({user_id}) on {date_str}")
+                logger.error("[mark_visit] Error sending notification to user: %s", e, exc_info=True)
+            logger.info("[mark_visit] Visit marked for @%s (%s) on %s", username, user_id, date_str)
         else:
             if message:
                 await message.reply_text(f"Не удалось отметить посещение пользователя @{username} за {date_str}. Проверьте данные.")
-            logger.warning(f"[mark_visit] Failed to mark visit for @{username} on {date_str}")
+            logger.warning("[mark_visit] Failed to mark visit for @%s on %s", username, date_str)
     except Exception as e:
-        logger.error(f"[mark_visit] Unexpected error: {e}", exc_info=True)
+        logger.error("[mark_visit] Unexpected error: %s", e, exc_info=True)
         try:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла непредвиденная ошибка при отметке посещения.")
         except Exception as inner_e:
-            logger.error(f"[mark_visit] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[mark_visit] Error sending error message: %s", inner_e, exc_info=True)
 
 async def clear_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -421,22 +581,22 @@ async def clear_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("У вас нет прав для выполнения этой команды.")
-            logger.warning(f"[clear_db] Non-admin user {admin_id} attempted to clear DB")
+            logger.warning("[clear_db] Non-admin user %s attempted to clear DB", admin_id)
             return
 
         db.clear_all_data()
         message = update.message or (update.callback_query and update.callback_query.message)
         if message:
             await message.reply_text("База данных полностью очищена.")
-        logger.info(f"[clear_db] Database cleared by admin {admin_id}")
+        logger.info("[clear_db] Database cleared by admin %s", admin_id)
     except Exception as e:
-        logger.error(f"[clear_db] Unexpected error: {e}", exc_info=True)
+        logger.error("[clear_db] Unexpected error: %s", e, exc_info=True)
         try:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла ошибка при очистке базы данных.")
         except Exception as inner_e:
-            logger.error(f"[clear_db] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[clear_db] Error sending error message: %s", inner_e, exc_info=True)
 
 async def remove_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -452,7 +612,7 @@ async def remove_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("У вас нет прав для выполнения этой команды.")
-            logger.warning(f"[remove_registration] Non-admin user {admin_id} attempted to remove registration")
+            logger.warning("[remove_registration] Non-admin user %s attempted to remove registration", admin_id)
             return
 
         if len(context.args) != 2:
@@ -471,11 +631,11 @@ async def remove_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text(f"Пользователь @{username} не найден.")
-            logger.warning(f"[remove_registration] User @{username} not found")
+            logger.warning("[remove_registration] User @%s not found", username)
             return
 
         # Удалить пользователя из участников на дату
-        result = db.remove_bath_participant(date_str, user_id)
+        result = await run_for_event(date_str, db.remove_bath_participant, date_str, user_id)
         message = update.message or (update.callback_query and update.callback_query.message)
         if result:
             if message:
@@ -486,20 +646,20 @@ async def remove_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
                     text=f"Ваша регистрация на баню {date_str} была удалена администратором."
                 )
             except Exception as e:
-                logger.error(f"[remove_registration] Error sending notification to user: {e}", exc_info=True)
-            logger.info(f"[remove_registration] Registration removed for @{username} ({user_id}) on {date_str}")
+                logger.error("[remove_registration] Error sending notification to user: %s", e, exc_info=True)
+            logger.info("[remove_registration] Registration removed for @%s (%s) on %s", username, user_id, date_str)
         else:
             if message:
                 await message.reply_text(f"Не удалось удалить регистрацию пользователя @{username} на {date_str}. Проверьте данные.")
-            logger.warning(f"[remove_registration] Failed to remove registration for @{username} on {date_str}")
+            logger.warning("[remove_registration] Failed to remove registration for @%s on %s", username, date_str)
     except Exception as e:
-        logger.error(f"[remove_registration] Unexpected error: {e}", exc_info=True)
+        logger.error("[remove_registration] Unexpected error: %s", e, exc_info=True)
         try:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла непредвиденная ошибка при удалении регистрации.")
         except Exception as inner_e:
-            logger.error(f"[remove_registration] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[remove_registration] Error sending error message: %s", inner_e, exc_info=True)
 
 async def cash_list(update: Update = None, context: ContextTypes.DEFAULT_TYPE = None, silent: bool = False):
     """
@@ -512,7 +672,7 @@ async def cash_list(update: Update = None, context: ContextTypes.DEFAULT_TYPE =
             user_id = update.effective_user.id
             if user_id not in ADMIN_IDS:
                 await update.message.reply_text("У вас нет прав для выполнения этой команды.")
-                logger.warning(f"[cash_list] Non-admin user {user_id} attempted to get cash list")
+                logger.warning("[cash_list] Non-admin user %s attempted to get cash list", user_id)
                 return
         # Получаем ближайшую дату бани
         from handlers.bath import get_next_sunday
@@ -527,91 +687,90 @@ async def cash_list(update: Update = None, context: ContextTypes.DEFAULT_TYPE =
                 username = p['username'] or f"ID: {p['user_id']}"
                 text += f"{i}. {username}\n"
         # Отправляем всем администраторам, кроме того, кто вызвал команду в личке
-        for admin_id in ADMIN_IDS:
-            if update and not silent and admin_id == update.effective_user.id and update.effective_chat.type == "private":
-                continue
-            try:
-                await context.bot.send_message(chat_id=admin_id, text=text)
-            except Exception as e:
-                logger.error(f"[cash_list] Error sending to admin {admin_id}: {e}")
+        messages = [
+            {'chat_id': admin_id, 'text': text}
+            for admin_id in ADMIN_IDS
+            if not (update and not silent and admin_id == update.effective_user.id and update.effective_chat.type == "private")
+        ]
+        await get_dispatcher(context).send_many(messages, bulk=silent)
         # Если вызвано вручную, выводим список только в чат, где вызвали команду
         if update and not silent:
             await update.message.reply_text(text)
     except Exception as e:
-        logger.error(f"[cash_list] Unexpected error: {e}", exc_info=True)
-        if update and not silent:
+        logger.error("[cash_list] Unexpected error: %s", e, exc_info=True)
+        if silent:
+            # Запуск из планировщика: ошибка попадет в журнал job_runs
+            raise
+        if update:
             await update.message.reply_text("Произошла ошибка при получении списка наличных.")
 
 async def admin_confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id, date_str, payment_type):
     try:
         query = update.callback_query
         user = query.from_user
-        logger.info(f"[admin_confirm_payment] CallbackQuery received: data={query.data}, chat_type={update.effective_chat.type}, user_id={user.id}")
+        logger.info("[admin_confirm_payment] CallbackQuery received: data=%s, chat_type=%s, user_id=%s", query.data, update.effective_chat.type, user.id)
         await query.answer()
         if user.id not in ADMIN_IDS:
-            logger.warning(f"[admin_confirm_payment] Non-admin user {user.id} attempted to confirm payment")
+            logger.warning("[admin_confirm_payment] Non-admin user %s attempted to confirm payment", user.id)
             await query.edit_message_text("У вас нет прав для выполнения этой операции.")
             return
-        callback_data = query.data
-        parts = callback_data.split("_")
-        if parts[0] == "admin" and parts[1] == "confirm":
-            user_id = int(parts[2])
-            date_str = parts[3]
-            payment_type = parts[4] if len(parts) > 4 else None
-            user_data = db.get_pending_payment(user_id, date_str, payment_type)
-            logger.info(f"[admin_confirm_payment] Looking for payment: user_id={user_id}, date_str={date_str}, payment_type={payment_type}")
-            logger.info(f"[admin_confirm_payment] Found payment data: {user_data}")
-            if user_data:
-                profile = db.get_user_profile(user_id)
-                if not profile:
-                    logger.warning(f"[admin_confirm_payment] No profile found for user {user_id}")
-                    await query.edit_message_text(
-                        text="Пользователь не заполнил профиль. Сначала нужно заполнить профиль, а затем подтвердить оплату."
-                    )
-                    try:
-                        await context.bot.send_message(
-                            chat_id=user_id,
-                            text="Пожалуйста, заполните профиль командой /profile, чтобы администратор мог подтвердить вашу оплату."
-                        )
-                    except Exception as e:
-                        logger.error(f"[admin_confirm_payment] Error sending profile request to user: {e}", exc_info=True)
-                    return
-                # Подтверждаем оплату
+        action, fields = decode_callback(query.data)
+        if action == ADMIN_CONFIRM:
+            user_id, date_str, payment_type = fields['user_id'], fields['date_str'], fields['payment_type']
+            logger.info("[admin_confirm_payment] Confirming payment: user_id=%s, date_str=%s, payment_type=%s", user_id, date_str, payment_type)
+            try:
+                status, user_data = await run_for_event(date_str, db.confirm_payment, user_id, date_str, payment_type)
+            except Exception as e:
+                logger.error("[admin_confirm_payment] Error confirming payment: %s", e, exc_info=True)
+                await query.edit_message_text(
+                    text="Произошла ошибка при подтверждении оплаты."
+                )
+                return
+            if status == PROFILE_MISSING:
+                logger.warning("[admin_confirm_payment] No profile found for user %s", user_id)
+                await query.edit_message_text(
+                    text="Пользователь не заполнил профиль. Сначала нужно заполнить профиль, а затем подтвердить оплату."
+                )
                 try:
-                    if payment_type == 'cash':
-                        username = profile['username'] or profile['full_name']
-                        db.add_bath_participant(date_str, user_id, username, paid=False, cash=True)
-                    else:
-                        db.confirm_payment(user_id, date_str, payment_type)
-                    logger.info(f"[admin_confirm_payment] Payment confirmed for user {user_id}")
-                    try:
-                        await context.bot.send_message(
-                            chat_id=user_id,
-                            text=f"Ваша оплата за баню {date_str} подтверждена администратором."
-                        )
-                        logger.info(f"[admin_confirm_payment] Sent confirmation to user {user_id}")
-                    except Exception as e:
-                        logger.error(f"[admin_confirm_payment] Error sending confirmation to user: {e}", exc_info=True)
-                    await query.edit_message_text(
-                        text=f"Оплата пользователя {user_data['username']} подтверждена."
+                    await context.bot.send_message(
+                        chat_id=user_id,
+                        text="Пожалуйста, заполните профиль командой /profile, чтобы администратор мог подтвердить вашу оплату."
                     )
                 except Exception as e:
-                    logger.error(f"[admin_confirm_payment] Error confirming payment: {e}", exc_info=True)
-                    await query.edit_message_text(
-                        text="Произошла ошибка при подтверждении оплаты."
-                    )
-            else:
-                logger.warning(f"[admin_confirm_payment] No payment found for user {user_id}")
+                    logger.error("[admin_confirm_payment] Error sending profile request to user: %s", e, exc_info=True)
+                return
+            if status == NO_SEATS:
+                logger.warning("[admin_confirm_payment] No seats left on %s for user %s", date_str, user_id)
+                await query.edit_message_text(
+                    text=f"На {date_str} свободных мест нет: оплату пользователя нельзя подтвердить. "
+                         f"Заявка осталась в ожидании — освободите место или отклоните оплату."
+                )
+                return
+            if status != PAYMENT_CONFIRMED:
+                logger.warning("[admin_confirm_payment] No payment found for user %s", user_id)
                 await query.edit_message_text(
                     text="Заявка на оплату не найдена."
                 )
+                return
+            logger.info("[admin_confirm_payment] Payment confirmed for user %s", user_id)
+            try:
+                await context.bot.send_message(
+                    chat_id=user_id,
+                    text=f"Ваша оплата за баню {date_str} подтверждена администратором."
+                )
+                logger.info("[admin_confirm_payment] Sent confirmation to user %s", user_id)
+            except Exception as e:
+                logger.error("[admin_confirm_payment] Error sending confirmation to user: %s", e, exc_info=True)
+            await query.edit_message_text(
+                text=f"Оплата пользователя {user_data['username']} подтверждена."
+            )
     except Exception as e:
-        logger.error(f"[admin_confirm_payment] Unexpected error: {e}", exc_info=True)
+        logger.error("[admin_confirm_payment] Unexpected error: %s", e, exc_info=True)
         try:
             await query.edit_message_text(
                 text="Произошла непредвиденная ошибка при подтверждении оплаты."
             )
         except Exception as inner_e:
-            logger.error(f"[admin_confirm_payment] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[admin_confirm_payment] Error sending error message: %s", inner_e, exc_info=True)
 
 # ... (оставить остальные функции, которые были в bot.py, связанные с админскими действиями) ...
@@ -1,17 +1,28 @@
+import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from config import BATH_TIME, BATH_COST, MAX_BATH_PARTICIPANTS, ADMIN_IDS, BATH_CHAT_ID, CARD_PAYMENT_LINK, REVOLUT_PAYMENT_LINK
-from utils.formatting import format_bath_message
-from database import Database
-from utils.logging import setup_logging
+from config import BATH_TIME, BATH_COST, MAX_BATH_PARTICIPANTS, ADMIN_IDS, CARD_PAYMENT_LINK, REVOLUT_PAYMENT_LINK
+from utils.formatting import create_bath_keyboard
+from database import get_database, PAYMENT_CONFIRMED, PROFILE_MISSING, NO_SEATS, ALREADY_REGISTERED, EVENT_FULL, ALREADY_INVITED, WAITLIST_WAITING, WAITLIST_OFFERED
+from services.notification import admin_fan_out, get_dispatcher
+from services.tasks import background_tasks
+from services.admission import admission, ADMITTED, ALREADY_ADMITTED, ALREADY_WAITLISTED
+from services.waitlist import waitlist_position
+from services.rollover import RolloverError, format_report
+from utils.locks import run_for_event
+from utils.idempotency import callback_dedup, answer_callback, callback_failed
+from utils.callback_data import (
+    encode_callback, decode_callback, InvalidCallbackData,
+    JOIN_BATH, CONFIRM_BATH, CLAIM_PAYMENT, ADMIN_CONFIRM, ADMIN_DECLINE, WAITLIST_ACCEPT, WAITLIST_DECLINE
+)
 
 # get_next_sunday и handle_deep_link тоже переносятся сюда
 import pytz
 from datetime import datetime, timedelta
 
-db = Database()
-logger = setup_logging()
+db = get_database()
+logger = logging.getLogger(__name__)
 
 def get_next_sunday():
     try:
@@ -23,7 +34,7 @@ def get_next_sunday():
         next_sunday = today + timedelta(days=days_until_sunday)
         return next_sunday.strftime("%d.%m.%Y")
     except Exception as e:
-        logging.error(f"Ошибка при получении даты следующего воскресенья: {e}")
+        logging.error("Ошибка при получении даты следующего воскресенья: %s", e)
         raise
 
 async def handle_deep_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -35,7 +46,7 @@ async def handle_deep_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     bath_info += f"Cтоимость: {BATH_COST} карта либо наличка при входе📍\n\n"
     bath_info += f"Для продолжения записи, нажмите кнопку ниже:"
     keyboard = [
-        [InlineKeyboardButton("Подтвердить запись", callback_data=f"confirm_bath_{date_str}")]
+        [InlineKeyboardButton("Подтвердить запись", callback_data=encode_callback(CONFIRM_BATH, date_str=date_str))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text(
@@ -53,31 +64,30 @@ async def register_bath(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.warning("[register_bath] Попытка запуска не в личном чате")
             return
         user = update.effective_user
-        logger.debug(f"[register_bath] Пользователь {user.id} инициировал регистрацию")
+        logger.debug("[register_bath] Пользователь %s инициировал регистрацию", user.id)
         if not context.args:
             # Автоматическая запись на ближайшее воскресенье
             next_sunday = get_next_sunday()
-            participants = db.get_bath_participants(next_sunday)
-            if any(p['user_id'] == user.id for p in participants):
+            username = user.username or f"{user.first_name} {user.last_name or ''}"
+            status = await run_for_event(next_sunday, db.register_participant, next_sunday, user.id, username, MAX_BATH_PARTICIPANTS)
+            if status == ALREADY_REGISTERED:
                 await update.message.reply_text(f"Вы уже записаны на баню {next_sunday}!")
                 return
-            if len(participants) >= MAX_BATH_PARTICIPANTS:
+            if status == EVENT_FULL:
                 await update.message.reply_text(f"К сожалению, на ближайшую баню {next_sunday} уже нет свободных мест.")
                 return
-            username = user.username or f"{user.first_name} {user.last_name or ''}"
-            db.add_bath_participant(next_sunday, user.id, username)
             await update.message.reply_text(f"Вы успешно записаны на баню {next_sunday}!\n\nВремя: {BATH_TIME}\nСтоимость: {BATH_COST}\n\nДо встречи в бане!")
-            logger.info(f"[register_bath] Пользователь {user.id} записан на {next_sunday}")
+            logger.info("[register_bath] Пользователь %s записан на %s", user.id, next_sunday)
             return
         # Старое поведение — регистрация по дате
         date_str = context.args[0]
-        logger.debug(f"[register_bath] Дата для регистрации: {date_str}")
+        logger.debug("[register_bath] Дата для регистрации: %s", date_str)
         bath_info = f"Вы хотите записаться на баню в воскресенье {date_str}.\n\n"
         bath_info += f"Время: {BATH_TIME} ‼️\n\n"
         bath_info += f"Cтоимость: {BATH_COST} карта либо наличка при входе📍\n\n"
         bath_info += f"Для продолжения записи, нажмите кнопку ниже:"
         keyboard = [
-            [InlineKeyboardButton("Подтвердить запись", callback_data=f"confirm_bath_{date_str}")]
+            [InlineKeyboardButton("Подтвердить запись", callback_data=encode_callback(CONFIRM_BATH, date_str=date_str))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         message = update.message or (update.callback_query and update.callback_query.message)
@@ -86,19 +96,13 @@ async def register_bath(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 text=bath_info,
                 reply_markup=reply_markup
             )
-        logger.info(f"[register_bath] Отправлено приглашение на регистрацию на {date_str} пользователю {user.id}")
+        logger.info("[register_bath] Отправлено приглашение на регистрацию на %s пользователю %s", date_str, user.id)
     except Exception as e:
-        logger.error(f"Ошибка в функции register_bath: {e}")
+        logger.error("Ошибка в функции register_bath: %s", e)
         message = update.message or (update.callback_query and update.callback_query.message)
         if message:
             await message.reply_text("Произошла ошибка при регистрации. Пожалуйста, попробуйте позже.")
 
-def create_bath_keyboard(date_str):
-    keyboard = [
-        [InlineKeyboardButton("Записаться", callback_data=f"join_bath_{date_str}")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
 async def create_bath_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         logger.info("[create_bath_event] Command received")
@@ -115,471 +119,474 @@ async def create_bath_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("У вас нет прав для выполнения этой команды.")
-            logger.warning(f"[create_bath_event] Non-admin user {admin_id} attempted to create event")
+            logger.warning("[create_bath_event] Non-admin user %s attempted to create event", admin_id)
             return
             
         next_sunday = get_next_sunday()
-        logger.info(f"[create_bath_event] Creating bath event for {next_sunday}")
-        
+        logger.info("[create_bath_event] Creating bath event for %s", next_sunday)
+        message = update.message or (update.callback_query and update.callback_query.message)
+
+        # Тот же конвейер, что и у автоматической смены недели: после сбоя команда продолжает с прерванного этапа
         try:
-            # Очищаем старые события
-            cleared_events = db.clear_previous_bath_events()
-            logger.info(f"[create_bath_event] Cleared {cleared_events} old events")
-            
-            # Создаем новое событие
-            db.create_bath_event(next_sunday)
-            logger.info(f"[create_bath_event] Created new bath event for {next_sunday}")
-            
-            # Получаем список участников
-            participants = db.get_bath_participants(next_sunday)
-            message_text = format_bath_message(next_sunday, db)
-            reply_markup = create_bath_keyboard(next_sunday)
-            
-            # Открепляем старое сообщение
-            old_pinned_id = db.get_pinned_message_id(BATH_CHAT_ID)
-            if old_pinned_id:
-                try:
-                    await context.bot.unpin_chat_message(chat_id=BATH_CHAT_ID, message_id=old_pinned_id)
-                    db.delete_pinned_message_id(old_pinned_id, BATH_CHAT_ID)
-                    logger.info(f"[create_bath_event] Unpinned old message {old_pinned_id}")
-                except Exception as e:
-                    logger.warning(f"[create_bath_event] Failed to unpin old message: {e}")
-                    
-            # Отправляем новое сообщение
-            try:
-                sent_message = await context.bot.send_message(
-                    chat_id=BATH_CHAT_ID,
-                    text=message_text,
-                    reply_markup=reply_markup
-                )
-                logger.info(f"[create_bath_event] Sent new message: {sent_message.message_id}")
-                
-                # Закрепляем новое сообщение
-                try:
-                    await context.bot.pin_chat_message(
-                        chat_id=BATH_CHAT_ID,
-                        message_id=sent_message.message_id,
-                        disable_notification=False
-                    )
-                    db.set_pinned_message_id(next_sunday, sent_message.message_id, BATH_CHAT_ID)
-                    logger.info(f"[create_bath_event] Pinned new message: {sent_message.message_id}")
-                except Exception as e:
-                    logger.error(f"[create_bath_event] Error pinning message: {e}", exc_info=True)
-                    
-                if cleared_events > 0:
-                    await context.bot.send_message(
-                        chat_id=BATH_CHAT_ID,
-                        text=f"Создана новая запись на баню {next_sunday}. Список участников предыдущей бани очищен."
-                    )
-                    logger.info(f"[create_bath_event] Sent cleanup notification")
-                    
-                # Отправляем подтверждение админу
-                message = update.message or (update.callback_query and update.callback_query.message)
-                if message:
-                    await message.reply_text(f"Событие бани на {next_sunday} успешно создано!")
-                    
-            except Exception as e:
-                logger.error(f"[create_bath_event] Error sending/updating message: {e}", exc_info=True)
-                message = update.message or (update.callback_query and update.callback_query.message)
-                if message:
-                    await message.reply_text("Произошла ошибка при отправке сообщения в чат бани.")
-                    
+            report = await context.bot_data['rollover'].run(context, next_sunday)
+        except RolloverError as e:
+            logger.error("[create_bath_event] %s", e)
+            if message:
+                await message.reply_text(str(e))
+            return
         except Exception as e:
-            logger.error(f"[create_bath_event] Database error: {e}", exc_info=True)
-            message = update.message or (update.callback_query and update.callback_query.message)
+            logger.error("[create_bath_event] Rollover failed: %s", e, exc_info=True)
             if message:
-                await message.reply_text("Произошла ошибка при работе с базой данных.")
-                
+                await message.reply_text("Произошла ошибка при создании события. Повторите /create_bath, чтобы продолжить.")
+            return
+        logger.info("[create_bath_event] Created new bath event for %s", next_sunday)
+        if message:
+            await message.reply_text(f"Событие бани на {next_sunday} успешно создано!\n\n{format_report(next_sunday, report)}")
+
     except Exception as e:
-        logger.error(f"[create_bath_event] Unexpected error: {e}", exc_info=True)
+        logger.error("[create_bath_event] Unexpected error: %s", e, exc_info=True)
         try:
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("Произошла непредвиденная ошибка при создании события бани.")
         except Exception as inner_e:
-            logger.error(f"[create_bath_event] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[create_bath_event] Error sending error message: %s", inner_e, exc_info=True)
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Единая точка входа inline-кнопок: разбирает callback_data и вызывает обработчик по таблице CALLBACK_HANDLERS"""
+    query = update.callback_query
+    try:
+        action, fields = decode_callback(query.data)
+    except InvalidCallbackData:
+        logger.warning("[button_callback] Rejected callback_data from user %s: %r", query.from_user.id, query.data)
+        await query.answer("Кнопка устарела. Пожалуйста, воспользуйтесь актуальным сообщением.")
+        return
+    # Двойное нажатие не повторяет записи в базу и уведомления администраторам
+    await callback_dedup.run(query, lambda: CALLBACK_HANDLERS[action](update, context, **fields))
+
+async def join_bath(update: Update, context: ContextTypes.DEFAULT_TYPE, date_str):
     try:
         query = update.callback_query
         user = query.from_user
-        logger.info(f"[button_callback] CallbackQuery received: data={query.data}, chat_type={update.effective_chat.type}, user_id={user.id}")
-        db.add_active_user(user.id, user.username or user.first_name)
-        callback_data = query.data
-        logger.debug(f"Получен callback от пользователя {user.id}: {callback_data}")
-
-        if callback_data.startswith("join_bath_"):
-            logger.info("[button_callback] Ветка join_bath_")
-            date_str = callback_data.replace("join_bath_", "")
-            logger.info(f"[button_callback] join_bath_ для даты {date_str}")
-            logger.info(f"Пользователь {user.id} пытается записаться на баню {date_str}")
-
-            # LOG: Проверка try_add_bath_invite
-            logger.debug(f"Пробую добавить bath_invite для user_id={user.id}, date_str={date_str}")
-            result = db.try_add_bath_invite(user.id, user.username or user.first_name, date_str, hours=2)
-            logger.debug(f"Результат try_add_bath_invite: {result}")
-            if not result:
-                logger.info(f"Пользователь {user.id} уже получил приглашение на регистрацию на {date_str}")
-                await query.answer("Вам уже отправлено приглашение на регистрацию. Проверьте личные сообщения.", show_alert=True)
-                return
-
-            # LOG: Проверка bath_registrations в user_data
-            logger.debug(f"Проверяю context.user_data['bath_registrations']: {context.user_data.get('bath_registrations')}")
-            if 'bath_registrations' in context.user_data and date_str in context.user_data['bath_registrations']:
-                logger.info(f"Пользователь {user.id} уже начал процесс записи на {date_str}")
-                await query.answer("Вы уже начали процесс записи на эту дату.", show_alert=True)
-                return
-
-            # LOG: Получение участников
-            participants = db.get_bath_participants(date_str)
-            logger.debug(f"Текущее количество участников на {date_str}: {len(participants)}")
-            if len(participants) >= MAX_BATH_PARTICIPANTS:
-                logger.warning(f"Пользователь {user.id} не смог записаться - достигнут лимит участников")
-                await query.answer("К сожалению, баня уже занята. Вы можете записаться в следующий раз!", show_alert=True)
-                return
-
-            try:
-                bath_info = f"Вы хотите записаться на баню в воскресенье {date_str}.\n\n"
-                bath_info += f"Время: {BATH_TIME} ‼️\n\n"
-                bath_info += f"Cтоимость: {BATH_COST} карта либо наличка при входе📍\n\n"
-                bath_info += f"Для продолжения записи, нажмите кнопку ниже:"
-
-                keyboard = [
-                    [InlineKeyboardButton("Подтвердить запись", callback_data=f"confirm_bath_{date_str}")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-
-                logger.debug(f"Пробую отправить сообщение с подтверждением записи пользователю {user.id}")
-                await context.bot.send_message(
-                    chat_id=user.id,
-                    text=bath_info,
-                    reply_markup=reply_markup
-                )
-                logger.info(f"Отправлено сообщение с подтверждением записи пользователю {user.id}")
-
-                logger.debug(f"Пробую отправить reply_text в группу для пользователя {user.id}")
-                await query.message.reply_text(
-                    f"@{user.username or user.first_name}, проверьте личные сообщения от бота.",
-                    reply_to_message_id=query.message.message_id
-                )
-                logger.info(f"Отправлено сообщение в группу о личном сообщении пользователю {user.id}")
+        logger.info("[join_bath] CallbackQuery received: date_str=%s, chat_type=%s, user_id=%s", date_str, update.effective_chat.type, user.id)
+        if admission.is_open(date_str):
+            await join_bath_surge(update, context, date_str)
+            return
+        await asyncio.to_thread(db.add_active_user, user.id, user.username or user.first_name)
+        logger.info("Пользователь %s пытается записаться на баню %s", user.id, date_str)
+
+        # Приглашение удерживает место, поэтому выдается только при свободном месте
+        # (участники, лист ожидания, заявки на оплату и чужие приглашения уже заняли свои)
+        logger.debug("Пробую выдать приглашение user_id=%s, date_str=%s", user.id, date_str)
+        result = await run_for_event(date_str, db.reserve_seat, date_str, user.id, user.username or user.first_name, MAX_BATH_PARTICIPANTS)
+        logger.debug("Результат reserve_seat: %s", result)
+        if result == ALREADY_INVITED:
+            logger.info("Пользователь %s уже получил приглашение на регистрацию на %s", user.id, date_str)
+            await answer_callback(query, "Вам уже отправлено приглашение на регистрацию. Проверьте личные сообщения.", show_alert=True)
+            return
+        if result == EVENT_FULL:
+            logger.warning("Пользователь %s не смог записаться - достигнут лимит участников", user.id)
+            await answer_callback(query, await _waitlist_answer(date_str, user), show_alert=True)
+            return
 
-            except Exception as e:
-                logger.error(f"Ошибка при отправке сообщения пользователю {user.id}: {e}")
-                bot_username = context.bot.username
-                start_link = f"https://t.me/{bot_username}?start=bath_{date_str}"
-                logger.info(f"Вместо личного сообщения отправляю ссылку: {start_link}")
-                # ... (оставить обработку ссылки, если нужно) ...
-        elif callback_data.startswith("confirm_bath_"):
-            logger.info("[button_callback] Ветка confirm_bath_")
-            date_str = callback_data.replace("confirm_bath_", "")
-            logger.info(f"[button_callback] confirm_bath_ для даты {date_str}")
-            
-            # Проверяем количество участников
-            participants = db.get_bath_participants(date_str)
-            if len(participants) >= MAX_BATH_PARTICIPANTS:
-                logger.warning(f"Пользователь {user.id} не смог подтвердить запись - достигнут лимит участников")
-                await query.edit_message_text(
-                    text="К сожалению, баня уже занята. Вы можете записаться в следующий раз!"
-                )
-                return
+        # LOG: Проверка bath_registrations в user_data
+        logger.debug("Проверяю context.user_data['bath_registrations']: %s", context.user_data.get('bath_registrations'))
+        if 'bath_registrations' in context.user_data and date_str in context.user_data['bath_registrations']:
+            logger.info("Пользователь %s уже начал процесс записи на %s", user.id, date_str)
+            await answer_callback(query, "Вы уже начали процесс записи на эту дату.", show_alert=True)
+            return
 
-            # Инициализируем словарь регистраций, если его нет
-            if 'bath_registrations' not in context.user_data:
-                context.user_data['bath_registrations'] = {}
+        try:
+            bath_info = _invite_text(date_str)
 
-            # Сохраняем информацию о регистрации
-            username = user.username or f"{user.first_name} {user.last_name or ''}"
-            context.user_data['bath_registrations'][date_str] = {
-                'user_id': user.id,
-                'username': username,
-                'status': 'pending_payment'
-            }
-            logger.info(f"Сохранена информация о регистрации пользователя {user.id} на {date_str}")
-
-            # Формируем сообщение с информацией об оплате
-            payment_info = f"Отлично! Для завершения записи на баню ({date_str}), пожалуйста, выполните оплату:\n\n"
-            payment_info += f"Cтоимость: {BATH_COST}\n\n"
-            payment_info += f"Способы оплаты:\n"
-            payment_info += f"1. КАРТА: {CARD_PAYMENT_LINK}\n"
-            payment_info += f"2. Revolut: {REVOLUT_PAYMENT_LINK}\n\n"
-            payment_info += f"После совершения оплаты, выберите способ ниже."
-
-            # Создаем клавиатуру с кнопками оплаты
             keyboard = [
-                [
-                    InlineKeyboardButton("Я оплатил(а) онлайн", callback_data=f"paid_bath_{date_str}"),
-                    InlineKeyboardButton("Буду платить наличными", callback_data=f"cash_bath_{date_str}")
-                ]
+                [InlineKeyboardButton("Подтвердить запись", callback_data=encode_callback(CONFIRM_BATH, date_str=date_str))]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            # Отправляем сообщение с информацией об оплате
-            await query.edit_message_text(
-                text=payment_info,
+            logger.debug("Пробую отправить сообщение с подтверждением записи пользователю %s", user.id)
+            await context.bot.send_message(
+                chat_id=user.id,
+                text=bath_info,
                 reply_markup=reply_markup
             )
-            logger.info(f"Отправлены инструкции по оплате пользователю {user.id}")
+            logger.info("Отправлено сообщение с подтверждением записи пользователю %s", user.id)
+
+            logger.debug("Пробую отправить reply_text в группу для пользователя %s", user.id)
+            await query.message.reply_text(
+                f"@{user.username or user.first_name}, проверьте личные сообщения от бота.",
+                reply_to_message_id=query.message.message_id
+            )
+            logger.info("Отправлено сообщение в группу о личном сообщении пользователю %s", user.id)
+
+        except Exception as e:
+            logger.error("Ошибка при отправке сообщения пользователю %s: %s", user.id, e)
+            bot_username = context.bot.username
+            start_link = f"https://t.me/{bot_username}?start=bath_{date_str}"
+            logger.info("Вместо личного сообщения отправляю ссылку: %s", start_link)
+            # ... (оставить обработку ссылки, если нужно) ...
 
     except Exception as e:
-        logger.error(f"Ошибка в функции button_callback: {e}", exc_info=True)
+        logger.error("Ошибка в функции join_bath: %s", e, exc_info=True)
+        callback_failed()
         try:
-            await query.answer("Произошла ошибка. Пожалуйста, попробуйте позже.", show_alert=True)
+            await answer_callback(query, "Произошла ошибка. Пожалуйста, попробуйте позже.", show_alert=True)
         except:
             pass
 
-async def confirm_bath_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def _waitlist_answer(date_str, user):
+    """Ставит пользователя в лист ожидания и возвращает текст ответа"""
+    username = user.username or user.first_name
+    status, place = await asyncio.to_thread(db.add_to_waitlist, date_str, user.id, username, waitlist_position())
+    if status == WAITLIST_OFFERED:
+        return "Вам уже предложено освободившееся место. Проверьте личные сообщения от бота."
+    if status != WAITLIST_WAITING:
+        return "Вы уже записаны на эту баню. Проверьте личные сообщения от бота."
+    return (f"Свободных мест нет. Вы №{place} в листе ожидания. "
+            f"Если место освободится, бот пришлет предложение в личные сообщения.")
+
+def _invite_text(date_str):
+    bath_info = f"Вы хотите записаться на баню в воскресенье {date_str}.\n\n"
+    bath_info += f"Время: {BATH_TIME} ‼️\n\n"
+    bath_info += f"Cтоимость: {BATH_COST} карта либо наличка при входе📍\n\n"
+    bath_info += f"Для продолжения записи, нажмите кнопку ниже:"
+    return bath_info
+
+async def join_bath_surge(update: Update, context: ContextTypes.DEFAULT_TYPE, date_str):
+    """Запись в окне наплыва: место выдает очередь допуска, ответ — всплывающее уведомление, личное сообщение — в фоне"""
+    query = update.callback_query
+    user = query.from_user
+    username = user.username or user.first_name
+    # Порядок в листе ожидания — по нажатию, а не по времени доставки
+    position = waitlist_position()
+    status, number = admission.admit(date_str, user.id)
+    if status == ADMITTED:
+        # Выданное место сразу закрепляется в базе приглашением: его учитывают обычная
+        # запись и лист ожидания. Если база мест не подтверждает, пользователь ждет в очереди
+        try:
+            reserved = await run_for_event(date_str, db.reserve_seat, date_str, user.id, username, MAX_BATH_PARTICIPANTS)
+        except Exception:
+            admission.release(date_str, user.id)
+            raise
+        if reserved == EVENT_FULL:
+            if not admission.is_open(date_str):
+                # Окно закрылось, пока шел запрос: обычная постановка в лист ожидания
+                await answer_callback(query, await _waitlist_answer(date_str, user), show_alert=True)
+                return
+            status, number = admission.revoke(date_str, user.id)
+    if status == ALREADY_ADMITTED:
+        await answer_callback(query, "Вам уже отправлено приглашение на регистрацию. Проверьте личные сообщения.", show_alert=True)
+        return
+    if status == ALREADY_WAITLISTED:
+        await answer_callback(query, f"Вы уже в листе ожидания: №{number}.", show_alert=True)
+        return
+    if status == ADMITTED:
+        await answer_callback(query, "Место за вами! Подтвердите запись в личных сообщениях от бота.", show_alert=True)
+        text = _invite_text(date_str)
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("Подтвердить запись", callback_data=encode_callback(CONFIRM_BATH, date_str=date_str))]
+        ])
+    else:
+        await answer_callback(query, f"Свободных мест нет. Вы №{number} в листе ожидания.", show_alert=True)
+        text = (f"Все места на баню {date_str} уже распределены. Вы №{number} в листе ожидания. "
+                f"Если место освободится, бот пришлет предложение.")
+        reply_markup = None
+    logger.info("[join_bath_surge] User %s: %s #%s for %s", user.id, status, number, date_str)
+
+    async def deliver():
+        await asyncio.to_thread(db.add_active_user, user.id, username)
+        if status != ADMITTED:
+            await asyncio.to_thread(db.add_to_waitlist, date_str, user.id, username, position)
+        await get_dispatcher(context).send_message(user.id, text, reply_markup=reply_markup)
+    admission.submit(deliver)
+
+async def confirm_bath_registration(update: Update, context: ContextTypes.DEFAULT_TYPE, date_str=None):
     try:
         query = update.callback_query
         user = query.from_user
-        logger.info(f"[confirm_bath_registration] CallbackQuery received: data={query.data}, chat_type={update.effective_chat.type}, user_id={user.id}")
-        db.add_active_user(user.id, user.username or user.first_name)
-        callback_data = query.data
-        logger.info(f"Пользователь {user.id} подтверждает запись на баню: {callback_data}")
+        logger.info("[confirm_bath_registration] CallbackQuery received: data=%s, chat_type=%s, user_id=%s", query.data, update.effective_chat.type, user.id)
+        # Индикатор загрузки снимается сразу: результат пользователь видит в отредактированном сообщении
+        await answer_callback(query)
+        background_tasks.spawn('add_active_user', lambda: asyncio.to_thread(db.add_active_user, user.id, user.username or user.first_name))
+        if date_str is None:
+            _, fields = decode_callback(query.data)
+            date_str = fields['date_str']
+        logger.info("Пользователь %s подтверждает запись на баню %s", user.id, date_str)
+
+        if await asyncio.to_thread(db.get_free_seats, date_str, MAX_BATH_PARTICIPANTS, user.id) <= 0:
+            logger.warning("Пользователь %s не смог подтвердить запись - достигнут лимит участников", user.id)
+            await query.edit_message_text(text=await _waitlist_answer(date_str, user))
+            return
 
-        if callback_data.startswith("confirm_bath_"):
-            date_str = callback_data.replace("confirm_bath_", "")
+        if 'bath_registrations' not in context.user_data:
+            context.user_data['bath_registrations'] = {}
 
-            participants = db.get_bath_participants(date_str)
-            if len(participants) >= MAX_BATH_PARTICIPANTS:
-                logger.warning(f"Пользователь {user.id} не смог подтвердить запись - достигнут лимит участников")
-                await query.edit_message_text(
-                    text="К сожалению, баня уже занята. Вы можете записаться в следующий раз!"
-                )
-                return
+        username = user.username or f"{user.first_name} {user.last_name or ''}"
+        context.user_data['bath_registrations'][date_str] = {
+            'user_id': user.id,
+            'username': username,
+            'status': 'pending_payment'
+        }
+        logger.info("Сохранена информация о регистрации пользователя %s на %s", user.id, date_str)
 
-            if 'bath_registrations' not in context.user_data:
-                context.user_data['bath_registrations'] = {}
+        payment_info = f"Отлично! Для завершения записи на баню ({date_str}), пожалуйста, выполните оплату:\n\n"
+        payment_info += f"Cтоимость: {BATH_COST}\n\n"
+        payment_info += f"Способы оплаты:\n"
+        payment_info += f"1. КАРТА: {CARD_PAYMENT_LINK}\n"
+        payment_info += f"2. Revolut: {REVOLUT_PAYMENT_LINK}\n\n"
+        payment_info += f"После совершения оплаты, выберите способ ниже."
 
-            username = user.username or f"{user.first_name} {user.last_name or ''}"
-            context.user_data['bath_registrations'][date_str] = {
-                'user_id': user.id,
-                'username': username,
-                'status': 'pending_payment'
-            }
-            logger.info(f"Сохранена информация о регистрации пользователя {user.id} на {date_str}")
-
-            payment_info = f"Отлично! Для завершения записи на баню ({date_str}), пожалуйста, выполните оплату:\n\n"
-            payment_info += f"Cтоимость: {BATH_COST}\n\n"
-            payment_info += f"Способы оплаты:\n"
-            payment_info += f"1. КАРТА: {CARD_PAYMENT_LINK}\n"
-            payment_info += f"2. Revolut: {REVOLUT_PAYMENT_LINK}\n\n"
-            payment_info += f"После совершения оплаты, выберите способ ниже."
-
-            keyboard = [
-                [
-                    InlineKeyboardButton("Я оплатил(а) онлайн", callback_data=f"paid_bath_{date_str}"),
-                    InlineKeyboardButton("Буду платить наличными", callback_data=f"cash_bath_{date_str}")
-                ]
+        keyboard = [
+            [
+                InlineKeyboardButton("Я оплатил(а) онлайн", callback_data=encode_callback(CLAIM_PAYMENT, date_str=date_str, payment_type='online')),
+                InlineKeyboardButton("Буду платить наличными", callback_data=encode_callback(CLAIM_PAYMENT, date_str=date_str, payment_type='cash'))
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
 
-            await query.edit_message_text(
-                text=payment_info,
-                reply_markup=reply_markup
-            )
-            logger.info(f"Отправлены инструкции по оплате пользователю {user.id}")
+        await query.edit_message_text(
+            text=payment_info,
+            reply_markup=reply_markup
+        )
+        logger.info("Отправлены инструкции по оплате пользователю %s", user.id)
+    except Exception as e:
+        logger.error("Ошибка в функции confirm_bath_registration: %s", e)
+        callback_failed()
+        await query.edit_message_text("Произошла ошибка. Пожалуйста, попробуйте позже.")
+
+async def waitlist_accept(update: Update, context: ContextTypes.DEFAULT_TYPE, date_str):
+    """Пользователь из листа ожидания занимает предложенное место и переходит к оплате"""
+    query = update.callback_query
+    user = query.from_user
+    try:
+        await answer_callback(query)
+        if not await context.bot_data['waitlist'].accept(date_str, user.id):
+            await query.edit_message_text("Предложение больше не действует: время вышло или место уже передано.")
+            return
+        logger.info("[waitlist_accept] User %s accepted a seat for %s", user.id, date_str)
+        await confirm_bath_registration(update, context, date_str)
     except Exception as e:
-        logger.error(f"Ошибка в функции confirm_bath_registration: {e}")
+        logger.error("[waitlist_accept] Error: %s", e, exc_info=True)
+        callback_failed()
         await query.edit_message_text("Произошла ошибка. Пожалуйста, попробуйте позже.")
 
-async def handle_payment_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def waitlist_decline(update: Update, context: ContextTypes.DEFAULT_TYPE, date_str):
+    query = update.callback_query
+    user = query.from_user
+    try:
+        await answer_callback(query)
+        await context.bot_data['waitlist'].leave(date_str, user.id)
+        logger.info("[waitlist_decline] User %s declined a seat for %s", user.id, date_str)
+        await query.edit_message_text(f"Вы отказались от места на баню {date_str}. Оно передано следующему в листе ожидания.")
+    except Exception as e:
+        logger.error("[waitlist_decline] Error: %s", e, exc_info=True)
+        callback_failed()
+        await query.edit_message_text("Произошла ошибка. Пожалуйста, попробуйте позже.")
+
+def _notify_admins_in_background(context, user_id, date_str, text, reply_markup):
+    """Рассылка администраторам после ответа пользователю; пользователь узнает о ней, только если она не удалась"""
+    async def on_failure():
+        await get_dispatcher(context).send_message(
+            user_id,
+            f"Не удалось передать вашу заявку на баню {date_str} администраторам. "
+            f"Пожалуйста, напишите администратору напрямую."
+        )
+    background_tasks.spawn('admin_fan_out', admin_fan_out(context, text, reply_markup=reply_markup), on_failure=on_failure)
+
+async def handle_payment_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, date_str=None, payment_type=None):
     try:
         query = update.callback_query
         user = query.from_user
-        logger.info(f"[handle_payment_confirmation] CallbackQuery received: data={query.data}, chat_type={update.effective_chat.type}, user_id={user.id}")
-        db.add_active_user(user.id, user.username or user.first_name)
-        callback_data = query.data
-        logger.info(f"Пользователь {user.id} подтверждает оплату: {callback_data}")
+        logger.info("[handle_payment_confirmation] CallbackQuery received: data=%s, chat_type=%s, user_id=%s", query.data, update.effective_chat.type, user.id)
+        await answer_callback(query)
+        if date_str is None:
+            _, fields = decode_callback(query.data)
+            date_str, payment_type = fields['date_str'], fields['payment_type']
+        logger.info("Пользователь %s подтверждает оплату (%s) за %s", user.id, payment_type, date_str)
 
-        if callback_data.startswith("paid_bath_"):
-            date_str = callback_data.replace("paid_bath_", "")
+        if payment_type == 'online':
 
             if ('bath_registrations' in context.user_data and
                     date_str in context.user_data['bath_registrations']):
 
-                context.user_data['bath_registrations'][date_str]['status'] = 'payment_claimed'
-                logger.info(f"Обновлен статус регистрации пользователя {user.id} на {date_str}")
-
                 username = user.username or f"{user.first_name} {user.last_name or ''}"
 
-                user_data = {
-                    'user_id': user.id,
-                    'username': username,
-                    'date_str': date_str
-                }
-                logger.info(f"Добавляю заявку: user_id={user.id}, username={username}, date_str={date_str}, payment_type=online")
-                db.add_pending_payment(user.id, username, date_str, payment_type='online')
-                logger.info(f"Добавлена заявка на подтверждение оплаты от пользователя {user.id}")
+                # Сообщение о принятой заявке — только после записи в базу
+                logger.info("Добавляю заявку: user_id=%s, username=%s, date_str=%s, payment_type=online", user.id, username, date_str)
+                await run_for_event(date_str, db.claim_payment, user.id, username, date_str, payment_type='online')
+                logger.info("Добавлена заявка на подтверждение оплаты от пользователя %s", user.id)
 
+                context.user_data['bath_registrations'][date_str]['status'] = 'payment_claimed'
+                logger.info("Обновлен статус регистрации пользователя %s на %s", user.id, date_str)
                 await query.edit_message_text(
                     text=f"Спасибо! Ваша заявка об оплате отправлена администратору.\n"
-                         f"После подтверждения оплаты, вы будете добавлены в список участников бани на {date_str}.\n"
-                         f"Пожалуйста, ожидайте подтверждения."
+                    f"После подтверждения оплаты, вы будете добавлены в список участников бани на {date_str}.\n"
+                    f"Пожалуйста, ожидайте подтверждения."
                 )
 
-                for admin_id in ADMIN_IDS:
-                    try:
-                        callback_data_confirm = f"admin_confirm_{user.id}_{date_str}_online"
-                        callback_data_decline = f"admin_decline_{user.id}_{date_str}_online"
-                        logger.info(f"Формирую callback_data: confirm={callback_data_confirm}, decline={callback_data_decline}")
-                        keyboard = [
-                            [
-                                InlineKeyboardButton("Оплатил онлайн", callback_data=callback_data_confirm),
-                                InlineKeyboardButton("Отклонить", callback_data=callback_data_decline)
-                            ]
-                        ]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        await context.bot.send_message(
-                            chat_id=admin_id,
-                            text=f"Пользователь @{username} (ID: {user.id}) утверждает, что оплатил баню на {date_str}.\nПожалуйста, подтвердите или отклоните оплату.",
-                            reply_markup=reply_markup
-                        )
-                        logger.info(f"Отправлено уведомление администратору {admin_id} о новой заявке на оплату (online)")
-                    except Exception as e:
-                        logger.error(f"Ошибка при отправке уведомления администратору {admin_id}: {e}")
-                        continue
+                callback_data_confirm = encode_callback(ADMIN_CONFIRM, user_id=user.id, date_str=date_str, payment_type='online')
+                callback_data_decline = encode_callback(ADMIN_DECLINE, user_id=user.id, date_str=date_str, payment_type='online')
+                logger.info("Формирую callback_data: confirm=%s, decline=%s", callback_data_confirm, callback_data_decline)
+                keyboard = [
+                    [
+                        InlineKeyboardButton("Оплатил онлайн", callback_data=callback_data_confirm),
+                        InlineKeyboardButton("Отклонить", callback_data=callback_data_decline)
+                    ]
+                ]
+                _notify_admins_in_background(
+                    context, user.id, date_str,
+                    f"Пользователь @{username} (ID: {user.id}) утверждает, что оплатил баню на {date_str}.\nПожалуйста, подтвердите или отклоните оплату.",
+                    InlineKeyboardMarkup(keyboard)
+                )
             else:
-                logger.warning(f"Пользователь {user.id} пытается подтвердить оплату без предварительной регистрации")
+                await asyncio.to_thread(db.add_active_user, user.id, user.username or user.first_name)
+                logger.warning("Пользователь %s пытается подтвердить оплату без предварительной регистрации", user.id)
                 await query.edit_message_text(
                     text="Произошла ошибка. Пожалуйста, начните процесс записи заново."
                 )
-        elif callback_data.startswith("cash_bath_"):
-            date_str = callback_data.replace("cash_bath_", "")
+        elif payment_type == 'cash':
+            username = user.username or f"{user.first_name} {user.last_name or ''}"
+            await run_for_event(date_str, db.claim_payment, user.id, username, date_str, payment_type='cash')
             if ('bath_registrations' in context.user_data and
                     date_str in context.user_data['bath_registrations']):
                 context.user_data['bath_registrations'][date_str]['status'] = 'cash_claimed'
-            username = user.username or f"{user.first_name} {user.last_name or ''}"
-            db.add_pending_payment(user.id, username, date_str, payment_type='cash')
             await query.edit_message_text(
                 text=f"Спасибо! Ваша заявка на оплату наличными отправлена администратору. После подтверждения и заполнения профиля вы будете добавлены в список участников бани на {date_str}. Пожалуйста, ожидайте подтверждения."
             )
-            for admin_id in ADMIN_IDS:
-                try:
-                    callback_data_confirm = f"admin_confirm_{user.id}_{date_str}_cash"
-                    callback_data_decline = f"admin_decline_{user.id}_{date_str}_cash"
-                    keyboard = [
-                        [
-                            InlineKeyboardButton("Подтвердить наличные", callback_data=callback_data_confirm),
-                            InlineKeyboardButton("Отклонить", callback_data=callback_data_decline)
-                        ]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    await context.bot.send_message(
-                        chat_id=admin_id,
-                        text=f"Пользователь @{username} (ID: {user.id}) хочет оплатить баню {date_str} наличными. Подтвердите или отклоните оплату.",
-                        reply_markup=reply_markup
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке уведомления администратору {admin_id}: {e}")
+            callback_data_confirm = encode_callback(ADMIN_CONFIRM, user_id=user.id, date_str=date_str, payment_type='cash')
+            callback_data_decline = encode_callback(ADMIN_DECLINE, user_id=user.id, date_str=date_str, payment_type='cash')
+            keyboard = [
+                [
+                    InlineKeyboardButton("Подтвердить наличные", callback_data=callback_data_confirm),
+                    InlineKeyboardButton("Отклонить", callback_data=callback_data_decline)
+                ]
+            ]
+            _notify_admins_in_background(
+                context, user.id, date_str,
+                f"Пользователь @{username} (ID: {user.id}) хочет оплатить баню {date_str} наличными. Подтвердите или отклоните оплату.",
+                InlineKeyboardMarkup(keyboard)
+            )
             return
     except Exception as e:
-        logger.error(f"Ошибка в функции handle_payment_confirmation: {e}")
+        logger.error("Ошибка в функции handle_payment_confirmation: %s", e)
+        callback_failed()
         await query.edit_message_text("Произошла ошибка. Пожалуйста, попробуйте позже.")
 
-async def admin_confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id=None, date_str=None, payment_type=None):
     try:
         query = update.callback_query
         user = query.from_user
-        logger.info(f"[admin_confirm_payment] CallbackQuery received: data={query.data}, chat_type={update.effective_chat.type}, user_id={user.id}")
-        await query.answer()
+        logger.info("[admin_confirm_payment] CallbackQuery received: data=%s, chat_type=%s, user_id=%s", query.data, update.effective_chat.type, user.id)
+        await answer_callback(query)
 
         if user.id not in ADMIN_IDS:
-            logger.warning(f"[admin_confirm_payment] Non-admin user {user.id} attempted to confirm payment")
+            logger.warning("[admin_confirm_payment] Non-admin user %s attempted to confirm payment", user.id)
             await query.edit_message_text("У вас нет прав для выполнения этой операции.")
             return
 
-        callback_data = query.data
-        parts = callback_data.split("_")
-        if len(parts) < 5:
-            logger.error(f"[admin_confirm_payment] Invalid callback_data: {callback_data}")
-            await query.edit_message_text("Ошибка: не удалось разобрать параметры.")
-            return
-        user_id = int(parts[2])
-        date_str = parts[3]
-        payment_type = parts[4]
-
-        user_data = db.get_pending_payment(user_id, date_str, payment_type)
-        logger.info(f"[admin_confirm_payment] Looking for payment: user_id={user_id}, date_str={date_str}, payment_type={payment_type}")
-        logger.info(f"[admin_confirm_payment] Found payment data: {user_data}")
-
-        if user_data:
-            profile = db.get_user_profile(user_id)
-            if not profile:
-                logger.warning(f"[admin_confirm_payment] No profile found for user {user_id}")
-                await query.edit_message_text(
-                    text="Пользователь не заполнил профиль. Сначала нужно заполнить профиль, а затем подтвердить оплату."
-                )
+        if user_id is None:
+            try:
+                _, fields = decode_callback(query.data)
+            except InvalidCallbackData:
+                logger.error("[admin_confirm_payment] Invalid callback_data: %s", query.data)
+                await query.edit_message_text("Ошибка: не удалось разобрать параметры.")
                 return
+            user_id, date_str, payment_type = fields['user_id'], fields['date_str'], fields['payment_type']
 
-            # Подтверждаем оплату
-            try:
-                db.confirm_payment(user_id, date_str, payment_type)
-                logger.info(f"[admin_confirm_payment] Payment confirmed for user {user_id}")
-
-                # Уведомляем пользователя
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=f"Ваша оплата за баню {date_str} подтверждена администратором."
-                    )
-                    logger.info(f"[admin_confirm_payment] Sent confirmation to user {user_id}")
-                except Exception as e:
-                    logger.error(f"[admin_confirm_payment] Error sending confirmation to user: {e}", exc_info=True)
+        logger.info("[admin_confirm_payment] Confirming payment: user_id=%s, date_str=%s, payment_type=%s", user_id, date_str, payment_type)
+        try:
+            status, user_data = await run_for_event(date_str, db.confirm_payment, user_id, date_str, payment_type)
+        except Exception as e:
+            logger.error("[admin_confirm_payment] Error confirming payment: %s", e, exc_info=True)
+            callback_failed()
+            await query.edit_message_text("Ошибка при подтверждении оплаты.")
+            return
 
-                await query.edit_message_text(
-                    text=f"Оплата пользователя {user_data['username']} подтверждена."
-                )
-            except Exception as e:
-                logger.error(f"[admin_confirm_payment] Error confirming payment: {e}", exc_info=True)
-                await query.edit_message_text("Ошибка при подтверждении оплаты.")
-        else:
+        if status == PROFILE_MISSING:
+            logger.warning("[admin_confirm_payment] No profile found for user %s", user_id)
+            await query.edit_message_text(
+                text="Пользователь не заполнил профиль. Сначала нужно заполнить профиль, а затем подтвердить оплату."
+            )
+            return
+        if status == NO_SEATS:
+            logger.warning("[admin_confirm_payment] No seats left on %s for user %s", date_str, user_id)
+            await query.edit_message_text(
+                f"На {date_str} свободных мест нет: оплату пользователя нельзя подтвердить. "
+                f"Заявка осталась в ожидании — освободите место или отклоните оплату."
+            )
+            return
+        if status != PAYMENT_CONFIRMED:
             await query.edit_message_text("Не найдена заявка на оплату.")
+            return
+
+        logger.info("[admin_confirm_payment] Payment confirmed for user %s", user_id)
+
+        # Уведомляем пользователя
+        try:
+            await context.bot.send_message(
+                chat_id=user_id,
+                text=f"Ваша оплата за баню {date_str} подтверждена администратором."
+            )
+            logger.info("[admin_confirm_payment] Sent confirmation to user %s", user_id)
+        except Exception as e:
+            logger.error("[admin_confirm_payment] Error sending confirmation to user: %s", e, exc_info=True)
+
+        await query.edit_message_text(
+            text=f"Оплата пользователя {user_data['username']} подтверждена."
+        )
     except Exception as e:
-        logger.error(f"Ошибка в функции admin_confirm_payment: {e}")
+        logger.error("Ошибка в функции admin_confirm_payment: %s", e)
+        callback_failed()
         await update.callback_query.edit_message_text("Произошла ошибка. Пожалуйста, попробуйте позже.")
 
-async def admin_decline_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_decline_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id=None, date_str=None, payment_type=None):
     try:
         query = update.callback_query
         user = query.from_user
-        logger.info(f"[admin_decline_payment] CallbackQuery received: data={query.data}, chat_type={update.effective_chat.type}, user_id={user.id}")
-        await query.answer()
+        logger.info("[admin_decline_payment] CallbackQuery received: data=%s, chat_type=%s, user_id=%s", query.data, update.effective_chat.type, user.id)
+        await answer_callback(query)
 
         if user.id not in ADMIN_IDS:
-            logger.warning(f"[admin_decline_payment] Non-admin user {user.id} attempted to decline payment")
+            logger.warning("[admin_decline_payment] Non-admin user %s attempted to decline payment", user.id)
             await query.edit_message_text("У вас нет прав для выполнения этой операции.")
             return
 
-        callback_data = query.data
-        parts = callback_data.split("_")
-        if len(parts) < 5:
-            logger.error(f"[admin_decline_payment] Invalid callback_data: {callback_data}")
-            await query.edit_message_text("Ошибка: не удалось разобрать параметры.")
-            return
-        user_id = int(parts[2])
-        date_str = parts[3]
-        payment_type = parts[4]
+        if user_id is None:
+            try:
+                _, fields = decode_callback(query.data)
+            except InvalidCallbackData:
+                logger.error("[admin_decline_payment] Invalid callback_data: %s", query.data)
+                await query.edit_message_text("Ошибка: не удалось разобрать параметры.")
+                return
+            user_id, date_str, payment_type = fields['user_id'], fields['date_str'], fields['payment_type']
 
         try:
-            db.delete_pending_payment(user_id, date_str)
-            logger.info(f"[admin_decline_payment] Payment declined for user {user_id}")
+            if not await run_for_event(date_str, db.decline_payment, user_id, date_str):
+                await query.edit_message_text("Не найдена заявка на оплату.")
+                return
+            logger.info("[admin_decline_payment] Payment declined for user %s", user_id)
+            # Место, полученное из листа ожидания, переходит следующему
+            waitlist = context.bot_data.get('waitlist')
+            if waitlist:
+                await waitlist.leave(date_str, user_id)
             try:
                 await context.bot.send_message(
                     chat_id=user_id,
                     text=f"Ваша оплата за баню {date_str} отклонена администратором. Пожалуйста, свяжитесь с организатором."
                 )
-                logger.info(f"[admin_decline_payment] Sent decline notification to user {user_id}")
+                logger.info("[admin_decline_payment] Sent decline notification to user %s", user_id)
             except Exception as e:
-                logger.error(f"[admin_decline_payment] Error sending decline notification to user: {e}", exc_info=True)
+                logger.error("[admin_decline_payment] Error sending decline notification to user: %s", e, exc_info=True)
             await query.edit_message_text(
                 text=f"Оплата пользователя с ID {user_id} отклонена."
             )
         except Exception as e:
-            logger.error(f"[admin_decline_payment] Error declining payment: {e}", exc_info=True)
+            logger.error("[admin_decline_payment] Error declining payment: %s", e, exc_info=True)
+            callback_failed()
             await query.edit_message_text("Ошибка при отклонении оплаты.")
     except Exception as e:
-        logger.error(f"Ошибка в функции admin_decline_payment: {e}")
+        logger.error("Ошибка в функции admin_decline_payment: %s", e)
+        callback_failed()
         await update.callback_query.edit_message_text("Произошла ошибка. Пожалуйста, попробуйте позже.")
 
 async def handle_message_to_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -621,7 +628,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         bath_info += f"Cтоимость: {BATH_COST} карта либо наличка при входе📍\n\n"
         bath_info += f"Для продолжения записи, нажмите кнопку ниже:"
         keyboard = [
-            [InlineKeyboardButton("Подтвердить запись", callback_data=f"confirm_bath_{date_str}")]
+            [InlineKeyboardButton("Подтвердить запись", callback_data=encode_callback(CONFIRM_BATH, date_str=date_str))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
@@ -640,4 +647,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Админам — управлять участниками, отмечать оплаты и посещения\n\n"
         "Воспользуйтесь меню команд или напишите /register, чтобы записаться!"
     )
-    await update.message.reply_text(text) 
\ No newline at end of file
+    await update.message.reply_text(text) 
+
+
+# Обработчики inline-кнопок по коду действия (см. utils.callback_data)
+CALLBACK_HANDLERS = {
+    JOIN_BATH: join_bath,
+    CONFIRM_BATH: confirm_bath_registration,
+    CLAIM_PAYMENT: handle_payment_confirmation,
+    ADMIN_CONFIRM: admin_confirm_payment,
+    ADMIN_DECLINE: admin_decline_payment,
+    WAITLIST_ACCEPT: waitlist_accept,
+    WAITLIST_DECLINE: waitlist_decline,
+}
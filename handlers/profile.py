@@ -1,13 +1,16 @@
+import asyncio
 import logging
 import re
-import csv
 import tempfile
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from config import ADMIN_IDS
-from database import Database
+from database import get_database
+from services.notification import notify_admins
+from services.mentions import mention_cache
+from utils.callback_data import encode_callback, ADMIN_CONFIRM, ADMIN_DECLINE
 
-db = Database()
+db = get_database()
 logger = logging.getLogger(__name__)
 
 PROFILE, FULL_NAME, BIRTH_DATE, OCCUPATION, INSTAGRAM, SKILLS = range(6)
@@ -57,27 +60,27 @@ async def handle_profile_update(update: Update, context: ContextTypes.DEFAULT_TY
     try:
         query = update.callback_query
         user = query.from_user
-        logger.info(f"[handle_profile_update] CallbackQuery received: data={query.data}, chat_type={update.effective_chat.type}, user_id={user.id}")
+        logger.info("[handle_profile_update] CallbackQuery received: data=%s, chat_type=%s, user_id=%s", query.data, update.effective_chat.type, user.id)
         await query.answer()
         if update.effective_chat.type != "private":
-            logger.warning(f"[handle_profile_update] Command used in non-private chat by user {user.id}")
+            logger.warning("[handle_profile_update] Command used in non-private chat by user %s", user.id)
             return ConversationHandler.END
         if query.data == "update_profile_yes":
-            logger.info(f"[handle_profile_update] ACTION: update_profile_yes, returning FULL_NAME")
+            logger.info("[handle_profile_update] ACTION: update_profile_yes, returning FULL_NAME")
             await query.message.reply_text("Пожалуйста, введите ваше полное имя:")
             context.user_data['updating_profile'] = True
             context.user_data['profile_step'] = 'full_name'
             return FULL_NAME
         elif query.data == "update_profile_no":
-            logger.info(f"[handle_profile_update] ACTION: update_profile_no, returning END")
+            logger.info("[handle_profile_update] ACTION: update_profile_no, returning END")
             await query.message.reply_text("Спасибо! Ваши данные сохранены. Если захотите обновить профиль позже, используйте команду /profile")
             return ConversationHandler.END
         else:
-            logger.info(f"[handle_profile_update] ACTION: unknown, returning PROFILE")
+            logger.info("[handle_profile_update] ACTION: unknown, returning PROFILE")
             await query.message.reply_text("Пожалуйста, выберите действие с помощью кнопок.")
             return PROFILE
     except Exception as e:
-        logger.error(f"[handle_profile_update] Unexpected error: {e}", exc_info=True)
+        logger.error("[handle_profile_update] Unexpected error: %s", e, exc_info=True)
         await update.callback_query.message.reply_text("Произошла ошибка. Попробуйте позже.")
         return ConversationHandler.END
 
@@ -88,21 +91,21 @@ async def handle_full_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return FULL_NAME
         user = update.effective_user
         full_name = update.message.text.strip()
-        logger.info(f"[handle_full_name] Received full name for user {user.id}: {full_name}")
+        logger.info("[handle_full_name] Received full name for user %s: %s", user.id, full_name)
         if not context.user_data.get('updating_profile'):
-            logger.warning(f"[handle_full_name] User {user.id} not in profile update mode")
+            logger.warning("[handle_full_name] User %s not in profile update mode", user.id)
             return FULL_NAME
         context.user_data['full_name'] = full_name
         context.user_data['profile_step'] = 'birth_date'
-        logger.info(f"[handle_full_name] Saved full name for user {user.id}")
+        logger.info("[handle_full_name] Saved full name for user %s", user.id)
         await update.message.reply_text("Пожалуйста, введите вашу дату рождения в формате ДД.ММ:")
         return BIRTH_DATE
     except Exception as e:
-        logger.error(f"[handle_full_name] Unexpected error: {e}", exc_info=True)
+        logger.error("[handle_full_name] Unexpected error: %s", e, exc_info=True)
         try:
             await update.message.reply_text("Произошла непредвиденная ошибка при сохранении имени. Пожалуйста, попробуйте позже.")
         except Exception as inner_e:
-            logger.error(f"[handle_full_name] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[handle_full_name] Error sending error message: %s", inner_e, exc_info=True)
         return FULL_NAME
 
 async def handle_birth_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -112,26 +115,26 @@ async def handle_birth_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return BIRTH_DATE
         user = update.effective_user
         birth_date = update.message.text.strip()
-        logger.info(f"[handle_birth_date] Received birth date for user {user.id}: {birth_date}")
+        logger.info("[handle_birth_date] Received birth date for user %s: %s", user.id, birth_date)
         if not context.user_data.get('updating_profile'):
-            logger.warning(f"[handle_birth_date] User {user.id} not in profile update mode")
+            logger.warning("[handle_birth_date] User %s not in profile update mode", user.id)
             return BIRTH_DATE
         # Проверяем формат даты
         if not re.match(r"^\d{1,2}\.\d{1,2}$", birth_date):
-            logger.warning(f"[handle_birth_date] Invalid date format from user {user.id}: {birth_date}")
+            logger.warning("[handle_birth_date] Invalid date format from user %s: %s", user.id, birth_date)
             await update.message.reply_text("Пожалуйста, введите дату в формате ДД.ММ (например, 01.01):")
             return BIRTH_DATE
         context.user_data['birth_date'] = birth_date
         context.user_data['profile_step'] = 'occupation'
-        logger.info(f"[handle_birth_date] Saved birth date for user {user.id}")
+        logger.info("[handle_birth_date] Saved birth date for user %s", user.id)
         await update.message.reply_text("Пожалуйста, введите вашу профессию:")
         return OCCUPATION
     except Exception as e:
-        logger.error(f"[handle_birth_date] Unexpected error: {e}", exc_info=True)
+        logger.error("[handle_birth_date] Unexpected error: %s", e, exc_info=True)
         try:
             await update.message.reply_text("Произошла непредвиденная ошибка при сохранении даты рождения. Пожалуйста, попробуйте позже.")
         except Exception as inner_e:
-            logger.error(f"[handle_birth_date] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[handle_birth_date] Error sending error message: %s", inner_e, exc_info=True)
         return BIRTH_DATE
 
 async def handle_occupation(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -141,21 +144,21 @@ async def handle_occupation(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return OCCUPATION
         user = update.effective_user
         occupation = update.message.text.strip()
-        logger.info(f"[handle_occupation] Received occupation for user {user.id}: {occupation}")
+        logger.info("[handle_occupation] Received occupation for user %s: %s", user.id, occupation)
         if not context.user_data.get('updating_profile'):
-            logger.warning(f"[handle_occupation] User {user.id} not in profile update mode")
+            logger.warning("[handle_occupation] User %s not in profile update mode", user.id)
             return OCCUPATION
         context.user_data['occupation'] = occupation
         context.user_data['profile_step'] = 'instagram'
-        logger.info(f"[handle_occupation] Saved occupation for user {user.id}")
+        logger.info("[handle_occupation] Saved occupation for user %s", user.id)
         await update.message.reply_text("Пожалуйста, введите ваш Instagram (без @):")
         return INSTAGRAM
     except Exception as e:
-        logger.error(f"[handle_occupation] Unexpected error: {e}", exc_info=True)
+        logger.error("[handle_occupation] Unexpected error: %s", e, exc_info=True)
         try:
             await update.message.reply_text("Произошла непредвиденная ошибка при сохранении профессии. Пожалуйста, попробуйте позже.")
         except Exception as inner_e:
-            logger.error(f"[handle_occupation] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[handle_occupation] Error sending error message: %s", inner_e, exc_info=True)
         return OCCUPATION
 
 async def handle_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -165,21 +168,21 @@ async def handle_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return INSTAGRAM
         user = update.effective_user
         instagram = update.message.text.strip()
-        logger.info(f"[handle_instagram] Received Instagram for user {user.id}: {instagram}")
+        logger.info("[handle_instagram] Received Instagram for user %s: %s", user.id, instagram)
         if not context.user_data.get('updating_profile'):
-            logger.warning(f"[handle_instagram] User {user.id} not in profile update mode")
+            logger.warning("[handle_instagram] User %s not in profile update mode", user.id)
             return INSTAGRAM
         context.user_data['instagram'] = instagram
         context.user_data['profile_step'] = 'skills'
-        logger.info(f"[handle_instagram] Saved Instagram for user {user.id}")
+        logger.info("[handle_instagram] Saved Instagram for user %s", user.id)
         await update.message.reply_text("Пожалуйста, расскажите о своих навыках и увлечениях:")
         return SKILLS
     except Exception as e:
-        logger.error(f"[handle_instagram] Unexpected error: {e}", exc_info=True)
+        logger.error("[handle_instagram] Unexpected error: %s", e, exc_info=True)
         try:
             await update.message.reply_text("Произошла непредвиденная ошибка при сохранении Instagram. Пожалуйста, попробуйте позже.")
         except Exception as inner_e:
-            logger.error(f"[handle_instagram] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[handle_instagram] Error sending error message: %s", inner_e, exc_info=True)
         return INSTAGRAM
 
 async def handle_skills(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -197,6 +200,8 @@ async def handle_skills(update: Update, context: ContextTypes.DEFAULT_TYPE):
         skills=context.user_data['skills']
     )
     if success:
+        # Новый или измененный профиль должен попасть в списки упоминаний
+        mention_cache.invalidate()
         if message:
             await message.reply_text(
                 "Спасибо! Ваш профиль успешно сохранен.\nВы можете обновить информацию в любой момент, используя команду /profile"
@@ -205,32 +210,23 @@ async def handle_skills(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pending_payments = db.get_pending_payments(user.id)
         if pending_payments:
             for payment in pending_payments:
-                for admin_id in ADMIN_IDS:
-                    try:
-                        keyboard = [
-                            [
-                                InlineKeyboardButton("Оплатил онлайн", callback_data=f"admin_confirm_{user.id}_{payment['date_str']}_online"),
-                                InlineKeyboardButton("Отклонить", callback_data=f"admin_decline_{user.id}_{payment['date_str']}_online")
-                            ]
-                        ]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        profile_info = (
-                            f"Пользователь @{user.username or user.first_name} заполнил профиль:\n\n"
-                            f"👤 Имя: {context.user_data['full_name']}\n"
-                            f"🎂 Дата рождения: {context.user_data['birth_date']}\n"
-                            f"💼 Род деятельности: {context.user_data['occupation']}\n"
-                            f"📸 Instagram: {context.user_data['instagram']}\n"
-                            f"🎯 Сфера бизнеса, область работы, тип услуг которые предоставляет: {context.user_data['skills']}\n\n"
-                            f"Теперь можно подтвердить оплату бани на {payment['date_str']}."
-                        )
-                        await context.bot.send_message(
-                            chat_id=admin_id,
-                            text=profile_info,
-                            reply_markup=reply_markup
-                        )
-                        logger.info(f"Отправлено уведомление администратору {admin_id} о заполненном профиле пользователя {user.id}")
-                    except Exception as e:
-                        logger.error(f"Ошибка при отправке уведомления администратору {admin_id}: {e}")
+                keyboard = [
+                    [
+                        InlineKeyboardButton("Оплатил онлайн", callback_data=encode_callback(ADMIN_CONFIRM, user_id=user.id, date_str=payment['date_str'], payment_type='online')),
+                        InlineKeyboardButton("Отклонить", callback_data=encode_callback(ADMIN_DECLINE, user_id=user.id, date_str=payment['date_str'], payment_type='online'))
+                    ]
+                ]
+                profile_info = (
+                    f"Пользователь @{user.username or user.first_name} заполнил профиль:\n\n"
+                    f"👤 Имя: {context.user_data['full_name']}\n"
+                    f"🎂 Дата рождения: {context.user_data['birth_date']}\n"
+                    f"💼 Род деятельности: {context.user_data['occupation']}\n"
+                    f"📸 Instagram: {context.user_data['instagram']}\n"
+                    f"🎯 Сфера бизнеса, область работы, тип услуг которые предоставляет: {context.user_data['skills']}\n\n"
+                    f"Теперь можно подтвердить оплату бани на {payment['date_str']}."
+                )
+                sent, failed = await notify_admins(context, profile_info, reply_markup=InlineKeyboardMarkup(keyboard))
+                logger.info("Уведомления о заполненном профиле пользователя %s отправлены администраторам: %s, ошибок: %s", user.id, len(sent), len(failed))
     else:
         if message:
             await message.reply_text(
@@ -242,25 +238,25 @@ async def start_profile_callback(update: Update, context: ContextTypes.DEFAULT_T
     try:
         query = update.callback_query
         user = query.from_user
-        logger.info(f"[start_profile_callback] CallbackQuery received: data={query.data}, chat_type={update.effective_chat.type}, user_id={user.id}")
+        logger.info("[start_profile_callback] CallbackQuery received: data=%s, chat_type=%s, user_id=%s", query.data, update.effective_chat.type, user.id)
         
         await query.answer()
         
         if update.effective_chat.type != "private":
-            logger.warning(f"[start_profile_callback] User {user.id} tried to start profile in non-private chat")
+            logger.warning("[start_profile_callback] User %s tried to start profile in non-private chat", user.id)
             await query.edit_message_text("Профиль можно заполнять только в личном чате с ботом.")
             return
             
         await query.edit_message_text("Давайте заполним информацию о вас.\nКак вас зовут? (Имя и Фамилия)")
-        logger.info(f"[start_profile_callback] Started profile creation for user {user.id}")
+        logger.info("[start_profile_callback] Started profile creation for user %s", user.id)
         return FULL_NAME
         
     except Exception as e:
-        logger.error(f"[start_profile_callback] Unexpected error: {e}", exc_info=True)
+        logger.error("[start_profile_callback] Unexpected error: %s", e, exc_info=True)
         try:
             await query.edit_message_text("Произошла непредвиденная ошибка. Пожалуйста, попробуйте позже.")
         except Exception as inner_e:
-            logger.error(f"[start_profile_callback] Error sending error message: {inner_e}", exc_info=True)
+            logger.error("[start_profile_callback] Error sending error message: %s", inner_e, exc_info=True)
         return ConversationHandler.END
 
 async def export_profiles(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -277,12 +273,15 @@ async def export_profiles(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message = update.message or (update.callback_query and update.callback_query.message)
             if message:
                 await message.reply_text("У вас нет прав для выполнения этой команды.")
-            logger.warning(f"[export_profiles] Пользователь {user_id} не админ")
+            logger.warning("[export_profiles] Пользователь %s не админ", user_id)
             return
-        profiles = db.get_all_user_profiles()
+        # Выгрузка всех профилей долгая: выполняем её в потоке, чтобы не задерживать других пользователей
+        profiles = await asyncio.to_thread(db.get_all_user_profiles)
         if not profiles:
             await update.message.reply_text("Нет данных о пользователях.")
             return
+        # csv нужен только для выгрузки; не загружаем его при запуске бота
+        import csv
         with tempfile.NamedTemporaryFile(mode='w+', newline='', delete=False, suffix='.csv') as tmpfile:
             fieldnames = [
                 'user_id', 'username', 'full_name', 'birth_date', 'occupation',
@@ -300,9 +299,9 @@ async def export_profiles(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 filename='bath_users.csv',
                 caption='Экспорт всех профилей пользователей.'
             )
-        logger.info(f"[export_profiles] Файл с профилями отправлен администратору {user_id}")
+        logger.info("[export_profiles] Файл с профилями отправлен администратору %s", user_id)
     except Exception as e:
-        logger.error(f"Ошибка в функции export_profiles: {e}")
+        logger.error("Ошибка в функции export_profiles: %s", e)
         await update.message.reply_text("Произошла ошибка при экспорте профилей.")
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -327,7 +326,7 @@ async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"{date}: {paid} {visited}\n"
         await update.message.reply_text(text)
     except Exception as e:
-        logger.error(f"[history] Ошибка при получении истории: {e}", exc_info=True)
+        logger.error("[history] Ошибка при получении истории: %s", e, exc_info=True)
         await update.message.reply_text("Произошла ошибка при получении истории. Попробуйте позже.")
 
 async def handle_profile_update_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -339,16 +338,16 @@ async def handle_profile_update_text(update: Update, context: ContextTypes.DEFAU
             context.user_data['updating_profile'] = True
             context.user_data['profile_step'] = 'full_name'
             await message.reply_text("Пожалуйста, введите ваше полное имя:")
-            logger.info(f"[handle_profile_update_text] Started profile update for user {user.id}")
+            logger.info("[handle_profile_update_text] Started profile update for user %s", user.id)
             return FULL_NAME
         elif text in ["нет", "no", "n", "н"]:
             await message.reply_text("Спасибо! Ваши данные сохранены. Если захотите обновить профиль позже, используйте команду /profile")
-            logger.info(f"[handle_profile_update_text] User {user.id} declined profile update")
+            logger.info("[handle_profile_update_text] User %s declined profile update", user.id)
             return ConversationHandler.END
         else:
             await message.reply_text("Пожалуйста, ответьте 'да' или 'нет'.")
             return PROFILE
     except Exception as e:
-        logger.error(f"[handle_profile_update_text] Unexpected error: {e}", exc_info=True)
+        logger.error("[handle_profile_update_text] Unexpected error: %s", e, exc_info=True)
         await update.message.reply_text("Произошла ошибка. Попробуйте позже.")
         return ConversationHandler.END
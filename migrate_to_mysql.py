@@ -1,9 +1,16 @@
+import argparse
+import hashlib
+import json
 import sqlite3
 import mysql.connector
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import RDS_CONFIG
 import os
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
 
 # Настройка логирования
 logging.basicConfig(
@@ -12,14 +19,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_sqlite_connection():
+SQLITE_PATH = 'bath_history.db'
+CHECKPOINT_FILE = 'migration_checkpoint.json'
+
+# Список таблиц для миграции (актуальный)
+TABLES = [
+    'active_users',
+    'bath_participants',
+    'bath_history',
+    'bath_invites',
+    'pending_payments',
+    'pinned_messages',
+    'subscribers',
+    'tracked_messages',
+    'user_profiles',
+]
+
+
+def get_sqlite_connection(path=SQLITE_PATH):
     """Получение соединения с SQLite базой данных."""
     try:
-        return sqlite3.connect('bath_history.db')
+        return sqlite3.connect(path)
     except sqlite3.Error as e:
-        logger.error(f"Ошибка подключения к SQLite: {e}")
+        logger.error("Ошибка подключения к SQLite: %s", e)
         raise
 
+
 def get_mysql_connection():
     """Получение соединения с MySQL базой данных."""
     try:
@@ -27,84 +52,246 @@ def get_mysql_connection():
         config['ssl_verify_cert'] = True
         return mysql.connector.connect(**config)
     except mysql.connector.Error as e:
-        logger.error(f"Ошибка подключения к MySQL: {e}")
+        logger.error("Ошибка подключения к MySQL: %s", e)
         raise
 
-def migrate_table(sqlite_conn, mysql_conn, table_name):
-    """Миграция данных из SQLite в MySQL для указанной таблицы."""
-    try:
-        sqlite_cursor = sqlite_conn.cursor()
-        mysql_cursor = mysql_conn.cursor()
 
-        # Получаем данные из SQLite
-        sqlite_cursor.execute(f"SELECT * FROM {table_name}")
-        rows = sqlite_cursor.fetchall()
+class Checkpoints:
+    """Контрольные точки миграции по таблицам, сохраняемые в JSON-файл.
 
-        if not rows:
-            logger.info(f"Таблица {table_name} пуста, пропускаем")
-            return
+    Для каждой таблицы хранится rowid последней перенесенной строки SQLite
+    и признак завершения, поэтому прерванный запуск продолжается с места остановки.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.data = json.load(file)
+
+    def get(self, table):
+        with self._lock:
+            return dict(self.data.get(table, {'last_rowid': 0, 'rows': 0, 'done': False}))
+
+    def save(self, table, **values):
+        with self._lock:
+            self.data.setdefault(table, {'last_rowid': 0, 'rows': 0, 'done': False}).update(values)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.data, file, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def reset(self):
+        with self._lock:
+            self.data = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def get_table_columns(sqlite_conn, mysql_conn, table_name):
+    """Возвращает колонки таблицы, которые есть и в SQLite, и в MySQL."""
+    sqlite_cursor = sqlite_conn.cursor()
+    sqlite_cursor.execute(f"PRAGMA table_info({table_name})")
+    sqlite_columns = [column[1] for column in sqlite_cursor.fetchall()]
 
-        # Получаем имена колонок
-        sqlite_cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [column[1] for column in sqlite_cursor.fetchall()]
+    mysql_cursor = mysql_conn.cursor()
+    mysql_cursor.execute(f"SHOW COLUMNS FROM {table_name}")
+    mysql_columns = {row[0] for row in mysql_cursor.fetchall()}
 
-        # Создаем плейсхолдеры для MySQL запроса
+    skipped = [column for column in sqlite_columns if column not in mysql_columns]
+    if skipped:
+        logger.warning("Таблица %s: колонки %s отсутствуют в MySQL и не переносятся", table_name, skipped)
+    return [column for column in sqlite_columns if column in mysql_columns]
+
+
+def sqlite_table_exists(sqlite_conn, table_name):
+    cursor = sqlite_conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+    return cursor.fetchone() is not None
+
+
+def migrate_table(sqlite_path, table_name, checkpoints, chunk_size=5000, commit_rows=50000):
+    """Потоковая миграция одной таблицы из SQLite в MySQL.
+
+    Строки читаются порциями через fetchmany в порядке rowid и вставляются
+    пакетно через executemany (многострочный INSERT IGNORE). Фиксация
+    выполняется раз в commit_rows строк, после чего сохраняется контрольная
+    точка. Возвращает количество прочитанных строк и время работы.
+    """
+    started = time.monotonic()
+    sqlite_conn = get_sqlite_connection(sqlite_path)
+    mysql_conn = get_mysql_connection()
+    try:
+        if not sqlite_table_exists(sqlite_conn, table_name):
+            logger.info("Таблица %s отсутствует в SQLite, пропускаем", table_name)
+            checkpoints.save(table_name, done=True)
+            return 0, 0.0
+
+        checkpoint = checkpoints.get(table_name)
+        if checkpoint['done']:
+            logger.info("Таблица %s уже мигрирована, пропускаем", table_name)
+            return 0, 0.0
+
+        columns = get_table_columns(sqlite_conn, mysql_conn, table_name)
         placeholders = ", ".join(["%s"] * len(columns))
         columns_str = ", ".join(columns)
+        insert_query = f"INSERT IGNORE INTO {table_name} ({columns_str}) VALUES ({placeholders})"
 
-        # Подготавливаем и выполняем INSERT запрос
-        insert_query = f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders})"
-        
-        for row in rows:
-            try:
-                mysql_cursor.execute(insert_query, row)
-            except mysql.connector.Error as e:
-                if e.errno == 1062:  # Duplicate entry error
-                    logger.warning(f"Пропуск дубликата в таблице {table_name}: {row}")
-                    continue
-                raise
+        sqlite_cursor = sqlite_conn.cursor()
+        sqlite_cursor.execute(
+            f"SELECT rowid, {columns_str} FROM {table_name} WHERE rowid > ? ORDER BY rowid",
+            (checkpoint['last_rowid'],)
+        )
+        mysql_cursor = mysql_conn.cursor()
+
+        last_rowid = checkpoint['last_rowid']
+        total_rows = checkpoint['rows']
+        migrated = skipped = uncommitted = 0
+        while True:
+            chunk = sqlite_cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            rows = [row[1:] for row in chunk]
+            mysql_cursor.executemany(insert_query, rows)
+            inserted = max(mysql_cursor.rowcount, 0)
+            skipped += len(rows) - inserted
+            migrated += len(rows)
+            uncommitted += len(rows)
+            last_rowid = chunk[-1][0]
+            if uncommitted >= commit_rows:
+                mysql_conn.commit()
+                checkpoints.save(table_name, last_rowid=last_rowid, rows=total_rows + migrated)
+                uncommitted = 0
 
         mysql_conn.commit()
-        logger.info(f"Успешно мигрирована таблица {table_name}: {len(rows)} записей")
+        checkpoints.save(table_name, last_rowid=last_rowid, rows=total_rows + migrated, done=True)
+
+        elapsed = time.monotonic() - started
+        rate = migrated / elapsed if elapsed > 0 else 0.0
+        if skipped:
+            logger.warning("Таблица %s: пропущено дубликатов: %s", table_name, skipped)
+        logger.info("Успешно мигрирована таблица %s: %s записей за %.2f с (%.0f строк/с)", table_name, migrated, elapsed, rate)
+        return migrated, elapsed
 
     except Exception as e:
-        logger.error(f"Ошибка при миграции таблицы {table_name}: {e}")
+        mysql_conn.rollback()
+        logger.error("Ошибка при миграции таблицы %s: %s", table_name, e)
         raise
+    finally:
+        sqlite_conn.close()
+        mysql_conn.close()
+
+
+def _normalize(value):
+    """Приводит значение к одному текстовому виду для SQLite и MySQL."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float, Decimal)):
+        return format(Decimal(str(value)).normalize(), 'f')
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return str(value)
+
+
+def _table_checksum(cursor, query, chunk_size):
+    """Считает количество строк и контрольную сумму, не зависящую от порядка строк."""
+    cursor.execute(query)
+    count = checksum = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            digest = hashlib.sha1('\x1f'.join(_normalize(value) for value in row).encode('utf-8')).digest()
+            checksum = (checksum + int.from_bytes(digest[:8], 'big')) % (1 << 64)
+            count += 1
+    return count, checksum
+
+
+def verify_table(sqlite_path, table_name, chunk_size=5000):
+    """Сверяет количество строк и контрольные суммы таблицы в SQLite и MySQL."""
+    sqlite_conn = get_sqlite_connection(sqlite_path)
+    mysql_conn = get_mysql_connection()
+    try:
+        if not sqlite_table_exists(sqlite_conn, table_name):
+            return True
+        columns_str = ", ".join(get_table_columns(sqlite_conn, mysql_conn, table_name))
+        query = f"SELECT {columns_str} FROM {table_name}"
+        sqlite_count, sqlite_sum = _table_checksum(sqlite_conn.cursor(), query, chunk_size)
+        mysql_count, mysql_sum = _table_checksum(mysql_conn.cursor(), query, chunk_size)
+        if (sqlite_count, sqlite_sum) == (mysql_count, mysql_sum):
+            logger.info("Проверка %s: OK (%s строк, checksum %016x)", table_name, sqlite_count, sqlite_sum)
+            return True
+        logger.error(
+            "Проверка %s: расхождение — SQLite %s строк (%016x), MySQL %s строк (%016x)",
+            table_name, sqlite_count, sqlite_sum, mysql_count, mysql_sum
+        )
+        return False
+    finally:
+        sqlite_conn.close()
+        mysql_conn.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Миграция данных из SQLite в MySQL")
+    parser.add_argument('--sqlite', default=SQLITE_PATH, help="путь к SQLite базе")
+    parser.add_argument('--tables', nargs='+', default=TABLES, help="таблицы для миграции")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="строк в одной порции чтения/вставки")
+    parser.add_argument('--commit-rows', type=int, default=50000, help="строк в одной транзакции MySQL")
+    parser.add_argument('--workers', type=int, default=4, help="количество таблиц, мигрируемых параллельно")
+    parser.add_argument('--checkpoint-file', default=CHECKPOINT_FILE, help="файл контрольных точек")
+    parser.add_argument('--reset', action='store_true', help="начать миграцию заново, игнорируя контрольные точки")
+    parser.add_argument('--skip-verify', action='store_true', help="не сверять данные после миграции")
+    return parser.parse_args()
+
 
 def main():
     """Основная функция миграции."""
-    try:
-        # Подключение к базам данных
-        sqlite_conn = get_sqlite_connection()
-        mysql_conn = get_mysql_connection()
-
-        # Список таблиц для миграции (актуальный)
-        tables = [
-            'active_users',
-            'bath_participants',
-            'bath_history',
-            'bath_invites',
-            'pending_payments',
-            'pinned_messages',
-            'subscribers',
-            'tracked_messages',
-            'user_profiles',
-        ]
-
-        # Миграция каждой таблицы
-        for table in tables:
-            migrate_table(sqlite_conn, mysql_conn, table)
-
-        logger.info("Миграция успешно завершена")
+    args = parse_args()
+    checkpoints = Checkpoints(args.checkpoint_file)
+    if args.reset:
+        checkpoints.reset()
+
+    started = time.monotonic()
+    total_rows = 0
+    failed_tables = []
+    # Таблицы независимы, поэтому переносятся параллельно, каждая на своих соединениях
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(migrate_table, args.sqlite, table, checkpoints, args.chunk_size, args.commit_rows): table
+            for table in args.tables
+        }
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                rows, _ = future.result()
+                total_rows += rows
+            except Exception:
+                failed_tables.append(table)
+
+    elapsed = time.monotonic() - started
+    rate = total_rows / elapsed if elapsed > 0 else 0.0
+    logger.info("Перенесено %s строк за %.2f с (%.0f строк/с)", total_rows, elapsed, rate)
+
+    if failed_tables:
+        logger.error("Миграция не завершена для таблиц: %s. Повторный запуск продолжит с контрольных точек.", ', '.join(failed_tables))
+        raise SystemExit(1)
+
+    if not args.skip_verify:
+        mismatched = [table for table in args.tables if not verify_table(args.sqlite, table, args.chunk_size)]
+        if mismatched:
+            logger.error("Данные не совпадают для таблиц: %s", ', '.join(mismatched))
+            raise SystemExit(1)
+
+    logger.info("Миграция успешно завершена")
 
-    except Exception as e:
-        logger.error(f"Ошибка при миграции: {e}")
-        raise
-    finally:
-        if 'sqlite_conn' in locals():
-            sqlite_conn.close()
-        if 'mysql_conn' in locals():
-            mysql_conn.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
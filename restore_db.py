@@ -1,19 +1,170 @@
+import argparse
+import gzip
+import json
 import os
 import shutil
+import sqlite3
+import tempfile
 
-DB_PATH = "bath_bot.db"
-BACKUP_DIR = "backups"
+from backup_db import DB_PATH, BACKUP_DIR, MANIFEST_SUFFIX, file_sha256, list_backups
 
-# Находим самый свежий бэкап
-backups = [f for f in os.listdir(BACKUP_DIR) if f.startswith("bath_bot_backup_") and f.endswith(".db")]
-if not backups:
-    print("Нет доступных бэкапов!")
-    exit(1)
+# Дамп восстанавливается в базу <имя>_restore, прежние таблицы переносятся в <имя>_before_restore
+STAGING_SUFFIX = '_restore'
+PREVIOUS_SUFFIX = '_before_restore'
 
-backups.sort(reverse=True)
-latest_backup = backups[0]
-backup_path = os.path.join(BACKUP_DIR, latest_backup)
 
-# Восстанавливаем базу
-shutil.copy2(backup_path, DB_PATH)
-print(f"База данных восстановлена из бэкапа: {backup_path}") 
\ No newline at end of file
+def verify_manifest(backup_path):
+    """Проверяет бэкап по манифесту. Возвращает манифест или бросает исключение"""
+    manifest_path = backup_path + MANIFEST_SUFFIX
+    if not os.path.exists(manifest_path):
+        raise RuntimeError(f"Не найден манифест {manifest_path}")
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest.get('file') != os.path.basename(backup_path):
+        raise RuntimeError("Манифест относится к другому файлу")
+    if os.path.getsize(backup_path) != manifest.get('size'):
+        raise RuntimeError("Размер бэкапа не совпадает с манифестом")
+    if file_sha256(backup_path) != manifest.get('sha256'):
+        raise RuntimeError("Контрольная сумма бэкапа не совпадает с манифестом")
+    return manifest
+
+
+def restore_sqlite(backup_path, manifest, db_path=DB_PATH):
+    """Распаковывает бэкап рядом с базой, проверяет его и атомарно подменяет файл базы"""
+    target_dir = os.path.dirname(os.path.abspath(db_path))
+    fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=target_dir)
+    os.close(fd)
+    try:
+        with gzip.open(backup_path, 'rb') as compressed, open(tmp_path, 'wb') as raw:
+            shutil.copyfileobj(compressed, raw, 1024 * 1024)
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            integrity = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            if integrity != 'ok':
+                raise RuntimeError(f"Проверка целостности не пройдена: {integrity}")
+            for table, expected in manifest.get('tables', {}).items():
+                actual = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                if actual != expected:
+                    raise RuntimeError(f"Таблица {table}: {actual} строк вместо {expected}")
+        finally:
+            conn.close()
+
+        if os.path.exists(db_path):
+            shutil.copy2(db_path, db_path + '.before_restore')
+        os.replace(tmp_path, db_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_statements(backup_path, manifest):
+    """Инструкции логического дампа MySQL по одной.
+
+    В дампах формата 2 каждая инструкция занимает одну строку. Старые дампы
+    (без format в манифесте) собираются до строки, оканчивающейся на ';'.
+    """
+    with gzip.open(backup_path, 'rt', encoding='utf-8', newline='\n') as dump:
+        if manifest.get('format', 1) >= 2:
+            for line in dump:
+                line = line.rstrip('\n')
+                if line and not line.startswith('--'):
+                    yield line
+            return
+        statement = []
+        for line in dump:
+            if line.startswith('--') and not statement:
+                continue
+            statement.append(line)
+            if line.rstrip().endswith(';'):
+                yield ''.join(statement)
+                statement = []
+
+
+def restore_mysql(backup_path, manifest):
+    """Восстанавливает дамп MySQL в отдельную базу и подменяет таблицы одним RENAME TABLE.
+
+    DROP/CREATE в MySQL фиксируются сразу и не откатываются, поэтому дамп
+    выполняется в промежуточной базе: пока число строк не сверено с
+    манифестом, рабочие таблицы не затрагиваются. Подмена — одна атомарная
+    инструкция RENAME TABLE; прежние таблицы остаются в базе
+    <имя>_before_restore.
+    """
+    import mysql.connector
+    from config import RDS_CONFIG
+
+    live = RDS_CONFIG['database']
+    staging, previous = live + STAGING_SUFFIX, live + PREVIOUS_SUFFIX
+    tables = manifest.get('tables', {})
+    conn = mysql.connector.connect(**RDS_CONFIG, ssl_verify_cert=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{staging}`")
+        cursor.execute(f"CREATE DATABASE `{staging}`")
+        cursor.execute(f"USE `{staging}`")
+        for statement in read_statements(backup_path, manifest):
+            cursor.execute(statement)
+        conn.commit()
+        for table, expected in tables.items():
+            cursor.execute(f"SELECT COUNT(*) FROM `{staging}`.`{table}`")
+            actual = cursor.fetchone()[0]
+            if actual != expected:
+                raise RuntimeError(f"Таблица {table}: {actual} строк вместо {expected}")
+
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s", (live,))
+        existing = {row[0] for row in cursor.fetchall()}
+        cursor.execute(f"DROP DATABASE IF EXISTS `{previous}`")
+        cursor.execute(f"CREATE DATABASE `{previous}`")
+        renames = []
+        for table in tables:
+            if table in existing:
+                renames.append(f"`{live}`.`{table}` TO `{previous}`.`{table}`")
+            renames.append(f"`{staging}`.`{table}` TO `{live}`.`{table}`")
+        cursor.execute("RENAME TABLE " + ", ".join(renames))
+    finally:
+        # После подмены промежуточная база пуста; при ошибке в ней остался неполный дамп
+        try:
+            conn.cursor().execute(f"DROP DATABASE IF EXISTS `{staging}`")
+        except Exception:
+            pass
+        conn.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Восстановление базы данных из бэкапа")
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite', help="какую базу восстанавливать")
+    parser.add_argument('--backup', help="путь к бэкапу (по умолчанию самый свежий)")
+    parser.add_argument('--db-path', default=DB_PATH, help="путь к SQLite базе")
+    parser.add_argument('--backup-dir', default=BACKUP_DIR, help="каталог с бэкапами")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Находим самый свежий бэкап
+    backup_path = args.backup
+    if not backup_path:
+        backups = list_backups(args.backup_dir, args.backend)
+        if not backups:
+            print("Нет доступных бэкапов!")
+            exit(1)
+        backup_path = backups[0]
+
+    try:
+        manifest = verify_manifest(backup_path)
+    except Exception as e:
+        print(f"Бэкап {backup_path} не прошёл проверку: {e}")
+        exit(1)
+
+    # Восстанавливаем базу
+    if args.backend == 'sqlite':
+        restore_sqlite(backup_path, manifest, args.db_path)
+    else:
+        restore_mysql(backup_path, manifest)
+    print(f"База данных восстановлена из бэкапа: {backup_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Очередь допуска к записи в первые минуты после публикации события.
+
+Пока окно наплыва открыто (ADMISSION_SURGE_SECONDS после отправки сообщения
+события), место выдается в памяти по счетчику в порядке нажатий, остальные
+получают номер в листе ожидания без обращений к базе. Решение принимается
+синхронно, без await, поэтому два нажатия не могут занять одно место.
+Счетчик при открытии берется из базы (занятые и удерживаемые места), а
+каждое выданное место сразу закрепляется в базе приглашением
+(Database.reserve_seat); если база места не подтвердила, пользователь
+переходит в лист ожидания (revoke). Личные сообщения отправляются
+отдельными воркерами в том же порядке через общий диспетчер с ограничением
+скорости.
+"""
+import asyncio
+import logging
+import time
+
+from config import MAX_BATH_PARTICIPANTS, ADMISSION_SURGE_SECONDS, NOTIFICATION_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Результаты admit
+ADMITTED = 'admitted'
+WAITLISTED = 'waitlisted'
+ALREADY_ADMITTED = 'already_admitted'
+ALREADY_WAITLISTED = 'already_waitlisted'
+
+
+class SurgeWindow:
+    """Места и лист ожидания одного события на время наплыва"""
+    def __init__(self, seats, until):
+        self.seats = seats
+        self.until = until
+        self.admitted = {}   # user_id -> номер по порядку допуска
+        self.waitlist = {}   # user_id -> позиция в листе ожидания
+
+
+class AdmissionQueue:
+    """Окна наплыва по датам событий и очередь доставки личных сообщений"""
+    def __init__(self, window=ADMISSION_SURGE_SECONDS, capacity=MAX_BATH_PARTICIPANTS, workers=NOTIFICATION_CONCURRENCY):
+        self.window = window
+        self.capacity = capacity
+        self.workers = workers
+        self._events = {}    # date_str -> SurgeWindow
+        self._queue = None
+        self._workers = []
+        self.stats = {'admitted': 0, 'waitlisted': 0, 'duplicates': 0, 'delivered': 0, 'failed': 0}
+
+    def open(self, date_str, taken=0):
+        """Открывает окно наплыва для события; taken — места, уже занятые и удерживаемые в базе"""
+        seats = max(0, self.capacity - taken)
+        self._events[date_str] = SurgeWindow(seats, time.monotonic() + self.window)
+        logger.info("[admission] Surge window for %s opened: %s seats for %s s", date_str, seats, self.window)
+
+    def close(self, date_str):
+        self._events.pop(date_str, None)
+
+    def is_open(self, date_str):
+        event = self._events.get(date_str)
+        if event is None:
+            return False
+        if time.monotonic() >= event.until:
+            logger.info(
+                "[admission] Surge window for %s closed: %s admitted, %s waitlisted",
+                date_str, len(event.admitted), len(event.waitlist)
+            )
+            del self._events[date_str]
+            return False
+        return True
+
+    def admit(self, date_str, user_id):
+        """Выдает место или позицию в листе ожидания: (результат, номер).
+
+        Вызывать только при открытом окне (is_open).
+        """
+        event = self._events[date_str]
+        if user_id in event.admitted:
+            self.stats['duplicates'] += 1
+            return ALREADY_ADMITTED, event.admitted[user_id]
+        if user_id in event.waitlist:
+            self.stats['duplicates'] += 1
+            return ALREADY_WAITLISTED, event.waitlist[user_id]
+        if event.seats > 0:
+            event.seats -= 1
+            event.admitted[user_id] = len(event.admitted) + 1
+            self.stats['admitted'] += 1
+            return ADMITTED, event.admitted[user_id]
+        event.waitlist[user_id] = len(event.waitlist) + 1
+        self.stats['waitlisted'] += 1
+        return WAITLISTED, event.waitlist[user_id]
+
+    def release(self, date_str, user_id):
+        """Возвращает в счетчик место, которое не удалось закрепить в базе из-за ошибки"""
+        event = self._events.get(date_str)
+        if event is not None and event.admitted.pop(user_id, None) is not None:
+            event.seats += 1
+            self.stats['admitted'] -= 1
+
+    def revoke(self, date_str, user_id):
+        """База не подтвердила выданное место: мест больше нет, пользователь переходит в лист ожидания.
+
+        Вызывать только при открытом окне (is_open). Возвращает (WAITLISTED, позиция).
+        """
+        event = self._events[date_str]
+        event.admitted.pop(user_id, None)
+        event.seats = 0
+        event.waitlist[user_id] = len(event.waitlist) + 1
+        self.stats['admitted'] -= 1
+        self.stats['waitlisted'] += 1
+        logger.warning("[admission] Seat for user %s on %s not confirmed by the database, waitlisted", user_id, date_str)
+        return WAITLISTED, event.waitlist[user_id]
+
+    def submit(self, deliver):
+        """Ставит доставку (асинхронную функцию без аргументов) в очередь в порядке допуска"""
+        if not self._workers:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._queue.put_nowait(deliver)
+
+    def queue_size(self):
+        return self._queue.qsize() if self._queue else 0
+
+    async def join(self):
+        """Дожидается доставки всего, что поставлено в очередь"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.queue_size():
+            logger.warning("[admission] %s deliveries dropped on shutdown", self.queue_size())
+        self._queue = None
+
+    async def _worker(self):
+        while True:
+            deliver = await self._queue.get()
+            try:
+                await deliver()
+                self.stats['delivered'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error("[admission] Delivery failed: %s", e)
+            finally:
+                self._queue.task_done()
+
+
+admission = AdmissionQueue()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import re
+import time
+
+from telegram.error import BadRequest, Forbidden
+from telegram.ext import ContextTypes
+from config import BROADCAST_BATCH_SIZE, BROADCAST_PROGRESS_INTERVAL
+from database import BROADCAST_RUNNING, BROADCAST_DONE, RECIPIENT_BLOCKED, RECIPIENT_FAILED
+from services.notification import get_dispatcher
+
+logger = logging.getLogger(__name__)
+
+TARGET_PATTERN = re.compile(r'^(all|participants|last(\d+))$')
+
+
+def parse_target(token):
+    """Разбирает аудиторию рассылки: all, participants или lastN.
+
+    Возвращает (target, last_events) или None, если аудитория не распознана.
+    """
+    match = TARGET_PATTERN.match(token.lower())
+    if not match:
+        return None
+    if match.group(2):
+        last_events = int(match.group(2))
+        return ('history', last_events) if last_events > 0 else None
+    return match.group(1), None
+
+
+def _classify_error(error):
+    """Заблокированный бот и удаленный чат не лечатся повтором, остальное считаем разовой ошибкой"""
+    if isinstance(error, Forbidden):
+        return RECIPIENT_BLOCKED
+    if isinstance(error, BadRequest) and 'chat not found' in str(error).lower():
+        return RECIPIENT_BLOCKED
+    return RECIPIENT_FAILED
+
+
+def _progress_text(broadcast, processed, elapsed, finished=False):
+    done = broadcast['sent'] + broadcast['failed']
+    remaining = max(broadcast['total'] - done, 0)
+    throughput = processed / elapsed if elapsed > 0 else 0.0
+    if finished:
+        header = f"Рассылка #{broadcast['id']} завершена ({broadcast['status']})."
+        eta = ""
+    else:
+        header = f"Рассылка #{broadcast['id']} выполняется."
+        eta = f"\nОсталось примерно: {int(remaining / throughput)} с" if throughput > 0 and remaining else ""
+    return (
+        f"{header}\n"
+        f"Обработано: {done} из {broadcast['total']}\n"
+        f"Доставлено: {broadcast['sent']}, не доставлено: {broadcast['failed']}\n"
+        f"Скорость: {throughput:.1f} сообщ./с{eta}"
+    )
+
+
+async def _report(dispatcher, broadcast, message, text):
+    """Обновляет сообщение с прогрессом; если его нет, отправляет новое"""
+    try:
+        if message:
+            await dispatcher.call('edit_message_text', broadcast['created_by'], message_id=message.message_id, text=text)
+            return message
+        return await dispatcher.send_message(broadcast['created_by'], text)
+    except Exception as e:
+        logger.warning("[broadcast] Failed to report progress of #%s: %s", broadcast['id'], e)
+        return message
+
+
+async def run_broadcast(application, broadcast_id):
+    """Отправляет рассылку пачками по BROADCAST_BATCH_SIZE.
+
+    После каждой пачки результаты сохраняются в базе, поэтому после
+    перезапуска рассылка продолжается с первого необработанного получателя
+    (получатели прерванной пачки могут получить сообщение повторно).
+    Отмена через /broadcast_cancel проверяется между пачками. Запросы к
+    базе выполняются в потоке, чтобы чтение и запись пачек не задерживали
+    обработку других обновлений.
+    """
+    from handlers.bath import db
+
+    dispatcher = get_dispatcher(application)
+    broadcast = await asyncio.to_thread(db.get_broadcast, broadcast_id)
+    if not broadcast or broadcast['status'] != BROADCAST_RUNNING:
+        return
+
+    started = last_report = time.monotonic()
+    processed = 0
+    message = await _report(dispatcher, broadcast, None, _progress_text(broadcast, 0, 0))
+    while True:
+        batch = await asyncio.to_thread(db.get_broadcast_batch, broadcast_id, BROADCAST_BATCH_SIZE)
+        if not batch:
+            await asyncio.to_thread(db.finish_broadcast, broadcast_id, BROADCAST_DONE)
+            break
+
+        results = await asyncio.gather(
+            *(dispatcher.send_message(user_id, broadcast['text'], bulk=True) for user_id in batch),
+            return_exceptions=True
+        )
+        sent_ids, failures = [], []
+        for user_id, result in zip(batch, results):
+            if isinstance(result, Exception):
+                failures.append((user_id, _classify_error(result), str(result)))
+            else:
+                sent_ids.append(user_id)
+        await asyncio.to_thread(db.record_broadcast_results, broadcast_id, sent_ids, failures)
+        processed += len(batch)
+
+        broadcast = await asyncio.to_thread(db.get_broadcast, broadcast_id)
+        if broadcast['status'] != BROADCAST_RUNNING:
+            break
+        if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            message = await _report(dispatcher, broadcast, message, _progress_text(broadcast, processed, last_report - started))
+
+    broadcast = await asyncio.to_thread(db.get_broadcast, broadcast_id)
+    elapsed = time.monotonic() - started
+    await _report(dispatcher, broadcast, message, _progress_text(broadcast, processed, elapsed, finished=True))
+    logger.info(
+        "[broadcast] #%s %s: sent=%s failed=%s elapsed=%.2fs throughput=%.1f msg/s",
+        broadcast_id, broadcast['status'], broadcast['sent'], broadcast['failed'], elapsed, processed / elapsed if elapsed > 0 else 0.0
+    )
+
+
+async def _supervise(application, broadcast_id):
+    try:
+        await run_broadcast(application, broadcast_id)
+    except asyncio.CancelledError:
+        logger.info("[broadcast] #%s interrupted, will resume after restart", broadcast_id)
+        raise
+    except Exception as e:
+        logger.error("[broadcast] #%s failed: %s", broadcast_id, e, exc_info=True)
+    finally:
+        application.bot_data.get('broadcast_tasks', {}).pop(broadcast_id, None)
+
+
+def start_broadcast(application, broadcast_id):
+    """Запускает рассылку в фоне (повторный запуск уже идущей рассылки ничего не делает)"""
+    tasks = application.bot_data.setdefault('broadcast_tasks', {})
+    task = tasks.get(broadcast_id)
+    if task is None or task.done():
+        task = asyncio.create_task(_supervise(application, broadcast_id))
+        tasks[broadcast_id] = task
+    return task
+
+
+async def resume_broadcasts(context: ContextTypes.DEFAULT_TYPE):
+    """Задача JobQueue при запуске бота: продолжает рассылки, прерванные перезапуском"""
+    from handlers.bath import db
+
+    for broadcast_id in await asyncio.to_thread(db.get_running_broadcasts):
+        logger.info("[broadcast] Resuming #%s", broadcast_id)
+        start_broadcast(context.application, broadcast_id)
+
+
+async def stop_broadcasts(application):
+    """Прерывает фоновые рассылки при остановке бота; прогресс уже сохранен в базе"""
+    tasks = list(application.bot_data.get('broadcast_tasks', {}).values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,88 @@
+import html
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+
+from config import MENTION_CACHE_TTL
+from database import on_participants_changed
+from utils.formatting import chunk_text
+
+logger = logging.getLogger(__name__)
+
+FILTER_PATTERN = re.compile(r'^(all|participants|unregistered|last(\d+))$')
+
+# Максимальная длина имени в ссылке-упоминании: вместе с разметкой
+# упоминание всегда намного короче лимита сообщения
+MENTION_NAME_LIMIT = 64
+
+
+def parse_mention_filter(token):
+    """Разбирает фильтр /mention_all: all, participants, unregistered или lastN (недель).
+
+    Возвращает (target, weeks) или None, если фильтр не распознан.
+    """
+    match = FILTER_PATTERN.match(token.lower())
+    if not match:
+        return None
+    if match.group(2):
+        weeks = int(match.group(2))
+        return ('history', weeks) if weeks > 0 else None
+    return match.group(1), None
+
+
+def previous_sundays(date_str, weeks):
+    """Даты weeks воскресений перед событием date_str (ДД.ММ.ГГГГ)"""
+    anchor = datetime.strptime(date_str, "%d.%m.%Y")
+    return [(anchor - timedelta(weeks=week)).strftime("%d.%m.%Y") for week in range(1, weeks + 1)]
+
+
+def format_mention(user):
+    """@username или ссылка-упоминание по id (HTML), если username нет"""
+    if user['username']:
+        return f"@{html.escape(user['username'])}"
+    name = user.get('full_name') or str(user['user_id'])
+    if len(name) > MENTION_NAME_LIMIT:
+        # Обрезается имя до экранирования, а не готовая разметка
+        name = name[:MENTION_NAME_LIMIT - 1] + "…"
+    return f'<a href="tg://user?id={user["user_id"]}">{html.escape(name)}</a>'
+
+
+class MentionCache:
+    """Готовые сообщения с упоминаниями по ключу фильтра.
+
+    Запись живет ttl секунд и сбрасывается целиком при изменении участников
+    любого события.
+    """
+    def __init__(self, ttl=MENTION_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry and now - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        chunks = build()
+        self._entries[key] = (now, chunks)
+        return chunks
+
+    def invalidate(self, *args):
+        self._entries.clear()
+
+
+mention_cache = MentionCache()
+on_participants_changed(mention_cache.invalidate)
+
+
+def get_mention_chunks(db, target, date_str, weeks=None):
+    """Возвращает список сообщений (не длиннее лимита Telegram) с упоминаниями пользователей фильтра"""
+    def build():
+        dates = previous_sundays(date_str, weeks) if target == 'history' else None
+        users = db.get_mention_users(target, date_str=date_str, dates=dates)
+        return chunk_text([format_mention(user) for user in users])
+    return mention_cache.get((target, date_str, weeks), build)
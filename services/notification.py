@@ -1,3 +1,335 @@
-# ... existing code ...
-# Добавить бизнес-логику уведомлений из bot.py, если требуется.
-# ... existing code ...
+import asyncio
+import itertools
+import logging
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from telegram.ext import ContextTypes
+from config import (
+    ADMIN_IDS, NOTIFICATION_RATE, NOTIFICATION_CONCURRENCY, NOTIFICATION_PRIVATE_INTERVAL,
+    NOTIFICATION_GROUP_PER_MINUTE, NOTIFICATION_MAX_RETRIES,
+    PAYMENT_REMINDER_HOURS, PAYMENT_REMINDER_BATCH_SIZE, PAYMENT_REMINDER_ESCALATE_AFTER
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты очереди: ответы на действия пользователей обгоняют массовые рассылки
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не более capacity подряд.
+
+    reserve() сразу забирает токен (допуская «долг») и возвращает, сколько
+    секунд нужно подождать до его появления. Так одно ведро можно делить
+    между корутинами без блокировок.
+    """
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_take(self):
+        """Забирает токен и возвращает 0, если он есть; иначе — секунды до его появления, ничего не забирая"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_idle(self):
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class MessageDispatcher:
+    """Единая очередь исходящих запросов к Telegram с ограничением скорости.
+
+    - общий лимит global_rate сообщений в секунду на бота;
+    - лимиты на чат: один запрос в private_interval секунд для личных чатов
+      и group_per_minute в минуту для групп;
+    - не более concurrency одновременных запросов; запрос в чат, лимит
+      которого исчерпан, откладывается обратно в очередь до своего времени,
+      а воркер берет следующий, поэтому поток сообщений в один чат не
+      занимает всех воркеров;
+    - RetryAfter приостанавливает все отправки на указанное время, сетевые
+      ошибки повторяются с экспоненциальной задержкой;
+    - интерактивные запросы выбираются из очереди раньше массовых.
+    """
+    def __init__(self, bot, global_rate=NOTIFICATION_RATE, concurrency=NOTIFICATION_CONCURRENCY,
+                 private_interval=NOTIFICATION_PRIVATE_INTERVAL, group_per_minute=NOTIFICATION_GROUP_PER_MINUTE,
+                 max_retries=NOTIFICATION_MAX_RETRIES, backoff=1.0):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.private_interval = private_interval
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets = {}
+        self._queue = None
+        self._workers = []
+        self._sequence = itertools.count()
+        self._deferred = {}  # номер запроса -> (таймер возврата в очередь, запрос)
+        self._paused_until = 0.0
+        self.stats = {'sent': 0, 'failed': 0, 'retried': 0, 'flood_waits': 0, 'deferred': 0}
+
+    def start(self):
+        """Запускает воркеров в текущем event loop (повторный вызов ничего не делает)"""
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Останавливает воркеров; запросы, оставшиеся в очереди, отменяются"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        items = [item for _, item in self._deferred.values()]
+        for handle, _ in self._deferred.values():
+            handle.cancel()
+        self._deferred.clear()
+        if self._queue:
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+        for _, _, (_, _, _, future) in items:
+            if not future.done():
+                future.cancel()
+
+    def queue_size(self):
+        return (self._queue.qsize() if self._queue else 0) + len(self._deferred)
+
+    async def call(self, method, chat_id, bulk=False, **kwargs):
+        """Ставит вызов метода бота (send_message, edit_message_text, ...) в очередь и ждет результат"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        priority = PRIORITY_BULK if bulk else PRIORITY_INTERACTIVE
+        self._queue.put_nowait((priority, next(self._sequence), (method, chat_id, kwargs, future)))
+        return await future
+
+    async def send_message(self, chat_id, text, bulk=False, **kwargs):
+        return await self.call('send_message', chat_id, bulk=bulk, text=text, **kwargs)
+
+    async def send_many(self, messages, bulk=True):
+        """Отправляет список сообщений (словари аргументов send_message).
+
+        Возвращает два списка: отправленные и неотправленные сообщения.
+        """
+        results = await asyncio.gather(
+            *(self.send_message(bulk=bulk, **message) for message in messages),
+            return_exceptions=True
+        )
+        sent, failed = [], []
+        for message, result in zip(messages, results):
+            if isinstance(result, BaseException):
+                logger.error("[MessageDispatcher] Error sending to %s: %s", message.get('chat_id'), result)
+                failed.append(message)
+            else:
+                sent.append(message)
+        return sent, failed
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {key: value for key, value in self._chat_buckets.items() if not value.is_idle()}
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(1.0 / self.private_interval, capacity=1)
+            else:
+                bucket = TokenBucket(self.group_per_minute / 60.0, capacity=self.group_per_minute)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _defer(self, item, delay):
+        """Возвращает запрос в очередь через delay секунд, не занимая воркера"""
+        sequence = item[1]
+        handle = asyncio.get_running_loop().call_later(delay, self._requeue, sequence)
+        self._deferred[sequence] = (handle, item)
+        self.stats['deferred'] += 1
+
+    def _requeue(self, sequence):
+        _, item = self._deferred.pop(sequence)
+        # Прежние приоритет и номер: запрос не теряет места среди сообщений в тот же чат
+        self._queue.put_nowait(item)
+
+    async def _wait_turn(self, chat_id=None):
+        """Ждет общей паузы и общего лимита; с chat_id — еще и лимита чата (для повторов)"""
+        if chat_id is not None:
+            delay = self._chat_bucket(chat_id).reserve()
+            if delay:
+                await asyncio.sleep(delay)
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        delay = self._global_bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _execute(self, method, chat_id, kwargs):
+        """Выполняет запрос; токен чата для первой попытки уже взят воркером"""
+        errors = flood_waits = 0
+        retry_chat = None
+        while True:
+            await self._wait_turn(retry_chat)
+            retry_chat = chat_id
+            try:
+                return await getattr(self.bot, method)(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if flood_waits >= self.max_retries:
+                    raise
+                flood_waits += 1
+                retry_after = e.retry_after
+                if hasattr(retry_after, 'total_seconds'):
+                    retry_after = retry_after.total_seconds()
+                # Флуд-контроль действует на весь бот, поэтому пауза общая для всех воркеров
+                self._paused_until = max(self._paused_until, time.monotonic() + float(retry_after))
+                self.stats['flood_waits'] += 1
+                logger.warning("[MessageDispatcher] RetryAfter %ss for chat %s", retry_after, chat_id)
+            except (BadRequest, Forbidden):
+                # BadRequest наследует NetworkError, но повтор не поможет
+                raise
+            except NetworkError as e:
+                if errors >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** errors)
+                errors += 1
+                self.stats['retried'] += 1
+                logger.warning("[MessageDispatcher] %s to %s failed (%s), retry in %.1fs", method, chat_id, e, delay)
+                await asyncio.sleep(delay)
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            _, _, (method, chat_id, kwargs, future) = item
+            try:
+                if future.done():
+                    continue
+                delay = self._chat_bucket(chat_id).try_take()
+                if delay:
+                    self._defer(item, delay)
+                    continue
+                try:
+                    result = await self._execute(method, chat_id, kwargs)
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self.stats['sent'] += 1
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+
+def get_dispatcher(context):
+    """Возвращает общий диспетчер приложения, создавая его при первом обращении"""
+    dispatcher = context.bot_data.get('dispatcher')
+    if dispatcher is None:
+        dispatcher = MessageDispatcher(context.bot)
+        context.bot_data['dispatcher'] = dispatcher
+    return dispatcher
+
+
+async def notify_admins(context, text, bulk=False, **kwargs):
+    """Отправляет одно и то же сообщение всем администраторам через диспетчер"""
+    messages = [dict(chat_id=admin_id, text=text, **kwargs) for admin_id in ADMIN_IDS]
+    return await get_dispatcher(context).send_many(messages, bulk=bulk)
+
+
+def admin_fan_out(context, text, **kwargs):
+    """Рассылка администраторам для фоновой задачи: повторная попытка отправляет только недоставленные"""
+    pending = [dict(chat_id=admin_id, text=text, **kwargs) for admin_id in ADMIN_IDS]
+
+    async def send():
+        _, failed = await get_dispatcher(context).send_many(pending, bulk=False)
+        pending[:] = failed
+        if failed:
+            raise RuntimeError(f"не доставлено администраторам: {[message['chat_id'] for message in failed]}")
+    return send
+
+
+def _payment_reminder_text(payment):
+    payment_type = "наличными" if payment['payment_type'] == 'cash' else "онлайн"
+    return (
+        f"Напоминаем: ваша заявка на оплату бани {payment['date_str']} ({payment_type}) "
+        f"ещё ожидает подтверждения администратором.\n"
+        f"Если вы ещё не заполнили профиль, сделайте это командой /profile — без него оплату нельзя подтвердить."
+    )
+
+
+def _payment_escalation_text(payment, reminders):
+    username = payment['username'] or f"ID: {payment['user_id']}"
+    return (
+        f"Заявка пользователя @{username} (ID: {payment['user_id']}) на баню {payment['date_str']} "
+        f"({payment['payment_type']}) не подтверждена после {reminders} напоминаний."
+    )
+
+
+async def send_payment_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """Задача JobQueue: рассылает напоминания по ожидающим оплатам.
+
+    Заявки читаются страницами по PAYMENT_REMINDER_BATCH_SIZE. Для каждой
+    страницы напоминания отправляются через общий диспетчер как массовые,
+    после чего last_notified обновляется одним запросом на всю страницу.
+    Когда число напоминаний достигает PAYMENT_REMINDER_ESCALATE_AFTER,
+    заявка дополнительно передается администраторам, и больше напоминаний
+    по ней не отправляется. Запросы к базе выполняются в потоке.
+    """
+    from handlers.bath import db
+
+    started = time.monotonic()
+    total_sent = total_failed = total_escalated = 0
+    after_id = 0
+    try:
+        while True:
+            payments = await asyncio.to_thread(
+                db.get_pending_payments_for_reminder,
+                hours=PAYMENT_REMINDER_HOURS,
+                limit=PAYMENT_REMINDER_BATCH_SIZE,
+                after_id=after_id,
+                max_reminders=PAYMENT_REMINDER_ESCALATE_AFTER
+            )
+            if not payments:
+                break
+            after_id = payments[-1]['id']
+
+            messages = []
+            for payment in payments:
+                messages.append({'chat_id': payment['user_id'], 'text': _payment_reminder_text(payment)})
+                reminders = payment['reminder_count'] + 1
+                if reminders == PAYMENT_REMINDER_ESCALATE_AFTER:
+                    total_escalated += 1
+                    text = _payment_escalation_text(payment, reminders)
+                    messages.extend({'chat_id': admin_id, 'text': text} for admin_id in ADMIN_IDS)
+
+            sent, failed = await get_dispatcher(context).send_many(messages, bulk=True)
+            total_sent += len(sent)
+            total_failed += len(failed)
+
+            # Заявки отмечаются целиком, чтобы недоставленные не повторялись на каждом запуске
+            await asyncio.to_thread(db.mark_payments_notified, [payment['id'] for payment in payments])
+
+            if len(payments) < PAYMENT_REMINDER_BATCH_SIZE:
+                break
+    except Exception as e:
+        logger.error("[send_payment_reminders] Unexpected error: %s", e, exc_info=True)
+
+    elapsed = time.monotonic() - started
+    throughput = total_sent / elapsed if elapsed > 0 else 0.0
+    logger.info(
+        "[send_payment_reminders] sent=%s failed=%s escalated=%s elapsed=%.2fs throughput=%.1f msg/s",
+        total_sent, total_failed, total_escalated, elapsed, throughput
+    )
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import time
+
+from telegram.ext import BasePersistence, ContextTypes, PersistenceInput
+from config import PERSISTENCE_FLUSH_INTERVAL, PERSISTENCE_IDLE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+
+class DatabasePersistence(BasePersistence):
+    """Хранит user_data и состояния диалогов ConversationHandler в MySQL.
+
+    - user_data пользователя загружается при первом его обновлении после
+      запуска, а не целиком при старте;
+    - изменения копятся в памяти и записываются одной транзакцией не чаще
+      раза в flush_interval секунд; неизмененные данные не пишутся;
+    - данные пользователей, неактивных дольше idle_ttl секунд, выгружаются
+      из памяти (в базе они остаются).
+    bot_data и chat_data не сохраняются: там лежат служебные объекты.
+    """
+    def __init__(self, db, flush_interval=PERSISTENCE_FLUSH_INTERVAL, idle_ttl=PERSISTENCE_IDLE_TTL):
+        # PTB передает изменения каждую секунду, но это только запись в буфер
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=1
+        )
+        self.db = db
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self._persisted = {}       # user_id -> сериализованные данные, совпадающие с базой
+        self._last_access = {}     # user_id -> момент последнего обращения
+        self._evicting = set()
+        self._pending_users = {}   # user_id -> данные или None (удаление)
+        self._pending_conversations = {}  # (name, ключ) -> состояние или None
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+        self.stats = {'loads': 0, 'flushes': 0, 'rows_written': 0, 'skipped_unchanged': 0, 'evicted': 0}
+
+    # Загрузка
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        # Незавершенных диалогов немного, поэтому они загружаются сразу
+        rows = await asyncio.to_thread(self.db.get_bot_conversations, name)
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def refresh_user_data(self, user_id, user_data):
+        """Вызывается PTB перед обработкой обновления: подгружает данные пользователя при первом обращении"""
+        self._last_access[user_id] = time.monotonic()
+        if user_id in self._persisted or user_id in self._pending_users:
+            return
+        raw = await asyncio.to_thread(self.db.get_bot_user_data, user_id)
+        self.stats['loads'] += 1
+        self._persisted[user_id] = raw or _dumps({})
+        if raw:
+            # Изменения, сделанные до загрузки, важнее сохраненных
+            stored = json.loads(raw)
+            stored.update(user_data)
+            user_data.clear()
+            user_data.update(stored)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # Запись
+    async def update_user_data(self, user_id, data):
+        serialized = _dumps(data)
+        if self._pending_users.get(user_id, self._persisted.get(user_id)) == serialized:
+            self.stats['skipped_unchanged'] += 1
+            return
+        self._pending_users[user_id] = serialized
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        if user_id in self._evicting:
+            # Выгрузка из памяти, а не удаление: данные остаются в базе
+            self._evicting.discard(user_id)
+            return
+        self._pending_users[user_id] = None
+        self._persisted.pop(user_id, None)
+        self._schedule_flush()
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_conversations[(name, _dumps(list(key)))] = None if new_state is None else _dumps(new_state)
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def flush(self):
+        """Вызывается PTB при остановке: записывает все накопленные изменения"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self._write_pending()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self._write_pending()
+
+    async def _write_pending(self):
+        async with self._lock:
+            users, self._pending_users = self._pending_users, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if not users and not conversations:
+                return
+            user_rows = [(user_id, data) for user_id, data in users.items() if data is not None and data != '{}']
+            # Пустые user_data не храним
+            user_deletes = [user_id for user_id, data in users.items() if data is None or data == '{}']
+            conversation_rows = [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+            conversation_deletes = [(name, key) for (name, key), state in conversations.items() if state is None]
+            try:
+                await asyncio.to_thread(
+                    self.db.save_bot_state, user_rows, user_deletes, conversation_rows, conversation_deletes
+                )
+            except Exception as e:
+                logger.error("[DatabasePersistence] Flush failed, will retry: %s", e, exc_info=True)
+                # Более новые изменения, пришедшие во время записи, не затираем
+                self._pending_users = {**users, **self._pending_users}
+                self._pending_conversations = {**conversations, **self._pending_conversations}
+                self._flush_task = asyncio.create_task(self._flush_later())
+                return
+            for user_id, data in users.items():
+                if data is not None:
+                    self._persisted[user_id] = data
+            self.stats['flushes'] += 1
+            self.stats['rows_written'] += len(users) + len(conversations)
+
+    # Выгрузка неактивных
+    async def evict_idle(self, context: ContextTypes.DEFAULT_TYPE):
+        """Задача JobQueue: выгружает из памяти user_data пользователей, неактивных дольше idle_ttl"""
+        threshold = time.monotonic() - self.idle_ttl
+        idle = [
+            user_id for user_id, accessed in self._last_access.items()
+            if accessed < threshold and user_id not in self._pending_users
+        ]
+        for user_id in idle:
+            del self._last_access[user_id]
+            self._persisted.pop(user_id, None)
+            self._evicting.add(user_id)
+            context.application.drop_user_data(user_id)
+        self.stats['evicted'] += len(idle)
+        if idle:
+            logger.info("[DatabasePersistence] Evicted %s idle users", len(idle))
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest
+from config import BATH_CHAT_ID, PINNED_UPDATE_INTERVAL
+from utils.formatting import render_cache
+from services.notification import get_dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class PinnedMessageUpdater:
+    """Обновляет закрепленное сообщение события при изменении списка участников.
+
+    Изменения за interval секунд схлопываются в одно редактирование на дату;
+    если текст не изменился, запрос к Telegram не отправляется.
+    """
+    def __init__(self, application, db, chat_id=BATH_CHAT_ID, interval=PINNED_UPDATE_INTERVAL):
+        self.application = application
+        self.db = db
+        self.chat_id = chat_id
+        self.interval = interval
+        self._loop = None
+        self._pending = {}       # date_str -> (задача, момент первого изменения)
+        self._last_edit = {}     # date_str -> момент последнего редактирования
+        self._rendered = {}      # date_str -> хеш текста в чате
+        self.stats = {'edits': 0, 'coalesced': 0, 'unchanged': 0, 'errors': 0}
+        self.latencies_ms = deque(maxlen=200)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        tasks = [task for task, _ in self._pending.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+
+    def remember(self, date_str, text):
+        """Запоминает текст, уже отправленный в чат (например, при создании события)"""
+        self._rendered[date_str] = _digest(text)
+        self._last_edit[date_str] = time.monotonic()
+
+    def mark_dirty(self, date_str):
+        """Обработчик изменения участников; может вызываться из любого потока"""
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._schedule(date_str)
+        else:
+            self._loop.call_soon_threadsafe(self._schedule, date_str)
+
+    def _schedule(self, date_str):
+        if date_str in self._pending:
+            self.stats['coalesced'] += 1
+            return
+        now = time.monotonic()
+        delay = max(0.0, self._last_edit.get(date_str, 0.0) + self.interval - now)
+        task = asyncio.create_task(self._update_later(date_str, delay))
+        self._pending[date_str] = (task, now)
+
+    async def _update_later(self, date_str, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        _, changed_at = self._pending.pop(date_str)
+        # Изменения, пришедшие во время редактирования, запланируют следующее
+        try:
+            await self.update(date_str, changed_at)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error("[PinnedMessageUpdater] Failed to update message for %s: %s", date_str, e, exc_info=True)
+
+    async def update(self, date_str, changed_at=None):
+        """Перерисовывает сообщение события на дату date_str, если текст изменился"""
+        # Запросы к базе — в потоке, чтобы медленный запрос не останавливал обработку обновлений
+        message_id = await asyncio.to_thread(self.db.get_pinned_message_id, self.chat_id, date_str)
+        if not message_id:
+            return False
+        text, keyboard = await asyncio.to_thread(render_cache.render, date_str, self.db)
+        digest = _digest(text)
+        if self._rendered.get(date_str) == digest:
+            self.stats['unchanged'] += 1
+            return False
+        try:
+            await get_dispatcher(self.application).call(
+                'edit_message_text', self.chat_id,
+                message_id=message_id, text=text, reply_markup=keyboard
+            )
+        except BadRequest as e:
+            # Текст в чате уже совпадает (например, после перезапуска бота)
+            if 'not modified' not in str(e).lower():
+                raise
+        self._rendered[date_str] = digest
+        self._last_edit[date_str] = time.monotonic()
+        self.stats['edits'] += 1
+        if changed_at is not None:
+            latency_ms = (time.monotonic() - changed_at) * 1000
+            self.latencies_ms.append(latency_ms)
+            logger.info(
+                "[PinnedMessageUpdater] Updated %s in %.0f ms (edits=%s, coalesced=%s)",
+                date_str, latency_ms, self.stats['edits'], self.stats['coalesced']
+            )
+        return True
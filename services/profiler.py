@@ -0,0 +1,92 @@
+import asyncio
+import io
+import logging
+import os
+import tempfile
+import time
+
+from config import CPU_PROFILE_MAX_SECONDS, CPU_PROFILE_TOP
+from utils.formatting import MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilerBusy(RuntimeError):
+    """Профилирование уже запущено"""
+
+
+class CpuProfiler:
+    """cProfile работающего процесса на заданное число секунд.
+
+    Профилируется поток event loop, где выполняются обработчики; код,
+    вынесенный в asyncio.to_thread (запросы к базе), в отчет не попадает.
+    Одновременно работает не больше одного замера, длительность ограничена
+    max_seconds, а профайлер выключается при любом завершении задачи,
+    включая отмену при остановке бота.
+    """
+    def __init__(self, max_seconds=CPU_PROFILE_MAX_SECONDS, top=CPU_PROFILE_TOP):
+        self.max_seconds = max_seconds
+        self.top = top
+        self._task = None
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, seconds, on_complete):
+        """Включает профайлер; по истечении seconds вызывает on_complete(отчет, путь к .pstats)"""
+        if self.running:
+            raise ProfilerBusy(f"Профилирование уже идет {time.monotonic() - self.started_at:.0f} с")
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"Длительность должна быть от 1 до {self.max_seconds} секунд")
+        # cProfile и pstats нужны только на время замера: не загружаем их при запуске бота
+        import cProfile
+        profile = cProfile.Profile()
+        # Бросает ValueError, если в процессе уже работает другой профайлер
+        profile.enable()
+        self.started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run(profile, seconds, on_complete))
+        logger.warning("[CpuProfiler] Profiling enabled for %s s", seconds)
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self, profile, seconds, on_complete):
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            logger.warning("[CpuProfiler] Profiling disabled after %.1f s", time.monotonic() - self.started_at)
+        report, path = await asyncio.to_thread(self._export, profile, seconds)
+        try:
+            await on_complete(report, path)
+        except Exception as e:
+            logger.error("[CpuProfiler] Failed to deliver report: %s", e, exc_info=True)
+        finally:
+            os.remove(path)
+
+    def _export(self, profile, seconds):
+        import pstats
+        with tempfile.NamedTemporaryFile(prefix='cpu_', suffix='.pstats', delete=False) as f:
+            path = f.name
+        profile.dump_stats(path)
+        buffer = io.StringIO()
+        stats = pstats.Stats(profile, stream=buffer)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        header = (
+            f"CPU-профиль за {seconds} с (поток event loop), "
+            f"топ-{self.top} по cumulative time:\n"
+        )
+        # Заголовок pstats с путями и числом вызовов сокращаем до таблицы
+        table = buffer.getvalue().strip()
+        table = table[table.find('ncalls'):] if 'ncalls' in table else table
+        report = header + table
+        if len(report) > MESSAGE_LIMIT:
+            report = report[:MESSAGE_LIMIT - 1] + "…"
+        return report, path
+
+
+cpu_profiler = CpuProfiler()
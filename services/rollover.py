@@ -0,0 +1,168 @@
+"""Смена недели: архив прошлых событий, новое событие и закрепленное сообщение.
+
+Этапы выполняются по порядку, последний завершенный хранится в таблице
+rollovers по дате нового события, поэтому повторный запуск (после ошибки,
+перезапуска бота или из /create_bath) продолжает с прерванного этапа.
+Сообщения отправляются не более одного раза: перед отправкой этап
+отмечается как начатый, и прерванная отправка не повторяется. Если Telegram
+отклонил отправку (сообщение точно не ушло), отметка снимается и этап можно
+повторить; после таймаута исход неизвестен, и отметку снимает администратор
+командой /rollover_reset, проверив чат.
+"""
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, InvalidToken, RetryAfter
+
+from config import BATH_CHAT_ID
+from services.admission import admission
+from services.mentions import get_mention_chunks
+from utils.formatting import render_cache
+from utils.locks import event_locks
+from utils.metrics import handler_metrics, OUTCOME_OK, OUTCOME_ERROR
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('archive', 'create', 'render', 'post', 'pin', 'announce', 'prewarm')
+
+# Итог этапа в отчете
+STAGE_DONE = 'done'
+STAGE_SKIPPED = 'skipped'
+
+# Ошибки, при которых Telegram отклонил запрос: сообщение точно не отправлено
+REJECTED_ERRORS = (BadRequest, Forbidden, ChatMigrated, RetryAfter, InvalidToken)
+
+
+class RolloverError(Exception):
+    """Смену недели нельзя продолжить автоматически"""
+
+
+class WeeklyRollover:
+    """Идемпотентная смена недели на дату date_str (см. run)"""
+    def __init__(self, db, chat_id=BATH_CHAT_ID):
+        self.db = db
+        self.chat_id = chat_id
+        self._lock = asyncio.Lock()
+
+    async def run(self, context, date_str):
+        """Выполняет незавершенные этапы. Возвращает отчет: [(этап, итог, мс)]"""
+        async with self._lock:
+            state = await asyncio.to_thread(self.db.get_rollover, date_str)
+            done = STAGES.index(state['stage']) + 1 if state['stage'] else 0
+            report = []
+            for index, stage in enumerate(STAGES):
+                # Рендер нужен отправке и закреплению, поэтому выполняется всегда (обычно из кеша)
+                if index < done and stage != 'render':
+                    report.append((stage, STAGE_SKIPPED, 0))
+                    continue
+                started = time.perf_counter()
+                try:
+                    outcome = await getattr(self, f'_{stage}')(context, date_str, state)
+                except Exception:
+                    handler_metrics.observe(f'rollover:{stage}', OUTCOME_ERROR, time.perf_counter() - started)
+                    logger.error("[rollover] %s: stage %s failed", date_str, stage)
+                    raise
+                seconds = time.perf_counter() - started
+                handler_metrics.observe(f'rollover:{stage}', OUTCOME_OK, seconds)
+                report.append((stage, outcome, round(seconds * 1000)))
+                logger.info("[rollover] %s: %s %s in %.0f ms", date_str, stage, outcome, seconds * 1000)
+                if index >= done:
+                    await asyncio.to_thread(
+                        self.db.complete_rollover_stage, date_str, stage,
+                        cleared_events=state['cleared_events'], message_id=state['message_id']
+                    )
+            if done < len(STAGES):
+                stage_ms = {stage: ms for stage, outcome, ms in report if outcome == STAGE_DONE}
+                await asyncio.to_thread(self.db.finish_rollover, date_str, stage_ms)
+            return report
+
+    async def _archive(self, context, date_str, state):
+        async with event_locks.lock(date_str):
+            # Записи новой даты не трогаются, поэтому повтор не удалит лишнего
+            state['cleared_events'] = await asyncio.to_thread(self.db.clear_previous_bath_events, date_str)
+        return STAGE_DONE
+
+    async def _create(self, context, date_str, state):
+        async with event_locks.lock(date_str):
+            await asyncio.to_thread(self.db.create_bath_event, date_str)
+            # Очистка не оповещает подписчиков, поэтому готовый текст сбрасывается явно
+            render_cache.invalidate(date_str)
+        return STAGE_DONE
+
+    async def _render(self, context, date_str, state):
+        state['rendered'] = await asyncio.to_thread(render_cache.render, date_str, self.db)
+        return STAGE_DONE
+
+    async def _post(self, context, date_str, state):
+        if state['message_id']:
+            return STAGE_SKIPPED
+        text, keyboard = state['rendered']
+        sent = await self._send_once(context, date_str, 'post', text=text, reply_markup=keyboard)
+        state['message_id'] = sent.message_id
+        # Нажатия сразу после публикации идут через очередь допуска; счетчик мест —
+        # из базы вместе с заявками на оплату и приглашениями, выданными до публикации
+        taken = await asyncio.to_thread(self.db.count_seat_holders, date_str)
+        admission.open(date_str, taken=taken)
+        # Места, не разобранные за время наплыва, достанутся листу ожидания
+        waitlist = context.bot_data.get('waitlist')
+        if waitlist:
+            waitlist.check(date_str, delay=admission.window)
+        return STAGE_DONE
+
+    async def _pin(self, context, date_str, state):
+        message_id = state['message_id']
+        for old_date, old_message_id in await asyncio.to_thread(self.db.get_pinned_messages, self.chat_id):
+            if old_date == date_str:
+                continue
+            try:
+                await context.bot.unpin_chat_message(chat_id=self.chat_id, message_id=old_message_id)
+                logger.info("[rollover] Unpinned old message %s (%s)", old_message_id, old_date)
+            except Exception as e:
+                logger.warning("[rollover] Failed to unpin old message %s: %s", old_message_id, e)
+            await asyncio.to_thread(self.db.delete_pinned_message_id, old_message_id, self.chat_id)
+        # Повторное закрепление того же сообщения безопасно
+        await context.bot.pin_chat_message(chat_id=self.chat_id, message_id=message_id, disable_notification=False)
+        await asyncio.to_thread(self.db.set_pinned_message_id, date_str, message_id, self.chat_id)
+        updater = context.bot_data.get('pinned_updater')
+        if updater:
+            updater.remember(date_str, state['rendered'][0])
+        return STAGE_DONE
+
+    async def _announce(self, context, date_str, state):
+        if not state['cleared_events']:
+            return STAGE_SKIPPED
+        await self._send_once(
+            context, date_str, 'announce',
+            text=f"Создана новая запись на баню {date_str}. Список участников предыдущей бани очищен."
+        )
+        return STAGE_DONE
+
+    async def _prewarm(self, context, date_str, state):
+        """Заполняет кеши, к которым первыми обратятся после публикации"""
+        await asyncio.to_thread(render_cache.render, date_str, self.db)
+        await asyncio.to_thread(get_mention_chunks, self.db, 'participants', date_str)
+        return STAGE_DONE
+
+    async def _send_once(self, context, date_str, stage, **kwargs):
+        """Отправляет сообщение этапа не более одного раза (см. описание модуля)"""
+        if not await asyncio.to_thread(self.db.begin_rollover_stage, date_str, stage):
+            raise RolloverError(
+                f"Отправка ({stage}) при смене недели {date_str} была прервана. "
+                f"Проверьте чат бани: повторная отправка отключена, чтобы не было дубля. "
+                f"Если сообщения нет, выполните /rollover_reset {date_str} и повторите /create_bath."
+            )
+        try:
+            # Без повторов диспетчера: повтор после таймаута мог бы продублировать сообщение
+            return await context.bot.send_message(chat_id=self.chat_id, **kwargs)
+        except REJECTED_ERRORS as e:
+            logger.warning("[rollover] %s: %s rejected by Telegram, stage can be retried: %s", date_str, stage, e)
+            await asyncio.to_thread(self.db.reset_rollover_stage, date_str)
+            raise
+
+
+def format_report(date_str, report):
+    lines = [f"Смена недели на {date_str}:"]
+    for stage, outcome, ms in report:
+        lines.append(f"{stage}: {'пропущен' if outcome == STAGE_SKIPPED else f'{ms} мс'}")
+    return "\n".join(lines)
@@ -0,0 +1,217 @@
+"""Планировщик периодических задач с журналом запусков в базе.
+
+В отличие от JobQueue, каждый запуск записывается в таблицу job_runs
+(статус, длительность, ошибка) под уникальным ключом (задача, плановое время):
+запуск выполняет только тот экземпляр бота, который успел его занять, а
+после перезапуска пропущенные запуски навёрстываются по политике задачи.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from config import SCHEDULER_TIMEZONE
+from database import JOB_OK, JOB_FAILED
+
+logger = logging.getLogger(__name__)
+
+# Политики навёрстывания пропущенных запусков
+CATCH_UP_SKIP = 'skip'      # пропущенный запуск не выполняется
+CATCH_UP_LATEST = 'latest'  # выполняется последний пропущенный, если опоздание не больше grace
+
+# Планировщик просыпается не реже этого, чтобы пережить перевод часов и сон машины
+MAX_SLEEP_SECONDS = 60
+
+
+def _utc(moment):
+    """Плановое время для ключа в job_runs: наивное UTC с точностью до секунды"""
+    return moment.astimezone(pytz.utc).replace(tzinfo=None, microsecond=0)
+
+
+class Daily:
+    """Каждый день (или в дни недели days, 0 — понедельник) в момент at по часовому поясу tz"""
+    def __init__(self, at, days=tuple(range(7)), tz=SCHEDULER_TIMEZONE):
+        self.at = at
+        self.days = frozenset(days)
+        self.tz = pytz.timezone(tz)
+
+    def _slot(self, day):
+        return self.tz.localize(datetime.combine(day, self.at))
+
+    def previous(self, now):
+        """Последнее плановое время не позже now"""
+        day = now.astimezone(self.tz).date()
+        for _ in range(8):
+            if day.weekday() in self.days and self._slot(day) <= now:
+                return self._slot(day)
+            day -= timedelta(days=1)
+        return None
+
+    def next(self, now):
+        """Первое плановое время позже now"""
+        day = now.astimezone(self.tz).date()
+        for _ in range(8):
+            if day.weekday() in self.days and self._slot(day) > now:
+                return self._slot(day)
+            day += timedelta(days=1)
+        return None
+
+    def __repr__(self):
+        days = '' if len(self.days) == 7 else f" по дням {sorted(self.days)}"
+        return f"ежедневно в {self.at:%H:%M}{days}"
+
+
+class Every:
+    """Каждые seconds секунд; плановые времена кратны интервалу от эпохи, одинаковы у всех экземпляров"""
+    def __init__(self, seconds):
+        self.seconds = int(seconds)
+
+    def previous(self, now):
+        timestamp = int(now.timestamp())
+        return datetime.fromtimestamp(timestamp - timestamp % self.seconds, pytz.utc)
+
+    def next(self, now):
+        return self.previous(now) + timedelta(seconds=self.seconds)
+
+    def __repr__(self):
+        return f"каждые {self.seconds // 60} мин" if self.seconds % 60 == 0 else f"каждые {self.seconds} с"
+
+
+class ScheduledJob:
+    """Задача планировщика: callback(context) по расписанию schedule.
+
+    catch_up — политика для запуска, пропущенного, пока бот не работал;
+    grace — наибольшее опоздание, с которым запуск еще выполняется.
+    """
+    def __init__(self, name, callback, schedule, catch_up=CATCH_UP_SKIP, grace=timedelta(hours=1)):
+        self.name = name
+        self.callback = callback
+        self.schedule = schedule
+        self.catch_up = catch_up
+        self.grace = grace
+        self.next_run = None
+        self.task = None
+
+
+class JobScheduler:
+    """Выполняет задачи по расписанию; запуски занимаются через Database.claim_job_run"""
+    def __init__(self, db, worker=None):
+        self.db = db
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs = {}
+        self.stats = {'runs': 0, 'failed': 0, 'skipped': 0, 'caught_up': 0}
+        self._context = None
+        self._task = None
+
+    def add(self, job):
+        if job.name in self.jobs:
+            raise ValueError(f"Задача {job.name} уже зарегистрирована")
+        self.jobs[job.name] = job
+        return job
+
+    def start(self, application):
+        if self._task is None:
+            self._context = application.context_types.context(application=application)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _now(self):
+        return datetime.now(pytz.utc)
+
+    async def _run(self):
+        # Схема проверяется в фоне при запуске (services.startup); ждем ее, не повторяя
+        while True:
+            try:
+                await asyncio.to_thread(self.db.ensure_schema)
+                break
+            except Exception as e:
+                logger.error("[scheduler] Database unavailable, retrying in %s s: %s", MAX_SLEEP_SECONDS, e)
+                await asyncio.sleep(MAX_SLEEP_SECONDS)
+        now = self._now()
+        for job in self.jobs.values():
+            if job.catch_up == CATCH_UP_LATEST:
+                missed = job.schedule.previous(now)
+                if missed is not None and now - missed <= job.grace:
+                    # Если запуск уже был (до перезапуска или на другом экземпляре), claim его не отдаст
+                    self._launch(job, missed, catch_up=True)
+            job.next_run = job.schedule.next(now)
+        while True:
+            now = self._now()
+            for job in self.jobs.values():
+                if job.next_run is not None and job.next_run <= now:
+                    self._launch(job, job.next_run)
+                    job.next_run = job.schedule.next(now)
+            upcoming = [job.next_run for job in self.jobs.values() if job.next_run is not None]
+            delay = min((moment - now).total_seconds() for moment in upcoming) if upcoming else MAX_SLEEP_SECONDS
+            await asyncio.sleep(min(max(delay, 0.01), MAX_SLEEP_SECONDS))
+
+    def _launch(self, job, scheduled_for, catch_up=False):
+        if job.task is not None and not job.task.done():
+            logger.warning("[scheduler] %s: previous run still in progress, slot %s skipped", job.name, scheduled_for)
+            self.stats['skipped'] += 1
+            return
+        job.task = asyncio.create_task(self._execute(job, scheduled_for, catch_up))
+
+    async def _execute(self, job, scheduled_for, catch_up):
+        slot = _utc(scheduled_for)
+        try:
+            run_id = await asyncio.to_thread(self.db.claim_job_run, job.name, slot, self.worker)
+        except Exception as e:
+            logger.error("[scheduler] %s: failed to claim run %s: %s", job.name, slot, e)
+            return
+        if run_id is None:
+            logger.debug("[scheduler] %s: run %s already taken", job.name, slot)
+            self.stats['skipped'] += 1
+            return
+        if catch_up:
+            self.stats['caught_up'] += 1
+            logger.info("[scheduler] %s: catching up missed run %s", job.name, slot)
+        started = time.perf_counter()
+        status, error = JOB_OK, None
+        try:
+            await job.callback(self._context)
+        except asyncio.CancelledError:
+            status, error = JOB_FAILED, "cancelled"
+            raise
+        except Exception as e:
+            status, error = JOB_FAILED, f"{type(e).__name__}: {e}"
+            logger.error("[scheduler] %s failed: %s", job.name, e, exc_info=True)
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000)
+            self.stats['runs'] += 1
+            if status == JOB_FAILED:
+                self.stats['failed'] += 1
+            try:
+                await asyncio.shield(asyncio.to_thread(self.db.finish_job_run, run_id, status, duration_ms, error))
+            except Exception as e:
+                logger.error("[scheduler] %s: failed to record run %s: %s", job.name, run_id, e)
+        logger.info("[scheduler] %s run %s: %s in %s ms", job.name, slot, status, duration_ms)
+
+    async def status_text(self):
+        """Отчет для команды /jobs: расписание, следующий и последний запуск каждой задачи"""
+        last_runs = await asyncio.to_thread(self.db.get_last_job_runs)
+        lines = [f"Задачи планировщика (экземпляр {self.worker}):"]
+        for job in self.jobs.values():
+            next_run = job.next_run.astimezone(pytz.timezone(SCHEDULER_TIMEZONE)).strftime('%d.%m %H:%M') if job.next_run else "—"
+            line = f"{job.name}: {job.schedule!r}, следующий {next_run}"
+            last = last_runs.get(job.name)
+            if last:
+                line += f"; последний {last['scheduled_for']:%d.%m %H:%M} UTC — {last['status']}"
+                if last['duration_ms'] is not None:
+                    line += f", {last['duration_ms']} мс"
+                if last['error']:
+                    line += f" ({last['error']})"
+            lines.append(line)
+        return "\n".join(lines)
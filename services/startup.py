@@ -0,0 +1,103 @@
+"""Замер и порядок фаз запуска бота.
+
+bot.py импортирует этот модуль первым, поэтому отсчет начинается до
+загрузки telegram и обработчиков. Проверка схемы базы (init_db) не
+выполняется при импорте: post_init запускает ее в потоке, и она идет
+одновременно с первым getUpdates. Обновления, пришедшие раньше, ждут ее
+в middleware wait_ready.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Группы middleware: ожидание базы — до всех обработчиков (и до замера метрик),
+# отметка первого обработанного обновления — после всех
+READY_GROUP = -2
+FIRST_UPDATE_GROUP = 1001
+
+
+class StartupMonitor:
+    """Фазы запуска с длительностями и время до первого обработанного обновления.
+
+    Последовательные фазы отмечаются mark(name): длительность считается от
+    предыдущей отметки. Фазы, идущие параллельно (проверка схемы), попадают
+    в отчет со своей длительностью, но не сдвигают отметки.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._last = self.origin
+        self.phases = []          # (фаза, секунды)
+        self.background = []      # (фаза, секунды) параллельных фаз
+        self.first_update = None  # секунды от начала до первого обработанного обновления
+        self.stop_after_first_update = False
+        self._db = None
+        self._schema_task = None
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    # Проверка схемы базы
+    def begin_schema_check(self, db):
+        """Запускает db.ensure_schema в потоке, не дожидаясь результата"""
+        self._db = db
+        if self._schema_task is None:
+            self._schema_task = asyncio.create_task(self._check_schema())
+
+    async def _check_schema(self):
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._db.ensure_schema)
+        except Exception as e:
+            logger.error("[startup] Schema check failed: %s", e, exc_info=True)
+            raise
+        seconds = time.perf_counter() - started
+        self.background.append(('schema', seconds))
+        logger.info("[startup] Schema ready in %.2f s (%.2f s since start)", seconds, self.elapsed())
+
+    async def wait_ready(self, update, context):
+        """Middleware: обновление обрабатывается, только когда схема базы проверена"""
+        if self._db is None or self._db.schema_ready:
+            return
+        task = self._schema_task
+        if task is None or (task.done() and task.exception() is not None):
+            # Прошлая попытка не удалась (например, база была недоступна): пробуем снова
+            task = self._schema_task = asyncio.create_task(self._check_schema())
+        try:
+            await asyncio.shield(task)
+        except Exception:
+            from telegram.ext import ApplicationHandlerStop
+            # Без базы обработчики все равно упадут; обновление пропускаем
+            raise ApplicationHandlerStop
+
+    async def stop(self):
+        """Дожидается фоновой проверки схемы при остановке бота"""
+        if self._schema_task is not None and not self._schema_task.done():
+            await asyncio.gather(self._schema_task, return_exceptions=True)
+
+    async def update_handled(self, update, context):
+        """Middleware: отмечает первое обработанное обновление"""
+        if self.first_update is not None:
+            return
+        self.first_update = self.elapsed()
+        logger.info("[startup] First update handled %.2f s after start", self.first_update)
+        if self.stop_after_first_update:
+            print(self.report())
+            context.application.stop_running()
+
+    def report(self):
+        lines = ["Запуск бота, с:"]
+        lines += [f"  {name:<16} {seconds:7.3f}" for name, seconds in self.phases]
+        lines += [f"  {name:<16} {seconds:7.3f} (параллельно)" for name, seconds in self.background]
+        if self.first_update is not None:
+            lines.append(f"  {'first update':<16} {self.first_update:7.3f} от начала")
+        return "\n".join(lines)
+
+
+startup = StartupMonitor()
@@ -0,0 +1,78 @@
+"""Фоновые задачи, которые продолжаются после ответа на нажатие кнопки.
+
+Обработчик отвечает пользователю, как только проверки пройдены и главная
+запись сделана, а остальное (уведомления администраторам, второстепенные
+записи в базу) передает сюда. Задача повторяется с экспоненциальной
+задержкой до BACKGROUND_TASK_RETRIES попыток; только если все они не
+удались, вызывается on_failure — обычно сообщение пользователю.
+"""
+import asyncio
+import logging
+import time
+
+from config import BACKGROUND_TASK_RETRIES, BACKGROUND_TASK_BACKOFF
+from utils.metrics import handler_metrics, OUTCOME_OK, OUTCOME_ERROR
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """Набор фоновых задач с повторами; время и исход видны в /perf как task:<name>"""
+    def __init__(self, retries=BACKGROUND_TASK_RETRIES, backoff=BACKGROUND_TASK_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self._tasks = set()
+        self.stats = {'done': 0, 'retried': 0, 'failed': 0}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def spawn(self, name, func, on_failure=None):
+        """Запускает func() (асинхронную функцию без аргументов; каждая попытка вызывает ее заново)"""
+        task = asyncio.create_task(self._supervise(name, func, on_failure))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _supervise(self, name, func, on_failure):
+        started = time.perf_counter()
+        for attempt in range(1, self.retries + 1):
+            try:
+                await func()
+                self.stats['done'] += 1
+                handler_metrics.observe(f'task:{name}', OUTCOME_OK, time.perf_counter() - started)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    logger.error("[tasks] %s failed after %s attempts: %s", name, attempt, e, exc_info=True)
+                    break
+                self.stats['retried'] += 1
+                delay = self.backoff * 2 ** (attempt - 1)
+                logger.warning("[tasks] %s failed (attempt %s), retrying in %.1fs: %s", name, attempt, delay, e)
+                await asyncio.sleep(delay)
+        self.stats['failed'] += 1
+        handler_metrics.observe(f'task:{name}', OUTCOME_ERROR, time.perf_counter() - started)
+        if on_failure is not None:
+            try:
+                await on_failure()
+            except Exception as e:
+                logger.error("[tasks] Failure handler of %s failed: %s", name, e)
+
+    async def join(self):
+        """Дожидается завершения всех запущенных задач"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def stop(self, timeout=10):
+        """Дает задачам timeout секунд завершиться, оставшиеся отменяет"""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            logger.warning("[tasks] %s background tasks cancelled on shutdown", len(pending))
+
+
+background_tasks = BackgroundTasks()
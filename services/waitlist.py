@@ -0,0 +1,193 @@
+"""Лист ожидания с автоматическим предложением освободившихся мест.
+
+Очередь хранится в таблице waitlist. Проверка свободных мест запускается
+событием изменения участников (database.on_participants_changed), истечением
+или отказом от предложения, а не опросом: за одну проверку каждое свободное
+место уходит следующему ожидающему одной транзакцией с выбором по индексу.
+Предложение действует WAITLIST_OFFER_MINUTES; срок отслеживает таймер
+event loop, после перезапуска таймеры восстанавливаются из базы. Принятое
+место ждет заявки на оплату WAITLIST_PAYMENT_MINUTES, затем его снимает
+периодическая проверка Database.expire_seat_holds.
+"""
+import asyncio
+import logging
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import MAX_BATH_PARTICIPANTS, WAITLIST_OFFER_MINUTES, WAITLIST_PAYMENT_MINUTES
+from database import on_participants_changed
+from services.admission import admission
+from services.notification import get_dispatcher
+from utils.callback_data import encode_callback, WAITLIST_ACCEPT, WAITLIST_DECLINE
+
+logger = logging.getLogger(__name__)
+
+# Таймер срабатывает с запасом, чтобы срок в базе (offer_expires_at, точность — секунда) уже истек
+OFFER_EXPIRY_SLACK = 2
+
+
+_last_position = 0
+
+
+def waitlist_position():
+    """Ключ порядка в листе ожидания: время нажатия в мкс, строго возрастает"""
+    global _last_position
+    _last_position = max(_last_position + 1, time.time_ns() // 1000)
+    return _last_position
+
+
+class Waitlist:
+    """Лист ожидания событий: постановка в очередь, предложения мест и их истечение"""
+    def __init__(self, application, db, capacity=MAX_BATH_PARTICIPANTS, offer_ttl=WAITLIST_OFFER_MINUTES * 60,
+                 payment_ttl=WAITLIST_PAYMENT_MINUTES * 60):
+        self.application = application
+        self.db = db
+        self.capacity = capacity
+        self.offer_ttl = offer_ttl
+        self.payment_ttl = payment_ttl
+        self._loop = None
+        self._checks = {}    # date_str -> задача проверки мест
+        self._rerun = set()  # даты, изменившиеся во время проверки
+        self._timers = {}    # (date_str, user_id) -> таймер истечения предложения
+        self._tasks = set()
+        self._restore_task = None
+        self.stats = {'offers': 0, 'accepted': 0, 'declined': 0, 'expired': 0}
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        on_participants_changed(self.seat_changed)
+        self._restore_task = asyncio.create_task(self._restore())
+
+    async def stop(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        tasks = list(self._checks.values()) + list(self._tasks)
+        if self._restore_task is not None:
+            tasks.append(self._restore_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _restore(self):
+        """Таймеры действующих предложений и проверка дат, где есть ожидающие"""
+        try:
+            await asyncio.to_thread(self.db.ensure_schema)
+            for date_str, user_id, seconds_left in await asyncio.to_thread(self.db.get_open_waitlist_offers):
+                self._arm(date_str, user_id, max(seconds_left or 0, 0))
+            for date_str in await asyncio.to_thread(self.db.get_waitlist_dates):
+                self.check(date_str)
+        except Exception as e:
+            logger.error("[waitlist] Failed to restore offers: %s", e, exc_info=True)
+
+    # Ответы на предложение
+    async def accept(self, date_str, user_id):
+        accepted = await asyncio.to_thread(self.db.accept_waitlist_offer, date_str, user_id, self.payment_ttl)
+        if accepted:
+            self._disarm(date_str, user_id)
+            self.stats['accepted'] += 1
+        return accepted
+
+    async def leave(self, date_str, user_id):
+        """Отказ от места или отклоненная оплата: место переходит следующему"""
+        left = await asyncio.to_thread(self.db.leave_waitlist, date_str, user_id)
+        if left:
+            self._disarm(date_str, user_id)
+            self.stats['declined'] += 1
+            self.check(date_str)
+        return left
+
+    # Проверка свободных мест
+    def seat_changed(self, date_str):
+        """Обработчик изменения участников; может вызываться из любого потока"""
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self.check(date_str)
+        else:
+            self._loop.call_soon_threadsafe(self.check, date_str)
+
+    def check(self, date_str, delay=0):
+        """Запускает проверку мест; изменения во время проверки запустят ее еще раз"""
+        if date_str in self._checks:
+            self._rerun.add(date_str)
+            return
+        self._checks[date_str] = asyncio.create_task(self._check(date_str, delay))
+
+    async def _check(self, date_str, delay):
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            # Во время наплыва места выдает очередь допуска; проверка запускается по окончании окна
+            if admission.is_open(date_str):
+                return
+            while True:
+                offer = await asyncio.to_thread(
+                    self.db.offer_next_waitlist_seat, date_str, self.capacity, self.offer_ttl
+                )
+                if offer is None:
+                    break
+                self.stats['offers'] += 1
+                self._arm(date_str, offer['user_id'], self.offer_ttl)
+                await self._send_offer(date_str, offer)
+        except Exception as e:
+            logger.error("[waitlist] Seat check for %s failed: %s", date_str, e, exc_info=True)
+        finally:
+            del self._checks[date_str]
+            if date_str in self._rerun:
+                self._rerun.discard(date_str)
+                self.check(date_str)
+
+    async def _send_offer(self, date_str, offer):
+        user_id = offer['user_id']
+        reply_markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("Занять место", callback_data=encode_callback(WAITLIST_ACCEPT, date_str=date_str)),
+            InlineKeyboardButton("Отказаться", callback_data=encode_callback(WAITLIST_DECLINE, date_str=date_str)),
+        ]])
+        try:
+            await get_dispatcher(self.application).send_message(
+                user_id,
+                f"Освободилось место на баню {date_str}! Подтвердите его в течение "
+                f"{self.offer_ttl // 60} мин, иначе оно перейдет следующему в листе ожидания.",
+                reply_markup=reply_markup
+            )
+            logger.info("[waitlist] Offered seat for %s to %s", date_str, user_id)
+        except Exception as e:
+            # Недоставленное предложение сразу передается следующему
+            logger.warning("[waitlist] Failed to offer seat for %s to %s: %s", date_str, user_id, e)
+            self._disarm(date_str, user_id)
+            await asyncio.to_thread(self.db.leave_waitlist, date_str, user_id)
+
+    # Истечение предложений
+    def _arm(self, date_str, user_id, delay):
+        self._disarm(date_str, user_id)
+        self._timers[(date_str, user_id)] = self._loop.call_later(delay + OFFER_EXPIRY_SLACK, self._on_timer, date_str, user_id)
+
+    def _disarm(self, date_str, user_id):
+        timer = self._timers.pop((date_str, user_id), None)
+        if timer:
+            timer.cancel()
+
+    def _on_timer(self, date_str, user_id):
+        self._timers.pop((date_str, user_id), None)
+        task = asyncio.create_task(self._expire(date_str, user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _expire(self, date_str, user_id):
+        try:
+            if not await asyncio.to_thread(self.db.expire_waitlist_offer, date_str, user_id):
+                return
+            self.stats['expired'] += 1
+            logger.info("[waitlist] Offer for %s to %s expired", date_str, user_id)
+            self.check(date_str)
+            await get_dispatcher(self.application).send_message(
+                user_id, f"Время на подтверждение места на баню {date_str} истекло, место передано следующему."
+            )
+        except Exception as e:
+            logger.error("[waitlist] Failed to expire offer for %s to %s: %s", date_str, user_id, e)
@@ -0,0 +1,143 @@
+import asyncio
+import types
+import unittest
+from unittest.mock import patch
+
+from services.admission import AdmissionQueue, ADMITTED, WAITLISTED, ALREADY_ADMITTED, ALREADY_WAITLISTED
+
+DATE = '07.01.2035'
+
+
+class SurgeDatabase:
+    """Заглушка Database: в окне наплыва список участников не запрашивается.
+
+    reserve_seat, как в базе, выдает приглашение, только пока занято
+    меньше max_participants мест (taken — места, занятые в обход окна).
+    """
+    def __init__(self, taken=0):
+        self.active_users = []
+        self.invites = []
+        self.waitlist = []
+        self.taken = taken
+
+    def add_active_user(self, user_id, username):
+        self.active_users.append(user_id)
+
+    def reserve_seat(self, date_str, user_id, username, max_participants, hours=2):
+        if user_id in self.invites:
+            return 'already_invited'
+        if self.taken + len(self.invites) >= max_participants:
+            return 'full'
+        self.invites.append(user_id)
+        return 'invited'
+
+    def add_to_waitlist(self, date_str, user_id, username, position):
+        self.waitlist.append((position, user_id))
+        return 'waiting', len(self.waitlist)
+
+    def get_bath_participants(self, date_str):
+        raise AssertionError("список участников при каждом нажатии")
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, bulk=False, **kwargs):
+        await asyncio.sleep(0)
+        self.sent.append((chat_id, text, kwargs.get('reply_markup')))
+
+
+class FakeQuery:
+    def __init__(self, user_id):
+        self.from_user = types.SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Имя", last_name=None)
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append(text)
+
+
+class TestAdmissionQueue(unittest.TestCase):
+    def test_seats_in_arrival_order(self):
+        """Места выдаются по порядку нажатий, остальные получают позицию в листе ожидания"""
+        queue = AdmissionQueue(window=60, capacity=20)
+        queue.open(DATE, taken=2)
+        results = [queue.admit(DATE, user_id) for user_id in range(30)]
+        self.assertEqual(results[:18], [(ADMITTED, number) for number in range(1, 19)])
+        self.assertEqual(results[18:], [(WAITLISTED, position) for position in range(1, 13)])
+        self.assertEqual(queue.admit(DATE, 0), (ALREADY_ADMITTED, 1))
+        self.assertEqual(queue.admit(DATE, 29), (ALREADY_WAITLISTED, 12))
+
+    def test_window_expires(self):
+        """После окна наплыва запись идет обычным путем"""
+        queue = AdmissionQueue(window=0)
+        queue.open(DATE)
+        self.assertFalse(queue.is_open(DATE))
+        self.assertFalse(queue.is_open('14.01.2035'))
+
+
+class TestSurgeLoad(unittest.IsolatedAsyncioTestCase):
+    async def test_500_clicks_for_20_seats(self):
+        """500 одновременных нажатий на 20 мест: ровно 20 приглашений, остальным — позиция в листе ожидания"""
+        import handlers.bath as bath
+
+        db = SurgeDatabase()
+        dispatcher = FakeDispatcher()
+        queue = AdmissionQueue(window=60, capacity=20, workers=8)
+        queue.open(DATE)
+        context = types.SimpleNamespace(bot_data={}, user_data={})
+        queries = [FakeQuery(user_id) for user_id in range(1, 501)]
+        updates = [
+            types.SimpleNamespace(callback_query=query, effective_chat=types.SimpleNamespace(type='supergroup'))
+            for query in queries
+        ]
+
+        with patch.object(bath, 'db', db), patch.object(bath, 'admission', queue), \
+                patch.object(bath, 'get_dispatcher', lambda context: dispatcher):
+            await asyncio.gather(*(bath.join_bath(update, context, DATE) for update in updates))
+            # Повторные нажатия не занимают мест и не шлют сообщений
+            await asyncio.gather(*(bath.join_bath(update, context, DATE) for update in updates[:50]))
+            await asyncio.wait_for(queue.join(), 10)
+        await queue.stop()
+
+        self.assertTrue(all(len(query.answers) == (2 if query.from_user.id <= 50 else 1) for query in queries))
+        invited = [chat_id for chat_id, _, markup in dispatcher.sent if markup is not None]
+        self.assertEqual(sorted(invited), list(range(1, 21)))
+        self.assertEqual(sorted(db.invites), list(range(1, 21)))
+        waitlisted = {chat_id: text for chat_id, text, markup in dispatcher.sent if markup is None}
+        self.assertEqual(len(waitlisted), 480)
+        self.assertIn("№480 в листе ожидания", waitlisted[500])
+        self.assertEqual(len(dispatcher.sent), 500)
+        # Порядок листа ожидания в базе — по нажатию, хотя доставка идет в несколько воркеров
+        self.assertEqual([user_id for _, user_id in sorted(db.waitlist)], list(range(21, 501)))
+        self.assertEqual(queue.stats['duplicates'], 50)
+        self.assertEqual(queue.stats['failed'], 0)
+
+    async def test_database_holds_win_over_counter(self):
+        """Место из счетчика, не подтвержденное базой, не выдается: пользователь переходит в лист ожидания"""
+        import handlers.bath as bath
+
+        db = SurgeDatabase(taken=18)  # два места заняты в базе уже после открытия окна
+        dispatcher = FakeDispatcher()
+        queue = AdmissionQueue(window=60, capacity=20, workers=2)
+        queue.open(DATE, taken=16)
+        context = types.SimpleNamespace(bot_data={}, user_data={})
+        queries = [FakeQuery(user_id) for user_id in range(1, 7)]
+
+        with patch.object(bath, 'db', db), patch.object(bath, 'admission', queue), \
+                patch.object(bath, 'MAX_BATH_PARTICIPANTS', 20), \
+                patch.object(bath, 'get_dispatcher', lambda context: dispatcher):
+            for query in queries:
+                update = types.SimpleNamespace(callback_query=query, effective_chat=types.SimpleNamespace(type='supergroup'))
+                await bath.join_bath(update, context, DATE)
+            await asyncio.wait_for(queue.join(), 10)
+        await queue.stop()
+
+        self.assertEqual(db.invites, [1, 2])
+        self.assertEqual([user_id for _, user_id in sorted(db.waitlist)], [3, 4, 5, 6])
+        self.assertIn("№1 в листе ожидания", queries[2].answers[0])
+        self.assertEqual(queue.stats['admitted'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
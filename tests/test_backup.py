@@ -0,0 +1,49 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from backup_db import _sql_literal
+from restore_db import read_statements
+
+
+class TestReadStatements(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sql.gz')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, text):
+        with gzip.open(self.path, 'wt', encoding='utf-8') as dump:
+            dump.write(text)
+
+    def test_one_statement_per_line(self):
+        """Значение с ';' и переводом строки не разрывает инструкцию"""
+        value = _sql_literal("оплата;\nналичными;\r\n")
+        self.write(
+            "-- dump\n"
+            "DROP TABLE IF EXISTS `t`;\n"
+            "CREATE TABLE `t` (  `id` int,  `note` text );\n"
+            f"INSERT INTO `t` (`id`, `note`) VALUES (1,{value});\n"
+        )
+        statements = list(read_statements(self.path, {'format': 2}))
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[2].endswith(f"{value});"))
+
+    def test_legacy_multiline_create(self):
+        """Старые дампы с многострочным CREATE TABLE по-прежнему читаются"""
+        self.write(
+            "-- dump\n"
+            "DROP TABLE IF EXISTS `t`;\n"
+            "CREATE TABLE `t` (\n  `id` int\n);\n"
+            "INSERT INTO `t` (`id`) VALUES (1);\n"
+        )
+        statements = list(read_statements(self.path, {}))
+        self.assertEqual(statements[1], "CREATE TABLE `t` (\n  `id` int\n);\n")
+        self.assertEqual(len(statements), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
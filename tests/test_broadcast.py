@@ -0,0 +1,89 @@
+import sys
+import types
+import unittest
+from unittest.mock import patch
+
+from telegram.error import Forbidden
+from database import BROADCAST_RUNNING, BROADCAST_DONE, RECIPIENT_PENDING, RECIPIENT_SENT, RECIPIENT_BLOCKED
+from services.broadcast import parse_target, run_broadcast
+
+
+class FakeDatabase:
+    """Хранит одну рассылку в памяти с тем же интерфейсом, что и Database"""
+    def __init__(self, user_ids):
+        self.broadcast = {'id': 1, 'created_by': 1, 'text': 'hello', 'target': 'all',
+                          'status': BROADCAST_RUNNING, 'total': len(user_ids), 'sent': 0, 'failed': 0}
+        self.recipients = {user_id: RECIPIENT_PENDING for user_id in user_ids}
+
+    def get_broadcast(self, broadcast_id):
+        return dict(self.broadcast)
+
+    def get_broadcast_batch(self, broadcast_id, limit):
+        return [user_id for user_id, status in sorted(self.recipients.items()) if status == RECIPIENT_PENDING][:limit]
+
+    def record_broadcast_results(self, broadcast_id, sent_ids, failures):
+        for user_id in sent_ids:
+            self.recipients[user_id] = RECIPIENT_SENT
+        for user_id, status, _ in failures:
+            self.recipients[user_id] = status
+        self.broadcast['sent'] += len(sent_ids)
+        self.broadcast['failed'] += len(failures)
+
+    def finish_broadcast(self, broadcast_id, status=BROADCAST_DONE):
+        self.broadcast['status'] = status
+        return True
+
+
+class FakeDispatcher:
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, bulk=False, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        self.delivered.append(chat_id)
+        return types.SimpleNamespace(message_id=len(self.delivered))
+
+    async def call(self, method, chat_id, bulk=False, **kwargs):
+        return None
+
+
+class TestBroadcast(unittest.IsolatedAsyncioTestCase):
+    async def run_with(self, db, dispatcher):
+        application = types.SimpleNamespace(bot_data={'dispatcher': dispatcher}, bot=None)
+        with patch.dict(sys.modules, {'handlers.bath': types.SimpleNamespace(db=db)}), \
+                patch('services.broadcast.BROADCAST_BATCH_SIZE', 3):
+            await run_broadcast(application, 1)
+
+    def test_parse_target(self):
+        """Разбор аудитории рассылки"""
+        self.assertEqual(parse_target('all'), ('all', None))
+        self.assertEqual(parse_target('Participants'), ('participants', None))
+        self.assertEqual(parse_target('last4'), ('history', 4))
+        self.assertIsNone(parse_target('last0'))
+        self.assertIsNone(parse_target('everyone'))
+
+    async def test_delivers_in_batches_and_marks_blocked(self):
+        """Все получатели обработаны, заблокировавшие бота помечены"""
+        db = FakeDatabase(range(100, 110))
+        dispatcher = FakeDispatcher(blocked={103})
+        await self.run_with(db, dispatcher)
+        self.assertEqual(db.broadcast['status'], BROADCAST_DONE)
+        self.assertEqual(db.broadcast['sent'], 9)
+        self.assertEqual(db.recipients[103], RECIPIENT_BLOCKED)
+        self.assertNotIn(103, dispatcher.delivered)
+
+    async def test_resume_skips_processed(self):
+        """После перезапуска сообщение получают только необработанные получатели"""
+        db = FakeDatabase(range(100, 106))
+        db.record_broadcast_results(1, [100, 101, 102], [])
+        dispatcher = FakeDispatcher()
+        await self.run_with(db, dispatcher)
+        # Первое доставленное сообщение — отчет о прогрессе администратору
+        self.assertEqual(sorted(dispatcher.delivered[1:]), [103, 104, 105])
+        self.assertEqual(db.broadcast['sent'], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+from utils import callback_data
+from utils.callback_data import (
+    CALLBACK_DATA_LIMIT, ADMIN_CONFIRM, CLAIM_PAYMENT, JOIN_BATH, InvalidCallbackData,
+    decode_callback, encode_callback
+)
+
+
+class TestCallbackData(unittest.TestCase):
+    def test_round_trip_within_limit(self):
+        """Поля восстанавливаются, а строка укладывается в лимит Telegram"""
+        fields = {'user_id': 1234567890123, 'date_str': "05.01.2025", 'payment_type': 'cash'}
+        data = encode_callback(ADMIN_CONFIRM, **fields)
+        self.assertLessEqual(len(data.encode('utf-8')), CALLBACK_DATA_LIMIT)
+        self.assertEqual(decode_callback(data), (ADMIN_CONFIRM, fields))
+        self.assertEqual(decode_callback(encode_callback(JOIN_BATH, date_str="31.12.2030")), (JOIN_BATH, {'date_str': "31.12.2030"}))
+
+    def test_forged_payload_rejected(self):
+        """Изменение любого символа или длины отклоняется"""
+        data = encode_callback(ADMIN_CONFIRM, user_id=42, date_str="05.01.2025", payment_type='online')
+        for index in range(1, len(data)):
+            replacement = 'A' if data[index] != 'A' else 'B'
+            with self.assertRaises(InvalidCallbackData):
+                decode_callback(data[:index] + replacement + data[index + 1:])
+        for broken in (data[:-1], data + 'A', '', '1', 'x' * 65):
+            with self.assertRaises(InvalidCallbackData):
+                decode_callback(broken)
+
+    def test_legacy_rejected_by_default(self):
+        """Неподписанные кнопки старого формата по умолчанию отклоняются"""
+        with patch.object(callback_data, 'CALLBACK_ACCEPT_LEGACY', False):
+            with self.assertRaises(InvalidCallbackData):
+                decode_callback("admin_confirm_42_05.01.2025_online")
+
+    def test_legacy_deadline(self):
+        """Старый формат принимается только до последнего дня CALLBACK_LEGACY_UNTIL"""
+        with patch.object(callback_data, 'CALLBACK_ACCEPT_LEGACY', True), \
+                patch.object(callback_data, 'LEGACY_UNTIL', date(2025, 1, 31)):
+            self.assertTrue(callback_data.legacy_allowed(date(2025, 1, 31)))
+            self.assertFalse(callback_data.legacy_allowed(date(2025, 2, 1)))
+
+    @patch.object(callback_data, 'CALLBACK_ACCEPT_LEGACY', True)
+    @patch.object(callback_data, 'LEGACY_UNTIL', None)
+    def test_legacy_format(self):
+        """Кнопки старого формата разбираются в те же действия, если прием включен"""
+        with self.assertLogs('utils.callback_data', 'WARNING'):
+            decode_callback("join_bath_05.01.2025")
+        self.assertEqual(
+            decode_callback("admin_confirm_42_05.01.2025_online"),
+            (ADMIN_CONFIRM, {'user_id': 42, 'date_str': "05.01.2025", 'payment_type': 'online'})
+        )
+        self.assertEqual(
+            decode_callback("cash_bath_05.01.2025"),
+            (CLAIM_PAYMENT, {'date_str': "05.01.2025", 'payment_type': 'cash'})
+        )
+        for broken in ("update_profile_yes", "join_bath_tomorrow", "admin_confirm_x_05.01.2025_online"):
+            with self.assertRaises(InvalidCallbackData):
+                decode_callback(broken)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 import unittest
 import os
 import sqlite3
-from database import Database
+from unittest.mock import MagicMock, patch
+from database import Database, PAYMENT_CONFIRMED, PAYMENT_NOT_FOUND, PROFILE_MISSING, NO_SEATS, EVENT_FULL, INVITED, ALREADY_INVITED
 
 class TestDatabase(unittest.TestCase):
     def setUp(self):
@@ -205,5 +206,130 @@ class TestDatabase(unittest.TestCase):
         
         self.assertIsNone(result)
 
+class TestUnitOfWork(unittest.TestCase):
+    def setUp(self):
+        """Подготовка Database с подменённым соединением"""
+        self.conn = MagicMock()
+        self.cursor = self.conn.cursor.return_value
+        self.cursor.rowcount = 1
+        with patch.object(Database, 'init_db'):
+            self.db = Database(file_path='test_unit_of_work.json')
+        self.db.get_connection = MagicMock(return_value=self.conn)
+
+    def test_commit_once_on_success(self):
+        """Все шаги выполняются на одном соединении с одним commit"""
+        with self.db.unit_of_work() as uow:
+            uow.add_active_user(1, 'user')
+            uow.delete_pending_payment(1, '12.05.2024')
+        self.db.get_connection.assert_called_once()
+        self.conn.commit.assert_called_once()
+        self.conn.rollback.assert_not_called()
+        self.conn.close.assert_called_once()
+
+    def test_rollback_on_error(self):
+        """Исключение внутри операции откатывает транзакцию"""
+        with self.assertRaises(RuntimeError):
+            with self.db.unit_of_work():
+                raise RuntimeError('boom')
+        self.conn.commit.assert_not_called()
+        self.conn.rollback.assert_called_once()
+        self.conn.close.assert_called_once()
+
+    def test_confirm_payment_not_found(self):
+        """Подтверждение без заявки не изменяет участников"""
+        self.cursor.fetchone.return_value = None
+        status, payment = self.db.confirm_payment(1, '12.05.2024', 'online')
+        self.assertEqual(status, PAYMENT_NOT_FOUND)
+        self.assertIsNone(payment)
+        self.assertEqual(self.cursor.execute.call_count, 1)
+
+    def test_confirm_payment_requires_profile(self):
+        """Подтверждение без профиля возвращает PROFILE_MISSING"""
+        self.cursor.fetchone.side_effect = [(1, 'user', '12.05.2024', 'online'), None]
+        status, payment = self.db.confirm_payment(1, '12.05.2024', 'online')
+        self.assertEqual(status, PROFILE_MISSING)
+        self.assertEqual(payment['username'], 'user')
+        self.assertEqual(self.cursor.execute.call_count, 2)
+
+    def test_confirm_cash_payment(self):
+        """Оплата наличными добавляет участника с cash=1 и удаляет заявку"""
+        self.cursor.fetchone.side_effect = [(1, 'user', '12.05.2024', 'cash'), (1, 'user', 'User Name')]
+        self.cursor.fetchall.return_value = [(0,), (2,)]
+        status, payment = self.db.confirm_payment(1, '12.05.2024', 'cash')
+        self.assertEqual(status, PAYMENT_CONFIRMED)
+        self.assertIn('FOR UPDATE', self.cursor.execute.call_args_list[2][0][0])
+        insert_params = self.cursor.execute.call_args_list[3][0][1]
+        self.assertEqual(insert_params, ('12.05.2024', 1, 'user', False, True))
+        self.assertIn('DELETE FROM pending_payments', self.cursor.execute.call_args_list[4][0][0])
+        self.conn.commit.assert_called_once()
+
+    def test_confirm_payment_when_full(self):
+        """Подтверждение сверх лимита возвращает NO_SEATS; строка-заглушка события место не занимает"""
+        self.cursor.fetchone.side_effect = [(1, 'user', '12.05.2024', 'cash'), (1, 'user', 'User Name')]
+        self.cursor.fetchall.return_value = [(0,), (2,), (3,)]
+        status, payment = self.db.confirm_payment(1, '12.05.2024', 'cash', max_participants=2)
+        self.assertEqual(status, NO_SEATS)
+        self.assertEqual(self.cursor.execute.call_count, 3)
+
+        self.cursor.fetchone.side_effect = [(1, 'user', '12.05.2024', 'cash'), (1, 'user', 'User Name')]
+        self.cursor.fetchall.return_value = [(0,), (2,)]
+        status, _ = self.db.confirm_payment(1, '12.05.2024', 'cash', max_participants=2)
+        self.assertEqual(status, PAYMENT_CONFIRMED)
+
+    def test_event_placeholder_is_not_null(self):
+        """Строка-заглушка события пишется с user_id 0 (столбец NOT NULL), а не с NULL"""
+        self.cursor.fetchone.return_value = (0,)
+        self.db.create_bath_event('12.05.2024')
+        query, params = self.cursor.execute.call_args_list[1][0]
+        self.assertIn('INSERT INTO bath_participants (date_str, user_id)', query)
+        self.assertEqual(params, ('12.05.2024', 0))
+
+    def test_seat_holders_include_payments_and_invites(self):
+        """Запись и лист ожидания считают заявки на оплату и приглашения занятыми местами"""
+        self.cursor.fetchall.return_value = [(0,), (2,)]
+        self.cursor.fetchone.return_value = (2,)
+        self.assertEqual(self.db.register_participant('12.05.2024', 1, 'user', 2), EVENT_FULL)
+        holders_query = self.cursor.execute.call_args_list[1][0][0]
+        self.assertIn('pending_payments', holders_query)
+        self.assertIn('bath_invites', holders_query)
+        self.assertIn('waitlist', holders_query)
+
+        self.cursor.execute.reset_mock()
+        self.assertIsNone(self.db.offer_next_waitlist_seat('12.05.2024', 2, 60))
+        self.assertEqual(self.cursor.execute.call_args_list[1][0][0], holders_query)
+        self.assertEqual(self.cursor.execute.call_count, 2)
+
+    def test_released_holds_notify(self):
+        """Отклоненная оплата и истекшие удержания оповещают об освободившемся месте"""
+        with patch('database._notify_participants_changed') as notify:
+            self.assertTrue(self.db.decline_payment(1, '12.05.2024'))
+            self.assertIn('DELETE FROM bath_invites', self.cursor.execute.call_args_list[-1][0][0])
+            notify.assert_called_once_with('12.05.2024')
+
+            notify.reset_mock()
+            self.cursor.fetchall.return_value = [('12.05.2024',), ('19.05.2024',)]
+            self.assertEqual(self.db.expire_seat_holds(), ['12.05.2024', '19.05.2024'])
+            self.assertEqual([call[0][0] for call in notify.call_args_list], ['12.05.2024', '19.05.2024'])
+
+            notify.reset_mock()
+            self.cursor.rowcount = 0
+            self.assertFalse(self.db.decline_payment(1, '12.05.2024'))
+            notify.assert_not_called()
+
+    def test_reserve_seat(self):
+        """Приглашение не создается при заполненном событии и не выдается повторно"""
+        self.cursor.fetchall.return_value = [(0,), (2,)]
+        self.cursor.fetchone.side_effect = [None, (2,)]
+        self.assertEqual(self.db.reserve_seat('12.05.2024', 1, 'user', 2), EVENT_FULL)
+        self.assertFalse(any('INSERT' in call[0][0] for call in self.cursor.execute.call_args_list))
+
+        self.cursor.fetchone.side_effect = [(1,)]
+        self.assertEqual(self.db.reserve_seat('12.05.2024', 1, 'user', 2), ALREADY_INVITED)
+
+        self.cursor.execute.reset_mock()
+        self.cursor.fetchone.side_effect = [None, (1,)]
+        self.assertEqual(self.db.reserve_seat('12.05.2024', 1, 'user', 2), INVITED)
+        self.assertIn('INSERT IGNORE INTO bath_invites', self.cursor.execute.call_args_list[-1][0][0])
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,41 @@
+import unittest
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
+
+from benchmarks.fake_bot_api import FakeBotApi, FAKE_BOT_USERNAME
+
+
+class TestFakeBotApi(unittest.IsolatedAsyncioTestCase):
+    async def test_records_sends_and_edits(self):
+        """Отправки и правки записываются, ответы разбираются PTB как Message"""
+        api = FakeBotApi()
+        bot = Bot('123:TEST', request=api, get_updates_request=api)
+        async with bot:
+            self.assertEqual(bot.username, FAKE_BOT_USERNAME)
+            markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK", callback_data="1x")]])
+            message = await bot.send_message(chat_id=42, text="привет", reply_markup=markup)
+            await bot.edit_message_text(chat_id=42, message_id=message.message_id, text="пока")
+
+        self.assertEqual(message.chat.id, 42)
+        self.assertEqual(message.reply_markup.inline_keyboard[0][0].callback_data, "1x")
+        sent = api.sent_to(42)
+        self.assertEqual([params['text'] for params in sent], ["привет", "пока"])
+        self.assertEqual(sent[1]['message_id'], message.message_id)
+        self.assertEqual(sent[0]['reply_markup']['inline_keyboard'][0][0]['callback_data'], "1x")
+        self.assertEqual(api.calls['sendMessage'], 1)
+
+    async def test_retry_after(self):
+        """С retry_after_rate=1 каждый запрос получает 429 и PTB поднимает RetryAfter"""
+        api = FakeBotApi(retry_after_rate=1.0, retry_after=3)
+        bot = Bot('123:TEST', request=api, get_updates_request=api)
+        async with bot:
+            with self.assertRaises(RetryAfter) as raised:
+                await bot.send_message(chat_id=42, text="привет")
+        self.assertEqual(raised.exception.retry_after, 3)
+        self.assertEqual(api.retry_afters['sendMessage'], 1)
+        self.assertEqual(api.sent_to(42), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
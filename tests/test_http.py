@@ -0,0 +1,39 @@
+import asyncio
+import json
+import unittest
+
+from utils.http import HttpServer
+
+
+async def fetch(port, path, method='GET'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), body
+
+
+class TestHttpServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def health():
+            return 200, 'application/json', {'status': 'ok'}
+        self.server = HttpServer('127.0.0.1', 0, {'/health': health})
+        await self.server.start()
+        self.addAsyncCleanup(self.server.stop)
+
+    async def test_health(self):
+        """Эндпоинт отдает JSON"""
+        status, body = await fetch(self.server.port, '/health')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'status': 'ok'})
+
+    async def test_unknown_path_and_method(self):
+        """Неизвестный путь — 404, запись — 405"""
+        self.assertEqual((await fetch(self.server.port, '/nope'))[0], 404)
+        self.assertEqual((await fetch(self.server.port, '/health', 'POST'))[0], 405)
+
+
+if __name__ == '__main__':
+    unittest.main()
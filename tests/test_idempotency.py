@@ -0,0 +1,187 @@
+import asyncio
+import types
+import unittest
+from unittest.mock import patch
+
+from services.tasks import BackgroundTasks
+from utils.callback_data import encode_callback, CLAIM_PAYMENT
+from utils.idempotency import CallbackDeduplicator, answer_callback, callback_failed, IN_PROGRESS_TEXT
+from utils.locks import PerUserUpdateProcessor
+
+DATE = '07.01.2035'
+
+
+class FakeQuery:
+    def __init__(self, data, user_id=7, message_id=100):
+        self.data = data
+        self.from_user = types.SimpleNamespace(id=user_id, username="user7", first_name="Имя", last_name=None)
+        self.message = types.SimpleNamespace(chat_id=user_id, message_id=message_id)
+        self.inline_message_id = None
+        self.answers = []
+        self.edits = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append((text, show_alert))
+
+    async def edit_message_text(self, text=None, reply_markup=None):
+        self.edits.append(text)
+
+
+class PaymentDatabase:
+    def __init__(self):
+        self.claims = []
+
+    def claim_payment(self, user_id, username, date_str, payment_type):
+        self.claims.append((user_id, date_str, payment_type))
+
+
+class TestCallbackDeduplicator(unittest.IsolatedAsyncioTestCase):
+    async def test_duplicate_gets_original_answer(self):
+        """Повтор не вызывает обработчик и получает ответ первого нажатия"""
+        dedup = CallbackDeduplicator(ttl=60)
+        calls = []
+
+        async def handler(query):
+            calls.append(query)
+            await answer_callback(query, "Готово", show_alert=True)
+
+        first, second = FakeQuery('data'), FakeQuery('data')
+        await dedup.run(first, lambda: handler(first))
+        await dedup.run(second, lambda: handler(second))
+        self.assertEqual(calls, [first])
+        self.assertEqual(second.answers, [("Готово", True)])
+        # Та же кнопка в другом сообщении и другой пользователь — разные нажатия
+        other_message, other_user = FakeQuery('data', message_id=101), FakeQuery('data', user_id=8)
+        await dedup.run(other_message, lambda: handler(other_message))
+        await dedup.run(other_user, lambda: handler(other_user))
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(dedup.stats, {'handled': 3, 'duplicates': 1})
+
+    async def test_in_flight_and_expiry(self):
+        """Повтор во время обработки отвечает сразу; по истечении TTL нажатие обрабатывается снова"""
+        dedup = CallbackDeduplicator(ttl=0.05)
+        release = asyncio.Event()
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            await release.wait()
+
+        task = asyncio.create_task(dedup.run(FakeQuery('data'), handler))
+        await asyncio.sleep(0)
+        duplicate = FakeQuery('data')
+        await dedup.run(duplicate, handler)
+        self.assertEqual(duplicate.answers, [(IN_PROGRESS_TEXT, False)])
+        release.set()
+        await task
+
+        await asyncio.sleep(0.06)
+        await dedup.run(FakeQuery('data'), handler)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(dedup), 1)
+
+    async def test_failure_allows_retry(self):
+        """Исключение обработчика не запоминается: повторное нажатие обрабатывается"""
+        dedup = CallbackDeduplicator(ttl=60)
+
+        async def failing():
+            raise RuntimeError("сбой")
+
+        with self.assertRaises(RuntimeError):
+            await dedup.run(FakeQuery('data'), failing)
+        self.assertEqual(len(dedup), 0)
+
+    async def test_error_answer_not_cached(self):
+        """Обработчик сам перехватил ошибку и ответил о ней: повтор обрабатывается заново, а не получает ошибку"""
+        dedup = CallbackDeduplicator(ttl=60)
+        outcomes = iter([False, True])
+
+        async def handler(query):
+            if next(outcomes):
+                await answer_callback(query, "Готово")
+            else:
+                await answer_callback(query, "Произошла ошибка")
+                callback_failed()
+
+        first, second, third = FakeQuery('data'), FakeQuery('data'), FakeQuery('data')
+        await dedup.run(first, lambda: handler(first))
+        await dedup.run(second, lambda: handler(second))
+        await dedup.run(third, lambda: handler(third))
+        self.assertEqual(second.answers, [("Готово", False)])
+        self.assertEqual(third.answers, [("Готово", False)])
+        self.assertEqual(dedup.stats, {'handled': 1, 'duplicates': 1})
+
+    async def test_size_bounded(self):
+        """При наплыве хранится не больше max_entries записей"""
+        dedup = CallbackDeduplicator(ttl=60, max_entries=10)
+
+        async def handler():
+            pass
+
+        for user_id in range(50):
+            await dedup.run(FakeQuery('data', user_id=user_id), handler)
+        self.assertLessEqual(len(dedup), 10)
+
+
+class TestDedupBeforeUserQueue(unittest.IsolatedAsyncioTestCase):
+    async def test_duplicate_not_queued_behind_original(self):
+        """Повтор, пришедший во время обработки первого нажатия, получает ответ сразу, не дожидаясь очереди пользователя"""
+        import utils.locks as locks
+
+        dedup = CallbackDeduplicator(ttl=60)
+        processor = PerUserUpdateProcessor(4)
+        release = asyncio.Event()
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            await release.wait()
+
+        def make_update(query):
+            return types.SimpleNamespace(callback_query=query, effective_user=query.from_user, effective_chat=None)
+
+        first, duplicate = FakeQuery('data'), FakeQuery('data')
+        with patch.object(locks, 'callback_dedup', dedup):
+            task = asyncio.create_task(processor.process_update(make_update(first), handler()))
+            await asyncio.sleep(0)
+            await asyncio.wait_for(processor.process_update(make_update(duplicate), handler()), timeout=1)
+            self.assertEqual(duplicate.answers, [(IN_PROGRESS_TEXT, False)])
+            release.set()
+            await task
+        self.assertEqual(calls, [1])
+
+
+class TestDoubleTapPayment(unittest.IsolatedAsyncioTestCase):
+    async def test_double_tap_claims_once(self):
+        """Двойное нажатие «Буду платить наличными»: одна заявка и одно уведомление администраторам"""
+        import handlers.bath as bath
+
+        db = PaymentDatabase()
+        notifications = []
+
+        def admin_fan_out(context, text, reply_markup=None):
+            async def send():
+                notifications.append(text)
+            return send
+
+        data = encode_callback(CLAIM_PAYMENT, date_str=DATE, payment_type='cash')
+        queries = [FakeQuery(data) for _ in range(3)]
+        context = types.SimpleNamespace(bot_data={}, user_data={'bath_registrations': {DATE: {'status': 'pending_payment'}}})
+        tasks = BackgroundTasks(backoff=0)
+        with patch.object(bath, 'db', db), patch.object(bath, 'admin_fan_out', admin_fan_out), \
+                patch.object(bath, 'background_tasks', tasks), \
+                patch.object(bath, 'callback_dedup', CallbackDeduplicator(ttl=60)):
+            for query in queries:
+                update = types.SimpleNamespace(callback_query=query, effective_chat=types.SimpleNamespace(type='private'))
+                await bath.button_callback(update, context)
+            await tasks.join()
+
+        self.assertEqual(db.claims, [(7, DATE, 'cash')])
+        self.assertEqual(len(notifications), 1)
+        self.assertEqual(len(queries[0].edits), 1)
+        self.assertEqual([query.edits for query in queries[1:]], [[], []])
+        self.assertEqual([query.answers for query in queries[1:]], [[(None, False)], [(None, False)]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import types
+import unittest
+
+from utils.locks import KeyedLocks, PerUserUpdateProcessor
+
+
+def make_update(user_id):
+    return types.SimpleNamespace(effective_user=types.SimpleNamespace(id=user_id), effective_chat=None)
+
+
+class TestKeyedLocks(unittest.IsolatedAsyncioTestCase):
+    async def test_released_locks_are_removed(self):
+        """После освобождения блокировка удаляется из словаря"""
+        locks = KeyedLocks()
+        async with locks.lock("01.01.2025"):
+            self.assertTrue(locks.locked("01.01.2025"))
+        self.assertEqual(len(locks), 0)
+
+    async def test_same_key_is_exclusive(self):
+        """Секции с одним ключом не пересекаются, с разными — выполняются параллельно"""
+        locks = KeyedLocks()
+        active = {'a': 0, 'b': 0}
+        peak = {'a': 0, 'b': 0}
+
+        async def work(key):
+            async with locks.lock(key):
+                active[key] += 1
+                peak[key] = max(peak[key], active[key])
+                await asyncio.sleep(0.01)
+                active[key] -= 1
+
+        await asyncio.gather(*(work(key) for key in 'abab'))
+        self.assertEqual(peak, {'a': 1, 'b': 1})
+
+
+class TestPerUserUpdateProcessor(unittest.IsolatedAsyncioTestCase):
+    async def test_user_order_and_parallelism(self):
+        """Обновления пользователя идут по порядку, разные пользователи — параллельно, в пределах лимита"""
+        processor = PerUserUpdateProcessor(2)
+        log = []
+        running = {'now': 0, 'peak': 0}
+
+        async def handler(user_id, index):
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+            await asyncio.sleep(0.01)
+            log.append((user_id, index))
+            running['now'] -= 1
+
+        tasks = [
+            asyncio.create_task(processor.process_update(make_update(user_id), handler(user_id, index)))
+            for index in range(5) for user_id in (1, 2, 3)
+        ]
+        await asyncio.gather(*tasks)
+        for user_id in (1, 2, 3):
+            self.assertEqual([index for uid, index in log if uid == user_id], list(range(5)))
+        self.assertEqual(running['peak'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
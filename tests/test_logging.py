@@ -0,0 +1,52 @@
+import logging
+import os
+import tempfile
+import unittest
+
+from utils.logging import DeferredQueueHandler, setup_logging, stop_logging
+
+
+class TestLoggingPipeline(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.root_level = logging.getLogger().level
+        self.addCleanup(logging.getLogger().setLevel, self.root_level)
+        self.addCleanup(stop_logging)
+
+    def read(self, filename):
+        with open(os.path.join(self.log_dir, filename), encoding='utf-8') as f:
+            return f.read()
+
+    def test_configured_once_and_routed_by_level(self):
+        """Повторный вызов не добавляет обработчики, записи расходятся по файлам по уровню"""
+        setup_logging(log_dir=self.log_dir, level='DEBUG', console_level='CRITICAL')
+        setup_logging(log_dir=self.log_dir, level='DEBUG', console_level='CRITICAL')
+        queue_handlers = [h for h in logging.getLogger().handlers if isinstance(h, DeferredQueueHandler)]
+        self.assertEqual(len(queue_handlers), 1)
+
+        logger = logging.getLogger('tests.pipeline')
+        logger.debug("debug %s", 1)
+        logger.warning("warning %s", 2)
+        stop_logging()
+
+        self.assertIn("debug 1", self.read('debug.log'))
+        self.assertNotIn("debug 1", self.read('info.log'))
+        self.assertIn("warning 2", self.read('warning.log'))
+        self.assertEqual(self.read('error.log'), "")
+
+    def test_mutable_arguments_captured_at_call(self):
+        """Изменяемые аргументы форматируются сразу, неизменяемые — в потоке записи"""
+        handler = DeferredQueueHandler(None)
+        state = {'count': 1}
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, "state %s", (state,), None)
+        handler.prepare(record)
+        state['count'] = 2
+        self.assertEqual(record.getMessage(), "state {'count': 1}")
+
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, "user %s", (42,), None)
+        handler.prepare(record)
+        self.assertEqual(record.args, (42,))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from services.mentions import MentionCache, format_mention, get_mention_chunks, mention_cache, parse_mention_filter, previous_sundays
+from utils.formatting import chunk_text
+
+
+class FakeDatabase:
+    def __init__(self, users):
+        self.users = users
+        self.calls = []
+
+    def get_mention_users(self, target='all', date_str=None, dates=None):
+        self.calls.append((target, date_str, dates))
+        return self.users
+
+
+class TestChunkText(unittest.TestCase):
+    def test_chunks_respect_limit(self):
+        """Части не превышают лимит и не разрываются"""
+        parts = [f"@user{i:04d}" for i in range(1000)]
+        chunks = chunk_text(parts, limit=100)
+        self.assertTrue(all(len(chunk) <= 100 for chunk in chunks))
+        self.assertEqual(" ".join(chunks).split(), parts)
+
+    def test_markup_is_never_sliced(self):
+        """HTML-упоминания попадают в сообщения целиком; слишком длинная часть пропускается"""
+        parts = [format_mention({'user_id': i, 'username': None, 'full_name': f"Имя {i}"}) for i in range(50)]
+        chunks = chunk_text(parts + ["x" * 200], limit=150)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 150 for chunk in chunks))
+        self.assertTrue(all(chunk.startswith('<a ') and chunk.endswith('</a>') for chunk in chunks))
+        self.assertEqual(" ".join(chunks), " ".join(parts))
+
+    def test_empty(self):
+        """Пустой список — нет сообщений"""
+        self.assertEqual(chunk_text([]), [])
+
+
+class TestMentions(unittest.TestCase):
+    def setUp(self):
+        mention_cache.invalidate()
+
+    def test_parse_filter(self):
+        """Фильтры all/participants/unregistered/lastN"""
+        self.assertEqual(parse_mention_filter('participants'), ('participants', None))
+        self.assertEqual(parse_mention_filter('last4'), ('history', 4))
+        self.assertIsNone(parse_mention_filter('last0'))
+        self.assertIsNone(parse_mention_filter('everyone'))
+
+    def test_format_mention(self):
+        """Без username используется HTML-ссылка с экранированным именем"""
+        self.assertEqual(format_mention({'user_id': 1, 'username': 'ivan'}), '@ivan')
+        self.assertEqual(
+            format_mention({'user_id': 2, 'username': None, 'full_name': 'A <B>'}),
+            '<a href="tg://user?id=2">A &lt;B&gt;</a>'
+        )
+        long_name = format_mention({'user_id': 3, 'username': None, 'full_name': '<' * 1000})
+        self.assertTrue(long_name.endswith('&lt;…</a>'))
+        self.assertLess(len(long_name), 500)
+
+    def test_previous_sundays(self):
+        """Даты предыдущих недель считаются от даты события"""
+        self.assertEqual(previous_sundays("19.01.2025", 2), ["12.01.2025", "05.01.2025"])
+
+    def test_chunks_are_cached(self):
+        """Повторный запрос берется из кеша, сброс — после изменения участников"""
+        db = FakeDatabase([{'user_id': i, 'username': f"user{i}"} for i in range(3)])
+        first = get_mention_chunks(db, 'history', "19.01.2025", 1)
+        second = get_mention_chunks(db, 'history', "19.01.2025", 1)
+        self.assertEqual(first, ["@user0 @user1 @user2"])
+        self.assertIs(first, second)
+        self.assertEqual(db.calls, [('history', "19.01.2025", ["12.01.2025"])])
+        mention_cache.invalidate("19.01.2025")
+        get_mention_chunks(db, 'history', "19.01.2025", 1)
+        self.assertEqual(len(db.calls), 2)
+
+    def test_ttl(self):
+        """Устаревшая запись пересобирается"""
+        cache = MentionCache(ttl=0)
+        builds = []
+        cache.get('key', lambda: builds.append(1) or ['x'])
+        cache.get('key', lambda: builds.append(1) or ['x'])
+        self.assertEqual(len(builds), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import types
+import unittest
+
+from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler
+
+from utils.metrics import HandlerMetrics, LatencyHistogram, OUTCOME_ERROR, OUTCOME_OK
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles_within_precision(self):
+        """Перцентили отличаются от точных не больше чем на 12.5%"""
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+        for fraction, exact in ((0.5, 0.5), (0.95, 0.95), (0.99, 0.99)):
+            value = histogram.percentile(fraction)
+            self.assertGreaterEqual(value, exact * 0.99)
+            self.assertLessEqual(value, exact * 1.125)
+        self.assertEqual(histogram.percentile(1.0), 1.0)
+        self.assertEqual(histogram.cumulative((0.0103, 10.0)), [10, 1000])
+
+
+class TestHandlerMetrics(unittest.IsolatedAsyncioTestCase):
+    async def test_wrap_records_outcome(self):
+        """Обернутый обработчик учитывает время и ошибки, результат не меняется"""
+        metrics = HandlerMetrics()
+
+        async def ok(update, context):
+            await asyncio.sleep(0.01)
+            return 'state'
+
+        async def broken(update, context):
+            raise RuntimeError("boom")
+
+        context = types.SimpleNamespace()
+        self.assertEqual(await metrics.wrap(ok)(None, context), 'state')
+        self.assertEqual(context.handled_by, 'ok')
+        with self.assertRaises(RuntimeError):
+            await metrics.wrap(broken)(None, context)
+        self.assertGreaterEqual(metrics.histograms[('ok', OUTCOME_OK)].max, 0.01)
+        self.assertEqual(metrics.errors, {'broken': 1})
+        self.assertEqual(metrics.histograms[('broken', OUTCOME_ERROR)].count, 1)
+        text = metrics.render_prometheus()
+        self.assertIn('bath_bot_handler_seconds_count{handler="ok",outcome="ok"} 1', text)
+        self.assertIn('bath_bot_handler_errors_total{handler="broken"} 1', text)
+
+    async def test_install_wraps_nested_handlers(self):
+        """install оборачивает обработчики, включая вложенные в ConversationHandler, и добавляет middleware"""
+        async def start(update, context):
+            return 1
+
+        application = ApplicationBuilder().token("123:abc").build()
+        inner = CommandHandler("start", start)
+        application.add_handler(ConversationHandler(entry_points=[inner], states={}, fallbacks=[]))
+        table = {'x': start}
+        metrics = HandlerMetrics()
+        metrics.install(application, tables=(table,))
+        self.assertEqual(inner.callback._metrics_name, 'start')
+        self.assertEqual(table['x']._metrics_name, 'start')
+        self.assertEqual(sorted(application.handlers), [-1, 0, 1000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+import types
+import unittest
+from unittest.mock import patch
+
+from telegram.error import Forbidden, RetryAfter
+from services import notification
+from services.notification import MessageDispatcher
+
+
+class FakeBot:
+    """Бот, записывающий вызовы; errors — очередь исключений для первых вызовов"""
+    def __init__(self, errors=None):
+        self.calls = []
+        self.errors = list(errors or [])
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.calls.append((chat_id, text, time.monotonic()))
+        return text
+
+
+class TestMessageDispatcher(unittest.IsolatedAsyncioTestCase):
+    def make_dispatcher(self, bot, **kwargs):
+        params = dict(global_rate=1000, concurrency=1, private_interval=0.001, group_per_minute=6000, backoff=0.01)
+        params.update(kwargs)
+        dispatcher = MessageDispatcher(bot, **params)
+        self.addAsyncCleanup(dispatcher.stop)
+        return dispatcher
+
+    async def test_interactive_before_bulk(self):
+        """Интерактивные сообщения обгоняют уже поставленную в очередь рассылку"""
+        bot = FakeBot()
+        dispatcher = self.make_dispatcher(bot)
+        dispatcher.start()
+        bulk = asyncio.ensure_future(dispatcher.send_many(
+            [{'chat_id': chat_id, 'text': 'bulk'} for chat_id in range(1, 6)]
+        ))
+        await asyncio.sleep(0)
+        await dispatcher.send_message(100, 'interactive')
+        await bulk
+        texts = [text for _, text, _ in bot.calls]
+        self.assertLess(texts.index('interactive'), 4)
+
+    async def test_retry_after(self):
+        """После RetryAfter сообщение отправляется повторно"""
+        bot = FakeBot(errors=[RetryAfter(0)])
+        dispatcher = self.make_dispatcher(bot)
+        self.assertEqual(await dispatcher.send_message(1, 'hello'), 'hello')
+        self.assertEqual(dispatcher.stats['flood_waits'], 1)
+        self.assertEqual(dispatcher.stats['sent'], 1)
+
+    async def test_private_chat_interval(self):
+        """Сообщения в один личный чат разнесены не меньше чем на private_interval"""
+        bot = FakeBot()
+        dispatcher = self.make_dispatcher(bot, concurrency=3, private_interval=0.05)
+        await dispatcher.send_many([{'chat_id': 1, 'text': str(index)} for index in range(3)])
+        moments = [moment for _, _, moment in bot.calls]
+        for first, second in zip(moments, moments[1:]):
+            self.assertGreaterEqual(second - first, 0.04)
+
+    async def test_busy_chat_does_not_block_workers(self):
+        """Поток сообщений в один чат не занимает воркеров: сообщение в другой чат уходит сразу"""
+        bot = FakeBot()
+        dispatcher = self.make_dispatcher(bot, concurrency=2, private_interval=0.2)
+        burst = asyncio.ensure_future(dispatcher.send_many(
+            [{'chat_id': 1, 'text': str(index)} for index in range(4)], bulk=False
+        ))
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        await dispatcher.send_message(2, 'other')
+        self.assertLess(time.monotonic() - started, 0.1)
+        await burst
+        self.assertEqual([text for chat_id, text, _ in bot.calls if chat_id == 1], ['0', '1', '2', '3'])
+        self.assertGreater(dispatcher.stats['deferred'], 0)
+        self.assertEqual(dispatcher.queue_size(), 0)
+
+    async def test_failed_messages_reported(self):
+        """Недоставленные сообщения возвращаются во втором списке"""
+        bot = FakeBot(errors=[Forbidden("bot was blocked by the user")])
+        dispatcher = self.make_dispatcher(bot)
+        sent, failed = await dispatcher.send_many([{'chat_id': 1, 'text': 'a'}, {'chat_id': 2, 'text': 'b'}])
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(dispatcher.stats['failed'], 1)
+
+
+
+class ReminderDatabase:
+    """Заглушка Database: одна страница заявок; запоминает поток и параметры вызовов"""
+    def __init__(self, payments):
+        self.payments = payments
+        self.calls = []
+        self.threads = set()
+
+    def get_pending_payments_for_reminder(self, hours=4, limit=None, after_id=0, max_reminders=None):
+        self.threads.add(threading.get_ident())
+        self.calls.append(max_reminders)
+        return [payment for payment in self.payments if payment['id'] > after_id]
+
+    def mark_payments_notified(self, payment_ids):
+        self.threads.add(threading.get_ident())
+        self.notified = payment_ids
+
+
+class ReminderDispatcher:
+    def __init__(self):
+        self.sent = []
+
+    async def send_many(self, messages, bulk=True):
+        self.sent.extend(messages)
+        return messages, []
+
+
+class TestPaymentReminders(unittest.IsolatedAsyncioTestCase):
+    async def test_reminders_stop_after_escalation(self):
+        """Напоминания выбираются только до эскалации, а запросы к базе идут не в потоке event loop"""
+        import handlers.bath as bath
+
+        db = ReminderDatabase([
+            {'id': 1, 'user_id': 7, 'username': 'user7', 'date_str': '07.01.2035', 'payment_type': 'cash', 'reminder_count': 2},
+        ])
+        dispatcher = ReminderDispatcher()
+        context = types.SimpleNamespace(bot_data={'dispatcher': dispatcher})
+        with patch.object(bath, 'db', db), patch.object(notification, 'ADMIN_IDS', [1]), \
+                patch.object(notification, 'PAYMENT_REMINDER_ESCALATE_AFTER', 3):
+            await notification.send_payment_reminders(context)
+
+        self.assertEqual(db.calls, [3])
+        self.assertEqual(db.notified, [1])
+        self.assertEqual([message['chat_id'] for message in dispatcher.sent], [7, 1])
+        self.assertNotIn(threading.get_ident(), db.threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
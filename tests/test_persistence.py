@@ -0,0 +1,85 @@
+import asyncio
+import json
+import types
+import unittest
+
+from services.persistence import DatabasePersistence
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.user_data = {}
+        self.conversations = {}
+        self.loads = 0
+        self.saves = []
+
+    def get_bot_user_data(self, user_id):
+        self.loads += 1
+        return self.user_data.get(user_id)
+
+    def get_bot_conversations(self, name):
+        return [(key, state) for (conv_name, key), state in self.conversations.items() if conv_name == name]
+
+    def save_bot_state(self, user_rows=(), user_deletes=(), conversation_rows=(), conversation_deletes=()):
+        self.saves.append((list(user_rows), list(user_deletes), list(conversation_rows), list(conversation_deletes)))
+        for user_id, data in user_rows:
+            self.user_data[user_id] = data
+        for user_id in user_deletes:
+            self.user_data.pop(user_id, None)
+        for name, key, state in conversation_rows:
+            self.conversations[(name, key)] = state
+        for name, key in conversation_deletes:
+            self.conversations.pop((name, key), None)
+
+
+class TestDatabasePersistence(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.persistence = DatabasePersistence(self.db, flush_interval=0.05, idle_ttl=0)
+
+    async def test_lazy_load(self):
+        """Данные пользователя читаются из базы один раз, при первом обновлении"""
+        self.db.user_data[1] = json.dumps({'bath_registrations': {'01.01.2025': {'status': 'pending_payment'}}})
+        self.assertEqual(await self.persistence.get_user_data(), {})
+        user_data = {}
+        await self.persistence.refresh_user_data(1, user_data)
+        await self.persistence.refresh_user_data(1, user_data)
+        self.assertEqual(user_data['bath_registrations']['01.01.2025']['status'], 'pending_payment')
+        self.assertEqual(self.db.loads, 1)
+
+    async def test_writes_are_coalesced(self):
+        """Несколько изменений за интервал дают одну запись с последними данными"""
+        await self.persistence.refresh_user_data(1, {})
+        for step in ('full_name', 'birth_date', 'occupation'):
+            await self.persistence.update_user_data(1, {'profile_step': step})
+        await self.persistence.update_conversation('profile', (1, 1), 2)
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(self.db.saves), 1)
+        self.assertEqual(json.loads(self.db.user_data[1]), {'profile_step': 'occupation'})
+        self.assertEqual(await self.persistence.get_conversations('profile'), {(1, 1): 2})
+
+    async def test_unchanged_data_not_written(self):
+        """Данные, совпадающие с сохраненными, повторно не пишутся"""
+        await self.persistence.update_user_data(1, {'a': 1})
+        await self.persistence.flush()
+        await self.persistence.update_user_data(1, {'a': 1})
+        await self.persistence.flush()
+        self.assertEqual(len(self.db.saves), 1)
+        self.assertEqual(self.persistence.stats['skipped_unchanged'], 1)
+
+    async def test_eviction_keeps_stored_data(self):
+        """Выгрузка неактивного пользователя не удаляет его данные из базы"""
+        dropped = []
+        context = types.SimpleNamespace(application=types.SimpleNamespace(drop_user_data=dropped.append))
+        await self.persistence.refresh_user_data(1, {})
+        await self.persistence.update_user_data(1, {'a': 1})
+        await self.persistence.flush()
+        await self.persistence.evict_idle(context)
+        await self.persistence.drop_user_data(1)
+        await self.persistence.flush()
+        self.assertEqual(dropped, [1])
+        self.assertIn(1, self.db.user_data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import types
+import unittest
+
+from services.pinned_message import PinnedMessageUpdater
+from utils.formatting import render_cache
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.participants = []
+
+    def get_pinned_message_id(self, chat_id, date_str):
+        return 42
+
+    def get_bath_participants(self, date_str):
+        return list(self.participants)
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.edits = []
+
+    async def call(self, method, chat_id, bulk=False, **kwargs):
+        self.edits.append(kwargs['text'])
+
+
+class TestPinnedMessageUpdater(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = FakeDatabase()
+        self.dispatcher = FakeDispatcher()
+        application = types.SimpleNamespace(bot_data={'dispatcher': self.dispatcher}, bot=None)
+        self.updater = PinnedMessageUpdater(application, self.db, chat_id=-100, interval=0.05)
+        self.updater.start()
+        render_cache.clear()
+        self.addAsyncCleanup(self.updater.stop)
+
+    async def test_burst_is_coalesced(self):
+        """Серия изменений за интервал дает одно редактирование"""
+        self.updater.remember("01.01.2025", "old")
+        for index in range(5):
+            self.db.participants.append({'user_id': index, 'username': f"user{index}", 'paid': False})
+            render_cache.invalidate("01.01.2025")
+            self.updater.mark_dirty("01.01.2025")
+        await asyncio.sleep(0.15)
+        self.assertEqual(len(self.dispatcher.edits), 1)
+        self.assertIn("user4", self.dispatcher.edits[0])
+        self.assertEqual(self.updater.stats['coalesced'], 4)
+        self.assertEqual(len(self.updater.latencies_ms), 1)
+
+    async def test_identical_render_skipped(self):
+        """Если текст не изменился, сообщение не редактируется"""
+        self.assertTrue(await self.updater.update("01.01.2025"))
+        self.assertFalse(await self.updater.update("01.01.2025"))
+        self.assertEqual(len(self.dispatcher.edits), 1)
+        self.assertEqual(self.updater.stats['unchanged'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
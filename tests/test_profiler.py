@@ -0,0 +1,59 @@
+import asyncio
+import gc
+import os
+import pstats
+import unittest
+
+from services.profiler import CpuProfiler, ProfilerBusy
+
+
+def busy_function():
+    return sum(i * i for i in range(20000))
+
+
+class TestCpuProfiler(unittest.IsolatedAsyncioTestCase):
+    async def test_report_and_pstats(self):
+        """По окончании приходят отчет и корректный .pstats, файл затем удаляется"""
+        # Event loop предыдущего теста, собранный сборщиком мусора во время замера,
+        # сбивает учет cProfile; собираем мусор заранее
+        gc.collect()
+        profiler = CpuProfiler(max_seconds=5, top=10)
+        delivered = asyncio.get_running_loop().create_future()
+
+        async def on_complete(report, path):
+            stats = pstats.Stats(path)
+            delivered.set_result((report, path, stats.total_calls))
+
+        profiler.start(0.2, on_complete)
+        for _ in range(5):
+            busy_function()
+            await asyncio.sleep(0.01)
+        report, path, total_calls = await asyncio.wait_for(delivered, 5)
+        await asyncio.sleep(0)
+        self.assertIn("busy_function", report)
+        self.assertGreater(total_calls, 0)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(profiler.running)
+
+    async def test_guards(self):
+        """Второй запуск и слишком долгий замер отклоняются, stop выключает профайлер"""
+        profiler = CpuProfiler(max_seconds=5)
+        with self.assertRaises(ValueError):
+            profiler.start(60, None)
+
+        async def on_complete(report, path):
+            self.fail("report after stop")
+
+        profiler.start(1, on_complete)
+        with self.assertRaises(ProfilerBusy):
+            profiler.start(1, on_complete)
+        await profiler.stop()
+        self.assertFalse(profiler.running)
+        # Профайлер действительно выключен: можно запустить новый
+        other = CpuProfiler(max_seconds=5)
+        other.start(1, on_complete)
+        await other.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from database import _notify_participants_changed
+from utils.formatting import RenderCache, render_cache, create_bath_keyboard
+
+
+class CountingDatabase:
+    def __init__(self):
+        self.participants = []
+        self.reads = 0
+
+    def get_bath_participants(self, date_str):
+        self.reads += 1
+        return list(self.participants)
+
+
+class TestRenderCache(unittest.TestCase):
+    def test_hit_skips_database(self):
+        """Повторный рендер без изменений не обращается к базе и отдает те же объекты"""
+        cache = RenderCache()
+        db = CountingDatabase()
+        first = cache.render("05.01.2025", db)
+        second = cache.render("05.01.2025", db)
+        self.assertEqual(db.reads, 1)
+        self.assertIs(first[1], second[1])
+        self.assertIn("Пока никто не записался", first[0])
+
+    def test_participants_change_invalidates(self):
+        """Изменение участников в базе сбрасывает запись только своей даты"""
+        render_cache.clear()
+        db = CountingDatabase()
+        render_cache.render("05.01.2025", db)
+        render_cache.render("12.01.2025", db)
+        db.participants.append({'username': "ivan", 'paid': True})
+        _notify_participants_changed("05.01.2025")
+        text, _ = render_cache.render("05.01.2025", db)
+        render_cache.render("12.01.2025", db)
+        self.assertIn("1. ivan ✅", text)
+        self.assertEqual(db.reads, 3)
+
+    def test_size_is_bounded(self):
+        """Хранятся только последние max_dates дат"""
+        cache = RenderCache(max_dates=2)
+        db = CountingDatabase()
+        for day in ("05.01.2025", "12.01.2025", "19.01.2025"):
+            cache.render(day, db)
+        cache.render("05.01.2025", db)
+        self.assertEqual(db.reads, 4)
+
+    def test_keyboard_is_shared(self):
+        """Клавиатура для даты создается один раз"""
+        self.assertIs(create_bath_keyboard("05.01.2025"), create_bath_keyboard("05.01.2025"))
+
+
+if __name__ == '__main__':
+    unittest.main()
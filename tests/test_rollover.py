@@ -0,0 +1,206 @@
+import types
+import unittest
+from unittest.mock import patch
+
+from telegram.error import BadRequest, TimedOut
+
+from services import rollover as rollover_module
+from services.rollover import WeeklyRollover, RolloverError, STAGES, STAGE_DONE, STAGE_SKIPPED
+
+
+class FakeRolloverDatabase:
+    """Заглушка Database: таблицы rollovers, pinned_messages и участники в памяти"""
+    def __init__(self, old_participants=3, pinned=()):
+        self.rollovers = {}
+        self.pinned = list(pinned)
+        self.events = []
+        self.old_participants = old_participants
+
+    def get_rollover(self, date_str):
+        row = self.rollovers.setdefault(date_str, {
+            'date_str': date_str, 'stage': None, 'in_progress': None,
+            'cleared_events': None, 'message_id': None, 'finished_at': None,
+        })
+        return dict(row)
+
+    def begin_rollover_stage(self, date_str, stage):
+        row = self.rollovers[date_str]
+        if row['in_progress'] is not None:
+            return False
+        row['in_progress'] = stage
+        return True
+
+    def reset_rollover_stage(self, date_str):
+        row = self.rollovers[date_str]
+        was_set, row['in_progress'] = row['in_progress'] is not None, None
+        return was_set
+
+    def complete_rollover_stage(self, date_str, stage, cleared_events=None, message_id=None):
+        row = self.rollovers[date_str]
+        row.update(stage=stage, in_progress=None)
+        if cleared_events is not None:
+            row['cleared_events'] = cleared_events
+        if message_id is not None:
+            row['message_id'] = message_id
+
+    def finish_rollover(self, date_str, stage_ms):
+        self.rollovers[date_str]['stage_ms'] = stage_ms
+
+    def clear_previous_bath_events(self, except_date_str=None):
+        cleared, self.old_participants = self.old_participants, 0
+        return cleared
+
+    def create_bath_event(self, date_str):
+        if date_str not in self.events:
+            self.events.append(date_str)
+
+    def get_bath_participants(self, date_str):
+        return []
+
+    def count_seat_holders(self, date_str):
+        return 0
+
+    def get_mention_users(self, target, date_str=None, dates=None):
+        return []
+
+    def get_pinned_messages(self, chat_id):
+        return list(self.pinned)
+
+    def set_pinned_message_id(self, date_str, message_id, chat_id):
+        if (date_str, message_id) not in self.pinned:
+            self.pinned.append((date_str, message_id))
+
+    def delete_pinned_message_id(self, message_id, chat_id):
+        self.pinned = [row for row in self.pinned if row[1] != message_id]
+
+
+class FakeBot:
+    def __init__(self, fail_pin=0, send_errors=()):
+        self.sent = []
+        self.pinned = []
+        self.unpinned = []
+        self.fail_pin = fail_pin
+        self.send_errors = list(send_errors)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.send_errors:
+            raise self.send_errors.pop(0)
+        self.sent.append(text)
+        return types.SimpleNamespace(message_id=500 + len(self.sent))
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        if self.fail_pin:
+            self.fail_pin -= 1
+            raise ConnectionError("нет связи")
+        self.pinned.append(message_id)
+
+    async def unpin_chat_message(self, chat_id, message_id):
+        self.unpinned.append(message_id)
+
+
+def make_context(bot):
+    return types.SimpleNamespace(bot=bot, bot_data={})
+
+
+class TestWeeklyRollover(unittest.IsolatedAsyncioTestCase):
+    async def test_full_run_and_repeat(self):
+        """Все этапы выполняются один раз; повторный запуск ничего не отправляет"""
+        db = FakeRolloverDatabase(pinned=[('07.01.2035', 400)])
+        bot = FakeBot()
+        rollover = WeeklyRollover(db, chat_id=-100)
+
+        report = await rollover.run(make_context(bot), '14.01.2035')
+        self.assertEqual([stage for stage, _, _ in report], list(STAGES))
+        self.assertTrue(all(outcome == STAGE_DONE for _, outcome, _ in report))
+        self.assertEqual(len(bot.sent), 2)  # сообщение события и уведомление об очистке
+        self.assertEqual(bot.unpinned, [400])
+        self.assertEqual(db.pinned, [('14.01.2035', 501)])
+        self.assertEqual(db.events, ['14.01.2035'])
+        self.assertIn('post', db.rollovers['14.01.2035']['stage_ms'])
+
+        report = await rollover.run(make_context(bot), '14.01.2035')
+        self.assertEqual(len(bot.sent), 2)
+        self.assertEqual(
+            [stage for stage, outcome, _ in report if outcome == STAGE_DONE], ['render']
+        )
+
+    async def test_retry_resumes_without_reposting(self):
+        """После сбоя закрепления повтор продолжает с него и не отправляет сообщение снова"""
+        db = FakeRolloverDatabase(old_participants=0)
+        bot = FakeBot(fail_pin=1)
+        rollover = WeeklyRollover(db, chat_id=-100)
+
+        with self.assertRaises(ConnectionError):
+            await rollover.run(make_context(bot), '21.01.2035')
+        self.assertEqual(db.rollovers['21.01.2035']['stage'], 'post')
+
+        report = dict((stage, outcome) for stage, outcome, _ in await rollover.run(make_context(bot), '21.01.2035'))
+        self.assertEqual(len(bot.sent), 1)
+        self.assertEqual(bot.pinned, [501])
+        self.assertEqual(report['post'], STAGE_SKIPPED)
+        self.assertEqual(report['announce'], STAGE_SKIPPED)  # старых участников не было
+        self.assertEqual(db.rollovers['21.01.2035']['stage'], 'prewarm')
+
+    async def test_interrupted_post_is_not_repeated(self):
+        """Если отправка была прервана, сообщение не отправляется повторно"""
+        db = FakeRolloverDatabase()
+        db.rollovers['28.01.2035'] = {
+            'date_str': '28.01.2035', 'stage': 'render', 'in_progress': 'post',
+            'cleared_events': 2, 'message_id': None, 'finished_at': None,
+        }
+        bot = FakeBot()
+        with self.assertRaises(RolloverError):
+            await WeeklyRollover(db, chat_id=-100).run(make_context(bot), '28.01.2035')
+        self.assertEqual(bot.sent, [])
+
+
+class FakeAdmission:
+    window = 30
+
+    def __init__(self):
+        self.opened = []
+
+    def open(self, date_str, taken=0):
+        self.opened.append((date_str, taken))
+
+
+class TestRolloverSendFailures(unittest.IsolatedAsyncioTestCase):
+    async def test_rejected_post_can_be_retried(self):
+        """Отклоненная Telegram отправка снимает отметку; допуск открывается только после публикации"""
+        db = FakeRolloverDatabase(old_participants=0)
+        bot = FakeBot(send_errors=[BadRequest("Chat not found")])
+        admission = FakeAdmission()
+        rollover = WeeklyRollover(db, chat_id=-100)
+
+        with patch.object(rollover_module, 'admission', admission):
+            with self.assertRaises(BadRequest):
+                await rollover.run(make_context(bot), '04.02.2035')
+            self.assertIsNone(db.rollovers['04.02.2035']['in_progress'])
+            self.assertEqual(admission.opened, [])
+
+            await rollover.run(make_context(bot), '04.02.2035')
+        self.assertEqual(len(bot.sent), 1)
+        self.assertEqual(admission.opened, [('04.02.2035', 0)])
+
+    async def test_timeout_keeps_guard_until_admin_reset(self):
+        """После таймаута повтор запрещен, пока администратор не снимет отметку"""
+        db = FakeRolloverDatabase(old_participants=0)
+        bot = FakeBot(send_errors=[TimedOut()])
+        admission = FakeAdmission()
+        rollover = WeeklyRollover(db, chat_id=-100)
+
+        with patch.object(rollover_module, 'admission', admission):
+            with self.assertRaises(TimedOut):
+                await rollover.run(make_context(bot), '11.02.2035')
+            with self.assertRaises(RolloverError):
+                await rollover.run(make_context(bot), '11.02.2035')
+            self.assertEqual(admission.opened, [])
+
+            self.assertTrue(db.reset_rollover_stage('11.02.2035'))
+            await rollover.run(make_context(bot), '11.02.2035')
+        self.assertEqual(len(bot.sent), 1)
+        self.assertEqual(db.rollovers['11.02.2035']['stage'], 'prewarm')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+import types
+import unittest
+from datetime import datetime, time, timedelta
+
+import pytz
+
+from database import JOB_OK, JOB_FAILED
+from services.scheduler import JobScheduler, ScheduledJob, Daily, Every, CATCH_UP_LATEST, CATCH_UP_SKIP
+
+WARSAW = pytz.timezone('Europe/Warsaw')
+
+
+class FakeJobRunsDatabase:
+    """Заглушка Database: job_runs в памяти с уникальным ключом (задача, плановое время)"""
+    def __init__(self):
+        self.runs = {}
+        self.lock = threading.Lock()
+        self.schema_ready = True
+
+    def ensure_schema(self):
+        pass
+
+    def claim_job_run(self, job_name, scheduled_for, worker):
+        with self.lock:
+            if (job_name, scheduled_for) in self.runs:
+                return None
+            run_id = len(self.runs) + 1
+            self.runs[(job_name, scheduled_for)] = {'id': run_id, 'worker': worker, 'status': 'running'}
+            return run_id
+
+    def finish_job_run(self, run_id, status, duration_ms, error=None):
+        for run in self.runs.values():
+            if run['id'] == run_id:
+                run.update(status=status, duration_ms=duration_ms, error=error)
+
+    def get_last_job_runs(self):
+        return {}
+
+
+def fake_application():
+    return types.SimpleNamespace(context_types=types.SimpleNamespace(context=lambda application: 'context'))
+
+
+class TestSchedules(unittest.TestCase):
+    def test_daily_slots(self):
+        """Daily: предыдущий и следующий запуск по местному времени"""
+        schedule = Daily(time(10, 0))
+        now = WARSAW.localize(datetime(2035, 1, 7, 9, 0))
+        self.assertEqual(schedule.previous(now), WARSAW.localize(datetime(2035, 1, 6, 10, 0)))
+        self.assertEqual(schedule.next(now), WARSAW.localize(datetime(2035, 1, 7, 10, 0)))
+
+    def test_daily_across_dst(self):
+        """После перевода часов запуск остается в 10:00 по местному времени"""
+        schedule = Daily(time(10, 0))
+        before = WARSAW.localize(datetime(2035, 3, 24, 11, 0))
+        after = schedule.next(before)
+        self.assertEqual(after.astimezone(WARSAW).hour, 10)
+        self.assertEqual(after - schedule.previous(before), timedelta(hours=23))
+
+    def test_daily_weekdays(self):
+        """Daily с днями недели пропускает остальные дни"""
+        schedule = Daily(time(10, 0), days=[6])
+        now = WARSAW.localize(datetime(2035, 1, 3, 12, 0))  # среда
+        self.assertEqual(schedule.next(now).date().weekday(), 6)
+        self.assertEqual(schedule.previous(now).date(), datetime(2034, 12, 31).date())
+
+    def test_every_is_aligned(self):
+        """Every: плановые времена кратны интервалу и одинаковы для всех экземпляров"""
+        schedule = Every(600)
+        now = datetime(2035, 1, 7, 9, 7, 31, tzinfo=pytz.utc)
+        self.assertEqual(schedule.previous(now), datetime(2035, 1, 7, 9, 0, tzinfo=pytz.utc))
+        self.assertEqual(schedule.next(now), datetime(2035, 1, 7, 9, 10, tzinfo=pytz.utc))
+
+
+class TestJobScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_slot_runs_once_across_instances(self):
+        """Два экземпляра бота: плановый запуск выполняет только один"""
+        db = FakeJobRunsDatabase()
+        calls = []
+
+        async def callback(context):
+            calls.append(context)
+
+        slot = datetime(2035, 1, 7, 9, 0, tzinfo=pytz.utc)
+        schedulers = [JobScheduler(db, worker=f"w{index}") for index in range(2)]
+        for scheduler in schedulers:
+            job = scheduler.add(ScheduledJob('reminders', callback, Every(600)))
+            scheduler._launch(job, slot)
+        await asyncio.gather(*(scheduler.jobs['reminders'].task for scheduler in schedulers))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sum(scheduler.stats['skipped'] for scheduler in schedulers), 1)
+        self.assertEqual(db.runs[('reminders', datetime(2035, 1, 7, 9, 0))]['status'], JOB_OK)
+
+    async def test_catch_up_within_grace(self):
+        """Пропущенный запуск навёрстывается при старте, если опоздание в пределах grace"""
+        db = FakeJobRunsDatabase()
+        calls = []
+
+        async def callback(context):
+            calls.append(context)
+
+        scheduler = JobScheduler(db)
+        now = datetime.now(pytz.utc)
+        recent = ScheduledJob('recent', callback, Every(3600), catch_up=CATCH_UP_LATEST, grace=timedelta(hours=2))
+        skipped = ScheduledJob('skipped', callback, Every(3600), catch_up=CATCH_UP_SKIP)
+        late = ScheduledJob('late', callback, Every(3600), catch_up=CATCH_UP_LATEST, grace=timedelta(0))
+        for job in (recent, skipped, late):
+            scheduler.add(job)
+        scheduler.start(fake_application())
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+        self.assertEqual(calls, ['context'])
+        self.assertEqual([name for name, _ in db.runs], ['recent'])
+        self.assertEqual(scheduler.stats['caught_up'], 1)
+        # Следующий запуск запланирован по расписанию
+        self.assertGreater(recent.next_run, now)
+
+    async def test_failed_run_is_recorded(self):
+        """Ошибка задачи записывается в журнал, планировщик продолжает работу"""
+        db = FakeJobRunsDatabase()
+
+        async def callback(context):
+            raise RuntimeError("нет связи")
+
+        scheduler = JobScheduler(db)
+        job = scheduler.add(ScheduledJob('cash_list_auto', callback, Daily(time(10, 0))))
+        scheduler._context = 'context'
+        scheduler._launch(job, WARSAW.localize(datetime(2035, 1, 7, 10, 0)))
+        await job.task
+
+        run = db.runs[('cash_list_auto', datetime(2035, 1, 7, 9, 0))]
+        self.assertEqual(run['status'], JOB_FAILED)
+        self.assertIn("нет связи", run['error'])
+        self.assertEqual(scheduler.stats['failed'], 1)
+
+    async def test_duplicate_job_name(self):
+        """Имя задачи должно быть уникальным"""
+        scheduler = JobScheduler(FakeJobRunsDatabase())
+        scheduler.add(ScheduledJob('maintenance', None, Every(60)))
+        with self.assertRaises(ValueError):
+            scheduler.add(ScheduledJob('maintenance', None, Every(60)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import types
+import unittest
+from unittest.mock import patch
+
+from telegram.ext import ApplicationHandlerStop
+
+import database
+from services.startup import StartupMonitor
+
+
+class SlowDatabase:
+    """Заглушка Database: проверка схемы идет в потоке и может упасть"""
+    def __init__(self, fail_times=0):
+        self.schema_ready = False
+        self.calls = 0
+        self.fail_times = fail_times
+        self.release = threading.Event()
+
+    def ensure_schema(self):
+        self.calls += 1
+        self.release.wait(5)
+        if self.calls <= self.fail_times:
+            raise RuntimeError("база недоступна")
+        self.schema_ready = True
+
+
+class TestStartupMonitor(unittest.IsolatedAsyncioTestCase):
+    async def test_updates_wait_for_schema(self):
+        """Обновления ждут фоновую проверку схемы, сама проверка идет один раз"""
+        monitor = StartupMonitor()
+        db = SlowDatabase()
+        monitor.begin_schema_check(db)
+        waiters = [asyncio.create_task(monitor.wait_ready(None, None)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        self.assertFalse(any(waiter.done() for waiter in waiters))
+
+        db.release.set()
+        await asyncio.wait_for(asyncio.gather(*waiters), 5)
+        self.assertEqual(db.calls, 1)
+        self.assertEqual([name for name, _ in monitor.background], ['schema'])
+        # После готовности ожидания нет
+        await monitor.wait_ready(None, None)
+        self.assertEqual(db.calls, 1)
+
+    async def test_failed_check_drops_update_and_retries(self):
+        """Если база недоступна, обновление пропускается, следующее повторяет проверку"""
+        monitor = StartupMonitor()
+        db = SlowDatabase(fail_times=1)
+        db.release.set()
+        monitor.begin_schema_check(db)
+        with self.assertRaises(ApplicationHandlerStop):
+            await monitor.wait_ready(None, None)
+        await monitor.wait_ready(None, None)
+        self.assertTrue(db.schema_ready)
+        self.assertEqual(db.calls, 2)
+
+    async def test_first_update_and_report(self):
+        """Первое обновление отмечается один раз; в режиме замера бот останавливается"""
+        monitor = StartupMonitor()
+        monitor.mark('imports')
+        monitor.stop_after_first_update = True
+        stopped = []
+        context = types.SimpleNamespace(application=types.SimpleNamespace(stop_running=lambda: stopped.append(True)))
+
+        with patch('builtins.print') as printed:
+            await monitor.update_handled(None, context)
+            await monitor.update_handled(None, context)
+
+        self.assertIsNotNone(monitor.first_update)
+        self.assertEqual(stopped, [True])
+        report = printed.call_args.args[0]
+        self.assertIn('imports', report)
+        self.assertIn('first update', report)
+
+
+class TestSharedDatabase(unittest.TestCase):
+    def test_get_database_is_lazy_and_shared(self):
+        """Общий экземпляр создается без подключения к базе и переиспользуется"""
+        with patch.object(database, '_shared_database', None), \
+                patch.object(database.Database, 'init_db', side_effect=AssertionError("init_db при импорте")):
+            first = database.get_database()
+            self.assertIs(database.get_database(), first)
+            self.assertFalse(first.schema_ready)
+
+
+if __name__ == '__main__':
+    unittest.main()
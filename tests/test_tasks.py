@@ -0,0 +1,183 @@
+import asyncio
+import types
+import unittest
+from unittest.mock import patch
+
+from services import notification
+from services.tasks import BackgroundTasks
+from utils.callback_data import encode_callback, CLAIM_PAYMENT
+from utils.idempotency import CallbackDeduplicator
+
+DATE = '07.01.2035'
+
+
+class FakeDispatcher:
+    """Заглушка диспетчера: сообщения в chat_id из failing не доставляются"""
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+        self.attempts = []
+
+    async def send_message(self, chat_id, text, bulk=False, **kwargs):
+        self.attempts.append(chat_id)
+        if chat_id in self.failing:
+            raise ConnectionError("недоступен")
+        self.sent.append((chat_id, text))
+
+    async def send_many(self, messages, bulk=True):
+        sent, failed = [], []
+        for message in messages:
+            try:
+                await self.send_message(bulk=bulk, **message)
+                sent.append(message)
+            except ConnectionError:
+                failed.append(message)
+        return sent, failed
+
+
+class FakeQuery:
+    def __init__(self, data, user_id=7):
+        self.data = data
+        self.from_user = types.SimpleNamespace(id=user_id, username="user7", first_name="Имя", last_name=None)
+        self.message = types.SimpleNamespace(chat_id=user_id, message_id=100)
+        self.inline_message_id = None
+        self.events = []
+        self.edits = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.events.append('answer')
+
+    async def edit_message_text(self, text=None, reply_markup=None):
+        self.events.append('edit')
+        self.edits.append(text)
+
+
+class SlowPaymentDatabase:
+    def __init__(self):
+        self.claims = []
+
+    def claim_payment(self, user_id, username, date_str, payment_type):
+        self.claims.append((user_id, date_str, payment_type))
+
+
+class FailingPaymentDatabase:
+    def claim_payment(self, user_id, username, date_str, payment_type):
+        raise ConnectionError("база недоступна")
+
+
+class TestBackgroundTasks(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_until_success(self):
+        """Временная ошибка повторяется, пользователь не уведомляется"""
+        tasks = BackgroundTasks(retries=3, backoff=0)
+        attempts, failures = [], []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("временно")
+
+        async def on_failure():
+            failures.append(1)
+
+        tasks.spawn('flaky', flaky, on_failure=on_failure)
+        await tasks.join()
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(failures, [])
+        self.assertEqual(tasks.stats, {'done': 1, 'retried': 2, 'failed': 0})
+        self.assertEqual(len(tasks), 0)
+
+    async def test_final_failure_calls_handler_once(self):
+        """После последней неудачной попытки on_failure вызывается один раз"""
+        tasks = BackgroundTasks(retries=2, backoff=0)
+        failures = []
+
+        async def broken():
+            raise ConnectionError("недоступно")
+
+        async def on_failure():
+            failures.append(1)
+
+        tasks.spawn('broken', broken, on_failure=on_failure)
+        await tasks.join()
+        self.assertEqual(failures, [1])
+        self.assertEqual(tasks.stats['failed'], 1)
+
+    async def test_stop_cancels_stuck_tasks(self):
+        """При остановке зависшие задачи отменяются по таймауту"""
+        tasks = BackgroundTasks()
+        task = tasks.spawn('stuck', lambda: asyncio.sleep(60))
+        await tasks.stop(timeout=0.01)
+        self.assertTrue(task.cancelled())
+
+    async def test_admin_fan_out_resends_only_failed(self):
+        """Повтор рассылки администраторам отправляет только недоставленные сообщения"""
+        dispatcher = FakeDispatcher(failing={2})
+        context = types.SimpleNamespace(bot_data={'dispatcher': dispatcher})
+        with patch.object(notification, 'ADMIN_IDS', [1, 2, 3]):
+            send = notification.admin_fan_out(context, "заявка")
+        with self.assertRaises(RuntimeError):
+            await send()
+        dispatcher.failing.clear()
+        await send()
+        self.assertEqual(dispatcher.attempts, [1, 2, 3, 2])
+        self.assertEqual(sorted(chat_id for chat_id, _ in dispatcher.sent), [1, 2, 3])
+
+
+class TestOptimisticPayment(unittest.IsolatedAsyncioTestCase):
+    async def test_user_answered_before_admin_fan_out(self):
+        """Пользователь получает ответ сразу; о сбое рассылки администраторам он узнает, только когда все попытки исчерпаны"""
+        import handlers.bath as bath
+
+        db = SlowPaymentDatabase()
+        dispatcher = FakeDispatcher(failing={1, 2})
+        context = types.SimpleNamespace(
+            bot_data={'dispatcher': dispatcher},
+            user_data={'bath_registrations': {DATE: {'status': 'pending_payment'}}}
+        )
+        query = FakeQuery(encode_callback(CLAIM_PAYMENT, date_str=DATE, payment_type='online'))
+        update = types.SimpleNamespace(callback_query=query, effective_chat=types.SimpleNamespace(type='private'))
+        tasks = BackgroundTasks(retries=3, backoff=0.01)
+
+        with patch.object(bath, 'db', db), patch.object(bath, 'background_tasks', tasks), \
+                patch.object(bath, 'callback_dedup', CallbackDeduplicator()), \
+                patch.object(notification, 'ADMIN_IDS', [1, 2]):
+            await bath.button_callback(update, context)
+            # Обработчик завершился: ответ и редактирование уже есть, рассылка еще идет
+            self.assertEqual(query.events, ['answer', 'edit'])
+            self.assertEqual(db.claims, [(7, DATE, 'online')])
+            self.assertEqual(len(tasks), 1)
+            self.assertEqual(dispatcher.sent, [])
+            await tasks.join()
+
+        self.assertEqual(dispatcher.attempts.count(1), 3)
+        self.assertEqual([chat_id for chat_id, _ in dispatcher.sent], [7])
+        self.assertIn("Не удалось передать", dispatcher.sent[0][1])
+        self.assertEqual(context.user_data['bath_registrations'][DATE]['status'], 'payment_claimed')
+
+    async def test_failed_claim_not_reported_as_accepted(self):
+        """Если заявку не удалось записать, пользователь видит ошибку, а не «заявка отправлена», и администраторам ничего не уходит"""
+        import handlers.bath as bath
+
+        db = FailingPaymentDatabase()
+        dispatcher = FakeDispatcher()
+        context = types.SimpleNamespace(
+            bot_data={'dispatcher': dispatcher},
+            user_data={'bath_registrations': {DATE: {'status': 'pending_payment'}}}
+        )
+        query = FakeQuery(encode_callback(CLAIM_PAYMENT, date_str=DATE, payment_type='online'))
+        update = types.SimpleNamespace(callback_query=query, effective_chat=types.SimpleNamespace(type='private'))
+        tasks = BackgroundTasks(retries=1, backoff=0)
+
+        with patch.object(bath, 'db', db), patch.object(bath, 'background_tasks', tasks), \
+                patch.object(bath, 'callback_dedup', CallbackDeduplicator()), \
+                patch.object(notification, 'ADMIN_IDS', [1, 2]):
+            await bath.button_callback(update, context)
+            await tasks.join()
+
+        self.assertEqual(query.edits, ["Произошла ошибка. Пожалуйста, попробуйте позже."])
+        self.assertEqual(dispatcher.attempts, [])
+        self.assertEqual(context.user_data['bath_registrations'][DATE]['status'], 'pending_payment')
+
+
+if __name__ == '__main__':
+    unittest.main()
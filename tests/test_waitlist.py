@@ -0,0 +1,174 @@
+import asyncio
+import time
+import types
+import unittest
+from unittest.mock import patch
+
+from database import WAITLIST_WAITING, WAITLIST_OFFERED, WAITLIST_ACCEPTED, WAITLIST_EXPIRED, WAITLIST_LEFT
+from services import waitlist as waitlist_module
+from services.admission import AdmissionQueue
+from services.waitlist import Waitlist, waitlist_position
+
+DATE = '07.01.2035'
+
+
+class FakeWaitlistDatabase:
+    """Заглушка Database: участники и лист ожидания в памяти"""
+    def __init__(self, participants):
+        self.participants = participants
+        self.entries = {}   # user_id -> {'position', 'status', 'expires'}
+        self.offer_calls = 0
+
+    def ensure_schema(self):
+        pass
+
+    def add_to_waitlist(self, date_str, user_id, username, position):
+        entry = self.entries.setdefault(user_id, {'position': position, 'status': WAITLIST_WAITING, 'expires': None})
+        return entry['status'], None
+
+    def offer_next_waitlist_seat(self, date_str, max_participants, ttl_seconds):
+        self.offer_calls += 1
+        holds = sum(1 for entry in self.entries.values() if entry['status'] in (WAITLIST_OFFERED, WAITLIST_ACCEPTED))
+        if self.participants + holds >= max_participants:
+            return None
+        waiting = [(entry['position'], user_id) for user_id, entry in self.entries.items() if entry['status'] == WAITLIST_WAITING]
+        if not waiting:
+            return None
+        user_id = min(waiting)[1]
+        self.entries[user_id].update(status=WAITLIST_OFFERED, expires=time.monotonic() + ttl_seconds)
+        return {'user_id': user_id, 'username': f"user{user_id}"}
+
+    def accept_waitlist_offer(self, date_str, user_id, ttl_seconds):
+        entry = self.entries.get(user_id)
+        if entry and entry['status'] == WAITLIST_OFFERED and entry['expires'] > time.monotonic():
+            entry['status'] = WAITLIST_ACCEPTED
+            return True
+        return False
+
+    def expire_waitlist_offer(self, date_str, user_id):
+        entry = self.entries.get(user_id)
+        if entry and entry['status'] == WAITLIST_OFFERED and entry['expires'] <= time.monotonic():
+            entry['status'] = WAITLIST_EXPIRED
+            return True
+        return False
+
+    def leave_waitlist(self, date_str, user_id):
+        entry = self.entries.get(user_id)
+        if entry and entry['status'] in (WAITLIST_WAITING, WAITLIST_OFFERED, WAITLIST_ACCEPTED):
+            entry['status'] = WAITLIST_LEFT
+            return True
+        return False
+
+    def get_open_waitlist_offers(self):
+        return []
+
+    def get_waitlist_dates(self):
+        return []
+
+    def status(self, user_id):
+        return self.entries[user_id]['status']
+
+
+class FakeDispatcher:
+    def __init__(self, blocked=()):
+        self.sent = []
+        self.blocked = set(blocked)
+
+    async def send_message(self, chat_id, text, bulk=False, **kwargs):
+        if chat_id in self.blocked:
+            raise ConnectionError("бот заблокирован")
+        self.sent.append((chat_id, kwargs.get('reply_markup') is not None))
+
+
+class TestWaitlist(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = FakeWaitlistDatabase(participants=20)
+        self.dispatcher = FakeDispatcher()
+        for user_id in (101, 102, 103):
+            self.db.add_to_waitlist(DATE, user_id, None, waitlist_position())
+        self.patches = [
+            patch.object(waitlist_module, 'get_dispatcher', lambda application: self.dispatcher),
+            patch.object(waitlist_module, 'admission', AdmissionQueue(window=60)),
+            patch.object(waitlist_module, 'OFFER_EXPIRY_SLACK', 0),
+        ]
+        for item in self.patches:
+            item.start()
+        self.waitlist = Waitlist(types.SimpleNamespace(bot_data={}), self.db, capacity=20, offer_ttl=60)
+        self.waitlist.start()
+
+    async def asyncTearDown(self):
+        await self.waitlist.stop()
+        for item in self.patches:
+            item.stop()
+
+    async def settle(self):
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            if not self.waitlist._checks:
+                return
+
+    async def test_freed_seat_goes_to_first_in_line(self):
+        """Освободившееся место предлагается первому ожидающему, остальным — нет"""
+        self.waitlist.seat_changed(DATE)
+        await self.settle()
+        self.assertEqual(self.dispatcher.sent, [])
+
+        self.db.participants = 19
+        self.waitlist.seat_changed(DATE)
+        await self.settle()
+        self.assertEqual(self.dispatcher.sent, [(101, True)])
+        self.assertEqual(self.db.status(102), WAITLIST_WAITING)
+
+        # Подтвержденное место по-прежнему занято: следующему не предлагается
+        self.assertTrue(await self.waitlist.accept(DATE, 101))
+        self.waitlist.seat_changed(DATE)
+        await self.settle()
+        self.assertEqual(len(self.dispatcher.sent), 1)
+
+    async def test_expired_offer_passes_to_next(self):
+        """Неподтвержденное предложение истекает и переходит следующему без опроса"""
+        self.waitlist.offer_ttl = 0.05
+        self.db.participants = 19
+        self.waitlist.seat_changed(DATE)
+        await self.settle()
+        self.waitlist.offer_ttl = 60
+        await asyncio.sleep(0.1)
+        await self.settle()
+        self.assertEqual(self.db.status(101), WAITLIST_EXPIRED)
+        self.assertEqual(self.db.status(102), WAITLIST_OFFERED)
+        self.assertFalse(await self.waitlist.accept(DATE, 101))
+        self.assertEqual(self.waitlist.stats['expired'], 1)
+
+    async def test_decline_and_undelivered_offer(self):
+        """Отказ и недоставленное предложение сразу передают место дальше"""
+        self.dispatcher.blocked.add(102)
+        self.db.participants = 19
+        self.waitlist.seat_changed(DATE)
+        await self.settle()
+        await self.waitlist.leave(DATE, 101)
+        await self.settle()
+        self.assertEqual(self.db.status(102), WAITLIST_LEFT)
+        self.assertEqual(self.db.status(103), WAITLIST_OFFERED)
+
+    async def test_changes_during_check_are_not_lost(self):
+        """Изменения во время проверки запускают ее повторно, а не теряются"""
+        self.db.participants = 19
+        self.waitlist.check(DATE)
+        self.waitlist.check(DATE)
+        self.waitlist.check(DATE)
+        await self.settle()
+        self.assertEqual(self.dispatcher.sent, [(101, True)])
+        # Первая проверка: предложение и пустой ответ; повтор, один на все запросы: пустой ответ
+        self.assertEqual(self.db.offer_calls, 3)
+
+    async def test_no_offers_during_surge(self):
+        """Пока открыто окно наплыва, места выдает очередь допуска"""
+        waitlist_module.admission.open(DATE)
+        self.db.participants = 0
+        self.waitlist.seat_changed(DATE)
+        await self.settle()
+        self.assertEqual(self.db.offer_calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+"""Компактный формат callback_data inline-кнопок.
+
+Строка кнопки: символ версии, символ действия и base64url от упакованных
+полей с усеченной HMAC-подписью, например ``1a`` + 23 символа для
+подтверждения оплаты администратором. Так данные укладываются в лимит
+Telegram в 64 байта, разбираются без split/replace, а подделанные или
+поврежденные кнопки отсекаются проверкой длины и подписи.
+
+Кнопки старого текстового формата (``admin_confirm_{user_id}_{date}_{type}``
+и т.п.) не подписаны, поэтому разбираются, только если явно включен
+CALLBACK_ACCEPT_LEGACY и не прошел день CALLBACK_LEGACY_UNTIL; каждое такое
+нажатие пишется в журнал.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import re
+import struct
+from datetime import date, datetime
+
+from config import CALLBACK_SECRET, CALLBACK_ACCEPT_LEGACY, CALLBACK_LEGACY_UNTIL
+
+logger = logging.getLogger(__name__)
+
+VERSION = '1'
+MAC_SIZE = 6
+# Максимальная длина callback_data в Telegram, байт
+CALLBACK_DATA_LIMIT = 64
+
+# Действия: код — один символ после версии
+JOIN_BATH = 'j'
+CONFIRM_BATH = 'c'
+CLAIM_PAYMENT = 'p'
+ADMIN_CONFIRM = 'a'
+ADMIN_DECLINE = 'd'
+WAITLIST_ACCEPT = 'w'
+WAITLIST_DECLINE = 'x'
+
+PAYMENT_TYPES = ('online', 'cash')
+
+# Поля действий в порядке упаковки
+ACTION_FIELDS = {
+    JOIN_BATH: ('date_str',),
+    CONFIRM_BATH: ('date_str',),
+    CLAIM_PAYMENT: ('date_str', 'payment_type'),
+    ADMIN_CONFIRM: ('user_id', 'date_str', 'payment_type'),
+    ADMIN_DECLINE: ('user_id', 'date_str', 'payment_type'),
+    WAITLIST_ACCEPT: ('date_str',),
+    WAITLIST_DECLINE: ('date_str',),
+}
+
+# user_id — 8 байт, дата — дни от 01.01.2000 (2 байта), тип оплаты — индекс (1 байт)
+_FIELD_FORMATS = {'user_id': 'q', 'date_str': 'H', 'payment_type': 'B'}
+_EPOCH = date(2000, 1, 1).toordinal()
+_KEY = CALLBACK_SECRET.encode('utf-8')
+_LEGACY_DATE = re.compile(r'^\d{2}\.\d{2}\.\d{4}$')
+# Последний день приема кнопок старого формата (None — без ограничения)
+LEGACY_UNTIL = datetime.strptime(CALLBACK_LEGACY_UNTIL, "%d.%m.%Y").date() if CALLBACK_LEGACY_UNTIL else None
+
+
+class InvalidCallbackData(ValueError):
+    """callback_data не распознан, поврежден или подписан другим ключом"""
+
+
+def _layout(fields):
+    struct_format = struct.Struct('>' + ''.join(_FIELD_FORMATS[field] for field in fields))
+    raw_size = struct_format.size + MAC_SIZE
+    encoded_size = len(VERSION) + 1 + (raw_size * 4 + 2) // 3
+    return struct_format, encoded_size
+
+
+_LAYOUTS = {action: _layout(fields) for action, fields in ACTION_FIELDS.items()}
+
+
+def _sign(header, payload):
+    return hmac.new(_KEY, header + payload, hashlib.sha256).digest()[:MAC_SIZE]
+
+
+def _pack_date(date_str):
+    day, month, year = date_str.split('.')
+    return date(int(year), int(month), int(day)).toordinal() - _EPOCH
+
+
+def _unpack_date(days):
+    return date.fromordinal(days + _EPOCH).strftime("%d.%m.%Y")
+
+
+def encode_callback(action, **fields):
+    """Кодирует действие и его поля в строку callback_data"""
+    struct_format, _ = _LAYOUTS[action]
+    values = []
+    for field in ACTION_FIELDS[action]:
+        value = fields[field]
+        if field == 'date_str':
+            value = _pack_date(value)
+        elif field == 'payment_type':
+            value = PAYMENT_TYPES.index(value)
+        values.append(value)
+    payload = struct_format.pack(*values)
+    header = (VERSION + action).encode('ascii')
+    token = base64.urlsafe_b64encode(payload + _sign(header, payload)).rstrip(b'=').decode('ascii')
+    return VERSION + action + token
+
+
+def decode_callback(data):
+    """Возвращает (действие, поля) или бросает InvalidCallbackData.
+
+    Длина проверяется до декодирования base64 и подписи, поэтому мусорные
+    данные отбрасываются без лишней работы.
+    """
+    if not data or len(data) > CALLBACK_DATA_LIMIT:
+        raise InvalidCallbackData(data)
+    if data[0] != VERSION:
+        if legacy_allowed():
+            return _decode_legacy(data)
+        raise InvalidCallbackData(data)
+    action = data[1:2]
+    layout = _LAYOUTS.get(action)
+    if layout is None or len(data) != layout[1]:
+        raise InvalidCallbackData(data)
+    struct_format, _ = layout
+    token = data[2:]
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except ValueError:
+        raise InvalidCallbackData(data)
+    payload, mac = raw[:-MAC_SIZE], raw[-MAC_SIZE:]
+    if not hmac.compare_digest(mac, _sign(data[:2].encode('ascii'), payload)):
+        raise InvalidCallbackData(data)
+    fields = {}
+    for field, value in zip(ACTION_FIELDS[action], struct_format.unpack(payload)):
+        if field == 'date_str':
+            value = _unpack_date(value)
+        elif field == 'payment_type':
+            if value >= len(PAYMENT_TYPES):
+                raise InvalidCallbackData(data)
+            value = PAYMENT_TYPES[value]
+        fields[field] = value
+    return action, fields
+
+
+def _legacy_date(value):
+    if not _LEGACY_DATE.match(value):
+        raise InvalidCallbackData(value)
+    return {'date_str': value}
+
+
+def _legacy_admin(value):
+    parts = value.split('_')
+    if len(parts) != 3 or not parts[0].isdigit() or not _LEGACY_DATE.match(parts[1]) or parts[2] not in PAYMENT_TYPES:
+        raise InvalidCallbackData(value)
+    return {'user_id': int(parts[0]), 'date_str': parts[1], 'payment_type': parts[2]}
+
+
+# Префикс старого формата -> (действие, разбор остатка, дополнительные поля)
+_LEGACY_PREFIXES = {
+    'join_bath': (JOIN_BATH, _legacy_date, {}),
+    'confirm_bath': (CONFIRM_BATH, _legacy_date, {}),
+    'paid_bath': (CLAIM_PAYMENT, _legacy_date, {'payment_type': 'online'}),
+    'cash_bath': (CLAIM_PAYMENT, _legacy_date, {'payment_type': 'cash'}),
+    'admin_confirm': (ADMIN_CONFIRM, _legacy_admin, {}),
+    'admin_decline': (ADMIN_DECLINE, _legacy_admin, {}),
+}
+
+
+def legacy_allowed(today=None):
+    """Принимаются ли сейчас неподписанные кнопки старого формата"""
+    if not CALLBACK_ACCEPT_LEGACY:
+        return False
+    return LEGACY_UNTIL is None or (today or date.today()) <= LEGACY_UNTIL
+
+
+def _decode_legacy(data):
+    parts = data.split('_', 2)
+    entry = _LEGACY_PREFIXES.get('_'.join(parts[:2])) if len(parts) == 3 else None
+    if entry is None:
+        raise InvalidCallbackData(data)
+    action, parse, extra = entry
+    fields = parse(parts[2])
+    fields.update(extra)
+    logger.warning("[callback] Unsigned legacy callback accepted: %r", data)
+    return action, fields
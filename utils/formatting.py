@@ -1,41 +1,145 @@
 from config import BATH_TIME, BATH_COST, MAX_BATH_PARTICIPANTS, CARD_PAYMENT_LINK, REVOLUT_PAYMENT_LINK, BATH_LOCATION
 import logging
+import threading
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from database import on_participants_changed
+from utils.callback_data import encode_callback, JOIN_BATH
 
 logger = logging.getLogger(__name__)
 
 
+def build_bath_message(date_str, participants):
+    """Собирает текст сообщения о бане по готовому списку участников"""
+    lines = [
+        "НОВАЯ ЗАПИСЬ В БАНЮ👇\n",
+        f"Время: {BATH_TIME} ‼️\n",
+        f"Дата: ВОСКРЕСЕНЬЕ {date_str}\n",
+        f"Cтоимость: {BATH_COST} карта либо наличка при входе📍\n",
+        f"Список участников (максимум {MAX_BATH_PARTICIPANTS} человек):",
+    ]
+    lines.extend(
+        f"{i}. {participant['username']} {'✅' if participant['paid'] else '❌'}"
+        for i, participant in enumerate(participants, 1)
+    )
+    if not participants:
+        lines.append("Пока никто не записался")
+
+    lines.extend([
+        "\nОплата:",
+        "КАРТА",
+        CARD_PAYMENT_LINK,
+        "Revolut",
+        f"{REVOLUT_PAYMENT_LINK}\n",
+        f"Локация: {BATH_LOCATION}\n",
+    ])
+    if len(participants) < MAX_BATH_PARTICIPANTS:
+        lines.extend([
+            "Для записи:",
+            "1. Нажмите кнопку 'Записаться' ниже",
+            "2. Следуйте инструкциям бота в личном чате",
+            "3. Оплатите участие и подтвердите оплату через бота",
+            "4. Ожидайте подтверждения от администратора",
+        ])
+        return "\n".join(lines)
+    lines.append("\n❗️Лимит участников достигнут. Запись закрыта.\n")
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=16)
+def create_bath_keyboard(date_str):
+    """Клавиатура сообщения о бане; разметка неизменяема, поэтому объект переиспользуется"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Записаться", callback_data=encode_callback(JOIN_BATH, date_str=date_str))]
+    ])
+
+
+class RenderCache:
+    """Готовые текст и клавиатура сообщения события по ключу (дата, версия списка участников).
+
+    Версия даты увеличивается при каждом изменении участников (см.
+    database.on_participants_changed), поэтому устаревшая запись не
+    используется. Хранятся последние max_dates дат.
+    """
+    def __init__(self, max_dates=8):
+        self.max_dates = max_dates
+        self._versions = {}   # date_str -> версия списка участников
+        self._entries = {}    # date_str -> (версия, текст, клавиатура)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, date_str):
+        return self._versions.get(date_str, 0)
+
+    def invalidate(self, date_str):
+        """Обработчик изменения участников; может вызываться из рабочих потоков"""
+        with self._lock:
+            self._versions[date_str] = self._versions.get(date_str, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._entries.clear()
+
+    def render(self, date_str, db):
+        """Возвращает (текст, клавиатура), обращаясь к базе только после изменения участников"""
+        # Версия читается до запроса: если участники изменятся во время
+        # рендера, запись окажется устаревшей и будет пересобрана
+        version = self.version(date_str)
+        entry = self._entries.get(date_str)
+        if entry and entry[0] == version:
+            self.hits += 1
+            return entry[1], entry[2]
+        self.misses += 1
+        text = build_bath_message(date_str, db.get_bath_participants(date_str))
+        keyboard = create_bath_keyboard(date_str)
+        with self._lock:
+            self._entries.pop(date_str, None)
+            self._entries[date_str] = (version, text, keyboard)
+            while len(self._entries) > self.max_dates:
+                del self._entries[next(iter(self._entries))]
+        return text, keyboard
+
+
+render_cache = RenderCache()
+on_participants_changed(render_cache.invalidate)
+
+
 def format_bath_message(date_str, db):
     try:
-        participants = db.get_bath_participants(date_str)
-
-        message = f"НОВАЯ ЗАПИСЬ В БАНЮ👇\n\n"
-        message += f"Время: {BATH_TIME} ‼️\n\n"
-        message += f"Дата: ВОСКРЕСЕНЬЕ {date_str}\n\n"
-        message += f"Cтоимость: {BATH_COST} карта либо наличка при входе📍\n\n"
-        message += f"Список участников (максимум {MAX_BATH_PARTICIPANTS} человек):\n"
-
-        for i, participant in enumerate(participants, 1):
-            paid_status = "✅" if participant["paid"] else "❌"
-            message += f"{i}. {participant['username']} {paid_status}\n"
-
-        if len(participants) == 0:
-            message += "Пока никто не записался\n"
-
-        message += f"\nОплата:\n"
-        message += f"КАРТА\n{CARD_PAYMENT_LINK}\n"
-        message += f"Revolut\n{REVOLUT_PAYMENT_LINK}\n\n"
-        message += f"Локация: {BATH_LOCATION}\n\n"
-
-        if len(participants) < MAX_BATH_PARTICIPANTS:
-            message += f"Для записи:\n"
-            message += f"1. Нажмите кнопку 'Записаться' ниже\n"
-            message += f"2. Следуйте инструкциям бота в личном чате\n"
-            message += f"3. Оплатите участие и подтвердите оплату через бота\n"
-            message += f"4. Ожидайте подтверждения от администратора"
-        else:
-            message += f"\n❗️Лимит участников достигнут. Запись закрыта.\n"
-
-        return message
+        return render_cache.render(date_str, db)[0]
     except Exception as e:
-        logger.error(f"Ошибка при форматировании сообщения о бане: {e}", exc_info=True)
-        raise 
\ No newline at end of file
+        logger.error("Ошибка при форматировании сообщения о бане: %s", e, exc_info=True)
+        raise
+
+
+# Максимальная длина текста одного сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+def chunk_text(parts, limit=MESSAGE_LIMIT, separator=" "):
+    """Собирает части в сообщения не длиннее limit, не разрывая ни одну часть.
+
+    Часть (например, HTML-упоминание) никогда не обрезается: срез посреди
+    разметки ломает parse_mode=HTML всего сообщения. Часть длиннее limit
+    пропускается с предупреждением в журнале.
+    """
+    chunks = []
+    current = []
+    length = 0
+    for part in parts:
+        if len(part) > limit:
+            logger.warning("[formatting] Part of %s chars exceeds message limit %s, skipped", len(part), limit)
+            continue
+        added = len(part) + (len(separator) if current else 0)
+        if current and length + added > limit:
+            chunks.append(separator.join(current))
+            current, length = [], 0
+            added = len(part)
+        current.append(part)
+        length += added
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATUS_TEXT = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class HttpServer:
+    """Минимальный HTTP-сервер на asyncio для служебных GET-эндпоинтов (health, метрики).
+
+    routes — словарь {путь: async-функция без аргументов}, возвращающая
+    (статус, content_type, тело). Словарь или список в качестве тела
+    отдается как JSON.
+    """
+    def __init__(self, host, port, routes=None):
+        self.host = host
+        self.port = port
+        self.routes = dict(routes or {})
+        self._server = None
+
+    def add_route(self, path, handler):
+        self.routes[path] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # При port=0 система выбирает свободный порт
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("[HttpServer] Listening on %s:%s (%s)", self.host, self.port, ', '.join(sorted(self.routes)))
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки не нужны, но их нужно дочитать до пустой строки
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2:
+                return
+            method, path = parts[0], parts[1].split('?', 1)[0]
+            handler = self.routes.get(path)
+            if handler is None:
+                status, content_type, body = 404, 'text/plain', 'not found'
+            elif method not in ('GET', 'HEAD'):
+                status, content_type, body = 405, 'text/plain', 'method not allowed'
+            else:
+                try:
+                    status, content_type, body = await handler()
+                except Exception as e:
+                    logger.error("[HttpServer] Error in handler for %s: %s", path, e, exc_info=True)
+                    status, content_type, body = 500, 'text/plain', 'internal error'
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body, ensure_ascii=False)
+            payload = body.encode('utf-8') if isinstance(body, str) else body
+            head = (
+                f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
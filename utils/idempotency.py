@@ -0,0 +1,142 @@
+"""Подавление повторных нажатий inline-кнопок.
+
+Двойное нажатие приходит двумя CallbackQuery с одинаковыми пользователем,
+callback_data и сообщением. Первое обрабатывается как обычно, а ответ на него
+(текст всплывающего уведомления) запоминается на CALLBACK_DEDUP_SECONDS;
+повторные в это время сразу получают тот же ответ без обращений к базе и
+Bot API. Проверка выполняется до очереди обновлений пользователя
+(PerUserUpdateProcessor), поэтому повтор не ждет завершения первого
+нажатия. Запоминаются только успешные результаты: обработчик, ответивший
+ошибкой, вызывает callback_failed(), и нажатие можно повторить. Хранилище — в памяти процесса: после перезапуска защиту дают
+проверки в базе (reserve_seat, статусы оплат).
+"""
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+
+from config import CALLBACK_DEDUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Ответ на повтор, пока первое нажатие еще обрабатывается
+IN_PROGRESS_TEXT = "Запрос уже обрабатывается…"
+
+# Запись обрабатываемого сейчас нажатия: в нее answer_callback сохраняет ответ
+_current = contextvars.ContextVar('callback_dedup_entry', default=None)
+
+
+class _Entry:
+    __slots__ = ('key', 'expires', 'done', 'failed', 'answered', 'answer')
+
+    def __init__(self, key):
+        self.key = key
+        self.expires = float('inf')
+        self.done = False
+        self.failed = False
+        self.answered = False
+        self.answer = (None, False)
+
+
+def callback_key(query):
+    """Ключ нажатия: пользователь, callback_data и сообщение с кнопкой"""
+    message = query.message
+    if message is not None:
+        source = (message.chat_id, message.message_id)
+    else:
+        source = query.inline_message_id
+    return query.from_user.id, query.data, source
+
+
+class CallbackDeduplicator:
+    """Кеш результатов нажатий с коротким TTL.
+
+    Записи хранятся в порядке завершения, поэтому устаревшие удаляются с
+    начала словаря при каждом обращении; max_entries ограничивает размер при
+    наплыве. Исключение обработчика или callback_failed() удаляют запись,
+    чтобы нажатие можно было повторить.
+    """
+    def __init__(self, ttl=CALLBACK_DEDUP_SECONDS, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # ключ -> _Entry
+        self.stats = {'handled': 0, 'duplicates': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _prune(self, now):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires > now and len(self._entries) < self.max_entries:
+                break
+            del self._entries[key]
+
+    async def run(self, query, handler):
+        """Вызывает handler() для первого нажатия; повторы в пределах TTL отвечают его результатом.
+
+        Возвращает False, если нажатие оказалось повтором и handler не вызывался.
+        """
+        key = callback_key(query)
+        current = _current.get()
+        if current is not None and current.key == key:
+            # Нажатие уже проверено выше по стеку (в PerUserUpdateProcessor)
+            await handler()
+            return True
+        self._prune(time.monotonic())
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.stats['duplicates'] += 1
+            logger.info("[idempotency] Duplicate callback from user %s suppressed: %r", key[0], query.data)
+            if entry.done:
+                text, show_alert = entry.answer
+                await query.answer(text, show_alert=show_alert)
+            else:
+                await query.answer(IN_PROGRESS_TEXT)
+            return False
+
+        entry = self._entries[key] = _Entry(key)
+        token = _current.set(entry)
+        try:
+            await handler()
+        except BaseException:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            raise
+        finally:
+            _current.reset(token)
+        if entry.failed:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            return True
+        self.stats['handled'] += 1
+        entry.done = True
+        entry.expires = time.monotonic() + self.ttl
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        return True
+
+
+async def answer_callback(query, text=None, show_alert=False):
+    """query.answer(), ответ которого запоминается для повторных нажатий.
+
+    Нажатие получает ответ один раз: обработчик может ответить сразу, а
+    вызванный из него следующий обработчик — повторно не ответит.
+    """
+    entry = _current.get()
+    if entry is not None:
+        if entry.answered:
+            return
+        entry.answered = True
+        entry.answer = (text, show_alert)
+    await query.answer(text, show_alert=show_alert)
+
+
+def callback_failed():
+    """Отмечает текущее нажатие неуспешным: его результат не запоминается, и повтор обрабатывается заново"""
+    entry = _current.get()
+    if entry is not None:
+        entry.failed = True
+
+
+callback_dedup = CallbackDeduplicator()
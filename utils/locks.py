@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from telegram.ext import BaseUpdateProcessor
+
+from utils.idempotency import callback_dedup
+
+
+class KeyedLocks:
+    """Набор asyncio.Lock по ключу (пользователь, дата события и т.п.).
+
+    Блокировка создается при первом обращении и удаляется, когда у неё не
+    остается владельца и ожидающих, поэтому словарь не растет бесконечно.
+    Ожидающие получают блокировку в порядке обращения.
+    """
+    def __init__(self):
+        self._locks = {}  # ключ -> [Lock, число владельцев и ожидающих]
+
+    def __len__(self):
+        return len(self._locks)
+
+    def locked(self, key):
+        entry = self._locks.get(key)
+        return bool(entry and entry[0].locked())
+
+    @asynccontextmanager
+    async def lock(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+
+# Блокировки событий бани по date_str: запись, оплата и смена недели для одной даты не пересекаются
+event_locks = KeyedLocks()
+
+
+async def run_for_event(date_str, func, *args, **kwargs):
+    """Выполняет синхронный метод Database в потоке под блокировкой события date_str.
+
+    Запрос к базе не блокирует event loop, поэтому обновления других
+    пользователей обрабатываются, пока он выполняется.
+    """
+    async with event_locks.lock(date_str):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+def _ordering_key(update):
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return 'user', user.id
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return 'chat', chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    Обновления разных пользователей обрабатываются одновременно (не более
+    max_concurrent_updates), обновления одного пользователя — строго
+    по очереди в порядке поступления. Повторные нажатия inline-кнопок
+    отсекаются до очереди пользователя и получают ответ сразу.
+    """
+    def __init__(self, max_concurrent_updates):
+        # Семафор PTB берется до блокировки пользователя, и обновления одного пользователя,
+        # ждущие своей очереди, заняли бы все слоты. Поэтому внешний лимит задаем с запасом,
+        # а настоящий применяем после получения блокировки пользователя.
+        super().__init__(max_concurrent_updates * 64)
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._user_locks = KeyedLocks()
+
+    async def do_process_update(self, update, coroutine):
+        query = getattr(update, 'callback_query', None)
+        if query is not None:
+            if not await callback_dedup.run(query, lambda: self._process_in_order(update, coroutine)):
+                coroutine.close()
+            return
+        await self._process_in_order(update, coroutine)
+
+    async def _process_in_order(self, update, coroutine):
+        key = _ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+        async with self._user_locks.lock(key):
+            async with self._slots:
+                await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
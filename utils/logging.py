@@ -1,11 +1,47 @@
+import atexit
 import logging
 import os
+import queue
 from datetime import datetime
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
+from config import LOG_DIR, LOG_LEVEL, LOG_CONSOLE_LEVEL
+
+# Аргументы этих типов не меняются после вызова логгера, поэтому строку можно
+# собрать позже, в потоке QueueListener
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None), bytes)
+
+_listener = None
+_queue_handler = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Кладет запись в очередь без форматирования.
+
+    Стандартный QueueHandler форматирует сообщение в вызывающем потоке;
+    здесь это делает поток QueueListener. Если среди аргументов есть
+    изменяемые объекты, сообщение собирается сразу, чтобы в лог попало
+    состояние на момент вызова.
+    """
+    def prepare(self, record):
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging(log_dir=LOG_DIR, level=LOG_LEVEL, console_level=LOG_CONSOLE_LEVEL):
+    """Настраивает логирование один раз на процесс и возвращает логгер модуля.
+
+    Корневой логгер получает только DeferredQueueHandler; запись в файлы
+    error/warning/info/debug.log и в консоль выполняет QueueListener в
+    отдельном потоке, каждый приемник со своим уровнем.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return logging.getLogger(__name__)
 
-def setup_logging():
-    log_dir = "logs"
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
@@ -24,29 +60,47 @@ def setup_logging():
         handler.setLevel(level)
         return handler
 
-    error_handler = create_file_handler('error.log', logging.ERROR)
-    warning_handler = create_file_handler('warning.log', logging.WARNING)
-    info_handler = create_file_handler('info.log', logging.INFO)
-    debug_handler = create_file_handler('debug.log', logging.DEBUG)
-
+    handlers = [
+        create_file_handler('error.log', logging.ERROR),
+        create_file_handler('warning.log', logging.WARNING),
+        create_file_handler('info.log', logging.INFO),
+        create_file_handler('debug.log', logging.DEBUG),
+    ]
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(log_format)
-    console_handler.setLevel(logging.INFO)
+    console_handler.setLevel(console_level)
+    handlers.append(console_handler)
 
+    log_queue = queue.SimpleQueue()
     root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG)
+    _queue_handler = DeferredQueueHandler(log_queue)
+    root_logger.addHandler(_queue_handler)
+    root_logger.setLevel(level)
+    # Каждый запрос к Bot API httpx пишет в INFO; оставляем только проблемы
+    logging.getLogger('httpx').setLevel(logging.WARNING)
 
-    root_logger.addHandler(error_handler)
-    root_logger.addHandler(warning_handler)
-    root_logger.addHandler(info_handler)
-    root_logger.addHandler(debug_handler)
-    root_logger.addHandler(console_handler)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
     logger = logging.getLogger(__name__)
     cleanup_old_logs(log_dir)
     return logger
 
 
+def stop_logging():
+    """Дописывает записи из очереди и останавливает поток QueueListener"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
+
+
 def cleanup_old_logs(log_dir):
     try:
         current_time = datetime.now()
@@ -58,6 +112,6 @@ def cleanup_old_logs(log_dir):
                 file_time = datetime.fromtimestamp(os.path.getctime(file_path))
                 if (current_time - file_time).days > 180:
                     os.remove(file_path)
-                    logging.info(f"Удален старый лог: {filename}")
+                    logging.info("Удален старый лог: %s", filename)
     except Exception as e:
-        logging.error(f"Ошибка при очистке старых логов: {e}") 
\ No newline at end of file
+        logging.error("Ошибка при очистке старых логов: %s", e)
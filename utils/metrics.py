@@ -0,0 +1,232 @@
+import functools
+import time
+
+from telegram import Update
+from telegram.ext import ConversationHandler, TypeHandler
+
+# Внутренний шаг гистограммы: 2**SUB_BUCKET_BITS линейных интервалов на каждую степень двойки,
+# т.е. относительная погрешность не больше 1/8
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# Границы бакетов для экспорта в Prometheus, секунды
+EXPORT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+OUTCOME_OK = 'ok'
+OUTCOME_ERROR = 'error'
+
+# Группы обработчиков middleware: до всех и после всех остальных
+MIDDLEWARE_START_GROUP = -1
+MIDDLEWARE_END_GROUP = 1000
+
+
+def _bucket_index(micros):
+    if micros < SUB_BUCKETS:
+        return micros
+    shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (micros >> shift) - SUB_BUCKETS
+
+
+def _bucket_upper(index):
+    """Наибольшее значение (мкс), попадающее в бакет index"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    sub = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((sub + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Гистограмма задержек в духе HdrHistogram: логарифмические бакеты с линейным
+    делением внутри степени двойки. Память не зависит от числа замеров,
+    перцентили точны до 12.5%.
+    """
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = _bucket_index(max(0, round(seconds * 1_000_000)))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Значение (секунды), не меньше которого fraction всех замеров"""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return min(_bucket_upper(index) / 1_000_000, self.max)
+        return self.max
+
+    def cumulative(self, bounds=EXPORT_BUCKETS):
+        """Число замеров не больше каждой из границ bounds (секунды)"""
+        result = [0] * len(bounds)
+        for index, count in self.counts.items():
+            upper = _bucket_upper(index) / 1_000_000
+            for position, bound in enumerate(bounds):
+                if upper <= bound:
+                    result[position] += count
+        return result
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class HandlerMetrics:
+    """Время обработки обновлений по обработчику и результату (ok/error)"""
+    def __init__(self):
+        self.histograms = {}   # (обработчик, результат) -> LatencyHistogram
+        self.errors = {}       # обработчик -> число исключений
+        self.updates = 0
+        self.unhandled = 0
+        self.started = time.monotonic()
+
+    def observe(self, name, outcome, seconds):
+        histogram = self.histograms.get((name, outcome))
+        if histogram is None:
+            histogram = self.histograms[(name, outcome)] = LatencyHistogram()
+        histogram.record(seconds)
+        if outcome == OUTCOME_ERROR:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def reset(self):
+        self.histograms.clear()
+        self.errors.clear()
+        self.updates = 0
+        self.unhandled = 0
+        self.started = time.monotonic()
+
+    def wrap(self, callback, name=None):
+        """Оборачивает callback обработчика: время и исход каждого вызова попадают в метрики"""
+        name = name or getattr(callback, '__name__', repr(callback))
+        if getattr(callback, '_metrics_name', None):
+            return callback
+
+        @functools.wraps(callback)
+        async def timed(update, context, *args, **kwargs):
+            started = time.perf_counter()
+            if context is not None:
+                context.handled_by = name
+            try:
+                result = await callback(update, context, *args, **kwargs)
+            except Exception:
+                self.observe(name, OUTCOME_ERROR, time.perf_counter() - started)
+                raise
+            self.observe(name, OUTCOME_OK, time.perf_counter() - started)
+            return result
+        timed._metrics_name = name
+        return timed
+
+    # Middleware: TypeHandler в группе -1 засекает начало обработки,
+    # TypeHandler в последней группе учитывает обновление целиком
+    async def _update_started(self, update, context):
+        context.update_started = time.perf_counter()
+        context.handled_by = None
+
+    async def _update_finished(self, update, context):
+        self.updates += 1
+        started = getattr(context, 'update_started', None)
+        if getattr(context, 'handled_by', None) is None:
+            self.unhandled += 1
+        elif started is not None:
+            self.observe('update', OUTCOME_OK, time.perf_counter() - started)
+
+    def install(self, application, tables=()):
+        """Оборачивает все зарегистрированные обработчики и добавляет middleware.
+
+        Вызывается один раз, после регистрации обработчиков. tables — словари
+        {ключ: callback}, через которые обработчики вызываются в обход PTB
+        (например, таблица inline-кнопок).
+        """
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                self._wrap_handler(handler)
+        for table in tables:
+            for key, callback in table.items():
+                table[key] = self.wrap(callback)
+        application.add_handler(TypeHandler(Update, self._update_started), group=MIDDLEWARE_START_GROUP)
+        application.add_handler(TypeHandler(Update, self._update_finished), group=MIDDLEWARE_END_GROUP)
+
+    def _wrap_handler(self, handler):
+        if isinstance(handler, ConversationHandler):
+            nested = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                nested.extend(state_handlers)
+            for inner in nested:
+                self._wrap_handler(inner)
+            return
+        handler.callback = self.wrap(handler.callback)
+
+    def summary(self):
+        """Строки (обработчик, вызовов, ошибок, p50, p95, p99, max), самые медленные по p95 сверху"""
+        rows = {}
+        for (name, outcome), histogram in self.histograms.items():
+            merged = rows.setdefault(name, LatencyHistogram())
+            for index, count in histogram.counts.items():
+                merged.counts[index] = merged.counts.get(index, 0) + count
+            merged.count += histogram.count
+            merged.total += histogram.total
+            merged.max = max(merged.max, histogram.max)
+        result = [
+            (name, histogram.count, self.errors.get(name, 0), histogram.percentile(0.5),
+             histogram.percentile(0.95), histogram.percentile(0.99), histogram.max)
+            for name, histogram in rows.items()
+        ]
+        result.sort(key=lambda row: row[4], reverse=True)
+        return result
+
+    def render_text(self, limit=20):
+        """Отчет для команды /perf"""
+        uptime = time.monotonic() - self.started
+        lines = [f"Обновлений: {self.updates} (без обработчика: {self.unhandled}) за {uptime / 60:.0f} мин"]
+        rows = self.summary()
+        if not rows:
+            lines.append("Замеров пока нет.")
+            return "\n".join(lines)
+        lines.append("обработчик: вызовов/ошибок, p50 / p95 / p99 / max, мс")
+        for name, count, errors, p50, p95, p99, worst in rows[:limit]:
+            lines.append(
+                f"{name}: {count}/{errors}, {p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f} / {worst * 1000:.0f}"
+            )
+        return "\n".join(lines)
+
+    def render_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = [
+            "# HELP bath_bot_handler_seconds Handler latency by handler and outcome.",
+            "# TYPE bath_bot_handler_seconds histogram",
+        ]
+        for (name, outcome), histogram in sorted(self.histograms.items()):
+            labels = f'handler="{_label(name)}",outcome="{outcome}"'
+            for bound, count in zip(EXPORT_BUCKETS, histogram.cumulative()):
+                lines.append(f'bath_bot_handler_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'bath_bot_handler_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"bath_bot_handler_seconds_sum{{{labels}}} {histogram.total:.6f}")
+            lines.append(f"bath_bot_handler_seconds_count{{{labels}}} {histogram.count}")
+        lines += [
+            "# HELP bath_bot_handler_errors_total Exceptions raised by handlers.",
+            "# TYPE bath_bot_handler_errors_total counter",
+        ]
+        lines += [f'bath_bot_handler_errors_total{{handler="{_label(name)}"}} {count}' for name, count in sorted(self.errors.items())]
+        lines += [
+            "# HELP bath_bot_updates_total Updates processed.",
+            "# TYPE bath_bot_updates_total counter",
+            f"bath_bot_updates_total {self.updates}",
+            "# HELP bath_bot_updates_unhandled_total Updates that matched no handler.",
+            "# TYPE bath_bot_updates_unhandled_total counter",
+            f"bath_bot_updates_unhandled_total {self.unhandled}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+handler_metrics = HandlerMetrics()